@@ -0,0 +1,112 @@
+"""Measures the throughput of the code generators in :mod:`cypy.cg`.
+
+Builds the token tree of a synthetic kernel shaped like the output of the C
+backends and appends it to each generator. The kernel has the given number of
+statements, each a tuple of short strings, and every eighth one is followed
+by a loop of eight statements, nested to the given depth, with :meth:`CG.tab
+<cypy.cg.CG.tab>` and :meth:`CG.untab <cypy.cg.CG.untab>` tokens around
+each loop body. The generators are:
+
+``CG``
+    The original generator, producing a string.
+
+``RopeCG``
+    :class:`cypy.cg.RopeCG`, producing a string.
+
+``RopeCG-stream``
+    :class:`cypy.cg.RopeCG` writing to a temporary file.
+
+Prints one JSON object per generator and size, with the best time over all
+repeats and the resulting throughput. The output of every generator is
+checked against that of ``CG``; if they differ, ``error`` is reported.
+
+    python benchmarks/cg.py [--statements N] [--depth N] [--repeats N]
+"""
+import os
+import sys
+import json
+import optparse
+import tempfile
+
+import cypy.cg as cg
+import clq.profiling
+
+def block(n_statements, depth):
+    stmts = [ ]
+    for i in xrange(n_statements):
+        stmts.append(("x", str(i), " = (", "a[", str(i), "] + ", "b", ");\n"))
+        if depth > 0 and i % 8 == 7:
+            stmts.append(("for (i", str(depth), " = 0; i", str(depth),
+                          " < n; i", str(depth), "++) {\n", cg.CG.tab,
+                          block(8, depth - 1),
+                          cg.CG.untab, "\n}\n"))
+    return stmts
+
+def kernel(n_statements, depth):
+    return ("__kernel void f(__global float* a, __global float* b) {\n",
+            cg.CG.tab, "float x;\n\n", block(n_statements, depth),
+            cg.CG.untab, "\n}\n")
+
+def run_cg(code):
+    g = cg.CG()
+    g.append(code)
+    return g.code
+
+def run_rope(code):
+    g = cg.RopeCG()
+    g.append(code)
+    return g.code
+
+def run_stream(code):
+    f = tempfile.TemporaryFile()
+    try:
+        g = cg.RopeCG(stream=f)
+        g.append(code)
+        g.flush()
+        f.seek(0)
+        return f.read()
+    finally:
+        f.close()
+
+generators = (("CG", run_cg), ("RopeCG", run_rope),
+              ("RopeCG-stream", run_stream))
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [--statements N] [--depth N] [--repeats N]")
+    parser.add_option("--statements", type="int", action="append",
+                      help="statements per block (repeatable)")
+    parser.add_option("--depth", type="int", default=2)
+    parser.add_option("--repeats", type="int", default=3)
+    options, _ = parser.parse_args(argv)
+
+    for n_statements in options.statements or (1000, 10000):
+        code = kernel(n_statements, options.depth)
+        expected = None
+        for name, run in generators:
+            best = None
+            for _ in xrange(options.repeats):
+                start = clq.profiling.clock()
+                output = run(code)
+                seconds = clq.profiling.clock() - start
+                if best is None or seconds < best:
+                    best = seconds
+            if expected is None:
+                expected = output
+            result = {
+                "benchmark": "cg",
+                "generator": name,
+                "statements": n_statements,
+                "depth": options.depth,
+                "bytes": len(output),
+                "seconds": best,
+                "mb_per_second": len(output) / best / 1e6 if best else None
+            }
+            if output != expected:
+                result["error"] = "output differs from CG"
+            print json.dumps(result)
+            sys.stdout.flush()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
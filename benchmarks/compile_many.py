@@ -0,0 +1,65 @@
+"""Measures how GenericFn.compile_many scales with the number of processes.
+
+Specializes one generic function for every pair of OpenCL scalar types, as
+tests/generate_test_cl.py does, once per process count. Prints one JSON
+object per process count.
+
+    python benchmarks/compile_many.py [max_processes] [repeats]
+"""
+import sys
+import json
+import time
+import multiprocessing
+
+import clq
+import clq.backends.opencl as ocl
+
+src = '''
+def mix(a, b):
+    c = a * b + a
+    d = c - b * a
+    e = (d + c) * (a - b)
+    if e > c:
+        e = e - d
+    f = e * e + d * c - a
+    return f + b
+'''
+
+scalar_types = sorted(ocl.int_types.values() + ocl.float_types.values(),
+                      key=lambda t: t.name)
+signatures = [(a, b) for a in scalar_types for b in scalar_types]
+
+def run(processes, repeats):
+    times = [ ]
+    for _ in xrange(repeats):
+        # new generic function and backend each time so that nothing is
+        # reused from the intern pools
+        generic_fn = clq.fn.from_source(src)
+        backend = ocl.Backend()
+        start = time.time()
+        generic_fn.compile_many(backend, signatures, processes=processes)
+        times.append(time.time() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    max_processes = multiprocessing.cpu_count()
+    if len(sys.argv) > 1:
+        max_processes = int(sys.argv[1])
+    repeats = 3
+    if len(sys.argv) > 2:
+        repeats = int(sys.argv[2])
+
+    baseline = None
+    processes = 1
+    while processes <= max_processes:
+        elapsed = run(processes, repeats)
+        if baseline is None:
+            baseline = elapsed
+        print json.dumps({
+            'benchmark': 'compile_many',
+            'processes': processes,
+            'specializations': len(signatures),
+            'seconds': elapsed,
+            'speedup': baseline / elapsed
+        })
+        processes *= 2
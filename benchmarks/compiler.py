@@ -0,0 +1,208 @@
+"""Measures compiler throughput on synthesized generic functions.
+
+Each case generates generic functions of increasing size and compiles them
+for the OpenCL backend, from parsing through to the final program item:
+
+``deep_expression``
+    A balanced tree of binary operators of the given depth.
+
+``many_locals``
+    The given number of local variables, each assigned several times with
+    values of different types, so that multiple assignments must be resolved.
+
+``nested_loops``
+    Alternating ``for`` and ``while`` loops nested to the given depth, each
+    with a few statements in its body.
+
+``call_chain``
+    A chain of the given number of generic functions, each calling the
+    previous one, passed in as an argument.
+
+Prints one JSON object per case and size. ``seconds`` is the best end-to-end
+time over all repeats with profiling disabled; ``phases`` is the time spent in
+each phase, from one additional run under :mod:`clq.profiling`. If compilation
+fails, ``error`` is reported instead.
+
+    python benchmarks/compiler.py [--repeats N] [--quick] [case ...]
+
+To check for regressions, save the output of a run and pass it as
+``--baseline`` to a later one. Each result then includes its ``ratio`` to the
+baseline time, and the exit status is 1 if any case is slower than the
+baseline by more than ``--tolerance`` (25% by default).
+"""
+import sys
+import json
+import optparse
+
+import clq
+import clq.profiling
+import clq.backends.opencl as ocl
+
+###############################################################################
+# Generators
+###############################################################################
+# each generator returns a list of sources; the last one is the function
+# that is compiled and each function takes the previous ones as arguments
+
+def deep_expression(depth):
+    ops = ("+", "*", "-")
+    def expr(d, i):
+        if d == 0:
+            return ("a", "b", "c")[i % 3]
+        return "(%s %s %s)" % (expr(d - 1, 2 * i), ops[d % len(ops)],
+                               expr(d - 1, 2 * i + 1))
+    return ["def deep(a, b, c):\n    return %s\n" % expr(depth, 0)]
+
+def many_locals(n):
+    lines = ["def locals_(a, b):"]
+    for i in xrange(n):
+        lines.append("    x%d = a" % i)
+    for i in xrange(n):
+        prev = "x%d" % (i - 1) if i else "b"
+        # b is a float, so each variable ends up with two assignments of
+        # different types
+        lines.append("    x%d = x%d + %s" % (i, i, prev))
+    lines.append("    return x%d" % (n - 1))
+    return ["\n".join(lines) + "\n"]
+
+def nested_loops(depth):
+    lines = ["def loops(a, n):", "    total = a"]
+    indent = "    "
+    for d in xrange(depth):
+        if d % 2 == 0:
+            lines.append("%sfor i%d in (0, n, 1):" % (indent, d))
+        else:
+            lines.append("%sj%d = 0" % (indent, d))
+            lines.append("%swhile j%d < n:" % (indent, d))
+            lines.append("%s    j%d = j%d + 1" % (indent, d, d))
+        indent += "    "
+        lines.append("%stotal = total + a * %d" % (indent, d))
+        lines.append("%sif total > n:" % indent)
+        lines.append("%s    total = total - n" % indent)
+    lines.append("    return total")
+    return ["\n".join(lines) + "\n"]
+
+def call_chain(length):
+    srcs = ["def f0(x):\n    return x + 1\n"]
+    for k in xrange(1, length):
+        params = ", ".join("g%d" % i for i in xrange(k))
+        callee_args = "".join(", g%d" % i for i in xrange(k - 1))
+        srcs.append("def f%d(x, %s):\n    y = g%d(x * 2%s)\n    return y + x\n"
+                    % (k, params, k - 1, callee_args))
+    return srcs
+
+cases = [
+    ("deep_expression", deep_expression, (4, 6, 8, 10), ("int", "float", "int")),
+    ("many_locals", many_locals, (10, 50, 100, 200), ("int", "float")),
+    ("nested_loops", nested_loops, (2, 4, 8, 16), ("int", "int")),
+    ("call_chain", call_chain, (2, 4, 8, 16), ("int",)),
+]
+
+quick_sizes = {
+    "deep_expression": (4, 6),
+    "many_locals": (10, 50),
+    "nested_loops": (2, 4),
+    "call_chain": (2, 4),
+}
+
+###############################################################################
+# Running
+###############################################################################
+def compile_srcs(srcs, arg_type_names):
+    backend = ocl.Backend()
+    arg_types = [getattr(ocl, name) for name in arg_type_names]
+    generic_fns = [ ]
+    for src in srcs:
+        generic_fn = clq.fn.from_source(src)
+        concrete_fn = generic_fn.compile(backend,
+                                         *(arg_types + [fn.cl_type for fn in
+                                                        generic_fns]))
+        generic_fns.append(generic_fn)
+    concrete_fn.program_item
+    return backend
+
+def run(srcs, arg_type_names, repeats):
+    best = None
+    for _ in xrange(repeats):
+        start = clq.profiling.clock()
+        compile_srcs(srcs, arg_type_names)
+        elapsed = clq.profiling.clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    with clq.profiling.Profile() as profile:
+        backend = compile_srcs(srcs, arg_type_names)
+    phases = dict((phase, stats["seconds"]) for phase, stats
+                  in profile.report["phases"].iteritems())
+    code_size = sum(len(item.code) for item in backend.program_items)
+    return best, phases, code_size
+
+def load_baseline(filename):
+    baseline = { }
+    f = open(filename)
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                result = json.loads(line)
+                if "seconds" in result:
+                    baseline[(result["case"], result["size"])] = \
+                        result["seconds"]
+    finally:
+        f.close()
+    return baseline
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [--repeats N] [--quick] [--baseline FILE] [case ...]")
+    parser.add_option("--repeats", type="int", default=5)
+    parser.add_option("--quick", action="store_true", default=False,
+                      help="only run the smallest sizes")
+    parser.add_option("--baseline", metavar="FILE",
+                      help="output of a previous run to compare against")
+    parser.add_option("--tolerance", type="float", default=0.25,
+                      help="slowdown relative to the baseline that counts "
+                           "as a regression (default 0.25)")
+    options, selected = parser.parse_args(argv)
+    baseline = { }
+    if options.baseline:
+        baseline = load_baseline(options.baseline)
+
+    regressions = 0
+
+    for name, generate, sizes, arg_type_names in cases:
+        if selected and name not in selected:
+            continue
+        if options.quick:
+            sizes = quick_sizes[name]
+        for size in sizes:
+            srcs = generate(size)
+            result = {
+                "benchmark": "compiler",
+                "case": name,
+                "size": size,
+                "source_lines": sum(src.count("\n") for src in srcs)
+            }
+            try:
+                seconds, phases, code_size = run(srcs, arg_type_names,
+                                                 options.repeats)
+            except RuntimeError as e:
+                # e.g. the recursion limit being hit for very large functions
+                result["error"] = "%s: %s" % (type(e).__name__, e)
+            else:
+                result["code_size"] = code_size
+                result["seconds"] = seconds
+                result["phases"] = phases
+                baseline_seconds = baseline.get((name, size))
+                if baseline_seconds:
+                    ratio = seconds / baseline_seconds
+                    result["baseline_seconds"] = baseline_seconds
+                    result["ratio"] = ratio
+                    result["regression"] = ratio > 1 + options.tolerance
+                    regressions += result["regression"]
+            print json.dumps(result)
+            sys.stdout.flush()
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
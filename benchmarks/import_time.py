@@ -0,0 +1,74 @@
+"""Measures how long it takes to import cl.oquence in a fresh interpreter.
+
+Each sample imports the module in a new process, as a command line tool or
+short-lived worker would. Prints one JSON object per module with the best and
+median import time, and which of the modules that should only be imported
+on demand (numpy, multiprocessing, the built-in descriptor tables) were
+imported anyway.
+
+    python benchmarks/import_time.py [--samples N] [--max-seconds S] [module ...]
+
+With ``--max-seconds``, exits with status 1 if the best time for any module
+exceeds the limit or if any on-demand module was imported.
+"""
+import os
+import sys
+import json
+import optparse
+import subprocess
+
+deferred_modules = ("numpy", "multiprocessing", "tempfile",
+                    "clq.backends.opencl.builtin_defs")
+
+probe = """
+import sys, json, time
+start = time.time()
+import %(module)s
+elapsed = time.time() - start
+print json.dumps({"seconds": elapsed,
+                  "imported": [m for m in %(deferred)r if m in sys.modules]})
+"""
+
+def sample(module):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (root, env.get("PYTHONPATH")) if p)
+    # -S skips site.py, which would otherwise dominate the measurement
+    output = subprocess.Popen(
+        [sys.executable, "-S", "-c",
+         probe % dict(module=module, deferred=deferred_modules)],
+        stdout=subprocess.PIPE, env=env).communicate()[0]
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [--samples N] [--max-seconds S] [module ...]")
+    parser.add_option("--samples", type="int", default=10)
+    parser.add_option("--max-seconds", type="float", default=None)
+    options, modules = parser.parse_args(argv)
+    if not modules:
+        modules = ["clq", "clq.backends.opencl"]
+
+    failed = False
+    for module in modules:
+        samples = [sample(module) for _ in xrange(options.samples)]
+        times = sorted(s["seconds"] for s in samples)
+        imported = sorted(set(m for s in samples for m in s["imported"]))
+        result = {
+            "benchmark": "import_time",
+            "module": module,
+            "samples": len(times),
+            "best_seconds": times[0],
+            "median_seconds": times[len(times) // 2],
+            "eagerly_imported": imported
+        }
+        if options.max_seconds is not None:
+            result["ok"] = times[0] <= options.max_seconds and not imported
+            failed = failed or not result["ok"]
+        print json.dumps(result)
+        sys.stdout.flush()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Measures the cost of the trees produced for generic and concrete functions.
+
+Compiles one generic function for many argument types and keeps every
+concrete function (and so its typed tree) alive, as a long-running program
+specializing a kernel library would. Reports the time taken, the growth in
+resident memory and the number of objects tracked by the garbage collector
+(which include the tree nodes) per specialization.
+
+    python benchmarks/ir.py [--statements N] [--repeats N]
+"""
+import gc
+import sys
+import json
+import optparse
+import resource
+
+import clq
+import clq.profiling
+import clq.backends.opencl as ocl
+
+def generate(statements):
+    lines = ["def kernel(a, b):", "    x = a * b + a"]
+    for i in xrange(statements):
+        lines.append("    y%d = (x - b * a) * (x + %d)" % (i, i))
+        lines.append("    if y%d > x:" % i)
+        lines.append("        x = x + y%d" % i)
+    lines.append("    return x")
+    return "\n".join(lines) + "\n"
+
+scalar_types = sorted(ocl.int_types.values() + ocl.float_types.values(),
+                      key=lambda t: t.name)
+signatures = [(a, b) for a in scalar_types for b in scalar_types]
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [--statements N]")
+    parser.add_option("--statements", type="int", default=50)
+    options, _ = parser.parse_args(argv)
+
+    generic_fn = clq.fn.from_source(generate(options.statements))
+    backend = ocl.Backend()
+
+    gc.collect()
+    start_objects = len(gc.get_objects())
+    start_rss = max_rss_kb()
+    start = clq.profiling.clock()
+    generic_fn.annotated_ast
+    annotate_seconds = clq.profiling.clock() - start
+    gc.collect()
+    annotated_objects = len(gc.get_objects()) - start_objects
+
+    start = clq.profiling.clock()
+    concrete_fns = [ ]
+    for arg_types in signatures:
+        concrete_fn = generic_fn.compile(backend, *arg_types)
+        concrete_fn.typed_ast
+        concrete_fns.append(concrete_fn)
+    seconds = clq.profiling.clock() - start
+    gc.collect()
+
+    n = len(signatures)
+    print json.dumps({
+        "benchmark": "ir",
+        "statements": options.statements,
+        "specializations": n,
+        "annotate_seconds": annotate_seconds,
+        "annotated_objects": annotated_objects,
+        "seconds_per_specialization": seconds / n,
+        "objects_per_specialization":
+            (len(gc.get_objects()) - start_objects - annotated_objects) / n,
+        "rss_growth_kb": max_rss_kb() - start_rss
+    })
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,104 @@
+"""Measures kernel launches per second through each launch path in
+:mod:`clq.backends.opencl.pyocl`.
+
+Launches a trivial kernel over a small buffer many times in a row, as a tight
+loop of small launches does, so that the time is dominated by the host. The
+paths are:
+
+``call``
+    :meth:`Kernel.__call__ <clq.backends.opencl.pyocl.Kernel.__call__>`
+    with the default queue and the buffer's shape as the global size.
+
+``prepared``
+    A :class:`PreparedKernel <clq.backends.opencl.pyocl.PreparedKernel>`
+    called with no arguments.
+
+``prepared-changing``
+    A prepared kernel called with all of its arguments, one of which (a
+    float) changes on every launch.
+
+Prints one JSON object per path, with the best time over all repeats, which
+includes waiting for the queue to finish, and the resulting launches per
+second. Runs on the first device of the first platform unless ``--interactive``
+is given.
+
+    python benchmarks/launch.py [--launches N] [--size N] [--repeats N]
+"""
+import sys
+import json
+import optparse
+
+import numpy
+
+import clq.profiling
+import clq.backends.opencl.pyocl as pyocl
+
+source = '''
+__kernel void axpb(__global float* x, float a, float b) {
+    size_t gid = get_global_id(0);
+    x[gid] = a * x[gid] + b;
+}
+'''
+
+def run_call(kernel, buffer, launches):
+    for i in xrange(launches):
+        kernel(buffer, buffer, 1.0, 0.5)
+
+def run_prepared(kernel, buffer, launches):
+    launch = kernel.prepare(buffer, buffer, 1.0, 0.5)
+    for i in xrange(launches):
+        launch()
+
+def run_prepared_changing(kernel, buffer, launches):
+    launch = kernel.prepare(buffer, buffer, 1.0, 0.5)
+    for i in xrange(launches):
+        launch(buffer, 1.0, i * 0.5)
+
+paths = (("call", run_call), ("prepared", run_prepared),
+         ("prepared-changing", run_prepared_changing))
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [--launches N] [--size N] [--repeats N]")
+    parser.add_option("--launches", type="int", default=20000)
+    parser.add_option("--size", type="int", default=256,
+                      help="elements in the buffer (work-items per launch)")
+    parser.add_option("--repeats", type="int", default=3)
+    parser.add_option("--interactive", action="store_true",
+                      help="prompt for the platform and device")
+    options, _ = parser.parse_args(argv)
+
+    ctx = pyocl.Context.get_somehow(options.interactive)
+    kernel = ctx.compile(source).axpb
+    buffer = ctx.to_device(numpy.zeros(options.size, numpy.float32))
+    queue = ctx.queue
+
+    baseline = None
+    for name, run in paths:
+        run(kernel, buffer, 10) # warm up
+        queue.finish()
+        best = None
+        for _ in xrange(options.repeats):
+            start = clq.profiling.clock()
+            run(kernel, buffer, options.launches)
+            queue.finish()
+            seconds = clq.profiling.clock() - start
+            if best is None or seconds < best:
+                best = seconds
+        if baseline is None:
+            baseline = best
+        print json.dumps({
+            "benchmark": "launch",
+            "path": name,
+            "device": ctx.device.name,
+            "launches": options.launches,
+            "size": options.size,
+            "seconds": best,
+            "launches_per_second": options.launches / best if best else None,
+            "speedup": baseline / best if best else None
+        })
+        sys.stdout.flush()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,55 @@
+"""Measures the cost of collecting program items as a backend accumulates
+them.
+
+Compiles the given number of distinct concrete functions into a single
+backend (each function is a separate generic function, so every compilation
+adds new items to :attr:`clq.Backend.program_items`) and reports the time
+taken by each block of compilations. With constant-time deduplication the
+time per block should stay flat as the backend grows.
+
+    python benchmarks/program_items.py [--functions N] [--step N]
+"""
+import sys
+import json
+import optparse
+
+import clq
+import clq.profiling
+import clq.backends.opencl as ocl
+
+src = """
+def f%d(a, b):
+    c = a * b + %d
+    return c - a
+"""
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [--functions N] [--step N]")
+    parser.add_option("--functions", type="int", default=4000)
+    parser.add_option("--step", type="int", default=500)
+    options, _ = parser.parse_args(argv)
+
+    backend = ocl.Backend()
+    block_start = clq.profiling.clock()
+    for i in xrange(1, options.functions + 1):
+        concrete_fn = clq.fn.from_source(src % (i, i)).compile(
+            backend, ocl.int, ocl.float)
+        concrete_fn.program_item
+        if i % options.step == 0:
+            now = clq.profiling.clock()
+            module_start = now
+            module = clq.ProgramModule((concrete_fn,))
+            print json.dumps({
+                "benchmark": "program_items",
+                "functions": i,
+                "backend_items": len(backend.program_items),
+                "block_seconds": now - block_start,
+                "module_items": len(module),
+                "module_seconds": clq.profiling.clock() - module_start
+            })
+            sys.stdout.flush()
+            block_start = clq.profiling.clock()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+"""Measures resident memory while compiling many specializations.
+
+Each specialization uses a fresh generic function (via clq.fn.from_source), so
+nothing is shared through the intern pools. Type resolution results are kept
+in a table on each Context which is cleared once code generation finishes, so
+memory per specialization should stay flat. Prints one JSON object every
+``step`` specializations.
+
+    python benchmarks/resolution_memory.py [specializations] [step]
+"""
+import gc
+import sys
+import json
+import time
+import resource
+
+import cypy
+import clq
+import clq.backends.opencl as ocl
+
+src = '''
+def mix(a, b):
+    c = a * b + a
+    d = c - b * a
+    e = (d + c) * (a - b)
+    if e > c:
+        e = e - d
+    else:
+        e = e + d
+    f = e * e + d * c - a
+    return f + b
+'''
+
+scalar_types = sorted(ocl.int_types.values() + ocl.float_types.values(),
+                      key=lambda t: t.name)
+signatures = [(a, b) for a in scalar_types for b in scalar_types]
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+if __name__ == "__main__":
+    n = 2000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    step = 250
+    if len(sys.argv) > 2:
+        step = int(sys.argv[2])
+
+    # don't let the intern pools pin every generic and concrete function
+    cypy.set_intern_pool(clq.GenericFn, cypy.WeakInternPool())
+    cypy.set_intern_pool(clq.ConcreteFn, cypy.WeakInternPool())
+
+    backend = ocl.Backend()
+    start_rss = max_rss_kb()
+    start = time.time()
+    for i in xrange(1, n + 1):
+        arg_types = signatures[i % len(signatures)]
+        concrete_fn = clq.fn.from_source(src).compile(backend, *arg_types)
+        concrete_fn.program_item
+        if i % step == 0:
+            # backend program items are kept by design; drop them so only
+            # what compilation leaves behind is measured
+            backend.program_items.clear()
+            gc.collect()
+            print json.dumps({
+                'benchmark': 'resolution_memory',
+                'specializations': i,
+                'seconds': time.time() - start,
+                'max_rss_kb': max_rss_kb(),
+                'rss_growth_kb': max_rss_kb() - start_rss,
+                'gc_objects': len(gc.get_objects())
+            })
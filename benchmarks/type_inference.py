@@ -0,0 +1,104 @@
+"""Measures type inference on generic functions with thousands of statements.
+
+Each case generates a single generic function with the given number of
+assignments and compiles it for the OpenCL backend:
+
+``chain``
+    Each variable is assigned from the previous one, so the type of the last
+    variable depends on all of the others.
+
+``reassigned``
+    A single variable assigned the given number of times, each time from its
+    previous value.
+
+``loop_carried``
+    Pairs of variables assigned from each other inside a loop, each pair
+    forming a group of mutually dependent variables.
+
+Prints one JSON object per case and size with the best time over all repeats,
+the time spent resolving types (from one additional run under
+:mod:`clq.profiling`) and the number of strongly connected components in the
+function's :class:`inference graph <clq.internals.InferenceGraph>`.
+
+    python benchmarks/type_inference.py [--repeats N] [case ...]
+"""
+import sys
+import json
+import optparse
+
+import clq
+import clq.profiling
+import clq.backends.opencl as ocl
+
+def chain(n):
+    lines = ["def chain(a, b):", "    x0 = a"]
+    for i in xrange(1, n):
+        lines.append("    x%d = x%d + b" % (i, i - 1))
+    lines.append("    return x%d" % (n - 1))
+    return "\n".join(lines) + "\n"
+
+def reassigned(n):
+    lines = ["def reassigned(a, b):", "    x = a"]
+    for i in xrange(1, n):
+        lines.append("    x = x + %s" % ("b" if i % 2 else "a"))
+    lines.append("    return x")
+    return "\n".join(lines) + "\n"
+
+def loop_carried(n):
+    pairs = n // 2
+    lines = ["def loop_carried(a, b):"]
+    for i in xrange(pairs):
+        lines.append("    s%d = 0" % i)
+        lines.append("    t%d = 0" % i)
+    lines.append("    for k in (0, a, 1):")
+    for i in xrange(pairs):
+        lines.append("        s%d = t%d + b" % (i, i))
+        lines.append("        t%d = s%d + a" % (i, i))
+    lines.append("    return s0")
+    return "\n".join(lines) + "\n"
+
+cases = [
+    ("chain", chain, (500, 1000, 2000, 5000)),
+    ("reassigned", reassigned, (500, 1000, 2000, 5000)),
+    ("loop_carried", loop_carried, (500, 1000, 2000, 5000)),
+]
+
+def compile_src(src):
+    generic_fn = clq.fn.from_source(src)
+    concrete_fn = generic_fn.compile(ocl.Backend(), ocl.int, ocl.float)
+    concrete_fn.program_item
+    return generic_fn
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [--repeats N] [case ...]")
+    parser.add_option("--repeats", type="int", default=3)
+    options, selected = parser.parse_args(argv)
+
+    for name, generate, sizes in cases:
+        if selected and name not in selected:
+            continue
+        for size in sizes:
+            src = generate(size)
+            best = None
+            for _ in xrange(options.repeats):
+                start = clq.profiling.clock()
+                compile_src(src)
+                elapsed = clq.profiling.clock() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            with clq.profiling.Profile() as profile:
+                generic_fn = compile_src(src)
+            phases = profile.report["phases"]
+            print json.dumps({
+                "benchmark": "type_inference",
+                "case": name,
+                "size": size,
+                "seconds": best,
+                "resolve_seconds": phases.get("resolve", {}).get("seconds", 0.0),
+                "components": len(generic_fn.inference_graph.components)
+            })
+            sys.stdout.flush()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,9 @@
 """The cl.oquence kernel programming language."""
 import ast as _ast # http://docs.python.org/library/ast.html
+import hashlib as _hashlib
+import re as _re
+import threading as _threading
+import weakref as _weakref
 
 import cypy
 import cypy.astx as astx
@@ -8,6 +12,12 @@ import cypy.cg as cg
 version = cypy.Version("cl.oquence", (("Major", 1), ("Minor", 0)), "alpha")
 """The current :class:`version <cypy.Version>` of cl.oquence (1.0 alpha)."""
 
+compiler_lock = _threading.RLock()
+"""Held while a generic function is specialized or annotated, while a 
+concrete function is created, and while a concrete function's typed syntax
+tree and program items are generated. The compiler is not thread-safe, so 
+only one thread does any of these at a time (see :mod:`clq.futures`)."""
+
 def fn(decl):
     """Create a :class:`generic cl.oquence function <GenericFn>` from a 
     Python function declaration.
@@ -58,21 +68,57 @@ def fn(decl):
     information on manipulating Python syntax trees. The :mod:`cypy.astx`
     module provides several convenience functions for working with Python 
     ASTs as well.
+    
+    When a Python function is provided, free variables that refer to numbers 
+    in the module it was declared in are treated as compile-time constants::
+    
+        WIDTH = 16
+        
+        @clq.fn
+        def row_start(row):
+            return row * WIDTH
+            
+    See :meth:`GenericFn.specialize`.
     """
-    ast = astx.infer_ast(decl)
-    ast = astx.extract_the(ast, _ast.FunctionDef)
-    return GenericFn(ast)
+    generic_fn = from_source(decl)
+    generic_fn.globals = getattr(decl, 'func_globals', None)
+    return generic_fn
     
 def from_source(src):
+    profile = profiling.active
+    if profile is not None:
+        start = profiling.clock()
     ast = astx.infer_ast(src)
     ast = astx.extract_the(ast, _ast.FunctionDef)
-    return GenericFn(ast)
+    generic_fn = GenericFn(ast)
+    if profile is not None:
+        profile.add(generic_fn, "parse", profiling.clock() - start)
+    return generic_fn
 fn.from_source = from_source
 
 def from_ast(ast):
     return GenericFn(ast)
 fn.from_ast = from_ast
 
+def unroll(bounds, factor=None):
+    """Marks a for loop in a generic function for unrolling::
+    
+        for i in unroll((0, 9)):        # unrolled fully
+            ...
+        for i in unroll((0, n, 2), 4):  # unrolled by a factor of 4
+            ...
+        for i in unroll(n, 1):          # never unrolled
+            ...
+            
+    ``bounds`` are the usual loop bounds. Loops are only unrolled by an 
+    :class:`optimizer <clq.optimize.Optimizer>` with the ``unroll`` pass 
+    enabled, and only when their bounds are constant; loops without a hint
+    are unrolled as configured there.
+    
+    Returns ``bounds``, so this is harmless when called from Python.
+    """
+    return bounds
+
 class GenericFn(object):
     """A generic cl.oquence function. 
     
@@ -105,12 +151,22 @@ class GenericFn(object):
 
     @cypy.lazy(property)
     def annotated_ast(self): 
-        """An annotated copy of the abstract syntax tree for this GenericFn.
+        """The annotated :mod:`intermediate representation <clq.ir>` of this 
+        GenericFn, shared by all of its concrete functions.
         
         See :class:`internals.GenericFnVisitor`.
         """
-        visitor = self._visitor = internals.GenericFnVisitor()
-        return visitor.visit(self.original_ast)
+        with compiler_lock:
+            annotated_ast = self._annotated_ast
+            if annotated_ast is None:
+                # not generated by another thread meanwhile
+                visitor = self._visitor = internals.GenericFnVisitor()
+                with profiling.phase(self, "annotate"):
+                    annotated_ast = self._annotated_ast = visitor.visit(
+                        self.original_ast)
+            return annotated_ast
+    
+    _annotated_ast = None
     
     @cypy.lazy(property)
     def arg_names(self):
@@ -132,17 +188,260 @@ class GenericFn(object):
     def name(self):
         """The function's name."""
         return self.annotated_ast.name
+    
+    @cypy.lazy(property)
+    def inference_graph(self):
+        """The dependencies between the local variables of this function, 
+        used for type inference.
+        
+        See :class:`internals.InferenceGraph`.
+        """
+        return internals.InferenceGraph(self)
+
+    globals = None
+    """The global namespace of the module this function was declared in, if
+    known. Set by :func:`fn` when given a Python function."""
+    
+    constants = cypy.frozendict()
+    """Names bound to constant values by :meth:`specialize`."""
+    
+    unspecialized = None
+    """The generic function that this one was specialized from, if any."""
+    
+    inline = None
+    """Whether calls to this function are inlined by an :class:`optimizer
+    <clq.optimize.Optimizer>` with the ``inline`` pass enabled: True to 
+    inline it regardless of its size, False never to inline it, or None 
+    (the default) to decide based on its size::
+    
+        @clq.fn
+        def helper(x):
+            ...
+        helper.inline = True
+    """
+    
+    fusion = None
+    """How this function was composed, if it was made by 
+    :func:`clq.fusion.fuse`."""
+    
+    def specialize(self, **constants):
+        """Returns a generic function with the named arguments bound to the 
+        provided constant values.
+        
+        Free variables that refer to numbers in :attr:`globals` are bound to 
+        their current values as well.
+        
+        The values are substituted into a copy of the syntax tree as 
+        literals, so type inference, the optimizer and the backend treat 
+        them as if they had been written inline. Bound arguments are removed
+        from the argument list. Only ``int``, ``long``, ``float`` and 
+        ``bool`` values can be bound.
+        
+        Specializations are cached by their bound values, so binding the 
+        same values again returns the same generic function (and so the same
+        concrete functions). If nothing is bound, returns this function.
+        """
+        with compiler_lock:
+            return self._specialize(constants)
+    
+    def _specialize(self, constants):
+        globals = self.globals
+        if globals is not None:
+            for name in self.annotated_ast.free_variables:
+                if name not in constants:
+                    value = globals.get(name, None)
+                    if _is_constant(value):
+                        constants[name] = value
+        if not constants:
+            return self
+        
+        key = tuple(sorted((name, type(value), value) 
+                           for name, value in constants.iteritems()))
+        specializations = self._specializations
+        try:
+            return specializations[key]
+        except KeyError:
+            pass
+        
+        arg_names = self.arg_names
+        free_variables = () if globals is None else \
+            self.annotated_ast.free_variables
+        for name, value in constants.iteritems():
+            if name not in arg_names and name not in free_variables:
+                raise Error("%s has no argument named %s." % 
+                            (self.__name__, name))
+            if not _is_constant(value):
+                raise Error(
+                    "Cannot bind %s to %r: constants must be finite numbers." % 
+                    (name, value))
+            if isinstance(value, bool):
+                constants[name] = int(value)
+
+        ast = internals.ConstantSubstitution(constants).visit(
+            self.original_ast)
+        generic_fn = specializations[key] = GenericFn(ast)
+        generic_fn.constants = cypy.frozendict(constants)
+        generic_fn.unspecialized = self
+        return generic_fn
+    
+    @cypy.lazy(property)
+    def _specializations(self):
+        return { }
 
-    def compile(self, target, *arg_types):
+    def compile(self, target, *arg_types, **constants):
         """Creates a :class:`concrete function <ConcreteFn>` with the provided
-        argument types."""
-        return ConcreteFn(self, arg_types, target)
+        argument types.
+        
+        Arguments can instead be bound to constant values by keyword, in 
+        which case ``arg_types`` gives the types of the remaining arguments, 
+        in order. See :meth:`specialize`.
+        """
+        # held across both steps so that concurrent compiles of the same 
+        # signature produce the same interned objects
+        with compiler_lock:
+            generic_fn = self.specialize(**constants)
+            return ConcreteFn(generic_fn, arg_types, target)
+    
+    def compile_async(self, target, *arg_types, **constants):
+        """Like :meth:`compile`, but specializes this function in the 
+        background on :data:`clq.futures.compile_executor`. Returns a 
+        :class:`future <clq.futures.Future>` of the concrete function, which
+        is done once its program items have been generated."""
+        import clq.futures
+        def compile():
+            concrete_fn = self.compile(target, *arg_types, **constants)
+            concrete_fn.program_items
+            return concrete_fn
+        return clq.futures.compile_executor.submit(compile)
+    
+    def compile_many(self, target, arg_types_seq, processes=None):
+        """Creates a :class:`concrete function <ConcreteFn>` for each tuple of
+        argument types in ``arg_types_seq``, specializing them in parallel 
+        over a pool of worker processes.
+        
+        The program items produced by the workers are sent back to this 
+        process and added to ``target.program_items`` in the order given by
+        ``arg_types_seq``, regardless of the order in which the workers 
+        finish. Returns a tuple of concrete functions in the same order.
+        
+        The :attr:`return types <ConcreteFn.return_type>` are sent back as 
+        well, if the backend can look them up by name (see 
+        :meth:`Backend.type_named`). Other attributes of the concrete 
+        functions, such as their :attr:`typed_ast <ConcreteFn.typed_ast>`, 
+        are computed in this process when first needed.
+        
+        ``processes``
+            The number of worker processes. Defaults to the number of CPUs. 
+            If 1, everything is compiled in this process.
+        
+        .. Note:: Workers are forked from this process, so this relies on 
+                  the ``fork`` start method available on Unix-like systems.
+                  A specialization that fails in a worker is compiled again 
+                  in this process, so that errors are raised here as usual.
+        """
+        concrete_fns = tuple(self.compile(target, *arg_types)
+                             for arg_types in arg_types_seq)
+        pending = cypy.SetList()
+        pending.extend(concrete_fn for concrete_fn in concrete_fns
+                       if concrete_fn._program_items_entry is None)
+        
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        processes = min(processes, len(pending))
+        if processes > 1:
+            results = _compile_in_pool(pending, processes)
+            for concrete_fn, result in zip(pending, results):
+                if result is not None:
+                    program_items = tuple(ProgramItem(name, code) 
+                                          for name, code in result[0])
+                    program_item = program_items[result[1]]
+                    return_type = target.type_named(result[2])
+                    if return_type is not None:
+                        concrete_fn._return_type = return_type
+                    target.add_concrete_fn(concrete_fn, program_item)
+                    concrete_fn._program_items_entry = (program_items, 
+                                                        program_item)
+                    target.add_program_items(program_items)
+                else:
+                    concrete_fn.program_items
+        else:
+            for concrete_fn in pending:
+                concrete_fn.program_items
+                
+        return concrete_fns
         
     @cypy.lazy(property)
     def cl_type(self):
         return self.Type(self)
 cypy.intern(GenericFn)
 
+def _is_constant(value):
+    """Returns whether ``value`` can be bound as a constant."""
+    if isinstance(value, float):
+        return value - value == 0.0 # finite
+    return isinstance(value, (int, long))
+
+def _compile_in_pool(concrete_fns, processes):
+    # imported here since it is slow to import and rarely needed
+    import multiprocessing
+    # Held while the workers are forked, so that they do not inherit the lock
+    # held by another thread (e.g. compile_executor's), which would never be 
+    # released in them. The workers are forked by this thread, so they own 
+    # their copy and can acquire it again. The concrete functions are passed
+    # to the initializer, which the forked workers inherit without pickling,
+    # so only indices need to be sent to them.
+    with compiler_lock:
+        pool = multiprocessing.Pool(processes, _init_compile_many_worker, 
+                                    (concrete_fns,))
+    try:
+        return pool.map(_compile_many_worker, xrange(len(concrete_fns)))
+    finally:
+        pool.close()
+        pool.join()
+
+# the concrete functions being compiled, in a compile_many worker process only
+_compile_many_jobs = None
+
+def _init_compile_many_worker(concrete_fns):
+    global _compile_many_jobs
+    _compile_many_jobs = concrete_fns
+        
+def _compile_many_worker(idx):
+    concrete_fn = _compile_many_jobs[idx]
+    try:
+        program_items = concrete_fn.program_items
+        program_item = concrete_fn.program_item
+        return_type = concrete_fn.return_type
+    except Exception:
+        # recompiled by the parent to report the error
+        return None
+    # types are sent by name, since unpickled copies would not be the 
+    # parent's (interned) types
+    return (tuple((item.name, item.code) for item in program_items),
+            program_items.index(program_item), return_type.name)
+
+def _mangle_constant(value):
+    """Returns a representation of a constant that can appear in an 
+    identifier, e.g. ``m2p5`` for -2.5."""
+    code = repr(value).rstrip("L")
+    return code.replace("-", "m").replace(".", "p").replace("+", "")
+
+def _mangle_identifier(name):
+    """Returns ``name`` with ``*`` spelled ``p`` and other characters that 
+    cannot appear in identifiers replaced by single underscores, without a 
+    double underscore or an underscore at either end."""
+    name = _re.sub(r"\W+|_{2,}", "_", name.replace("*", "p"))
+    return name.strip("_")
+
+def _mangle_fn_type(name, clq_type):
+    """Returns the mangled name of the type of a generic or concrete function
+    named ``name``: the name followed by a digest of the function's :func:`
+    cache key <clq.cache.type_key>`, which tells apart different functions 
+    of the same name."""
+    digest = _hashlib.sha1(cache.type_key(clq_type)).hexdigest()[:8]
+    return "%s_%s" % (_mangle_identifier(name), digest)
+
 class ConcreteFn(object):
     """A concrete function is made from a generic function by binding the 
     arguments to concrete types.
@@ -186,25 +485,88 @@ class ConcreteFn(object):
         
     @cypy.lazy(property)
     def typed_ast(self):
-        """The typed abstract syntax tree for this function."""
-        backend = self.backend
-        visitor = self._visitor = internals.ConcreteFnVisitor(self, backend)
-        return visitor.visit(self._generic_fn.annotated_ast)
+        """The typed abstract syntax tree for this function. 
+        
+        The code and type of each expression are in ``typed_ast.context.typed``,
+        indexed by :attr:`ir.Node.index <clq.ir.Node.index>`."""
+        with compiler_lock:
+            typed_ast = self._typed_ast
+            if typed_ast is None:
+                # not generated by another thread meanwhile
+                backend = self.backend
+                annotated_ast = self._generic_fn.annotated_ast
+                visitor = self._visitor = internals.ConcreteFnVisitor(
+                    self, backend)
+                with profiling.phase(self, "generate"):
+                    typed_ast = self._typed_ast = visitor.visit(annotated_ast)
+            return typed_ast
+    
+    _typed_ast = None
+    
+    def _get_program_items_entry(self):
+        """Returns a pair ``(program_items, program_item)`` for this function.
+        
+        The pair is loaded from the :mod:`persistent cache <clq.cache>` if 
+        one is active, or produced by compiling this function otherwise (and 
+        then stored in the cache, if active).
+        """
+        entry = self._program_items_entry
+        if entry is not None:
+            return entry
+        
+        with compiler_lock:
+            return self._load_program_items_entry()
+        
+    def _load_program_items_entry(self):
+        entry = self._program_items_entry
+        if entry is not None:
+            # compiled by another thread meanwhile
+            return entry
+        
+        program_item_cache = cache.active
+        if program_item_cache is not None:
+            entry = program_item_cache.load(self)
+            if entry is not None:
+                self.backend.add_program_items(entry[0])
+                
+        if entry is None:
+            context = self.typed_ast.context
+            entry = (tuple(context.program_items), context.program_item)
+            if program_item_cache is not None:
+                program_item_cache.store(self, *entry)
+        
+        self.backend.add_concrete_fn(self, entry[1])
+        self._program_items_entry = entry
+        return entry
+    
+    _program_items_entry = None
     
     @cypy.lazy(property)
     def program_items(self):
         """A list of all program items needed by this concrete function."""
-        return tuple(self.typed_ast.context.program_items)
+        return self._get_program_items_entry()[0]
     
     @cypy.lazy(property)
     def program_item(self):
         """The program item corresponding to this function."""
-        return self.typed_ast.context.program_item
+        return self._get_program_items_entry()[1]
+    
+    @cypy.lazy(property)
+    def optimizations(self):
+        """The :class:`changes <clq.optimize.Change>` made by the backend's 
+        :attr:`optimizer <Backend.optimizer>` to this function, if any."""
+        return self.typed_ast.context.optimizations
     
     @cypy.lazy(property)
     def return_type(self):
         """The return type of this function."""
-        return self.typed_ast.context.return_type
+        return_type = self._return_type
+        if return_type is None:
+            return_type = self.typed_ast.context.return_type
+        return return_type
+    
+    # set by compile_many when received from a worker
+    _return_type = None
     
     @cypy.lazy(property)
     def name(self):
@@ -227,6 +589,18 @@ class Type(object):
     def __repr__(self):
         return str(self)
     
+    @cypy.lazy(property)
+    def mangled_name(self):
+        """The name of this type as it appears in :meth:`mangled 
+        <Backend.mangle>` function names.
+        
+        By default, the name with ``*`` spelled ``p`` and other characters 
+        that cannot appear in identifiers replaced by underscores, e.g. 
+        ``global_floatp`` for ``__global float*``. Must not contain a double
+        underscore or end with an underscore.
+        """
+        return _mangle_identifier(self.name)
+    
     def observe(self, context, node):
         """Called when this type has been assigned to an expression, given by 
         ``node``."""
@@ -302,6 +676,15 @@ class Type(object):
             "Type '%s' does not support the call operation." % 
             self.name, node.func)
         
+    def effects_Call(self, context, node):
+        """Describes the side effects of a call to a value of this type: 
+        None if it neither reads nor writes memory, "read" if it only reads 
+        memory and "write" otherwise. 
+        
+        Used by the :mod:`optimizer <clq.optimize>`. The default, "write", 
+        is always safe."""
+        return "write"
+        
     def validate_Return(self, context, node):
         raise TypeResolutionError(
             "Type '%s' does not support the 'return' statement." % 
@@ -383,29 +766,31 @@ class VirtualType(Type):
     """Designates a type that does not have a concrete representation (e.g. 
     singleton function types)."""
 
-def _generic_generate_Call(context, node):
+def _generic_generate_Call(context, node, func_code=None):
     arg_types = tuple(arg.unresolved_type.resolve(context)
                       for arg in node.args)
     args = tuple(context.visit(arg)
                  for i, arg in enumerate(node.args)
                  if not isinstance(arg_types[i], VirtualType))
     func = context.visit(node.func)
+    if func_code is None:
+        func_code = func.code
     
-    code = (func.code, "(",
+    code = (func_code, "(",
             cypy.join((arg.code for arg in args), ", "),
             ")")
     
-    return astx.copy_node(node,
-        args=args,
-        func=func,
-        
-        code=code) 
+    return ir.Typed(node, code)
 
 class GenericFnType(VirtualType):
     """Each generic function uniquely inhabits a GenericFnType."""
     def __init__(self, generic_fn):
         VirtualType.__init__(self, generic_fn.name)
         self.generic_fn = generic_fn
+    
+    @property
+    def mangled_name(self):
+        return _mangle_fn_type(self.generic_fn.name, self)
          
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
@@ -414,11 +799,11 @@ class GenericFnType(VirtualType):
         return concrete_fn.return_type
     
     def generate_Call(self, context, node):
-        r = _generic_generate_Call(context, node)
         arg_types = tuple(arg.unresolved_type.resolve(context)
                           for arg in node.args)
         concrete_fn = self.generic_fn.compile(context.backend, *arg_types)
-        cypy.extend_front(context.program_items, concrete_fn.program_items)
+        r = _generic_generate_Call(context, node, concrete_fn.name)
+        context.program_items.extend_front(concrete_fn.program_items)
         return r
 
 cypy.intern(GenericFnType)
@@ -429,6 +814,10 @@ class ConcreteFnType(VirtualType):
     def __init__(self, concrete_fn):
         VirtualType.__init__(self, concrete_fn.name)
         self.concrete_fn = concrete_fn
+    
+    @property
+    def mangled_name(self):
+        return _mangle_fn_type(self.concrete_fn.generic_fn.name, self)
         
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
@@ -443,8 +832,9 @@ class ConcreteFnType(VirtualType):
         return concrete_fn.return_type
     
     def generate_Call(self, context, node):
-        r = _generic_generate_Call(context, node)
-        cypy.extend_front(context.program_items, self.concrete_fn.program_items)
+        concrete_fn = self.concrete_fn
+        r = _generic_generate_Call(context, node, concrete_fn.name)
+        context.program_items.extend_front(concrete_fn.program_items)
         return r
     
 cypy.intern(ConcreteFnType)
@@ -454,7 +844,10 @@ class Backend(object):
     """Abstract base class for a backend language specification."""
     def __init__(self, name):
         self.name = name
-        self.program_items = cypy.SetList([])
+        self.program_items = ProgramModule()
+        # weak, so that recording a function does not keep it alive
+        self._concrete_fns_by_name = _weakref.WeakValueDictionary()
+        self._program_item_keys = { }
         
     def init_context(self, context):
         """Initializes a :class:`context <Context>`."""
@@ -469,11 +862,116 @@ class Backend(object):
         """
         raise Error("Backend must provide a method to generate program items.")
     
+    program_items = None
+    """A :class:`ProgramModule` containing the items of every concrete 
+    function compiled for this backend. 
+    
+    To build only the items needed by particular functions, create a 
+    :class:`ProgramModule` from them instead.
+    """
+    
+    optimizer = None
+    """The :class:`Optimizer <clq.optimize.Optimizer>` applied to each 
+    concrete function before code is generated for it, or None (the 
+    default) to generate code that mirrors the source."""
+    
     def add_program_items(self, items):
         """Called to add the :class:`program items <ProgramItem>` generated
         by compiling a concrete function to the global list of program items."""
         self.program_items.extend(items)
         
+    mangle_names = False
+    """Whether each concrete function is given a :meth:`mangled <mangle>` 
+    name that includes its argument types, so that any number of 
+    specializations of a generic function can be built in one program::
+    
+        OpenCL.mangle_names = True
+        module = clq.ProgramModule((identity.compile(OpenCL, int),
+                                    identity.compile(OpenCL, float)))
+        program = module.build(ctx)
+        program.identity__3int(...)
+        
+    If False (the default), functions are named after their generic 
+    function, so its specializations cannot share a program."""
+    
+    def mangle(self, concrete_fn):
+        """Returns the mangled name of ``concrete_fn``: the name of its 
+        generic function and a double underscore, followed by the 
+        :attr:`mangled names <Type.mangled_name>` of its argument types and 
+        then, after an underscore, the constants bound by 
+        :meth:`GenericFn.specialize`, if any, as ``name_value`` (with the 
+        underscores in ``name`` spelled ``_1``). Each argument type and 
+        constant is preceded by its length, e.g. 
+        ``scale__13global_floatp5float_3n_4`` for ``scale`` specialized for
+        a ``__global float*`` and a ``float`` with ``n`` bound to 4.
+        
+        Names are deterministic, and distinct for distinct specializations, 
+        since none of the parts contains a double underscore. Functions 
+        passed as arguments are identified by their content as well as their
+        name.
+        """
+        generic_fn = concrete_fn.generic_fn
+        parts = [generic_fn.name, "__"]
+        parts.extend("%d%s" % (len(name), name) for name in
+                     (arg_type.mangled_name 
+                      for arg_type in concrete_fn.arg_types))
+        constants = { }
+        while generic_fn is not None:
+            constants.update(generic_fn.constants)
+            generic_fn = generic_fn.unspecialized
+        if constants:
+            parts.append("_")
+            parts.extend("%d%s" % (len(constant), constant) for constant in
+                         ("%s_%s" % (name.replace("_", "_1"), 
+                                     _mangle_constant(value))
+                          for name, value in sorted(constants.iteritems())))
+        return "".join(parts)
+    
+    def add_concrete_fn(self, concrete_fn, program_item):
+        """Called when the program items of a concrete function compiled 
+        for this backend become available, whether they were generated or 
+        loaded from the :mod:`cache <clq.cache>`, to record it for 
+        :meth:`demangle`.
+        
+        If :attr:`mangle_names` is set, raises an :class:`Error` if another
+        function with different code has the same name (e.g. a generic 
+        function with the same name declared in another module).
+        
+        Only a weak reference to ``concrete_fn`` is kept.
+        """
+        name = program_item.name
+        if self.mangle_names:
+            key = self._program_item_keys.setdefault(name, program_item.key)
+            if key != program_item.key:
+                other = self._concrete_fns_by_name.get(name, None)
+                raise Error("%s and %s were both given the name %s." % 
+                            (other.generic_fn.__name__ if other is not None
+                             else "Another function", 
+                             concrete_fn.generic_fn.__name__, name))
+        self._concrete_fns_by_name.setdefault(name, concrete_fn)
+    
+    def demangle(self, name):
+        """Returns the concrete function compiled for this backend with the 
+        provided name, e.g. to find the function corresponding to a kernel 
+        in a program built from a :class:`ProgramModule`.
+        
+        Unless :attr:`mangle_names` is set, specializations of a generic 
+        function share its name, and the first one compiled that is still 
+        alive is returned.
+        """
+        try:
+            return self._concrete_fns_by_name[name]
+        except KeyError:
+            raise Error("No function named %s has been compiled for %s." % 
+                        (name, self.name))
+        
+    def type_named(self, name):
+        """Returns the type of this backend with the provided ``name`` 
+        attribute, or None if it is not known (the default). Used by 
+        :meth:`GenericFn.compile_many` to receive the return types of 
+        functions compiled in other processes."""
+        return None
+        
     def void_type(self, context, node):
         raise TypeResolutionError(
             "Backend does not specify a void type.", node) 
@@ -550,11 +1048,21 @@ class Context(object):
         
         self.body = [ ]
         self.stmts = [ ]
-        self.program_items = cypy.SetList()
-                
-        # used to provide base case for resolving multiple assignments
-        self._resolving_name = None
-        self._multiple_assignment_prev = { }
+        self.program_items = ProgramModule()
+        
+        # node index => ir.Typed, for each expression generated
+        self.typed = [None] * self.generic_fn.annotated_ast.n_nodes
+        
+        # unresolved type => concrete type, see UnresolvedType.resolve
+        self.resolved_types = { }
+        self.inference = internals.TypeInference(self)
+        
+        # variable name => concrete type, for variables introduced by the 
+        # optimizer rather than the source
+        self.temporaries = { }
+        
+        # clq.optimize.Change, for each change made by the optimizer
+        self.optimizations = [ ]
         
         backend.init_context(self)
         
@@ -579,6 +1087,127 @@ class ProgramItem(object):
     
     code = None
     """The source code associated with this item."""
+    
+    @cypy.lazy(property)
+    def key(self):
+        """A hash of the name and code of this item.
+        
+        Items with the same key are interchangeable, so 
+        :class:`program modules <ProgramModule>` keep only one of them.
+        """
+        return _hashlib.sha1("%s\0%s" % (self.name, self.code)).hexdigest()
+
+class ProgramModule(object):
+    """An ordered collection of :class:`program items <ProgramItem>` that
+    can be built as a single program.
+    
+    Each item appears once, in the position it was first added, so items 
+    added in dependency order (as in :attr:`ConcreteFn.program_items`) stay 
+    in dependency order. Items are deduplicated by :attr:`ProgramItem.key`, 
+    so adding an item takes constant time regardless of the size of the 
+    module.
+    
+    A module only contains the items needed by the concrete functions added 
+    to it::
+    
+        module = clq.ProgramModule((sum_ff, sum_ii))
+        program = module.build(ctx)
+        program.sum_ff(...)
+    
+    Backends and contexts also collect program items this way (see 
+    :attr:`Backend.program_items`).
+    """
+    def __init__(self, concrete_fns=()):
+        self.concrete_fns = [ ]
+        self._items = [ ]
+        self._items_by_key = { }
+        self._programs = { }
+        for concrete_fn in concrete_fns:
+            self.add(concrete_fn)
+        
+    concrete_fns = None
+    """The concrete functions added with :meth:`add`."""
+    
+    def add(self, concrete_fn):
+        """Adds a concrete function and all of the items it depends on."""
+        self.extend(concrete_fn.program_items)
+        self.concrete_fns.append(concrete_fn)
+        
+    def append(self, item):
+        """Adds ``item`` at the end, unless an equivalent item is present."""
+        key = item.key
+        if key not in self._items_by_key:
+            self._items_by_key[key] = item
+            self._items.append(item)
+            
+    def extend(self, items):
+        """Appends each of the provided items, in order."""
+        for item in items:
+            self.append(item)
+            
+    def extend_front(self, items):
+        """Adds the provided items, in order, before all current items. 
+        Items already present stay where they are."""
+        items_by_key = self._items_by_key
+        new_items = [ ]
+        for item in items:
+            key = item.key
+            if key not in items_by_key:
+                items_by_key[key] = item
+                new_items.append(item)
+        self._items[0:0] = new_items
+        
+    def clear(self):
+        """Removes all items and concrete functions."""
+        del self.concrete_fns[:]
+        del self._items[:]
+        self._items_by_key.clear()
+        self._programs.clear()
+        
+    def __len__(self):
+        return len(self._items)
+    
+    def __iter__(self):
+        return iter(self._items)
+    
+    def __getitem__(self, idx):
+        return self._items[idx]
+    
+    def __contains__(self, item):
+        return item.key in self._items_by_key
+    
+    def index(self, item):
+        """Returns the position of the item equivalent to ``item``."""
+        return self._items.index(self._items_by_key[item.key])
+    
+    @property
+    def code(self):
+        """The source code of all of the items, in order."""
+        return "\n\n".join(item.code for item in self._items)
+    
+    def build(self, ctx, options=""):
+        """Returns a program built from :attr:`code` by ``ctx.compile`` (e.g.
+        a :class:`pyocl.Context <clq.backends.opencl.pyocl.Context>`).
+        
+        The program is built once per context and set of options, and built 
+        again only if items have been added since.
+        """
+        key = (ctx, options if isinstance(options, basestring) 
+                    else tuple(options))
+        n_items, program = self._programs.get(key, (None, None))
+        if n_items != len(self._items):
+            program = ctx.compile(self.code, options)
+            self._programs[key] = (len(self._items), program)
+        return program
+    
+    def build_async(self, ctx, options=""):
+        """Like :meth:`build`, but builds the program in the background on 
+        :data:`clq.futures.build_executor`. Returns a :class:`future 
+        <clq.futures.ProgramFuture>` of the program, whose kernels can be 
+        looked up as attributes, waiting only once one is needed."""
+        import clq.futures
+        return clq.futures.build_executor.run(clq.futures.ProgramFuture(),
+                                              self.build, ctx, options)
 
 class Error(Exception):
     """Base class for errors in cl.oquence."""
@@ -605,4 +1234,8 @@ class CodeGenerationError(Error):
         self.node = node
 
 # placed at the end because the internals use the definitions above
+import profiling
+import ir
 import internals 
+import optimize
+import cache
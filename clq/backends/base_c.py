@@ -5,7 +5,7 @@ import cypy.astx as astx
 import cypy.cg as cg
 
 import clq
-from clq import TypeResolutionError
+from clq import TypeResolutionError, ir
 
 class Backend(clq.Backend):
     """A backend that centralizes logic common to C-based languages."""
@@ -21,7 +21,7 @@ class Backend(clq.Backend):
     ## Generating Program Items
     ######################################################################
     def generate_program_item(self, context):
-        g = cg.CG()
+        g = cg.RopeCG()
         g.append(cypy.join(cypy.cons(context.modifiers, 
                                      (context.return_type.name,)), " "))
         name = self._generate_name(context)
@@ -41,8 +41,10 @@ class Backend(clq.Backend):
                 yield (arg_type.name, " ", arg_name)
     
     def _generate_name(self, context):
-        # TODO: proper namespacing
-        return context.concrete_fn.generic_fn.name
+        concrete_fn = context.concrete_fn
+        if self.mangle_names:
+            return self.mangle(concrete_fn)
+        return concrete_fn.generic_fn.name
     
     def _add_declaration(self, context, id, type):
         decl = type.name + " " + id + ";"
@@ -73,11 +75,11 @@ class Backend(clq.Backend):
             return self.float_t
         
     def generate_Num(self, context, node):
-        code = str(node.n)
+        n = node.n
+        # repr, unlike str, does not round floats
+        code = repr(n) if isinstance(n, float) else str(n)
         
-        return astx.copy_node(node,
-            code = code                  
-        )
+        return ir.Typed(node, code)
 
     int_t = None
     float_t = None
@@ -88,8 +90,7 @@ class Backend(clq.Backend):
     def generate_Str(self, context, node):
         code = cypy.string_escape(node.s)
         
-        return astx.copy_node(node,
-            code = code)
+        return ir.Typed(node, code)
     
     string_t = None
     
@@ -103,60 +104,47 @@ class Backend(clq.Backend):
         
         context.end_stmt = "; "
         context.visit(node.init)
-        init = context.body.pop()
+        context.body.pop()
         
         guard = context.visit(node.guard)
         context.stmts.append((guard.code, "; "))
          
         context.end_stmt = (") {\n", context.tab)
         context.visit(node.update_stmt)
-        update_stmt = context.body.pop()
+        context.body.pop()
         
         context.end_stmt = orig_end_stmt
         
         parent_body = context.body
-        body = context.body = [ ]
+        context.body = [ ]
         for stmt in node.body:
             context.visit(stmt)
         context.body = parent_body
         
         context.stmts.append((context.untab, "}\n"))
         
-        context.body.append(astx.copy_node(node,
-            target=astx.deep_copy_node(node.target),
-            iter=astx.copy_node(node.iter),
-            body=body,
-            orelse=[],
-            
-            init=init,
-            guard=guard,
-            update_stmt=update_stmt
-        ))
+        context.body.append(ir.Typed(node))
     
     def generate_While(self, context, node):
         test = context.visit(node.test)
         context.stmts.append(("while (", test.code, ") {\n", context.tab))
         
         parent_body = context.body
-        body = context.body = [ ]
+        context.body = [ ]
         for stmt in node.body:
             context.visit(stmt)
         context.body = parent_body
         
         context.stmts.append((context.untab, "}\n"))
         
-        context.body.append(astx.copy_node(node,
-            test=test,
-            body=body,
-            orelse=[]
-        ))
+        context.body.append(ir.Typed(node))
                             
     def generate_If(self, context, node):
         test = context.visit(node.test)
         context.stmts.append(("if (", test.code, ") {\n", context.tab))
         
         parent_body = context.body
-        body = context.body = [ ]
+        context.body = [ ]
         for stmt in node.body:
             context.visit(stmt)
         context.body = parent_body
@@ -165,61 +153,50 @@ class Backend(clq.Backend):
         num_else = len(orelse)
         if num_else == 0:
             context.stmts.append((context.untab, "}\n"))
-            new_orelse = [ ]
         elif num_else == 1:
             context.stmts.append((context.untab, 
                                   "} else ", 
                                   context.tab))
-            new_orelse = [context.visit(orelse[0])]
+            context.visit(orelse[0])
             context.stmts.append(context.untab)
         else:
             context.stmts.append((context.untab,
                                   "} else {\n", context.tab))
-            new_orelse = context.body = [ ]
+            context.body = [ ]
             for stmt in orelse:
                 context.visit(stmt)
             context.body = parent_body
             context.stmts.append((context.untab, "}\n"))
             
-        context.body.append(astx.copy_node(node,
-            test=test,
-            body=body,
-            orelse=new_orelse
-        ))
+        context.body.append(ir.Typed(node))
         
     def generate_Expr(self, context, node):
         value = context.visit(node.value)
         context.stmts.append((value.code, context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            value=value
-        ))
+        context.body.append(ir.Typed(node))
         
     def generate_Pass(self, context, node):
         context.stmts.append(context.end_stmt)
-        context.body.append(astx.copy_node(node))
+        context.body.append(ir.Typed(node))
         
     def generate_Break(self, context, node):
         context.stmts.append(("break", context.end_stmt))
-        context.body.append(astx.copy_node(node))
+        context.body.append(ir.Typed(node))
         
     def generate_Continue(self, context, node):
         context.stmts.append(("continue", context.end_stmt))
-        context.body.append(astx.copy_node(node))
+        context.body.append(ir.Typed(node))
         
     def generate_Exec(self, context, node):
         body = node.body
         context.stmts.append((body.s, "\n"))
-        context.body.append(astx.copy_node(node,
-            body=astx.copy_node(body),
-            globals=[],
-            locals=[]
-        ))
+        context.body.append(ir.Typed(node))
     
     ######################################################################
     ## Operator Expressions
     ######################################################################
     def generate_op(self, context, op):
-        return astx.copy_node(op, code=astx.C_all_operators[type(op)])
+        return ir.Typed(op, astx.C_all_operators[type(op)])
 
     ######################################################################
     ## Other Expressions
@@ -233,13 +210,7 @@ class Backend(clq.Backend):
                       body.code, ") : (",
                       orelse.code, ")")
                 
-        return astx.copy_node(node,
-            test=test,
-            body=body,
-            orelse=orelse,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
         
 class Type(clq.Type):
         
@@ -259,9 +230,7 @@ class Type(clq.Type):
             context.stmts.append((self.generate_Return_stmt(value.code), 
                                   context.end_stmt))
                     
-        context.body.append(astx.copy_node(node,
-            value=value
-        ))
+        context.body.append(ir.Typed(node))
         
     @classmethod
     def generate_Return_stmt(cls, value_code):
@@ -283,14 +252,14 @@ class Type(clq.Type):
         if id in local_variables:
             context.backend._add_declaration(context, 
                 id, local_variables[id].resolve(context))
+        elif id in context.temporaries:
+            context.backend._add_declaration(context,
+                id, context.temporaries[id])
 
         context.stmts.append((self.generate_Assign_stmt(target.code, 
                                                         value.code), 
                               context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            targets=[target],
-            value=value
-        ))
+        context.body.append(ir.Typed(node))
                 
     @classmethod
     def generate_Assign_stmt(cls, target_code, value_code):
@@ -337,12 +306,7 @@ class BoolType(Type):
         
         code = ("(", left.code, " ", op.code, " ", right.code, ")")
         
-        return astx.copy_node(node,
-            op=op,
-            values=[left, right],
-            
-            code=code
-        )
+        return ir.Typed(node, code)
         
     def resolve_UnaryOp(self, context, node):
         if isinstance(node.op, _ast.Not):
@@ -357,12 +321,7 @@ class BoolType(Type):
         operand = context.visit(node.operand)
         
         code = ("(", op.code, "(", operand.code, "))")
-        return astx.copy_node(node,
-            op=op,
-            operand=operand,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
     
 class ScalarType(Type):
     min = None
@@ -418,19 +377,13 @@ class ScalarType(Type):
         
         code = (left.code, " ", op.code, " ", right.code)
         
-        return astx.copy_node(node,
-            left=left,
-            ops=[op],
-            comparators=[right],
-            
-            code=code
-        )
+        return ir.Typed(node, code)
 
 class StrType(ScalarType):
     def resolve_BinOp(self,context,node):
         right_type = node.right.unresolved_type.resolve(context)
         try:
-            return self._resolve_BinOp(node.op, right_type, context.backend)
+            return self._resolve_BinOp(type(node.op), right_type, context.backend)
         except TypeResolutionError as e:
             if e.node is None:
                 e.node = node
@@ -451,13 +404,7 @@ class StrType(ScalarType):
         #TODO: generate include?
         code = ("strcat(" , left.code , "," , right.code , ")")
         
-        return astx.copy_node(node,
-            left=left,
-            op=op,
-            right=right,
-            
-            code=code
-       )
+        return ir.Typed(node, code)
 
     def string_type(self):
         return string_t
@@ -499,22 +446,19 @@ class IntegerType(ScalarType):
         
         code = ("(", op.code, "(", operand.code, "))")
         
-        return astx.copy_node(node,
-            op=op,
-            operand=operand,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
          
     def resolve_BinOp(self, context, node):
         right_type = node.right.unresolved_type.resolve(context)
         try:
-            return self._resolve_BinOp(node.op, right_type, context.backend)
+            return self._resolve_BinOp(type(node.op), right_type, context.backend)
         except TypeResolutionError as e:
             if e.node is None:
                 e.node = node
             raise e
         
+    # op is the operator's class rather than the node, so the memo table is
+    # bounded by the number of type and operator combinations
     @cypy.memoize
     def _resolve_BinOp(self, op, right_type, backend):        
         if isinstance(right_type, FloatType):
@@ -551,7 +495,7 @@ class IntegerType(ScalarType):
                         return right_type
                     
         # pointer arithmetic
-        elif isinstance(right_type, PtrType) and isinstance(op, _ast.Add):
+        elif isinstance(right_type, PtrType) and issubclass(op, _ast.Add):
             return right_type
     
     def generate_BinOp(self, context, node):
@@ -562,13 +506,7 @@ class IntegerType(ScalarType):
         
         code = ("(", left.code, " ", op.code, " ", right.code, ")")
         
-        return astx.copy_node(node,
-            left=left,
-            op=op,
-            right=right,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
     
     def resolve_MultipleAssignment(self, context, prev, new, node):
         new_type = new.resolve(context)
@@ -605,7 +543,9 @@ class IntegerType(ScalarType):
     
     def validate_AugAssign(self, context, node):
         # TODO: Need to check value too right?
-        context.concrete_fn.generic_fn.local_variables[node.target.id].resolve(context)
+        id = node.target.id
+        if id not in context.temporaries:
+            context.concrete_fn.generic_fn.local_variables[id].resolve(context)
 
     def generate_AugAssign(self, context, node):
         target = context.visit(node.target)
@@ -618,6 +558,9 @@ class IntegerType(ScalarType):
         if id in local_variables:
             context.backend._add_declaration(context, 
                 id, local_variables[id].resolve(context))
+        elif id in context.temporaries:
+            context.backend._add_declaration(context,
+                id, context.temporaries[id])
 
         # add code        
         context.stmts.append((self.generate_AugAssign_stmt(
@@ -627,11 +570,7 @@ class IntegerType(ScalarType):
         ), context.end_stmt))
         
         # add node
-        context.body.append(astx.copy_node(node,
-            target=target,
-            value=value,
-            op=op
-        ))
+        context.body.append(ir.Typed(node))
             
     #def resolve_Call(self, context, node):
         # TODO: implement this
@@ -664,17 +603,12 @@ class FloatType(ScalarType):
         
         code = ("(", op.code, operand.code, ")")
         
-        return astx.copy_node(node,
-            op=op,
-            operand=operand,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
         
     def resolve_BinOp(self, context, node):
         right_type = node.right.unresolved_type.resolve(context)
         try:
-            return self._resolve_BinOp(node.op, right_type, context.backend)
+            return self._resolve_BinOp(type(node.op), right_type, context.backend)
         except TypeResolutionError as e:
             if e.node is None:
                 e.node = node
@@ -707,13 +641,7 @@ class FloatType(ScalarType):
         
         code = ("(", left.code, " ", op.code, " ", right.code, ")")
         
-        return astx.copy_node(node,
-            left=left,
-            op=op,
-            right=right,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
         
     def resolve_MultipleAssignment(self, context, prev, new, node):
         new_type = new.resolve(context)
@@ -742,7 +670,9 @@ class FloatType(ScalarType):
             
     def validate_AugAssign(self, context, node):
         # TODO: Need to check value too right?
-        context.concrete_fn.generic_fn.local_variables[node.target.id].resolve(context)
+        id = node.target.id
+        if id not in context.temporaries:
+            context.concrete_fn.generic_fn.local_variables[id].resolve(context)
     
     def generate_AugAssign(self, context, node):
         target = context.visit(node.target)
@@ -756,6 +686,9 @@ class FloatType(ScalarType):
         if id in local_variables:
             context.backend._add_declaration(context,
                 id, local_variables[id].resolve(context))
+        elif id in context.temporaries:
+            context.backend._add_declaration(context,
+                id, context.temporaries[id])
             
         # add code
         context.stmts.append((self.generate_AugAssign_stmt(
@@ -764,11 +697,7 @@ class FloatType(ScalarType):
             value.code), context.end_stmt))
         
         # add node
-        context.body.append(astx.copy_node(node,
-            target=target,
-            value=value,
-            op=op
-        ))
+        context.body.append(ir.Typed(node))
         
     #def resolve_Call(self, context, node):
         # TODO: implement this
@@ -805,13 +734,7 @@ class PtrType(Type):
         
         code = ("(", left.code, " ", op.code, " ", right.code, ")")
         
-        return astx.copy_node(node,
-            left=left,
-            op=op,
-            right=right,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
 
     #def resolve_BinOp(self, context, node):
         # TODO: implement this
@@ -840,12 +763,7 @@ class PtrType(Type):
         
         code = (value.code, "[", slice.code, "]")
         
-        return astx.copy_node(node,
-            value=value,
-            slice=slice,
-            
-            code=code
-        )
+        return ir.Typed(node, code)
             
     def validate_AssignSubscript(self, context, node):
         # TODO: implement this
@@ -855,17 +773,14 @@ class PtrType(Type):
     def generate_AssignSubscript(self, context, node):
         target = context.visit(node.targets[0])        
         value = context.visit(node.value)
-        context.stmts.append((self.generate_Assign_stmt(target.code, value.code), 
+        context.stmts.append((self.generate_Assign_stmt(target.code, value.code),
                               context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            targets=[target],
-            value=value
-        ))       
-    
+        context.body.append(ir.Typed(node))
+
     def validate_AugAssignSubscript(self, context, node):
         # TODO: implement this
         return True
-    
+
     def generate_AugAssignSubscript(self, context, node):
         target = context.visit(node.target)
         value = context.visit(node.value)
@@ -875,12 +790,8 @@ class PtrType(Type):
             op.code,
             value.code
         ), context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            target=target,
-            value=value,
-            op=op
-        ))
-    
+        context.body.append(ir.Typed(node))
+
 class StructureType(Type):
     signature = None
     """Structure signature."""
@@ -902,10 +813,7 @@ class StructureType(Type):
         value = context.visit(node.value)
         context.stmts.append((self.generate_Assign_stmt(target.code, value.code), 
                               context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            targets=[target],
-            value=value
-        ))
+        context.body.append(ir.Typed(node))
             
     #def validate_AugAssignAttribute(self, context, node):
         # TODO: implement this
@@ -920,11 +828,7 @@ class StructureType(Type):
             op.code,
             value.code
         ), context.end_stmt))
-        context.body.append(astx.copy_node(node,
-            target=target,
-            value=value,
-            op=op
-        ))
+        context.body.append(ir.Typed(node))
         
 keywords = (
     "auto",
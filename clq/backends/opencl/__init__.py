@@ -1,9 +1,10 @@
 import ast as _ast
+import re as _re
 
 import cypy
 import cypy.astx as astx
 import clq
-from clq import TypeResolutionError
+from clq import TypeResolutionError, ir
 import clq.backends.base_c as base_c
 
 _globals = globals() # used to create lists of types below
@@ -15,9 +16,43 @@ class Type(base_c.Type):
     def sizeof_for(self, device):
         # TODO: Implement this
         return self.max_sizeof
+    
+    @cypy.lazy(property)
+    def cl_type(self):
+        """The :class:`type <TypeType>` of this type, so that it can be 
+        passed to a function to construct values of this type."""
+        return TypeType(self)
+    
+    @property
+    def ptr(self):
+        """The same as ``ptr_private``: pointers without an address space 
+        qualifier point to private memory."""
+        return self.ptr_private
+    
+    @property
+    def ptr_local(self):
+        """The same as ``ptr_shared``."""
+        return self.ptr_shared
 
 class ScalarType(base_c.ScalarType, Type):
-    ptr = None
+    vector_types = None
+    """A map from sizes to the :class:`vector types <VectorType>` with this 
+    element type, or None if there are none."""
+    
+    _np_dtype_name = None
+    
+    @cypy.lazy(property)
+    def np_dtype(self):
+        """The corresponding numpy dtype, or None if there is none. 
+        
+        numpy is imported the first time this is needed rather than when this
+        module is imported.
+        """
+        name = self._np_dtype_name
+        if name is None:
+            return None
+        import numpy
+        return numpy.dtype(name)
     
     @cypy.lazy(property)
     def ptr_global(self):
@@ -34,10 +69,20 @@ class ScalarType(base_c.ScalarType, Type):
     @cypy.lazy(property)
     def ptr_constant(self):
         return ConstantPtrType(self)
+    
+    def resolve_Compare(self, context, node):
+        right_type = node.comparators[0].unresolved_type.resolve(context)
+        if isinstance(right_type, VectorType):
+            return right_type.resolve_Compare(context, node)
+        return base_c.ScalarType.resolve_Compare(self, context, node)
+    
+    def generate_Compare(self, context, node):
+        right_type = node.comparators[0].unresolved_type.resolve(context)
+        if isinstance(right_type, VectorType):
+            return right_type.generate_Compare(context, node)
+        return base_c.ScalarType.generate_Compare(self, context, node)
 
 class VoidType(base_c.VoidType, Type):
-    ptr = None
-    
     @cypy.lazy(property)
     def ptr_global(self):
         return GlobalPtrType(self)
@@ -57,8 +102,6 @@ class VoidType(base_c.VoidType, Type):
 void = VoidType()
 
 class BoolType(base_c.BoolType, Type):
-    ptr = None
-    
     @cypy.lazy(property)
     def ptr_global(self):
         return GlobalPtrType(self)
@@ -115,6 +158,17 @@ class IntegerType(base_c.IntegerType, ScalarType):
         unsigned.signed_variant = signed
         
         return signed, unsigned
+    
+    def _resolve_BinOp(self, op, right_type, backend):
+        if isinstance(right_type, VectorType):
+            return right_type._resolve_BinOp(op, self, backend)
+        return base_c.IntegerType._resolve_BinOp(self, op, right_type, backend)
+    
+    def generate_BinOp(self, context, node):
+        right_type = node.right.unresolved_type.resolve(context)
+        if isinstance(right_type, VectorType):
+            return right_type.generate_BinOp(context, node)
+        return base_c.IntegerType.generate_BinOp(self, context, node)
 
 # Machine-independent integers
 #===============================================================================
@@ -127,23 +181,14 @@ machine_independent_int_types = dict(
     (name, _globals[name]) for name in 
     ('char', 'uchar', 'short', 'ushort', 'int', 'uint', 'long', 'ulong'))
 
-try:
-    import numpy
-except ImportError:
-    pass
-else:
-    char.np_dtype = numpy.dtype('int8')
-    uchar.np_dtype = numpy.dtype('uint8')
-    short.np_dtype = numpy.dtype('int16')
-    ushort.np_dtype = numpy.dtype('uint16')
-    int.np_dtype = numpy.dtype('int32')
-    uint.np_dtype = numpy.dtype('uint32')
-    long.np_dtype = numpy.dtype('int64')
-    ulong.np_dtype = numpy.dtype('uint64')
-    
-    to_cl_type = { }
-    for cl_type in machine_independent_int_types.itervalues():
-        to_cl_type[cl_type.np_dtype] = cl_type
+char._np_dtype_name = 'int8'
+uchar._np_dtype_name = 'uint8'
+short._np_dtype_name = 'int16'
+ushort._np_dtype_name = 'uint16'
+int._np_dtype_name = 'int32'
+uint._np_dtype_name = 'uint32'
+long._np_dtype_name = 'int64'
+ulong._np_dtype_name = 'uint64'
 
 # Machine-dependent integers
 #===============================================================================
@@ -189,7 +234,16 @@ int_types = cypy.merge_dicts(machine_independent_int_types,
 # Floating-point numbers
 #===============================================================================
 class FloatType(base_c.FloatType, ScalarType):
-    pass
+    def _resolve_BinOp(self, op, right_type, backend):
+        if isinstance(right_type, VectorType):
+            return right_type._resolve_BinOp(op, self, backend)
+        return base_c.FloatType._resolve_BinOp(self, op, right_type, backend)
+    
+    def generate_BinOp(self, context, node):
+        right_type = node.right.unresolved_type.resolve(context)
+        if isinstance(right_type, VectorType):
+            return right_type.generate_BinOp(context, node)
+        return base_c.FloatType.generate_BinOp(self, context, node)
 
 half = FloatType("half")
 half.min_sizeof = half.max_sizeof = 2
@@ -203,19 +257,8 @@ double.min_sizeof = double.max_sizeof = 8
 float_types = dict((name, _globals[name]) for name in 
     ('half', 'float', 'double'))
 
-try:
-    import numpy
-except ImportError:
-    pass
-else:
-    half.np_dtype = None
-    float.np_dtype = numpy.dtype('float32')
-    double.np_dtype = numpy.dtype('float64')
-    
-    for cl_type in float_types.itervalues():
-        np_dtype = cl_type.np_dtype
-        if np_dtype is not None:
-            to_cl_type[np_dtype] = cl_type   
+float._np_dtype_name = 'float32'
+double._np_dtype_name = 'float64'
 
 scalar_types = cypy.merge_dicts(int_types,
                                 float_types)
@@ -224,11 +267,337 @@ scalar_types = cypy.merge_dicts(int_types,
 # Vector Types
 #===============================================================================
 vector_type_sizes = (2, 3, 4, 8, 16)
+"""The number of elements that vector types can have."""
 
 class VectorType(Type):
-    pass
+    """The type of OpenCL vectors of ``n`` elements of type ``base_type``
+    (e.g. ``float4``).
+    
+    Operators are applied element-wise. The other operand may be a vector of 
+    the same type or a scalar, which is converted to the element type, and
+    comparisons produce a vector of signed integers of the same size as the
+    elements (:attr:`comparison_type`). Components are accessed with 
+    ``v.x``, ``v.s0``, swizzles such as ``v.xy`` or ``v.s3210``, and 
+    ``v.lo``, ``v.hi``, ``v.even`` and ``v.odd``.
+    
+    Vectors are constructed by calling the type (passed to a function as 
+    ``float4.cl_type``, see :class:`TypeType`) with a single scalar, which is
+    copied to each element, or with scalars and vectors providing ``n`` 
+    elements in total.
+    """
+    def __init__(self, base_type, n):
+        Type.__init__(self, base_type.name + str(n))
+        self.base_type = base_type
+        self.n = n
+        # 3-element vectors are aligned and sized like 4-element vectors
+        padded_n = 4 if n == 3 else n
+        self.min_sizeof = base_type.min_sizeof * padded_n
+        self.max_sizeof = base_type.max_sizeof * padded_n
+        
+    base_type = None
+    """The type of the elements."""
+    
+    n = None
+    """The number of elements."""
+    
+    @cypy.lazy(property)
+    def ptr_global(self):
+        return GlobalPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_shared(self):
+        return SharedPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_private(self):
+        return PrivatePtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_constant(self):
+        return ConstantPtrType(self)
+    
+    @cypy.lazy(property)
+    def np_dtype(self):
+        """The corresponding numpy dtype, or None if there is none.
+        
+        The elements are the fields ``s0``, ``s1``, ..., which vectors of up
+        to 4 elements also title ``x``, ``y``, ``z`` and ``w``. The dtype of 
+        3-element vectors is padded to the size of 4 elements.
+        """
+        base_dtype = self.base_type.np_dtype
+        if base_dtype is None:
+            return None
+        import numpy
+        n = self.n
+        spec = {
+            'names': ['s%d' % i for i in xrange(n)],
+            'formats': [base_dtype] * n,
+            'itemsize': self.min_sizeof
+        }
+        if n <= 4:
+            spec['titles'] = list(_xyzw[:n])
+        return numpy.dtype(spec)
+    
+    @cypy.lazy(property)
+    def comparison_type(self):
+        """The type of the result of comparing vectors of this type."""
+        signed = _signed_int_types_by_sizeof[self.base_type.min_sizeof]
+        return signed.vector_types[self.n]
+    
+    @cypy.lazy(property)
+    def is_integer(self):
+        return isinstance(self.base_type, IntegerType)
+    
+    # Operators
+    def resolve_UnaryOp(self, context, node):
+        op = node.op
+        if isinstance(op, (_ast.USub, _ast.UAdd)) or \
+                (isinstance(op, _ast.Invert) and self.is_integer):
+            return self
+        raise TypeResolutionError(
+            "Invalid unary operation on operand of type '%s'." % 
+            self.name, node.operand)
+    
+    def generate_UnaryOp(self, context, node):
+        op = context.visit(node.op)
+        operand = context.visit(node.operand)
+        
+        code = ("(", op.code, "(", operand.code, "))")
+        return ir.Typed(node, code)
+    
+    def resolve_BinOp(self, context, node):
+        right_type = node.right.unresolved_type.resolve(context)
+        try:
+            return self._resolve_BinOp(type(node.op), right_type, 
+                                       context.backend)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
+    
+    # also used when the vector is the right operand, since the operators 
+    # accept the same types on either side
+    @cypy.memoize
+    def _resolve_BinOp(self, op, other_type, backend):
+        if op not in _vector_arithmetic_ops and (
+                op not in _vector_integer_ops or not self.is_integer):
+            raise TypeResolutionError(
+                "Invalid binary operation on vectors of type '%s'." % 
+                self.name, None)
+        if other_type is self or (isinstance(other_type, ScalarType) and
+                                  not isinstance(other_type, StrType)):
+            return self
+        raise TypeResolutionError(
+            "Invalid operands to a binary operation: '%s' and '%s'." % 
+            (self.name, other_type.name), None)
+        
+    # also used when the vector is the right operand
+    def generate_BinOp(self, context, node):
+        left = self._operand_code(context, node.left)
+        op = context.visit(node.op)
+        right = self._operand_code(context, node.right)
+        
+        code = ("(", left, " ", op.code, " ", right, ")")
+        
+        return ir.Typed(node, code)
+    
+    def _operand_code(self, context, operand):
+        """Returns the code for an operand of an operation on vectors of this 
+        type, casting scalars to the element type. OpenCL rejects scalars of 
+        a higher rank than the element type rather than converting them."""
+        operand = context.visit(operand)
+        clq_type = operand.clq_type
+        if isinstance(clq_type, ScalarType) and clq_type is not self.base_type:
+            return ("((", self.base_type.name, ")", operand.code, ")")
+        return operand.code
+    
+    def resolve_Compare(self, context, node):
+        left_type = node.left.unresolved_type.resolve(context)
+        right_type = node.comparators[0].unresolved_type.resolve(context)
+        other_type = right_type if left_type is self else left_type
+        if other_type is self or (isinstance(other_type, ScalarType) and
+                                  not isinstance(other_type, StrType)):
+            return self.comparison_type
+        raise TypeResolutionError(
+            "Cannot compare values of type '%s' and '%s'." % 
+            (left_type.name, right_type.name), node)
+    
+    # also used when the vector is the right operand
+    def generate_Compare(self, context, node):
+        left = self._operand_code(context, node.left)
+        right = self._operand_code(context, node.comparators[0])
+        op = context.visit(node.ops[0])
+        
+        code = ("(", left, " ", op.code, " ", right, ")")
+        
+        return ir.Typed(node, code)
+    
+    # Components
+    @cypy.memoize
+    def components(self, attr):
+        """Returns the indices of the elements selected by the component 
+        name or swizzle ``attr``, or None if it is invalid for this type."""
+        n = self.n
+        if attr in _halves:
+            # 3-element vectors are treated as 4-element vectors here
+            padded_n = 4 if n == 3 else n
+            half = padded_n // 2
+            return {
+                'lo': tuple(xrange(half)),
+                'hi': tuple(xrange(half, padded_n)),
+                'even': tuple(xrange(0, padded_n, 2)),
+                'odd': tuple(xrange(1, padded_n, 2))
+            }[attr]
+        
+        if attr[0] in 'sS' and len(attr) > 1:
+            digits = attr[1:].lower()
+            if not all(digit in _hex_digits for digit in digits):
+                return None
+            indices = tuple(_hex_digits.index(digit) for digit in digits)
+        elif n <= 4 and all(c in _xyzw for c in attr):
+            indices = tuple(_xyzw.index(c) for c in attr)
+        else:
+            return None
+        
+        if any(index >= n for index in indices):
+            return None
+        return indices
+    
+    def component_type(self, attr):
+        """Returns the type of the component or swizzle ``attr``."""
+        indices = self.components(attr)
+        if indices is None:
+            raise TypeResolutionError(
+                "'%s' is not a component of type '%s'." % (attr, self.name),
+                None)
+        n = len(indices)
+        if n == 1:
+            return self.base_type
+        try:
+            return self.base_type.vector_types[n]
+        except KeyError:
+            raise TypeResolutionError(
+                "Invalid number of components in '%s': %d." % (attr, n), None)
+    
+    def resolve_Attribute(self, context, node):
+        try:
+            return self.component_type(node.attr)
+        except TypeResolutionError as e:
+            e.node = node
+            raise e
+        
+    def generate_Attribute(self, context, node):
+        value = context.visit(node.value)
+        return ir.Typed(node, (value.code, ".", node.attr))
+    
+    def _validate_component_assignment(self, context, target, value):
+        attr = target.attr
+        try:
+            component_type = self.component_type(attr)
+        except TypeResolutionError as e:
+            e.node = target
+            raise e
+        indices = self.components(attr)
+        if len(set(indices)) != len(indices):
+            raise TypeResolutionError(
+                "Cannot assign to '%s': components are repeated." % attr, 
+                target)
+        value_type = value.unresolved_type.resolve(context)
+        if value_type is component_type or (
+                isinstance(value_type, ScalarType) and 
+                not isinstance(value_type, StrType)):
+            return
+        raise TypeResolutionError(
+            "Cannot assign a value of type '%s' to '%s' (of type '%s')." % 
+            (value_type.name, attr, component_type.name), value)
+    
+    def validate_AssignAttribute(self, context, node):
+        self._validate_component_assignment(context, node.targets[0], 
+                                            node.value)
+    
+    def generate_AssignAttribute(self, context, node):
+        target = context.visit(node.targets[0])
+        value = context.visit(node.value)
+        context.stmts.append((self.generate_Assign_stmt(target.code, 
+                                                        value.code), 
+                              context.end_stmt))
+        context.body.append(ir.Typed(node))
+    
+    def validate_AugAssignAttribute(self, context, node):
+        self._validate_component_assignment(context, node.target, node.value)
+    
+    def generate_AugAssignAttribute(self, context, node):
+        target = context.visit(node.target)
+        value = context.visit(node.value)
+        op = context.visit(node.op)
+        context.stmts.append((self.generate_AugAssign_stmt(
+            target.code,
+            op.code,
+            value.code
+        ), context.end_stmt))
+        context.body.append(ir.Typed(node))
+        
+    # Augmented assignment to a vector variable
+    def validate_AugAssign(self, context, node):
+        context.concrete_fn.generic_fn.local_variables[node.target.id].resolve(
+            context)
+        
+    def generate_AugAssign(self, context, node):
+        target = context.visit(node.target)
+        value = context.visit(node.value)
+        op = context.visit(node.op)
+        
+        # add declaration
+        id = target.id
+        local_variables = context.generic_fn.local_variables
+        if id in local_variables:
+            context.backend._add_declaration(context, 
+                id, local_variables[id].resolve(context))
+        
+        context.stmts.append((self.generate_AugAssign_stmt(
+            target.code,
+            op.code,
+            value.code
+        ), context.end_stmt))
+        context.body.append(ir.Typed(node))
+
+_xyzw = 'xyzw'
+_hex_digits = '0123456789abcdef'
+_halves = ('lo', 'hi', 'even', 'odd')
+_vector_arithmetic_ops = (_ast.Add, _ast.Sub, _ast.Mult, _ast.Div)
+_vector_integer_ops = (_ast.Mod, _ast.LShift, _ast.RShift, _ast.BitOr, 
+                       _ast.BitXor, _ast.BitAnd)
+_signed_int_types_by_sizeof = {1: char, 2: short, 4: int, 8: long}
 
 vector_types = { }
+"""A map from names to vector types.
+
+The vector types are also available as attributes of this module (e.g. 
+``float4``) and by size from the ``vector_types`` attribute of their element 
+type (e.g. ``float.vector_types[4]``)."""
+
+def _make_vector_types():
+    for base_type in cypy.cons(machine_independent_int_types.itervalues(),
+                               float_types.itervalues()):
+        base_type.vector_types = { }
+        for n in vector_type_sizes:
+            vector_type = VectorType(base_type, n)
+            base_type.vector_types[n] = vector_type
+            vector_types[vector_type.name] = _globals[vector_type.name] = \
+                vector_type
+_make_vector_types()
+
+def _load_to_cl_type(to_cl_type):
+    for cl_type in cypy.cons(machine_independent_int_types.itervalues(),
+                             float_types.itervalues(),
+                             vector_types.itervalues()):
+        np_dtype = cl_type.np_dtype
+        if np_dtype is not None:
+            to_cl_type[np_dtype] = cl_type
+
+to_cl_type = cypy.LazyDict(_load_to_cl_type)
+"""A map from numpy dtypes to the corresponding scalar and vector types. 
+numpy is imported the first time this is used."""
 #base_types['bool'] = bool
 
 #===============================================================================
@@ -238,14 +607,31 @@ class PtrType(base_c.PtrType, Type):
     def __init__(self, target_type, address_space):
         self.target_type = target_type
         self.address_space = address_space
-        # TODO: pointers to pointers (does OpenCL actually support that?)
-        Type.__init__(self, "%s %s*" % (address_space, 
-                                        target_type.name))
+        target_name = target_type.name
+        if target_name.endswith("*"):
+            # the qualifier of the pointer being pointed to follows it
+            Type.__init__(self, "%s %s*" % (target_name, address_space))
+        else:
+            Type.__init__(self, "%s %s*" % (address_space, target_name))
         
     target_type = None
     address_space = None
     
-    ptr = None
+    @cypy.lazy(property)
+    def ptr_global(self):
+        return GlobalPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_shared(self):
+        return SharedPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_private(self):
+        return PrivatePtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_constant(self):
+        return ConstantPtrType(self)
     
 class GlobalPtrType(PtrType):
     def __init__(self, target_type):
@@ -312,7 +698,115 @@ base_types = cypy.merge_dicts(scalar_types, vector_types)
 #===============================================================================
 # Type parser
 #===============================================================================
+_qualifier = r"(?:__)?(?:global|constant|private|shared|local)\b|const\b"
+
+_re_type_name = _re.compile(r"""^\s*(?:
+    (?P<kind>TypeType|BuiltinFnType)\((?P<of>.+)\)   # virtual types
+    |(?P<quals>(?:(?:%(qual)s)\s*)*)                  # qualifiers
+    (?P<name>(?:(?:un)?signed\s+)?\w+)                # base type
+    (?P<ptrs>(?:\s*\*(?:\s*(?:%(qual)s))*)*)          # pointers
+    )\s*$""" % {"qual": _qualifier}, _re.VERBOSE)
+
+_ptr_attrs = {
+    None: "ptr",
+    "global": "ptr_global",
+    "constant": "ptr_constant",
+    "private": "ptr_private",
+    "shared": "ptr_shared",
+    "local": "ptr_shared"
+}
+
 def t(name):
+    """Returns the type with the provided name, as given by its ``name`` 
+    attribute (or as it would be written in OpenCL), e.g. ``"float4"``, 
+    ``"unsigned int"``, ``"__global float*"``, ``"__global float**"`` or 
+    ``"TypeType(float4)"``. ``t(x.name) is x`` for every type ``x`` of this
+    backend.
+    
+    Each ``*`` makes a pointer into the address space qualifying what 
+    precedes it, or into private memory if there is none, so 
+    ``"__global float**"`` is ``float.ptr_global.ptr`` and 
+    ``"__global float* __global*"`` is ``float.ptr_global.ptr_global``.
+    ``const`` is accepted and ignored, and an unqualified ``char*`` is the 
+    type of string literals.
+    
+    The name of a :class:`builtin function <BuiltinFn>` gives its type, so 
+    ``t("get_global_id")`` is ``get_global_id.cl_type``.
+    
+    Raises a :class:`clq.Error` if the name is not understood.
+    """
+    cl_type = _parse_type(name)
+    if cl_type is None:
+        raise clq.Error("Unknown type: %s" % name)
+    return cl_type
+
+def _parse_type(name):
+    match = _re_type_name.match(name)
+    if match is None:
+        return None
+    
+    kind = match.group("kind")
+    if kind == "TypeType":
+        target_type = _parse_type(match.group("of"))
+        if target_type is None or isinstance(target_type, clq.VirtualType):
+            return None
+        return target_type.cl_type
+    elif kind is not None:
+        return _builtin_fn_type(match.group("of"))
+    
+    space = _address_space(match.group("quals"))
+    words = match.group("name").split()
+    if words[0] in ("unsigned", "signed"):
+        type_name = words[1] if len(words) > 1 else "int"
+        if type_name not in ("char", "short", "int", "long"):
+            return None
+        if words[0] == "unsigned":
+            type_name = "u" + type_name
+    else:
+        type_name = words[0]
+    cl_type = base_types.get(type_name, None)
+    if cl_type is None and type_name in ("bool", "void"):
+        cl_type = _globals[type_name]
+    
+    qualifiers = match.group("ptrs").split("*")
+    if len(qualifiers) == 1:
+        # not a pointer
+        if space is not None:
+            return None
+        if cl_type is None and len(words) == 1:
+            return _builtin_fn_type(type_name)
+        return cl_type
+    
+    for i, quals in enumerate(qualifiers[1:]):
+        if cl_type is None or space is _invalid:
+            return None
+        if i == 0 and space is None and cl_type is char:
+            cl_type = string
+        else:
+            cl_type = getattr(cl_type, _ptr_attrs[space], None)
+        # the qualifiers after a * apply to the pointer itself, so give the 
+        # address space of the next pointer
+        space = _address_space(quals)
+    if space is not None:
+        return None
+    return cl_type
+
+_invalid = object()
+
+def _address_space(quals):
+    """Returns the address space named in ``quals`` without leading 
+    underscores, None if there is none or _invalid if there are several."""
+    spaces = [qual.lstrip("_") for qual in quals.split() if qual != "const"]
+    if not spaces:
+        return None
+    if len(spaces) > 1:
+        return _invalid
+    return spaces[0]
+
+def _builtin_fn_type(name):
+    builtin = builtins.get(name, None)
+    if isinstance(builtin, BuiltinFn):
+        return builtin.cl_type
     return None
 
 #===============================================================================
@@ -328,6 +822,9 @@ class Backend(base_c.Backend):
     float_t = float
     bool_t = bool
     string_t = string # TODO: char.private_ptr
+    
+    def type_named(self, name):
+        return _parse_type(name)
 
 #############################################################################
 ## OpenCL Extension descriptors
@@ -341,6 +838,7 @@ class Extension(object):
     """
     def __init__(self, name):
         self.name = name
+        extensions[name] = self
 
     @property
     def pragma_str(self):
@@ -348,104 +846,6 @@ class Extension(object):
         return "#pragma extension %s : enable" % self.name
 cypy.intern(Extension)
 
-cl_khr_fp64 = Extension("cl_khr_fp64")
-"""Standard 64-bit floating point extension.
-
-*See section 9.3 in the spec.*
-"""
-
-cl_khr_fp16 = Extension("cl_khr_fp16")
-"""Standard extension supporting use of the half type as a full type. 
-
-*See section 9.10 in the spec.*
-"""
-
-cl_khr_global_int32_base_atomics = Extension("cl_khr_global_int32_base_atomics")
-"""Standard 32-bit base atomic operations for global memory.
-
-*See section 9.5 in the spec.*
-"""
-
-cl_khr_global_int32_extended_atomics = \
-    Extension("cl_khr_global_int32_extended_atomics")
-"""Standard 32-bit extended atomic operations for global memory.
-
-*See section 9.5 in the spec.*
-"""
-
-cl_khr_local_int32_base_atomics = Extension("cl_khr_local_int32_base_atomics")
-"""Standard 32-bit base atomic operations for local memory.
-
-*See section 9.6 in the spec.*
-"""
-
-cl_khr_local_int32_extended_atomics = \
-    Extension("cl_khr_local_int32_extended_atomics")
-"""Standard 32-bit extended atomic operations for local memory.
-
-*See section 9.6 in the spec.*
-"""
-
-int32_global_atomics_extensions = (cl_khr_global_int32_base_atomics,
-                                   cl_khr_global_int32_extended_atomics)
-"""Tuple containing both the base and extended 32-bit base atomic extensions."""
-
-int32_local_atomics_extensions = (cl_khr_local_int32_base_atomics,
-                                  cl_khr_local_int32_extended_atomics)
-"""Tuple containing both the base and extended 32-bit base atomic extensions."""
-
-int32_atomics_extensions = (cl_khr_global_int32_base_atomics,
-                            cl_khr_global_int32_extended_atomics,
-                            cl_khr_local_int32_base_atomics,
-                            cl_khr_local_int32_extended_atomics)
-"""Tuple containing all 32-bit atomics extensions."""
-
-cl_khr_int64_base_atomics = Extension("cl_khr_int64_base_atomics")
-"""Standard 64-bit base atomic operations.
-
-*See section 9.7 in the spec.*
-"""
-
-cl_khr_int64_extended_atomics = Extension("cl_khr_int64_extended_atomics")
-"""Standard 64-bit extended atomic operations.
-
-*See section 9.7 in the spec.*
-"""
-
-int64_atomics_extensions = (cl_khr_int64_base_atomics,
-                            cl_khr_int64_extended_atomics)
-"""Tuple containing all 64-bit atomics extensions."""
-
-cl_khr_byte_addressable_store = Extension("cl_khr_byte_addressable_store")
-"""Standard extension to support byte addressable arrays.
-
-*See section 9.9 in the spec.*
-"""
-
-cl_khr_3d_image_writes = Extension("cl_khr_3d_image_writes")
-"""Standard extension to support 3D image memory objects.
-
-*See section 9.8 in the spec.*
-"""
-
-khr_extensions = cypy.cons.ed(int32_atomics_extensions,                           #@UndefinedVariable
-                              int64_atomics_extensions, 
-                              (cl_khr_byte_addressable_store,))
-
-cl_APPLE_gl_sharing = Extension("cl_APPLE_gl_sharing")
-"""Apple extension for OpenGL sharing."""
-
-cl_APPLE_SetMemObjectDestructor = Extension("cl_APPLE_SetMemObjectDestructor")
-"""Apple SetMemObjectDestructor extension."""
-
-cl_APPLE_ContextLoggingFunctions = Extension("cl_APPLE_ContextLoggingFunctions")
-"""Apple ContextLoggingFunctions extension."""
-
-APPLE_extensions = (cl_APPLE_gl_sharing, 
-                    cl_APPLE_SetMemObjectDestructor,
-                    cl_APPLE_ContextLoggingFunctions)
-"""Tuple containing all Apple extensions."""
-
 ##############################################################################
 # Built-ins 
 ##############################################################################
@@ -468,6 +868,12 @@ class BuiltinFn(object):
     """If not None, returns a tuple of extensions required for arguments of 
     the specified types."""
     
+    effects = None
+    """The side effects of calling this function, as described by 
+    :meth:`clq.Type.effects_Call`: None for pure functions (the default), 
+    "read" for functions that read memory and "write" for functions that 
+    write to memory or synchronize."""
+    
     @cypy.lazy(property)
     def cl_type(self):
         return BuiltinFnType(self)
@@ -477,7 +883,11 @@ class BuiltinFnType(Type, clq.VirtualType):
     def __init__(self, builtin):
         Type.__init__(self, "BuiltinFnType(%s)" % builtin.name)
         self.builtin = builtin
-        
+
+    @cypy.lazy(property)
+    def mangled_name(self):
+        return self.builtin.name
+
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
                           for arg in node.args)
@@ -485,8 +895,87 @@ class BuiltinFnType(Type, clq.VirtualType):
     
     def generate_Call(self, context, node):
         return clq._generic_generate_Call(context, node)
+    
+    def effects_Call(self, context, node):
+        return self.builtin.effects
 cypy.intern(BuiltinFnType)
 
+class TypeType(Type, clq.VirtualType):
+    """The type of types, which can be called to construct vectors or to 
+    convert scalars::
+    
+        @clq.fn
+        def scale(v, float4):
+            return v * float4(1.0, 2.0, 3.0, 4.0)
+        scale.compile(OpenCL, float4, float4.cl_type)
+        
+    A vector type is called with one scalar, which is copied to each 
+    element, or with scalars and vectors of the same element type providing 
+    all of its elements. A scalar type is called with one scalar, which is 
+    cast to it.
+    """
+    def __init__(self, type):
+        Type.__init__(self, "TypeType(%s)" % type.name)
+        self.type = type
+    
+    type = None
+    """The type of the values constructed."""
+    
+    def resolve_Call(self, context, node):
+        arg_types = tuple(arg.unresolved_type.resolve(context)
+                          for arg in node.args)
+        try:
+            return self._resolve_Call(arg_types)
+        except TypeResolutionError as e:
+            e.node = node
+            raise e
+    
+    @cypy.memoize
+    def _resolve_Call(self, arg_types):
+        type = self.type
+        scalar = lambda t: isinstance(t, ScalarType) and \
+            not isinstance(t, StrType)
+        if isinstance(type, VectorType):
+            if len(arg_types) == 1 and scalar(arg_types[0]):
+                return type
+            n = 0
+            for arg_type in arg_types:
+                if scalar(arg_type):
+                    n += 1
+                elif isinstance(arg_type, VectorType) and \
+                        arg_type.base_type is type.base_type:
+                    n += arg_type.n
+                else:
+                    raise TypeResolutionError(
+                        "Cannot construct a '%s' from a '%s'." % 
+                        (type.name, arg_type.name), None)
+            if n != type.n:
+                raise TypeResolutionError(
+                    "Constructing a '%s' requires %d elements, but got %d." %
+                    (type.name, type.n, n), None)
+            return type
+        elif scalar(type):
+            if len(arg_types) == 1 and scalar(arg_types[0]):
+                return type
+            raise TypeResolutionError(
+                "Conversion to '%s' requires a single scalar argument." % 
+                type.name, None)
+        raise TypeResolutionError(
+            "Values of type '%s' cannot be constructed." % type.name, None)
+    
+    def generate_Call(self, context, node):
+        args = tuple(context.visit(arg) for arg in node.args)
+        type = self.type
+        if isinstance(type, VectorType):
+            code = ("((", type.name, ")(", 
+                    cypy.join((arg.code for arg in args), ", "), "))")
+        else:
+            code = ("((", type.name, ")", args[0].code, ")")
+        return ir.Typed(node, code)
+    
+    def effects_Call(self, context, node):
+        return None
+
 class BuiltinConstant(object):
     """A descriptor for builtin constants available to OpenCL kernels."""
     def __init__(self, name, cl_type):
@@ -500,423 +989,19 @@ class ReservedKeyword(object):
         self.name = name
         builtins[name] = self
 
-builtins = { }
-"""A map from built-in and reserved names to their corresponding descriptor."""
- 
-# TODO: These don't actually do any error checking
-# Work-Item Built-in Functions [6.11.1]
-get_work_dim = BuiltinFn("get_work_dim", lambda D: uint)
-"""The ``get_work_dim`` builtin function."""
-get_global_size = BuiltinFn("get_global_size", lambda D: size_t)
-"""The ``get_global_size`` builtin function."""
-get_global_id = BuiltinFn("get_global_id", lambda D: size_t)
-"""The ``get_global_id`` builtin function."""
-get_local_size = BuiltinFn("get_local_size", lambda D: size_t)
-"""The ``get_local_size`` builtin function."""
-get_local_id = BuiltinFn("get_local_id", lambda D: size_t)
-"""The ``get_local_id`` builtin function."""
-get_num_groups = BuiltinFn("get_num_groups", lambda D: size_t)
-"""The ``get_num_groups`` builtin function."""
-get_group_id = BuiltinFn("get_group_id", lambda D: size_t)
-"""The ``get_group_id`` builtin function."""
-
-# Integer Built-in Functions [6.11.3]
-abs = BuiltinFn("abs", lambda x: x.unsigned_variant)
-"""The ``abs`` builtin function."""
-abs_diff = BuiltinFn("abs_diff", lambda x, y: x.unsigned_variant)
-"""The ``abs_diff`` builtin function."""
-add_sat = BuiltinFn("add_sat", lambda x, y: x)
-"""The ``add_sat`` builtin function."""
-hadd = BuiltinFn("hadd", lambda x, y: x)
-"""The ``hadd`` builtin function."""
-rhadd = BuiltinFn("rhadd", lambda x, y: x)
-"""The ``rhadd`` builtin function."""
-clz = BuiltinFn("clz", lambda x: x)
-"""The ``clz`` builtin function."""
-mad_hi = BuiltinFn("mad_hi", lambda a, b, c: a)
-"""The ``mad_hi`` builtin function."""
-mad24 = BuiltinFn("mad24", lambda a, b, c: a)
-"""The ``mad24`` builtin function."""
-mad_sat = BuiltinFn("mad_sat", lambda a, b, c: a)
-"""The ``mad_sat`` builtin function."""
-max = BuiltinFn("max", lambda x, y: x)
-"""The ``max`` builtin function."""
-min = BuiltinFn("min", lambda x, y: x)
-"""The ``min`` builtin function."""
-mul_hi = BuiltinFn("mul_hi", lambda x, y: x)
-"""The ``mul_hi`` builtin function."""
-mul24 = BuiltinFn("mul24", lambda a, b: a)
-"""The ``mul24`` builtin function."""
-rotate = BuiltinFn("rotate", lambda v, i: v)
-"""The ``rotate`` builtin function."""
-sub_sat = BuiltinFn("sub_sat", lambda x, y: x)
-"""The ``sub_sat`` builtin function."""
-
-def _upsample_return_type_fn(hi, lo):
-    # TODO: don't use is
-    if hi is char and lo is uchar:
-        return short
-    if hi is uchar and lo is uchar:
-        return ushort
-    if hi is short and lo is ushort:
-        return int
-    if hi is ushort and lo is short:
-        return uint
-    if hi is int and lo is int:
-        return long
-    if hi is uint and lo is uint:
-        return ulong
-    
-    raise TypeResolutionError(
-        "Invalid argument types for upsample built-in: %s and %s." % 
-        (hi.name, lo.name))
-upsample = BuiltinFn("upsample", _upsample_return_type_fn)
-"""The ``upsample`` builtin function."""
-
-# Common Built-in Functions [6.11.4]
-clamp = BuiltinFn("clamp", lambda x, min, max: x)
-"""The ``clamp`` builtin function."""
-degrees = BuiltinFn("degrees", lambda radians: radians)
-"""The ``degrees`` builtin function."""
-mix = BuiltinFn("mix", lambda x, y: x)
-"""The ``mix`` builtin function."""
-radians = BuiltinFn("radians", lambda degrees: degrees)
-"""The ``radians`` builtin function."""
-step = BuiltinFn("step", lambda edge, x: x)
-"""The ``step`` builtin function."""
-smoothstep = BuiltinFn("smoothstep", lambda edge0, edge1, x: x)
-"""The ``smoothstep`` builtin function."""
-sign = BuiltinFn("sign", lambda x: x)
-"""The ``sign`` builtin function."""
-
-# Math Built-in Functions [6.11.2]
-acos = BuiltinFn("acos", lambda x: x)
-"""The ``acos`` builtin function."""
-acosh = BuiltinFn("acosh", lambda x: x)
-"""The ``acosh`` builtin function."""
-acospi = BuiltinFn("acospi", lambda x: x)
-"""The ``acospi`` builtin function."""
-asin = BuiltinFn("asin", lambda x: x)
-"""The ``asin`` builtin function."""
-asinh = BuiltinFn("asinh", lambda x: x)
-"""The ``asinh`` builtin function."""
-asinpi = BuiltinFn("asinpi", lambda x: x)
-"""The ``asinpi`` builtin function."""
-atan = BuiltinFn("atan", lambda y_over_x: y_over_x)
-"""The ``atan`` builtin function."""
-atan2 = BuiltinFn("atan2", lambda y, x: y)
-"""The ``atan2`` builtin function."""
-atanh = BuiltinFn("atanh", lambda x: x)
-"""The ``atanh`` builtin function."""
-atanpi = BuiltinFn("atanpi", lambda x: x)
-"""The ``atanpi`` builtin function."""
-atan2pi = BuiltinFn("atan2pi", lambda x, y: x)
-"""The ``atan2pi`` builtin function."""
-cbrt = BuiltinFn("cbrt", lambda x: x)
-"""The ``cbrt`` builtin function."""
-ceil = BuiltinFn("ceil", lambda x: x)
-"""The ``ceil`` builtin function."""
-copysign = BuiltinFn("copysign", lambda x, y: x)
-"""The ``copysign`` builtin function."""
-cos = BuiltinFn("cos", lambda x: x)
-"""The ``cos`` builtin function."""
-half_cos = BuiltinFn("half_cos", lambda x: x)
-"""The ``half_cos`` builtin function."""
-native_cos = BuiltinFn("native_cos", lambda x: x)
-"""The ``native_cos`` builtin function."""
-cosh = BuiltinFn("cosh", lambda x: x)
-"""The ``cosh`` builtin function."""
-cospi = BuiltinFn("cospi", lambda x: x)
-"""The ``cospi`` builtin function."""
-half_divide = BuiltinFn("half_divide", lambda x, y: x)
-"""The ``half_divide`` builtin function."""
-native_divide = BuiltinFn("native_divide", lambda x, y: x)
-"""The ``native_divide`` builtin function."""
-erfc = BuiltinFn("erfc", lambda x, y: x)
-"""The ``erfc`` builtin function."""
-erf = BuiltinFn("erf", lambda x: x)
-"""The ``erf`` builtin function."""
-exp = BuiltinFn("exp", lambda x: x)
-"""The ``exp`` builtin function."""
-half_exp = BuiltinFn("half_exp", lambda x: x)
-"""The ``half_exp`` builtin function."""
-native_exp = BuiltinFn("native_exp", lambda x: x)
-"""The ``native_exp`` builtin function."""
-exp2 = BuiltinFn("exp2", lambda x: x)
-"""The ``exp2`` builtin function."""
-half_exp2 = BuiltinFn("half_exp2", lambda x: x)
-"""The ``half_exp2`` builtin function."""
-native_exp2 = BuiltinFn("native_exp2", lambda x: x)
-"""The ``native_exp2`` builtin function."""
-exp10 = BuiltinFn("exp10", lambda x: x)
-"""The ``exp10`` builtin function."""
-half_exp10 = BuiltinFn("half_exp10", lambda x: x)
-"""The ``half_exp10`` builtin function."""
-native_exp10 = BuiltinFn("native_exp10", lambda x: x)
-"""The ``native_exp10`` builtin function."""
-expm1 = BuiltinFn("expm1", lambda x: x)
-"""The ``expm1`` builtin function."""
-fabs = BuiltinFn("fabs", lambda x: x)
-"""The ``fabs`` builtin function."""
-fdim = BuiltinFn("fdim", lambda x, y: x)
-"""The ``fdim`` builtin function."""
-floor = BuiltinFn("floor", lambda x: x)
-"""The ``floor`` builtin function."""
-fma = BuiltinFn("fma", lambda a, b, c: a)
-"""The ``fma`` builtin function."""
-fmax = BuiltinFn("fmax", lambda x, y: x)
-"""The ``fmax`` builtin function."""
-fmin = BuiltinFn("fmin", lambda x, y: x)
-"""The ``fmin`` builtin function."""
-fmod = BuiltinFn("fmod", lambda x, y: x)
-"""The ``fmod`` builtin function."""
-fract = BuiltinFn("fract", lambda x, iptr: x)
-"""The ``fract`` builtin function."""
-frexp = BuiltinFn("frexp", lambda x, exp: x)
-"""The ``frexp`` builtin function."""
-hypot = BuiltinFn("hypot", lambda x, y: x)
-"""The ``hypot`` builtin function."""
-ilogb = BuiltinFn("ilogb", lambda x: x)
-"""The ``ilogb`` builtin function."""
-ldexp = BuiltinFn("ldexp", lambda x, n: x)
-"""The ``ldexp`` builtin function."""
-lgamma = BuiltinFn("lgamma", lambda x: x)
-"""The ``lgamma`` builtin function."""
-lgamma_r = BuiltinFn("lgamma_r", lambda x, signp: x)
-"""The ``lgamma_r`` builtin function."""
-log = BuiltinFn("log", lambda x: x)
-"""The ``log`` builtin function."""
-half_log = BuiltinFn("half_log", lambda x: x)
-"""The ``half_log`` builtin function."""
-native_log = BuiltinFn("native_log", lambda x: x)
-"""The ``native_log`` builtin function."""
-log2 = BuiltinFn("log2", lambda x: x)
-"""The ``log2`` builtin function."""
-half_log2 = BuiltinFn("half_log2", lambda x: x)
-"""The ``half_log2`` builtin function."""
-native_log2 = BuiltinFn("native_log2", lambda x: x)
-"""The ``native_log2`` builtin function."""
-log10 = BuiltinFn("log10", lambda x: x)
-"""The ``log10`` builtin function."""
-half_log10 = BuiltinFn("half_log10", lambda x: x)
-"""The ``half_log10`` builtin function."""
-native_log10 = BuiltinFn("native_log10", lambda x: x)
-"""The ``native_log10`` builtin function."""
-log1p = BuiltinFn("log1p", lambda x: x)
-"""The ``log1p`` builtin function."""
-logb = BuiltinFn("logb", lambda x: x)
-"""The ``logb`` builtin function."""
-mad = BuiltinFn("mad", lambda a, b, c: a)
-"""The ``mad`` builtin function."""
-modf = BuiltinFn("modf", lambda x, iptr: x)
-"""The ``modf`` builtin function."""
-nextafter = BuiltinFn("nextafter", lambda x, y: x)
-"""The ``nextafter`` builtin function."""
-pow = BuiltinFn("pow", lambda x, y: x)
-"""The ``pow`` builtin function."""
-pown = BuiltinFn("pown", lambda x, y: x)
-"""The ``pown`` builtin function."""
-powr = BuiltinFn("powr", lambda x, y: x)
-"""The ``powr`` builtin function."""
-half_powr = BuiltinFn("half_powr", lambda x, y: x)
-"""The ``half_powr`` builtin function."""
-native_powr = BuiltinFn("native_powr", lambda x, y: x)
-"""The ``native_powr`` builtin function."""
-half_recip = BuiltinFn("half_recip", lambda x: x)
-"""The ``half_recip`` builtin function."""
-native_recip = BuiltinFn("native_recip", lambda x: x)
-"""The ``native_recip`` builtin function."""
-remainder = BuiltinFn("remainder", lambda x, y: x)
-"""The ``remainder`` builtin function."""
-remquo = BuiltinFn("remquo", lambda x, y, n: x)
-"""The ``remquo`` builtin function."""
-rint = BuiltinFn("rint", lambda x: x)
-"""The ``rint`` builtin function."""
-rootn = BuiltinFn("rootn", lambda x, y: x)
-"""The ``rootn`` builtin function."""
-round = BuiltinFn("round", lambda x: x)
-"""The ``round`` builtin function."""
-rsqrt = BuiltinFn("rsqrt", lambda x: x)
-"""The ``rsqrt`` builtin function."""
-native_rsqrt = BuiltinFn("native_rsqrt", lambda x: x)
-"""The ``native_rsqrt`` builtin function."""
-half_rsqrt = BuiltinFn("half_rsqrt", lambda x: x)
-"""The ``half_rsqrt`` builtin function."""
-sin = BuiltinFn("sin", lambda x: x)
-"""The ``sin`` builtin function."""
-native_sin = BuiltinFn("native_sin", lambda x: x)
-"""The ``native_sin`` builtin function."""
-half_sin = BuiltinFn("half_sin", lambda x: x)
-"""The ``half_sin`` builtin function."""
-sincos = BuiltinFn("sincos", lambda x, cosval: x)
-"""The ``sincos`` builtin function."""
-sinh = BuiltinFn("sinh", lambda x: x)
-"""The ``sinh`` builtin function."""
-sinpi = BuiltinFn("sinpi", lambda x: x)
-"""The ``sinpi`` builtin function."""
-sqrt = BuiltinFn("sqrt", lambda x: x)
-"""The ``sqrt`` builtin function."""
-half_sqrt = BuiltinFn("half_sqrt", lambda x: x)
-"""The ``half_sqrt`` builtin function."""
-native_sqrt = BuiltinFn("native_sqrt", lambda x: x)
-"""The ``native_sqrt`` builtin function."""
-tan = BuiltinFn("tan", lambda x: x)
-"""The ``tan`` builtin function."""
-half_tan = BuiltinFn("half_tan", lambda x: x)
-"""The ``half_tan`` builtin function."""
-native_tan = BuiltinFn("native_tan", lambda x: x)
-"""The ``native_tan`` builtin function."""
-tanh = BuiltinFn("tanh", lambda x: x)
-"""The ``tanh`` builtin function."""
-tanpi = BuiltinFn("tanpi", lambda x: x)
-"""The ``tanpi`` builtin function."""
-tgamma = BuiltinFn("tgamma", lambda x: x)
-"""The ``tgamma`` builtin function."""
-trunc = BuiltinFn("trunc", lambda x: x)
-"""The ``trunc`` builtin function."""
-
-# Geometric Built-in Functions [6.11.5]
-dot = BuiltinFn("dot", lambda p0, p1: p0)
-"""The ``dot`` builtin function."""
-distance = BuiltinFn("distance", lambda p0, p1: p0)
-"""The ``distance`` builtin function."""
-length = BuiltinFn("length", lambda p: p)
-"""The ``length`` builtin function."""
-normalize = BuiltinFn("normalize", lambda p: p)
-"""The ``normalize`` builtin function."""
-fast_distance = BuiltinFn("fast_distance", lambda p0, p1: float)
-"""The ``fast_distance`` builtin function."""
-fast_length = BuiltinFn("fast_length", lambda p: float)
-"""The ``fast_length`` builtin function."""
-fast_normalize = BuiltinFn("fast_normalize", lambda p: float)
-"""The ``fast_normalize`` builtin function."""
-
-# Relational Built-in Functions [6.11.6]
-isequal = BuiltinFn("isequal", lambda x, y: int)
-"""The ``isequal`` builtin function."""
-isnotequal = BuiltinFn("isnotequal", lambda x, y: int)
-"""The ``isnotequal`` builtin function."""
-isgreater = BuiltinFn("isgreater", lambda x, y: int)
-"""The ``isgreater`` builtin function."""
-isgreaterequal = BuiltinFn("isgreaterequal", lambda x, y: int)
-"""The ``isgreaterequal`` builtin function."""
-isless = BuiltinFn("isless", lambda x, y: int)
-"""The ``isless`` builtin function."""
-islessequal = BuiltinFn("islessequal", lambda x, y: int)
-"""The ``islessequal`` builtin function."""
-islessgreater = BuiltinFn("islessgreater", lambda x, y: int)
-"""The ``islessgreater`` builtin function."""
-isfinite = BuiltinFn("isfinite", lambda x: int)
-"""The ``isfinite`` builtin function."""
-isinf = BuiltinFn("isinf", lambda x: int)
-"""The ``isinf`` builtin function."""
-isnan = BuiltinFn("isnan", lambda x: int)
-"""The ``isnan`` builtin function."""
-isnormal = BuiltinFn("isnormal", lambda x: int)
-"""The ``isnormal`` builtin function."""
-isordered = BuiltinFn("isordered", lambda x, y: int)
-"""The ``isordered`` builtin function."""
-isunordered = BuiltinFn("isunordered", lambda x, y: int)
-"""The ``isunordered`` builtin function."""
-signbit = BuiltinFn("signbit", lambda x: int)
-"""The ``signbit`` builtin function."""
-any = BuiltinFn("any", lambda x: int)
-"""The ``any`` builtin function."""
-all = BuiltinFn("all", lambda x: int)
-"""The ``all`` builtin function."""
-bitselect = BuiltinFn("bitselect", lambda a, b, c: a)
-"""The ``bitselect`` builtin function."""
-select = BuiltinFn("select", lambda a, b, c: a)
-"""The ``select`` builtin function."""
-
-# Base Atomic Functions [9.5]
-atom_add = BuiltinFn("atom_add", lambda p, val: val)
-"""The ``atom_add`` builtin function."""
-atom_sub = BuiltinFn("atom_sub", lambda p, val: val)
-"""The ``atom_sub`` builtin function."""
-atom_xchg = BuiltinFn("atom_xchg", lambda p, val: val)
-"""The ``atom_xchg`` builtin function."""
-atom_inc = BuiltinFn("atom_inc", lambda p: p.target_type)
-"""The ``atom_inc`` builtin function."""
-atom_dec = BuiltinFn("atom_dec", lambda p: p.target_type)
-"""The ``atom_dec`` builtin function."""
-atom_cmpxchg = BuiltinFn("atom_cmpxchg", lambda p, cmp, val: val)
-"""The ``atom_cmpxchg`` builtin function."""
-base_atomics = (atom_add, atom_sub, atom_xchg, atom_inc, atom_dec, atom_cmpxchg)
-
-def _base_atomic_extension_inference(p, *args): #@UnusedVariable
-    target_type = p.target_type
-    if target_type is int or target_type is uint:
-        if p.address_space == "__global":
-            return (cl_khr_global_int32_base_atomics,)
-        return (cl_khr_local_int32_base_atomics,)
-    return (cl_khr_int64_base_atomics,)
-    
-for fn in base_atomics:
-    fn.requires_extensions = _base_atomic_extension_inference
-    
-# Extended Atomic Functions [9.5]
-atom_min = BuiltinFn("atom_min", lambda p, val: val)
-"""The ``atom_min`` builtin function."""
-atom_max = BuiltinFn("atom_max", lambda p, val: val)
-"""The ``atom_max`` builtin function."""
-atom_and = BuiltinFn("atom_and", lambda p, val: val)
-"""The ``atom_and`` builtin function."""
-atom_or = BuiltinFn("atom_or", lambda p, val: val)
-"""The ``atom_or`` builtin function."""
-atom_xor = BuiltinFn("atom_xor", lambda p, val: val)
-"""The ``atom_xor`` builtin function."""
-extended_atomics = (atom_min, atom_max, atom_and, atom_or, atom_xor)
-
-def _extended_atomic_extension_inference(p):
-    target_type = p.target_type
-    if target_type is int or target_type is uint:
-        if p.address_space == "__global":
-            return (cl_khr_global_int32_extended_atomics,)
-        return (cl_khr_local_int32_extended_atomics,)
-    return (cl_khr_int64_extended_atomics,)
-
-for fn in extended_atomics:
-    fn.requires_extensions = _extended_atomic_extension_inference
-
-# Vector Data Load/Store Built-in Functions [6.11.7]
-vload_half = BuiltinFn("vload_half", lambda offset, p: float)
-"""The ``vload_half`` builtin function."""
-vstore_half = BuiltinFn("vstore_half", lambda data, offset, p: void)
-"""The ``vstore_half`` builtin function."""
-
-sizeof = BuiltinFn("sizeof", lambda x: size_t)
-"""The ``sizeof`` builtin operator."""
-
-# Built-in constants
-true = BuiltinConstant("true", int)
-false = BuiltinConstant("false", int)
-NULL = BuiltinConstant("NULL", intptr_t)
-
-# Reserved keywords
-reserved_keywords = ["auto", "break", "case", "char", "const", "continue", 
-                     "default", "do", "double", "else", "enum", "extern", 
-                     "float", "for", "goto", "if", "inline", "int", "long", 
-                     "register", "restrict", "return", "short", "signed", 
-                     "sizeof", "static", "struct", "switch", "typedef",
-                     "union", "unsigned", "void", "volatile", "while", "_Bool",
-                     "_Complex", "_Imaginary", "char", "uchar", "short", 
-                     "ushort", "int", "uint", "long", "ulong", "float",
-                     "half", "double", "bool", "quad", "complex", "imaginary",
-                     "image2d_t", "image3d_t", "sampler_t", "event_t",
-                     "__global", "global", "__local", "local", "__private",
-                     "private", "__constant", "constant", "__kernel", "kernel",
-                     "__read_only", "read_only", "__write_only", "write_only",
-                     "__read_write", "read_write", "__attribute__"]
-scalar_types = ("char", "uchar", "short", "ushort", "int", "uint", "long",
-                "ulong", "float", "half", "double", "bool", "quad")
-vector_type_sizes = (2, 3, 4, 8, 16)
-for type in scalar_types:
-    for size in vector_type_sizes:
-        reserved_keywords.append(type + str(size))
-reserved_keywords = tuple(reserved_keywords)
-reserved_keyword_descriptors = tuple(ReservedKeyword(kw) 
-                                     for kw in reserved_keywords)
+def _load_builtin_defs(registry): #@UnusedVariable
+    # the descriptors add themselves to builtins and extensions
+    import clq.backends.opencl.builtin_defs #@UnusedImport
+
+builtins = cypy.LazyDict(_load_builtin_defs)
+"""A map from built-in and reserved names to their corresponding descriptor.
+
+Populated from :mod:`clq.backends.opencl.builtin_defs` on first use."""
+
+extensions = cypy.LazyDict(_load_builtin_defs)
+"""A map from extension names to their :class:`Extension` descriptor.
+
+Populated from :mod:`clq.backends.opencl.builtin_defs` on first use."""
 
 #############################################################################
 ## Versions
@@ -2366,3 +2451,45 @@ reserved_keyword_descriptors = tuple(ReservedKeyword(kw)
 #}
 #"""A map from numeric literal suffixes to their correspond 
 #`type <cl.ScalarType>`."""
+
+#############################################################################
+## Module attributes
+#############################################################################
+import sys as _sys
+import types as _types
+
+class _Module(_types.ModuleType):
+    """The type of the object installed in place of this module in 
+    ``sys.modules``. Attributes are looked up in this module's namespace and
+    then among the descriptors defined in 
+    :mod:`clq.backends.opencl.builtin_defs`, which is imported when one is 
+    first needed, so that, e.g., ``from clq.backends.opencl import 
+    get_global_id`` still works. Nothing is copied: attributes are set and 
+    deleted in this module's namespace."""
+    # keeps the original module, and so the globals of the functions defined
+    # in it, alive
+    _original = _sys.modules[__name__]
+    
+    def __getattr__(self, name):
+        try:
+            return self._original.__dict__[name]
+        except KeyError:
+            pass
+        if not name.startswith("__"):
+            import clq.backends.opencl.builtin_defs as builtin_defs
+            try:
+                return getattr(builtin_defs, name)
+            except AttributeError:
+                pass
+        raise AttributeError("'module' object has no attribute '%s'" % name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._original, name, value)
+        
+    def __delattr__(self, name):
+        delattr(self._original, name)
+        
+    def __dir__(self):
+        return dir(self._original)
+
+_sys.modules[__name__] = _Module(__name__, __doc__)
@@ -0,0 +1,406 @@
+"""Chooses work-group (local) sizes for kernel launches by benchmarking.
+
+The best local size for a kernel depends on the device, the problem size and
+the kernel itself, and the driver's own choice, made when none is given, is
+often far from it. When a :class:`Tuner` is active,
+:meth:`pyocl.Kernel.__call__ <clq.backends.opencl.pyocl.Kernel.__call__>` and
+:meth:`pyocl.Kernel.prepare <clq.backends.opencl.pyocl.Kernel.prepare>` use
+the local size it chose for the kernel, device and global size whenever the
+caller does not pass a ``local_size`` (passing ``local_size=None`` explicitly
+still leaves the choice to the driver).
+
+Tuning is off by default. To turn it on for the whole process::
+
+    import clq.backends.opencl.autotune
+    tuner = clq.backends.opencl.autotune.enable("/var/cache/clq-tuning")
+
+The tuner has two modes:
+
+explicit (the default)
+    :meth:`Tuner.tune` benchmarks every :func:`candidate <candidates>` local
+    size for a launch and saves the fastest. Launches only consult the
+    results, and leave the choice to the driver for anything not tuned.
+
+online (``enable(path, online=True)``)
+    Launches that have not been tuned try one candidate each, waiting for
+    the queue to finish before and after, until each has been timed
+    :attr:`Tuner.samples` times. The fastest is then saved and used from
+    then on, so only the first few launches of each kernel and global size
+    pay for tuning, and later ones cost a dict lookup.
+
+The results are saved in a :class:`TuningDatabase`, keyed by the kernel's
+program source, build options and name, the platform, device and driver (see
+:func:`clq.backends.opencl.binaries.device_key`) and the global size, so each
+device has its own results and upgrading the driver starts afresh. Results
+are also remembered in memory under the same key, up to
+:attr:`Tuner.max_memo` of them, so the tuner keeps no kernels or queues
+alive. Kernels whose program source is not known (see :func:`kernel_key`)
+are not tuned during launches. Kernels whose arguments depend on the local
+size (e.g. :class:`LocalMemory <clq.backends.opencl.pyocl.LocalMemory>`
+sized per work-group) or that
+assume a particular local size should always be launched with an explicit
+``local_size``.
+"""
+import hashlib as _hashlib
+import collections as _collections
+import itertools as _itertools
+
+import cypy
+import clq.cache
+import clq.profiling
+import clq.backends.opencl.binaries as _binaries
+
+format_version = 1
+"""The version of the on-disk entry format. Bumped whenever it changes, which
+invalidates all existing entries."""
+
+active = None
+"""The process-wide :class:`Tuner` consulted by :class:`pyocl.Kernel
+<clq.backends.opencl.pyocl.Kernel>`, or None if tuning is disabled (the
+default)."""
+
+def enable(path=None, online=False, max_size=None):
+    """Creates a :class:`Tuner` saving its results to a
+    :class:`TuningDatabase` at ``path`` (or only in memory, if None) and
+    makes it :data:`active`. Returns the tuner."""
+    global active
+    database = None if path is None else TuningDatabase(path, max_size)
+    active = Tuner(database, online)
+    return active
+
+def disable():
+    """Disables tuning. Results already on disk are left alone."""
+    global active
+    active = None
+
+def _divisors(n):
+    small, large = [ ], [ ]
+    i = 1
+    while i * i <= n:
+        if n % i == 0:
+            small.append(i)
+            if i * i != n:
+                large.append(n // i)
+        i += 1
+    return small + large[::-1]
+
+def candidates(global_size, max_work_item_sizes, max_work_group_size,
+               multiple=1, max_candidates=16):
+    """Returns the local sizes worth trying for ``global_size``, as tuples.
+
+    The first candidate is always None, leaving the choice to the driver. The
+    rest divide ``global_size`` in each dimension, are within the
+    corresponding ``max_work_item_sizes`` and have at most
+    ``max_work_group_size`` work-items in total. Sizes whose total is a
+    multiple of ``multiple`` (the device's preferred multiple, e.g. the warp
+    or wavefront size) come first, then larger sizes before smaller ones.
+    At most ``max_candidates`` are returned.
+    """
+    per_dimension = [[d for d in _divisors(n) if d <= max_size]
+                     for n, max_size in zip(global_size, max_work_item_sizes)]
+    sizes = [size for size in _itertools.product(*per_dimension)
+             if cypy.prod(size) <= max_work_group_size]
+    sizes.sort(key=lambda size: (cypy.prod(size) % multiple != 0,
+                                 -cypy.prod(size), size))
+    return [None] + sizes[:max_candidates - 1]
+
+def kernel_key(kernel):
+    """Returns a string identifying a :class:`pyocl.Kernel
+    <clq.backends.opencl.pyocl.Kernel>` by the source and build options of
+    its program and its name, or None if the source is not known (i.e. the
+    program was not built by :meth:`pyocl.Context.compile
+    <clq.backends.opencl.pyocl.Context.compile>`)."""
+    program = kernel.program
+    source = getattr(program, 'source', None)
+    if source is None:
+        return None
+    return "\0".join((_hashlib.sha1(source).hexdigest(),
+                      program.options or "", kernel.name))
+
+def key_for(kernel_key, device_key, global_size):
+    """Returns the database key for a kernel (see :func:`kernel_key`)
+    launched over ``global_size`` on a device (see
+    :func:`clq.backends.opencl.binaries.device_key`)."""
+    parts = [str(format_version), kernel_key, device_key]
+    parts.extend(str(n) for n in global_size)
+    return _hashlib.sha1("\0".join(parts)).hexdigest()
+
+class TuningDatabase(clq.cache.DirectoryCache):
+    """A directory of tuning results (see
+    :class:`clq.cache.DirectoryCache`)."""
+    suffix = ".cltune"
+
+    def load(self, key):
+        """Returns a pair ``(local_size, timings)`` stored under ``key``, or
+        None if there is none. ``local_size`` is None if the driver's choice
+        was fastest; ``timings`` is a list of ``(local_size, seconds)``
+        pairs, fastest first."""
+        def decode(entry):
+            local_size = entry['local_size']
+            if local_size is not None:
+                local_size = tuple(local_size)
+            return local_size, list(entry['timings'])
+        return self._load_entry(key, decode)
+
+    def store(self, key, local_size, timings):
+        """Saves a result under ``key``."""
+        self._store_entry(key, {
+            'local_size': local_size,
+            'timings': tuple(timings)
+        })
+
+class Tuning(object):
+    """The timings collected so far while tuning one launch."""
+    def __init__(self, candidates, samples):
+        self.candidates = list(candidates)
+        self.samples = samples
+        self.times = dict((local_size, [ ]) for local_size in candidates)
+
+    candidates = None
+    """The local sizes being tried, in order. Those that fail to launch are
+    removed."""
+
+    samples = None
+    """The number of times each candidate is timed."""
+
+    times = None
+    """A dict of the times measured for each candidate, in seconds."""
+
+    def next(self):
+        """Returns ``(True, local_size)`` for the next candidate to time, or
+        ``(False, None)`` if all have been timed enough."""
+        for local_size in self.candidates:
+            if len(self.times[local_size]) < self.samples:
+                return True, local_size
+        return False, None
+
+    def record(self, local_size, seconds):
+        """Records one time for a candidate."""
+        self.times[local_size].append(seconds)
+
+    def reject(self, local_size):
+        """Stops trying a candidate, e.g. because the launch failed."""
+        if local_size in self.candidates:
+            self.candidates.remove(local_size)
+
+    @property
+    def timings(self):
+        """A list of ``(local_size, seconds)`` pairs, with the best time
+        for each candidate timed, fastest first."""
+        timings = [(local_size, min(self.times[local_size]))
+                   for local_size in self.candidates
+                   if self.times[local_size]]
+        timings.sort(key=lambda timing: timing[1])
+        return timings
+
+    @property
+    def best(self):
+        """The fastest candidate, or None if none were timed."""
+        timings = self.timings
+        return timings[0][0] if timings else None
+
+class Trial(object):
+    """Times one launch with a candidate local size, for the online mode."""
+    def __init__(self, tuning, local_size):
+        self.tuning = tuning
+        self.local_size = local_size
+
+    def launch(self, launch, kernel, queue, global_size, *args, **kwargs):
+        """Returns ``launch(kernel, queue, global_size, *args, **kwargs)``,
+        recording how long it took or, if it fails, rejecting the candidate
+        and launching again with the driver's choice instead."""
+        queue.finish()
+        start = clq.profiling.clock()
+        try:
+            event = launch(kernel, queue, global_size, *args, **kwargs)
+        except Exception:
+            # e.g. too many resources requested for this local size
+            if self.local_size is None:
+                raise
+            self.tuning.reject(self.local_size)
+            kwargs['local_size'] = None
+            return launch(kernel, queue, global_size, *args, **kwargs)
+        event.wait()
+        self.tuning.record(self.local_size, clq.profiling.clock() - start)
+        return event
+
+_unknown = object()
+
+class Tuner(object):
+    """Chooses local sizes for launches, saving them to ``database`` (a
+    :class:`TuningDatabase`, or None to keep them only in memory). See the
+    module documentation for the meaning of ``online``."""
+    def __init__(self, database=None, online=False):
+        self.database = database
+        self.online = online
+        self._chosen = _collections.OrderedDict()
+        self._tunings = _collections.OrderedDict()
+        self._device_keys = { }
+
+    database = None
+    """The :class:`TuningDatabase` results are saved to, or None."""
+
+    online = False
+    """Whether launches that have not been tuned are tuned as they happen."""
+
+    samples = 3
+    """The number of times each candidate is timed. The fastest time
+    counts."""
+
+    max_candidates = 16
+    """The maximum number of candidates tried (see :func:`candidates`)."""
+
+    max_memo = 1024
+    """The maximum number of launches whose local sizes are remembered in 
+    memory, and of online tunings in progress. The oldest are forgotten 
+    first; forgotten results are loaded from the database again when next
+    needed."""
+
+    def limits(self, kernel, device):
+        """Returns a triple ``(max_work_item_sizes, max_work_group_size,
+        multiple)`` giving the limits on the local size of ``kernel`` on
+        ``device`` and its preferred multiple."""
+        import pyopencl as cl # only needed with a device
+        info = cl.kernel_work_group_info
+        max_work_group_size = min(
+            device.max_work_group_size, device.max_work_items,
+            kernel.get_work_group_info(info.WORK_GROUP_SIZE, device))
+        try:
+            multiple = kernel.get_work_group_info(
+                info.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, device)
+        except (AttributeError, cl.Error):
+            # OpenCL 1.0
+            multiple = 1
+        return device.max_work_item_sizes, max_work_group_size, multiple
+
+    def candidates_for(self, kernel, device, global_size):
+        """Returns the :func:`candidates` for launching ``kernel`` over
+        ``global_size`` on ``device``."""
+        width = getattr(kernel, 'elements_per_work_item', 1)
+        if width > 1:
+            # the global size counts elements; see Kernel.__call__
+            global_size = ((global_size[0] + width - 1) // width,) + \
+                tuple(global_size[1:])
+        max_work_item_sizes, max_work_group_size, multiple = \
+            self.limits(kernel, device)
+        return candidates(global_size, max_work_item_sizes,
+                          max_work_group_size, multiple, self.max_candidates)
+
+    def _memo_key(self, kernel, queue, global_size):
+        """Returns ``(kernel key, device key, global size)`` identifying a 
+        launch, or None if the kernel's source is not known (see 
+        :func:`kernel_key`). The kernel key is cached on the kernel and the
+        device key by device, so that no references to kernels or queues are
+        kept."""
+        try:
+            key = kernel._autotune_key
+        except AttributeError:
+            key = kernel._autotune_key = kernel_key(kernel)
+        if key is None:
+            return None
+        device = queue.device
+        device_keys = self._device_keys
+        try:
+            device_key = device_keys[device]
+        except KeyError:
+            device_key = device_keys[device] = _binaries.device_key(device)
+        return key, device_key, tuple(global_size)
+
+    def _remember(self, memo, local_size):
+        chosen = self._chosen
+        chosen[memo] = local_size
+        if len(chosen) > self.max_memo:
+            chosen.popitem(last=False)
+
+    def lookup(self, kernel, queue, global_size):
+        """Returns the local size chosen for launching ``kernel`` on
+        ``queue`` over ``global_size``, or None (the driver's choice) if it
+        has not been tuned."""
+        memo = self._memo_key(kernel, queue, global_size)
+        if memo is None:
+            return None
+        local_size = self._lookup(memo)
+        return None if local_size is _unknown else local_size
+
+    def _lookup(self, memo):
+        local_size = self._chosen.get(memo, _unknown)
+        if local_size is not _unknown:
+            return local_size
+        if self.database is not None:
+            result = self.database.load(key_for(*memo))
+            if result is not None:
+                self._remember(memo, result[0])
+                return result[0]
+        return _unknown
+
+    def choose(self, kernel, queue, global_size):
+        """Returns a pair ``(local_size, trial)`` for a launch of ``kernel``
+        on ``queue`` over ``global_size``. ``trial`` is None unless the
+        launch should be timed with :meth:`Trial.launch`, in the online
+        mode. Kernels whose source is not known are not tuned."""
+        memo = self._memo_key(kernel, queue, global_size)
+        if memo is None:
+            return None, None
+        local_size = self._chosen.get(memo, _unknown)
+        if local_size is not _unknown:
+            return local_size, None
+
+        local_size = self._lookup(memo)
+        if local_size is not _unknown:
+            return local_size, None
+        if not self.online:
+            return None, None
+
+        tunings = self._tunings
+        tuning = tunings.get(memo, None)
+        if tuning is None:
+            tuning = tunings[memo] = Tuning(
+                self.candidates_for(kernel, queue.device, memo[2]),
+                self.samples)
+            if len(tunings) > self.max_memo:
+                # abandon the oldest tuning in progress
+                tunings.popitem(last=False)
+        pending, local_size = tuning.next()
+        if pending:
+            return local_size, Trial(tuning, local_size)
+        del tunings[memo]
+        return self._finish(memo, tuning), None
+
+    def tune(self, kernel, global_size, *args, **kwargs):
+        """Times launches of ``kernel`` over ``global_size`` with ``args``
+        for each candidate local size, saves the fastest and returns it.
+
+        ``queue`` can be passed as a keyword argument; it defaults to the
+        kernel's default queue. The kernel is launched ``samples + 1`` times
+        per candidate, so its arguments should tolerate being run
+        repeatedly. If the kernel's source is not known (see
+        :func:`kernel_key`), the result is returned but not saved.
+        """
+        queue = kwargs.pop('queue', None) or kernel.queue
+        global_size = tuple(global_size)
+        tuning = Tuning(self.candidates_for(kernel, queue.device, global_size),
+                        self.samples)
+        for local_size in list(tuning.candidates):
+            try:
+                # warm up
+                kernel(queue, global_size, *args,
+                       local_size=local_size).wait()
+                for _ in xrange(self.samples):
+                    start = clq.profiling.clock()
+                    kernel(queue, global_size, *args,
+                           local_size=local_size).wait()
+                    tuning.record(local_size, clq.profiling.clock() - start)
+            except Exception:
+                # e.g. too many resources requested for this local size
+                tuning.reject(local_size)
+        memo = self._memo_key(kernel, queue, global_size)
+        if memo is None:
+            return tuning.best
+        return self._finish(memo, tuning)
+
+    def _finish(self, memo, tuning):
+        local_size = tuning.best
+        self._remember(memo, local_size)
+        if self.database is not None:
+            self.database.store(key_for(*memo), local_size, tuning.timings)
+        return local_size
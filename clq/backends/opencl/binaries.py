@@ -0,0 +1,97 @@
+"""A persistent on-disk cache of built OpenCL program binaries.
+
+Building a program from source can take the driver hundreds of milliseconds
+or more per device. When a cache is active,
+:meth:`pyocl.Context.compile <clq.backends.opencl.pyocl.Context.compile>`
+saves the binaries of each program it builds from source and builds the
+program from them in later processes instead.
+
+Caching is off by default. To turn it on for the whole process::
+
+    import clq.backends.opencl.binaries
+    clq.backends.opencl.binaries.enable("/var/cache/clq-binaries",
+                                        max_size=256*1024*1024)
+
+Entries are keyed by a hash of the source, the build options and the
+platform name and version, device name and driver version of each device
+(see :func:`key_for`), so upgrading the driver invalidates them implicitly.
+Each binary is stored with its digest, so corrupted entries are detected,
+deleted and rebuilt from source. Entries that load but that the driver
+refuses to build from are :meth:`discarded <clq.cache.DirectoryCache.discard>`
+in the same way.
+"""
+import hashlib as _hashlib
+
+import clq.cache
+
+format_version = 1
+"""The version of the on-disk entry format. Bumped whenever it changes, which
+invalidates all existing entries."""
+
+active = None
+"""The process-wide :class:`BinaryCache` consulted by
+:meth:`pyocl.Context.compile <clq.backends.opencl.pyocl.Context.compile>`,
+or None if caching is disabled (the default)."""
+
+def enable(path, max_size=None):
+    """Creates a :class:`BinaryCache` at ``path`` and makes it
+    :data:`active`. Returns the cache."""
+    global active
+    active = BinaryCache(path, max_size)
+    return active
+
+def disable():
+    """Disables caching. Entries already on disk are left alone."""
+    global active
+    active = None
+
+def device_key(device):
+    """Returns a string identifying the platform, device and driver of an
+    OpenCL device (e.g. a :class:`pyopencl.Device`)."""
+    platform = device.platform
+    return "\0".join((platform.name, platform.version, device.name,
+                      device.driver_version))
+
+def key_for(source, options, device_keys):
+    """Returns the cache key for ``source`` built with ``options`` (a string)
+    for the devices identified by ``device_keys`` (see :func:`device_key`),
+    in order."""
+    parts = [str(format_version),
+             _hashlib.sha1(source).hexdigest(),
+             options]
+    parts.extend(device_keys)
+    return _hashlib.sha1("\0".join(parts)).hexdigest()
+
+class BinaryCache(clq.cache.DirectoryCache):
+    """A directory of cached program binaries (see
+    :class:`clq.cache.DirectoryCache`)."""
+    suffix = ".clbin"
+
+    def load(self, key):
+        """Returns the binaries stored under ``key``, one per device, or None
+        if there are none.
+
+        Entries that are unreadable or whose binaries do not match their
+        digests are deleted and treated as misses.
+        """
+        def decode(entry):
+            binaries = entry['binaries']
+            digests = tuple(_hashlib.sha1(binary).hexdigest()
+                            for binary in binaries)
+            if digests != entry['digests']:
+                raise ValueError("Digest mismatch.")
+            return binaries
+        return self._load_entry(key, decode)
+
+    def store(self, key, binaries):
+        """Saves ``binaries``, one per device, under ``key``. Does nothing if
+        any of them are empty (i.e. the program was not built for that
+        device)."""
+        binaries = tuple(str(binary) for binary in binaries)
+        if not binaries or not all(binaries):
+            return
+        self._store_entry(key, {
+            'binaries': binaries,
+            'digests': tuple(_hashlib.sha1(binary).hexdigest()
+                             for binary in binaries)
+        })
@@ -0,0 +1,663 @@
+"""Descriptors for the OpenCL extensions and built-in functions, constants and
+reserved keywords.
+
+This module is imported the first time :data:`builtins 
+<clq.backends.opencl.builtins>` or :data:`extensions 
+<clq.backends.opencl.extensions>` is used, rather than when 
+:mod:`clq.backends.opencl` is imported, since constructing several hundred 
+descriptors is a noticeable part of the startup time of short-lived 
+processes. The descriptors can be imported from here or, as before, from 
+:mod:`clq.backends.opencl`, which imports this module when one is first 
+looked up there::
+
+    from clq.backends.opencl import get_global_id
+"""
+import cypy
+from clq import TypeResolutionError
+from clq.backends.opencl import (Extension, BuiltinFn, BuiltinConstant, 
+                                 ReservedKeyword, void, char, uchar, short, 
+                                 ushort, int, uint, long, ulong, float, 
+                                 size_t, intptr_t, ScalarType, VectorType, 
+                                 PtrType, StrType, FloatType, vector_types, 
+                                 vector_type_sizes, 
+                                 machine_independent_int_types, float_types)
+
+#############################################################################
+## OpenCL Extension descriptors
+#############################################################################
+cl_khr_fp64 = Extension("cl_khr_fp64")
+"""Standard 64-bit floating point extension.
+
+*See section 9.3 in the spec.*
+"""
+
+cl_khr_fp16 = Extension("cl_khr_fp16")
+"""Standard extension supporting use of the half type as a full type. 
+
+*See section 9.10 in the spec.*
+"""
+
+cl_khr_global_int32_base_atomics = Extension("cl_khr_global_int32_base_atomics")
+"""Standard 32-bit base atomic operations for global memory.
+
+*See section 9.5 in the spec.*
+"""
+
+cl_khr_global_int32_extended_atomics = \
+    Extension("cl_khr_global_int32_extended_atomics")
+"""Standard 32-bit extended atomic operations for global memory.
+
+*See section 9.5 in the spec.*
+"""
+
+cl_khr_local_int32_base_atomics = Extension("cl_khr_local_int32_base_atomics")
+"""Standard 32-bit base atomic operations for local memory.
+
+*See section 9.6 in the spec.*
+"""
+
+cl_khr_local_int32_extended_atomics = \
+    Extension("cl_khr_local_int32_extended_atomics")
+"""Standard 32-bit extended atomic operations for local memory.
+
+*See section 9.6 in the spec.*
+"""
+
+int32_global_atomics_extensions = (cl_khr_global_int32_base_atomics,
+                                   cl_khr_global_int32_extended_atomics)
+"""Tuple containing both the base and extended 32-bit base atomic extensions."""
+
+int32_local_atomics_extensions = (cl_khr_local_int32_base_atomics,
+                                  cl_khr_local_int32_extended_atomics)
+"""Tuple containing both the base and extended 32-bit base atomic extensions."""
+
+int32_atomics_extensions = (cl_khr_global_int32_base_atomics,
+                            cl_khr_global_int32_extended_atomics,
+                            cl_khr_local_int32_base_atomics,
+                            cl_khr_local_int32_extended_atomics)
+"""Tuple containing all 32-bit atomics extensions."""
+
+cl_khr_int64_base_atomics = Extension("cl_khr_int64_base_atomics")
+"""Standard 64-bit base atomic operations.
+
+*See section 9.7 in the spec.*
+"""
+
+cl_khr_int64_extended_atomics = Extension("cl_khr_int64_extended_atomics")
+"""Standard 64-bit extended atomic operations.
+
+*See section 9.7 in the spec.*
+"""
+
+int64_atomics_extensions = (cl_khr_int64_base_atomics,
+                            cl_khr_int64_extended_atomics)
+"""Tuple containing all 64-bit atomics extensions."""
+
+cl_khr_byte_addressable_store = Extension("cl_khr_byte_addressable_store")
+"""Standard extension to support byte addressable arrays.
+
+*See section 9.9 in the spec.*
+"""
+
+cl_khr_3d_image_writes = Extension("cl_khr_3d_image_writes")
+"""Standard extension to support 3D image memory objects.
+
+*See section 9.8 in the spec.*
+"""
+
+khr_extensions = cypy.cons.ed(int32_atomics_extensions,                           #@UndefinedVariable
+                              int64_atomics_extensions, 
+                              (cl_khr_byte_addressable_store,))
+
+cl_APPLE_gl_sharing = Extension("cl_APPLE_gl_sharing")
+"""Apple extension for OpenGL sharing."""
+
+cl_APPLE_SetMemObjectDestructor = Extension("cl_APPLE_SetMemObjectDestructor")
+"""Apple SetMemObjectDestructor extension."""
+
+cl_APPLE_ContextLoggingFunctions = Extension("cl_APPLE_ContextLoggingFunctions")
+"""Apple ContextLoggingFunctions extension."""
+
+APPLE_extensions = (cl_APPLE_gl_sharing, 
+                    cl_APPLE_SetMemObjectDestructor,
+                    cl_APPLE_ContextLoggingFunctions)
+"""Tuple containing all Apple extensions."""
+
+##############################################################################
+# Built-ins 
+##############################################################################
+# TODO: These don't actually do any error checking
+# Work-Item Built-in Functions [6.11.1]
+get_work_dim = BuiltinFn("get_work_dim", lambda D: uint)
+"""The ``get_work_dim`` builtin function."""
+get_global_size = BuiltinFn("get_global_size", lambda D: size_t)
+"""The ``get_global_size`` builtin function."""
+get_global_id = BuiltinFn("get_global_id", lambda D: size_t)
+"""The ``get_global_id`` builtin function."""
+get_local_size = BuiltinFn("get_local_size", lambda D: size_t)
+"""The ``get_local_size`` builtin function."""
+get_local_id = BuiltinFn("get_local_id", lambda D: size_t)
+"""The ``get_local_id`` builtin function."""
+get_num_groups = BuiltinFn("get_num_groups", lambda D: size_t)
+"""The ``get_num_groups`` builtin function."""
+get_group_id = BuiltinFn("get_group_id", lambda D: size_t)
+"""The ``get_group_id`` builtin function."""
+work_item_fns = (get_work_dim, get_global_size, get_global_id, 
+                 get_local_size, get_local_id, get_num_groups, get_group_id)
+"""Tuple containing the work-item functions."""
+
+# Integer Built-in Functions [6.11.3]
+abs = BuiltinFn("abs", lambda x: x.unsigned_variant)
+"""The ``abs`` builtin function."""
+abs_diff = BuiltinFn("abs_diff", lambda x, y: x.unsigned_variant)
+"""The ``abs_diff`` builtin function."""
+add_sat = BuiltinFn("add_sat", lambda x, y: x)
+"""The ``add_sat`` builtin function."""
+hadd = BuiltinFn("hadd", lambda x, y: x)
+"""The ``hadd`` builtin function."""
+rhadd = BuiltinFn("rhadd", lambda x, y: x)
+"""The ``rhadd`` builtin function."""
+clz = BuiltinFn("clz", lambda x: x)
+"""The ``clz`` builtin function."""
+mad_hi = BuiltinFn("mad_hi", lambda a, b, c: a)
+"""The ``mad_hi`` builtin function."""
+mad24 = BuiltinFn("mad24", lambda a, b, c: a)
+"""The ``mad24`` builtin function."""
+mad_sat = BuiltinFn("mad_sat", lambda a, b, c: a)
+"""The ``mad_sat`` builtin function."""
+max = BuiltinFn("max", lambda x, y: x)
+"""The ``max`` builtin function."""
+min = BuiltinFn("min", lambda x, y: x)
+"""The ``min`` builtin function."""
+mul_hi = BuiltinFn("mul_hi", lambda x, y: x)
+"""The ``mul_hi`` builtin function."""
+mul24 = BuiltinFn("mul24", lambda a, b: a)
+"""The ``mul24`` builtin function."""
+rotate = BuiltinFn("rotate", lambda v, i: v)
+"""The ``rotate`` builtin function."""
+sub_sat = BuiltinFn("sub_sat", lambda x, y: x)
+"""The ``sub_sat`` builtin function."""
+
+def _upsample_return_type_fn(hi, lo):
+    # TODO: don't use is
+    if hi is char and lo is uchar:
+        return short
+    if hi is uchar and lo is uchar:
+        return ushort
+    if hi is short and lo is ushort:
+        return int
+    if hi is ushort and lo is short:
+        return uint
+    if hi is int and lo is int:
+        return long
+    if hi is uint and lo is uint:
+        return ulong
+    
+    raise TypeResolutionError(
+        "Invalid argument types for upsample built-in: %s and %s." % 
+        (hi.name, lo.name))
+upsample = BuiltinFn("upsample", _upsample_return_type_fn)
+"""The ``upsample`` builtin function."""
+
+# Common Built-in Functions [6.11.4]
+clamp = BuiltinFn("clamp", lambda x, min, max: x)
+"""The ``clamp`` builtin function."""
+degrees = BuiltinFn("degrees", lambda radians: radians)
+"""The ``degrees`` builtin function."""
+mix = BuiltinFn("mix", lambda x, y: x)
+"""The ``mix`` builtin function."""
+radians = BuiltinFn("radians", lambda degrees: degrees)
+"""The ``radians`` builtin function."""
+step = BuiltinFn("step", lambda edge, x: x)
+"""The ``step`` builtin function."""
+smoothstep = BuiltinFn("smoothstep", lambda edge0, edge1, x: x)
+"""The ``smoothstep`` builtin function."""
+sign = BuiltinFn("sign", lambda x: x)
+"""The ``sign`` builtin function."""
+
+# Math Built-in Functions [6.11.2]
+acos = BuiltinFn("acos", lambda x: x)
+"""The ``acos`` builtin function."""
+acosh = BuiltinFn("acosh", lambda x: x)
+"""The ``acosh`` builtin function."""
+acospi = BuiltinFn("acospi", lambda x: x)
+"""The ``acospi`` builtin function."""
+asin = BuiltinFn("asin", lambda x: x)
+"""The ``asin`` builtin function."""
+asinh = BuiltinFn("asinh", lambda x: x)
+"""The ``asinh`` builtin function."""
+asinpi = BuiltinFn("asinpi", lambda x: x)
+"""The ``asinpi`` builtin function."""
+atan = BuiltinFn("atan", lambda y_over_x: y_over_x)
+"""The ``atan`` builtin function."""
+atan2 = BuiltinFn("atan2", lambda y, x: y)
+"""The ``atan2`` builtin function."""
+atanh = BuiltinFn("atanh", lambda x: x)
+"""The ``atanh`` builtin function."""
+atanpi = BuiltinFn("atanpi", lambda x: x)
+"""The ``atanpi`` builtin function."""
+atan2pi = BuiltinFn("atan2pi", lambda x, y: x)
+"""The ``atan2pi`` builtin function."""
+cbrt = BuiltinFn("cbrt", lambda x: x)
+"""The ``cbrt`` builtin function."""
+ceil = BuiltinFn("ceil", lambda x: x)
+"""The ``ceil`` builtin function."""
+copysign = BuiltinFn("copysign", lambda x, y: x)
+"""The ``copysign`` builtin function."""
+cos = BuiltinFn("cos", lambda x: x)
+"""The ``cos`` builtin function."""
+half_cos = BuiltinFn("half_cos", lambda x: x)
+"""The ``half_cos`` builtin function."""
+native_cos = BuiltinFn("native_cos", lambda x: x)
+"""The ``native_cos`` builtin function."""
+cosh = BuiltinFn("cosh", lambda x: x)
+"""The ``cosh`` builtin function."""
+cospi = BuiltinFn("cospi", lambda x: x)
+"""The ``cospi`` builtin function."""
+half_divide = BuiltinFn("half_divide", lambda x, y: x)
+"""The ``half_divide`` builtin function."""
+native_divide = BuiltinFn("native_divide", lambda x, y: x)
+"""The ``native_divide`` builtin function."""
+erfc = BuiltinFn("erfc", lambda x, y: x)
+"""The ``erfc`` builtin function."""
+erf = BuiltinFn("erf", lambda x: x)
+"""The ``erf`` builtin function."""
+exp = BuiltinFn("exp", lambda x: x)
+"""The ``exp`` builtin function."""
+half_exp = BuiltinFn("half_exp", lambda x: x)
+"""The ``half_exp`` builtin function."""
+native_exp = BuiltinFn("native_exp", lambda x: x)
+"""The ``native_exp`` builtin function."""
+exp2 = BuiltinFn("exp2", lambda x: x)
+"""The ``exp2`` builtin function."""
+half_exp2 = BuiltinFn("half_exp2", lambda x: x)
+"""The ``half_exp2`` builtin function."""
+native_exp2 = BuiltinFn("native_exp2", lambda x: x)
+"""The ``native_exp2`` builtin function."""
+exp10 = BuiltinFn("exp10", lambda x: x)
+"""The ``exp10`` builtin function."""
+half_exp10 = BuiltinFn("half_exp10", lambda x: x)
+"""The ``half_exp10`` builtin function."""
+native_exp10 = BuiltinFn("native_exp10", lambda x: x)
+"""The ``native_exp10`` builtin function."""
+expm1 = BuiltinFn("expm1", lambda x: x)
+"""The ``expm1`` builtin function."""
+fabs = BuiltinFn("fabs", lambda x: x)
+"""The ``fabs`` builtin function."""
+fdim = BuiltinFn("fdim", lambda x, y: x)
+"""The ``fdim`` builtin function."""
+floor = BuiltinFn("floor", lambda x: x)
+"""The ``floor`` builtin function."""
+fma = BuiltinFn("fma", lambda a, b, c: a)
+"""The ``fma`` builtin function."""
+fmax = BuiltinFn("fmax", lambda x, y: x)
+"""The ``fmax`` builtin function."""
+fmin = BuiltinFn("fmin", lambda x, y: x)
+"""The ``fmin`` builtin function."""
+fmod = BuiltinFn("fmod", lambda x, y: x)
+"""The ``fmod`` builtin function."""
+fract = BuiltinFn("fract", lambda x, iptr: x)
+"""The ``fract`` builtin function."""
+frexp = BuiltinFn("frexp", lambda x, exp: x)
+"""The ``frexp`` builtin function."""
+hypot = BuiltinFn("hypot", lambda x, y: x)
+"""The ``hypot`` builtin function."""
+ilogb = BuiltinFn("ilogb", lambda x: x)
+"""The ``ilogb`` builtin function."""
+ldexp = BuiltinFn("ldexp", lambda x, n: x)
+"""The ``ldexp`` builtin function."""
+lgamma = BuiltinFn("lgamma", lambda x: x)
+"""The ``lgamma`` builtin function."""
+lgamma_r = BuiltinFn("lgamma_r", lambda x, signp: x)
+"""The ``lgamma_r`` builtin function."""
+log = BuiltinFn("log", lambda x: x)
+"""The ``log`` builtin function."""
+half_log = BuiltinFn("half_log", lambda x: x)
+"""The ``half_log`` builtin function."""
+native_log = BuiltinFn("native_log", lambda x: x)
+"""The ``native_log`` builtin function."""
+log2 = BuiltinFn("log2", lambda x: x)
+"""The ``log2`` builtin function."""
+half_log2 = BuiltinFn("half_log2", lambda x: x)
+"""The ``half_log2`` builtin function."""
+native_log2 = BuiltinFn("native_log2", lambda x: x)
+"""The ``native_log2`` builtin function."""
+log10 = BuiltinFn("log10", lambda x: x)
+"""The ``log10`` builtin function."""
+half_log10 = BuiltinFn("half_log10", lambda x: x)
+"""The ``half_log10`` builtin function."""
+native_log10 = BuiltinFn("native_log10", lambda x: x)
+"""The ``native_log10`` builtin function."""
+log1p = BuiltinFn("log1p", lambda x: x)
+"""The ``log1p`` builtin function."""
+logb = BuiltinFn("logb", lambda x: x)
+"""The ``logb`` builtin function."""
+mad = BuiltinFn("mad", lambda a, b, c: a)
+"""The ``mad`` builtin function."""
+modf = BuiltinFn("modf", lambda x, iptr: x)
+"""The ``modf`` builtin function."""
+nextafter = BuiltinFn("nextafter", lambda x, y: x)
+"""The ``nextafter`` builtin function."""
+pow = BuiltinFn("pow", lambda x, y: x)
+"""The ``pow`` builtin function."""
+pown = BuiltinFn("pown", lambda x, y: x)
+"""The ``pown`` builtin function."""
+powr = BuiltinFn("powr", lambda x, y: x)
+"""The ``powr`` builtin function."""
+half_powr = BuiltinFn("half_powr", lambda x, y: x)
+"""The ``half_powr`` builtin function."""
+native_powr = BuiltinFn("native_powr", lambda x, y: x)
+"""The ``native_powr`` builtin function."""
+half_recip = BuiltinFn("half_recip", lambda x: x)
+"""The ``half_recip`` builtin function."""
+native_recip = BuiltinFn("native_recip", lambda x: x)
+"""The ``native_recip`` builtin function."""
+remainder = BuiltinFn("remainder", lambda x, y: x)
+"""The ``remainder`` builtin function."""
+remquo = BuiltinFn("remquo", lambda x, y, n: x)
+"""The ``remquo`` builtin function."""
+rint = BuiltinFn("rint", lambda x: x)
+"""The ``rint`` builtin function."""
+rootn = BuiltinFn("rootn", lambda x, y: x)
+"""The ``rootn`` builtin function."""
+round = BuiltinFn("round", lambda x: x)
+"""The ``round`` builtin function."""
+rsqrt = BuiltinFn("rsqrt", lambda x: x)
+"""The ``rsqrt`` builtin function."""
+native_rsqrt = BuiltinFn("native_rsqrt", lambda x: x)
+"""The ``native_rsqrt`` builtin function."""
+half_rsqrt = BuiltinFn("half_rsqrt", lambda x: x)
+"""The ``half_rsqrt`` builtin function."""
+sin = BuiltinFn("sin", lambda x: x)
+"""The ``sin`` builtin function."""
+native_sin = BuiltinFn("native_sin", lambda x: x)
+"""The ``native_sin`` builtin function."""
+half_sin = BuiltinFn("half_sin", lambda x: x)
+"""The ``half_sin`` builtin function."""
+sincos = BuiltinFn("sincos", lambda x, cosval: x)
+"""The ``sincos`` builtin function."""
+sinh = BuiltinFn("sinh", lambda x: x)
+"""The ``sinh`` builtin function."""
+sinpi = BuiltinFn("sinpi", lambda x: x)
+"""The ``sinpi`` builtin function."""
+sqrt = BuiltinFn("sqrt", lambda x: x)
+"""The ``sqrt`` builtin function."""
+half_sqrt = BuiltinFn("half_sqrt", lambda x: x)
+"""The ``half_sqrt`` builtin function."""
+native_sqrt = BuiltinFn("native_sqrt", lambda x: x)
+"""The ``native_sqrt`` builtin function."""
+tan = BuiltinFn("tan", lambda x: x)
+"""The ``tan`` builtin function."""
+half_tan = BuiltinFn("half_tan", lambda x: x)
+"""The ``half_tan`` builtin function."""
+native_tan = BuiltinFn("native_tan", lambda x: x)
+"""The ``native_tan`` builtin function."""
+tanh = BuiltinFn("tanh", lambda x: x)
+"""The ``tanh`` builtin function."""
+tanpi = BuiltinFn("tanpi", lambda x: x)
+"""The ``tanpi`` builtin function."""
+tgamma = BuiltinFn("tgamma", lambda x: x)
+"""The ``tgamma`` builtin function."""
+trunc = BuiltinFn("trunc", lambda x: x)
+"""The ``trunc`` builtin function."""
+
+elementwise_fns = frozenset(
+    value for value in globals().values()
+    if isinstance(value, BuiltinFn) and value not in work_item_fns and 
+    value not in (fract, frexp, lgamma_r, modf, remquo, sincos))
+"""The integer, common and math functions above that do not write to memory.
+They apply to each element of vector arguments."""
+
+# Geometric Built-in Functions [6.11.5]
+def _element_type(p):
+    # dot, distance and length of vectors are scalars
+    if isinstance(p, VectorType):
+        return p.base_type
+    return p
+
+dot = BuiltinFn("dot", lambda p0, p1: _element_type(p0))
+"""The ``dot`` builtin function."""
+distance = BuiltinFn("distance", lambda p0, p1: _element_type(p0))
+"""The ``distance`` builtin function."""
+length = BuiltinFn("length", lambda p: _element_type(p))
+"""The ``length`` builtin function."""
+normalize = BuiltinFn("normalize", lambda p: p)
+"""The ``normalize`` builtin function."""
+fast_distance = BuiltinFn("fast_distance", lambda p0, p1: float)
+"""The ``fast_distance`` builtin function."""
+fast_length = BuiltinFn("fast_length", lambda p: float)
+"""The ``fast_length`` builtin function."""
+fast_normalize = BuiltinFn("fast_normalize", lambda p: float)
+"""The ``fast_normalize`` builtin function."""
+
+# Relational Built-in Functions [6.11.6]
+isequal = BuiltinFn("isequal", lambda x, y: int)
+"""The ``isequal`` builtin function."""
+isnotequal = BuiltinFn("isnotequal", lambda x, y: int)
+"""The ``isnotequal`` builtin function."""
+isgreater = BuiltinFn("isgreater", lambda x, y: int)
+"""The ``isgreater`` builtin function."""
+isgreaterequal = BuiltinFn("isgreaterequal", lambda x, y: int)
+"""The ``isgreaterequal`` builtin function."""
+isless = BuiltinFn("isless", lambda x, y: int)
+"""The ``isless`` builtin function."""
+islessequal = BuiltinFn("islessequal", lambda x, y: int)
+"""The ``islessequal`` builtin function."""
+islessgreater = BuiltinFn("islessgreater", lambda x, y: int)
+"""The ``islessgreater`` builtin function."""
+isfinite = BuiltinFn("isfinite", lambda x: int)
+"""The ``isfinite`` builtin function."""
+isinf = BuiltinFn("isinf", lambda x: int)
+"""The ``isinf`` builtin function."""
+isnan = BuiltinFn("isnan", lambda x: int)
+"""The ``isnan`` builtin function."""
+isnormal = BuiltinFn("isnormal", lambda x: int)
+"""The ``isnormal`` builtin function."""
+isordered = BuiltinFn("isordered", lambda x, y: int)
+"""The ``isordered`` builtin function."""
+isunordered = BuiltinFn("isunordered", lambda x, y: int)
+"""The ``isunordered`` builtin function."""
+signbit = BuiltinFn("signbit", lambda x: int)
+"""The ``signbit`` builtin function."""
+any = BuiltinFn("any", lambda x: int)
+"""The ``any`` builtin function."""
+all = BuiltinFn("all", lambda x: int)
+"""The ``all`` builtin function."""
+bitselect = BuiltinFn("bitselect", lambda a, b, c: a)
+"""The ``bitselect`` builtin function."""
+select = BuiltinFn("select", lambda a, b, c: a)
+"""The ``select`` builtin function."""
+
+# Base Atomic Functions [9.5]
+atom_add = BuiltinFn("atom_add", lambda p, val: val)
+"""The ``atom_add`` builtin function."""
+atom_sub = BuiltinFn("atom_sub", lambda p, val: val)
+"""The ``atom_sub`` builtin function."""
+atom_xchg = BuiltinFn("atom_xchg", lambda p, val: val)
+"""The ``atom_xchg`` builtin function."""
+atom_inc = BuiltinFn("atom_inc", lambda p: p.target_type)
+"""The ``atom_inc`` builtin function."""
+atom_dec = BuiltinFn("atom_dec", lambda p: p.target_type)
+"""The ``atom_dec`` builtin function."""
+atom_cmpxchg = BuiltinFn("atom_cmpxchg", lambda p, cmp, val: val)
+"""The ``atom_cmpxchg`` builtin function."""
+base_atomics = (atom_add, atom_sub, atom_xchg, atom_inc, atom_dec, atom_cmpxchg)
+
+def _base_atomic_extension_inference(p, *args): #@UnusedVariable
+    target_type = p.target_type
+    if target_type is int or target_type is uint:
+        if p.address_space == "__global":
+            return (cl_khr_global_int32_base_atomics,)
+        return (cl_khr_local_int32_base_atomics,)
+    return (cl_khr_int64_base_atomics,)
+    
+for fn in base_atomics:
+    fn.requires_extensions = _base_atomic_extension_inference
+    
+# Extended Atomic Functions [9.5]
+atom_min = BuiltinFn("atom_min", lambda p, val: val)
+"""The ``atom_min`` builtin function."""
+atom_max = BuiltinFn("atom_max", lambda p, val: val)
+"""The ``atom_max`` builtin function."""
+atom_and = BuiltinFn("atom_and", lambda p, val: val)
+"""The ``atom_and`` builtin function."""
+atom_or = BuiltinFn("atom_or", lambda p, val: val)
+"""The ``atom_or`` builtin function."""
+atom_xor = BuiltinFn("atom_xor", lambda p, val: val)
+"""The ``atom_xor`` builtin function."""
+extended_atomics = (atom_min, atom_max, atom_and, atom_or, atom_xor)
+
+def _extended_atomic_extension_inference(p):
+    target_type = p.target_type
+    if target_type is int or target_type is uint:
+        if p.address_space == "__global":
+            return (cl_khr_global_int32_extended_atomics,)
+        return (cl_khr_local_int32_extended_atomics,)
+    return (cl_khr_int64_extended_atomics,)
+
+for fn in extended_atomics:
+    fn.requires_extensions = _extended_atomic_extension_inference
+
+# Vector Data Load/Store Built-in Functions [6.11.7]
+vload_half = BuiltinFn("vload_half", lambda offset, p: float)
+"""The ``vload_half`` builtin function."""
+vstore_half = BuiltinFn("vstore_half", lambda data, offset, p: void)
+"""The ``vstore_half`` builtin function."""
+
+def _vload_return_type_fn(n):
+    def return_type_fn(offset, p):
+        if not isinstance(p, PtrType) or \
+                p.target_type.vector_types is None:
+            raise TypeResolutionError(
+                "vload%d requires a pointer to scalars, but got a '%s'." % 
+                (n, p.name), None)
+        return p.target_type.vector_types[n]
+    return return_type_fn
+
+def _vstore_return_type_fn(n):
+    def return_type_fn(data, offset, p):
+        if not isinstance(p, PtrType) or \
+                p.target_type.vector_types is None:
+            raise TypeResolutionError(
+                "vstore%d requires a pointer to scalars, but got a '%s'." % 
+                (n, p.name), None)
+        if data is not p.target_type.vector_types[n]:
+            raise TypeResolutionError(
+                "vstore%d cannot store a '%s' to a '%s'." % 
+                (n, data.name, p.name), None)
+        return void
+    return return_type_fn
+
+def _vstore_half_return_type_fn(n):
+    def return_type_fn(data, offset, p):
+        if not isinstance(data, VectorType) or data.n != n or \
+                not isinstance(data.base_type, FloatType):
+            raise TypeResolutionError(
+                "vstore_half%d requires a floating point vector of size %d, "
+                "but got a '%s'." % (n, n, data.name), None)
+        return void
+    return return_type_fn
+
+vloads = tuple(BuiltinFn("vload%d" % n, _vload_return_type_fn(n)) 
+               for n in vector_type_sizes)
+"""The ``vloadN`` builtin functions."""
+vstores = tuple(BuiltinFn("vstore%d" % n, _vstore_return_type_fn(n)) 
+                for n in vector_type_sizes)
+"""The ``vstoreN`` builtin functions."""
+vload_halfs = tuple(BuiltinFn("vload_half%d" % n, 
+                              lambda offset, p, n=n: float.vector_types[n]) 
+                    for n in vector_type_sizes)
+"""The ``vload_halfN`` builtin functions."""
+vstore_halfs = tuple(BuiltinFn("vstore_half%d" % n, 
+                               _vstore_half_return_type_fn(n))
+                     for n in vector_type_sizes)
+"""The ``vstore_halfN`` builtin functions."""
+
+# Conversions and Type Reinterpretation [6.2.3, 6.2.4]
+rounding_modes = ("_rte", "_rtz", "_rtp", "_rtn")
+"""The rounding mode suffixes of the ``convert_`` functions."""
+
+def _is_scalar(t):
+    return isinstance(t, ScalarType) and not isinstance(t, StrType)
+
+def _convert_return_type_fn(dest):
+    if isinstance(dest, VectorType):
+        def return_type_fn(x):
+            if not isinstance(x, VectorType) or x.n != dest.n:
+                raise TypeResolutionError(
+                    "Cannot convert a '%s' to a '%s'." % (x.name, dest.name),
+                    None)
+            return dest
+    else:
+        def return_type_fn(x):
+            if not _is_scalar(x):
+                raise TypeResolutionError(
+                    "Cannot convert a '%s' to a '%s'." % (x.name, dest.name),
+                    None)
+            return dest
+    return return_type_fn
+
+def _as_return_type_fn(dest):
+    def return_type_fn(x):
+        if not (_is_scalar(x) or isinstance(x, VectorType)) or \
+                x.min_sizeof != dest.min_sizeof or \
+                x.max_sizeof != dest.max_sizeof:
+            raise TypeResolutionError(
+                "Cannot reinterpret a '%s' as a '%s': the sizes differ." % 
+                (x.name, dest.name), None)
+        return dest
+    return return_type_fn
+
+conversions = { }
+"""A map from the names of the ``convert_`` and ``as_`` functions, e.g. 
+``convert_float4_sat_rte`` or ``as_int4``, to their descriptors."""
+
+for dest in cypy.cons(machine_independent_int_types.itervalues(),
+                      float_types.itervalues(),
+                      vector_types.itervalues()):
+    return_type_fn = _convert_return_type_fn(dest)
+    for saturation in ("", "_sat"):
+        for rounding_mode in ("",) + rounding_modes:
+            name = "convert_%s%s%s" % (dest.name, saturation, rounding_mode)
+            conversions[name] = BuiltinFn(name, return_type_fn)
+    name = "as_" + dest.name
+    conversions[name] = BuiltinFn(name, _as_return_type_fn(dest))
+
+sizeof = BuiltinFn("sizeof", lambda x: size_t)
+"""The ``sizeof`` builtin operator."""
+
+# Side effects, for the optimizer (the other functions are pure)
+for fn in base_atomics + extended_atomics + vstores + vstore_halfs + (
+        vstore_half, fract, frexp, lgamma_r, modf, remquo, sincos):
+    fn.effects = "write"
+for fn in vloads + vload_halfs + (vload_half,):
+    fn.effects = "read"
+
+# Built-in constants
+true = BuiltinConstant("true", int)
+false = BuiltinConstant("false", int)
+NULL = BuiltinConstant("NULL", intptr_t)
+
+# Reserved keywords
+reserved_keywords = ["auto", "break", "case", "char", "const", "continue", 
+                     "default", "do", "double", "else", "enum", "extern", 
+                     "float", "for", "goto", "if", "inline", "int", "long", 
+                     "register", "restrict", "return", "short", "signed", 
+                     "sizeof", "static", "struct", "switch", "typedef",
+                     "union", "unsigned", "void", "volatile", "while", "_Bool",
+                     "_Complex", "_Imaginary", "char", "uchar", "short", 
+                     "ushort", "int", "uint", "long", "ulong", "float",
+                     "half", "double", "bool", "quad", "complex", "imaginary",
+                     "image2d_t", "image3d_t", "sampler_t", "event_t",
+                     "__global", "global", "__local", "local", "__private",
+                     "private", "__constant", "constant", "__kernel", "kernel",
+                     "__read_only", "read_only", "__write_only", "write_only",
+                     "__read_write", "read_write", "__attribute__"]
+scalar_types = ("char", "uchar", "short", "ushort", "int", "uint", "long",
+                "ulong", "float", "half", "double", "bool", "quad")
+for type in scalar_types:
+    for size in vector_type_sizes:
+        reserved_keywords.append(type + str(size))
+reserved_keywords = tuple(reserved_keywords)
+reserved_keyword_descriptors = tuple(ReservedKeyword(kw) 
+                                     for kw in reserved_keywords)
@@ -0,0 +1,157 @@
+"""A pool of device buffers, reused across allocations of similar sizes.
+
+Creating an OpenCL buffer is not free, and iterative workloads often allocate
+and drop buffers of the same few sizes over and over. Each
+:class:`pyocl.Context <clq.backends.opencl.pyocl.Context>` has a
+:class:`BufferPool` (its ``pool``), through which :meth:`Context.alloc
+<clq.backends.opencl.pyocl.Context.alloc>`, :meth:`Buffer.shaped
+<clq.backends.opencl.pyocl.Buffer.shaped>` and the methods built on them
+(``to_device``, ``In``, ``Out`` and ``InOut``) allocate buffers. Requests are
+rounded up to a :func:`size class <size_class>`, and buffers given back by
+:meth:`Buffer.release <clq.backends.opencl.pyocl.Buffer.release>` are
+retained and handed out again for the next request of the same class and
+flags::
+
+    for i in xrange(n_iterations):
+        tmp = ctx.alloc(like=a)
+        step(a, tmp)
+        ...
+        tmp.release() # returned to ctx.pool, not freed
+
+Buffers that are never released are freed when garbage collected, as
+before. A released buffer must not be used again. Releasing does not wait
+for queued commands using the buffer to finish, which is safe as long as its
+next user enqueues commands on the same in-order queue (e.g. the default
+queue).
+
+At most :attr:`BufferPool.max_retained` bytes are retained. Beyond that, the
+buffers that were released least recently are freed.
+"""
+import collections as _collections
+
+min_size = 256
+"""The smallest size class, in bytes."""
+
+steps = 4
+"""The number of size classes between consecutive powers of two. With 4,
+at most a fifth of a buffer is wasted by rounding up."""
+
+def size_class(size):
+    """Returns the size, in bytes, of the buffer allocated for a request of
+    ``size`` bytes: ``size`` rounded up to one of :data:`steps` evenly spaced
+    sizes between consecutive powers of two, and to at least
+    :data:`min_size`."""
+    if size <= min_size:
+        return min_size
+    power = 1 << ((size - 1).bit_length() - 1)
+    step = max(power // steps, 1)
+    return (size + step - 1) // step * step
+
+class BufferPool(object):
+    """Allocates buffers with ``allocate(flags, size)`` and retains released
+    ones for reuse. ``free(buffer)`` frees a buffer that is not retained."""
+    def __init__(self, allocate, free, max_retained=None):
+        self.allocate = allocate
+        self.free = free
+        if max_retained is not None:
+            self.max_retained = max_retained
+        self._free_buffers = { }
+        self._released = _collections.OrderedDict()
+        self.retained_bytes = 0
+        self.allocations = 0
+        self.hits = 0
+        self.misses = 0
+        self.releases = 0
+        self.evictions = 0
+
+    max_retained = 256 * 1024 * 1024
+    """The maximum total size of the retained buffers, in bytes. Can be
+    changed on the class, for all pools, or on a pool. 0 retains nothing."""
+
+    retained_bytes = None
+    """The total size of the retained buffers, in bytes."""
+
+    @property
+    def retained(self):
+        """The number of retained buffers."""
+        return len(self._released)
+
+    @property
+    def stats(self):
+        """A dict containing the allocation, hit, miss, release and eviction
+        counters and the number and total size of retained buffers.
+
+        Hits are allocations served by a retained buffer, misses those that
+        allocated a new one. Evictions count retained buffers freed to stay
+        within :attr:`max_retained`, or because an allocation failed."""
+        return dict(allocations=self.allocations,
+                    hits=self.hits,
+                    misses=self.misses,
+                    releases=self.releases,
+                    evictions=self.evictions,
+                    retained=self.retained,
+                    retained_bytes=self.retained_bytes)
+
+    def alloc(self, flags, size):
+        """Returns a buffer of at least ``size`` bytes with the provided
+        flags, reusing a retained buffer of the same size class if there is
+        one. Its ``pool_key`` is set so that it can be :meth:`released
+        <release>`.
+
+        If allocating a new buffer fails, for example because the device is
+        out of memory, all retained buffers are freed and it is tried once
+        more.
+        """
+        self.allocations += 1
+        key = (flags, size_class(size))
+        free_buffers = self._free_buffers.get(key, None)
+        if free_buffers:
+            buffer = free_buffers.pop()
+            del self._released[id(buffer)]
+            self.retained_bytes -= key[1]
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                buffer = self.allocate(*key)
+            except Exception:
+                if not self._released:
+                    raise
+                self.clear()
+                buffer = self.allocate(*key)
+        buffer.pool_key = key
+        return buffer
+
+    def release(self, buffer):
+        """Retains ``buffer``, allocated by :meth:`alloc`, for reuse, freeing
+        the least recently released buffers if more than
+        :attr:`max_retained` bytes would be retained. Its attributes are
+        cleared."""
+        key = buffer.pool_key
+        buffer.__dict__.clear()
+        self.releases += 1
+        size = key[1]
+        if size > self.max_retained:
+            self.free(buffer)
+            return
+        while self.retained_bytes + size > self.max_retained:
+            self._evict()
+        self._free_buffers.setdefault(key, [ ]).append(buffer)
+        self._released[id(buffer)] = key
+        self.retained_bytes += size
+
+    def _evict(self):
+        buffer_id, key = self._released.popitem(last=False)
+        free_buffers = self._free_buffers[key]
+        for i, buffer in enumerate(free_buffers):
+            if id(buffer) == buffer_id:
+                del free_buffers[i]
+                break
+        self.retained_bytes -= key[1]
+        self.evictions += 1
+        self.free(buffer)
+
+    def clear(self):
+        """Frees all retained buffers."""
+        while self._released:
+            self._evict()
@@ -6,6 +6,10 @@ import numpy as _numpy
 import pyopencl as _cl
 from pyopencl import * #@UnusedWildImport
 import clq.backends.opencl as clqcl
+import clq.backends.opencl.binaries as binaries
+import clq.backends.opencl.autotune as autotune
+import clq.backends.opencl.pool as pool
+import clq.futures
 
 class Error(Error): 
     """Base class for errors in ``cl.oquence.pyopencl``. 
@@ -236,6 +240,19 @@ class Context(Context):
         if len(self.devices) > 1:
             raise Error("Multiple devices bound to Context.")
         return self.devices[0]
+    
+    @property
+    def pool(self):
+        """The :class:`clq.backends.opencl.pool.BufferPool` that buffers for 
+        this Context are allocated from."""
+        if self._pool is None:
+            self._pool = pool.BufferPool(self._new_buffer, 
+                                         _orig_release_Buffer)
+        return self._pool
+    _pool = None
+    
+    def _new_buffer(self, flags, size):
+        return Buffer(self, flags, size)
         
     def alloc(self, shape=None, cl_dtype=None, order="C", 
               like=None, flags=mem_flags.READ_WRITE):
@@ -252,6 +269,9 @@ class Context(Context):
         ``flags``
             One or more :class:`mem_flags`. Defaults to 
             ``mem_flags.READ_WRITE``.            
+            
+        The buffer comes from the Context's :attr:`pool`, and can be returned
+        to it with :meth:`Buffer.release`.
         """
         if cypy.is_int_like(shape):
             shape = (shape,)
@@ -297,7 +317,9 @@ class Context(Context):
         if isinstance(dest, Buffer):
             if isinstance(src, Buffer):
                 # device to device
+                # pooled buffers may be larger than their contents
                 event = enqueue_copy_buffer(queue, src, dest, 
+                                            byte_count=src.size,
                                             wait_for=wait_for,
                                             is_blocking=block)
             else:
@@ -387,10 +409,57 @@ class Context(Context):
         
         The compiler options can be provided as a single string or a sequence 
         of strings.
+        
+        If a :mod:`binary cache <clq.backends.opencl.binaries>` is active, 
+        the program is built from the binaries saved when the same source was
+        last built with the same options for the same devices and drivers, 
+        if any. Otherwise, it is built from source and its binaries are 
+        saved.
+        
+        The program's ``source`` and ``options`` are saved as attributes, 
+        which identify its kernels to the :mod:`autotuner 
+        <clq.backends.opencl.autotune>`.
         """
         if cypy.is_iterable(options):
             options = " ".join(options)
-        return Program(self, source).build(options)
+        program = self._build(source, options)
+        program.source = source
+        program.options = options
+        return program
+    
+    def _build(self, source, options):
+        cache = binaries.active
+        if cache is None:
+            return Program(self, source).build(options)
+        
+        devices = self.get_info(context_info.DEVICES)
+        key = binaries.key_for(source, options, 
+                               [binaries.device_key(device) 
+                                for device in devices])
+        cached = cache.load(key)
+        if cached is not None:
+            try:
+                return Program(self, devices, cached).build(options)
+            except _cl.Error:
+                # e.g. rejected by the driver despite the matching version
+                cache.discard(key)
+        
+        program = Program(self, source).build(options)
+        cache.store(key, program.get_info(program_info.BINARIES))
+        return program
+    
+    def compile_async(self, source, options=""):
+        """Like :meth:`compile`, but builds the program in the background on 
+        :data:`clq.futures.build_executor`. Returns a :class:`future 
+        <clq.futures.ProgramFuture>` of the program, whose kernels can be 
+        looked up as attributes, waiting only once one is needed::
+        
+            program = ctx.compile_async(source)
+            ... 
+            program.saxpy(...) # waits for the build, if still running
+        """
+        return clq.futures.build_executor.run(clq.futures.ProgramFuture(), 
+                                              self.compile, source, options)
 _cl.Context = Context
 
 ctx = None
@@ -416,6 +485,7 @@ def _Out_post_kernel_hook(context, buffer, event):
 ## Memory Objects
 #############################################################################
 _orig__init_Buffer = _cl.Buffer.__init__
+_orig_release_Buffer = _cl.Buffer.release
 class Buffer(Buffer):
     """Represents a buffer in global memory."""
     def __init__(self, context, flags, size=0, hostbuf=None):
@@ -439,6 +509,10 @@ class Buffer(Buffer):
         - If mem_flags.USE_HOST_PTR is not included and a ``hostbuf`` is 
           specified, it will be added automatically.
         - Metadata will be inferred from ``hostbuf`` if not explicitly provided.
+        - If no ``hostbuf`` is provided, the buffer is allocated from the 
+          :attr:`Context.pool`, rounded up to a :func:`size class 
+          <clq.backends.opencl.pool.size_class>`. ``size`` is still the size 
+          requested.
     
         ``shape``
             If an int is provided, converted to a one-dimensional tuple. 
@@ -465,7 +539,13 @@ class Buffer(Buffer):
         if size <= 0:
             raise Error("Invalid buffer size %s." % str(size))
         assert size > 0
-        buffer = cls(ctx, flags, size, hostbuf)
+        if hostbuf is None:
+            buffer = ctx.pool.alloc(flags, size)
+            buffer.context = ctx
+            buffer.flags = flags
+            buffer.size = size
+        else:
+            buffer = cls(ctx, flags, size, hostbuf)
         buffer.shape = shape
         buffer.cl_dtype = cl_dtype
         buffer.order = order
@@ -514,6 +594,23 @@ class Buffer(Buffer):
     """Whether to place this argument in constant memory when passed to a 
     cl.oquence function."""
     
+    pool_key = None
+    """The key this buffer is retained under by the 
+    :class:`clq.backends.opencl.pool.BufferPool` it came from, or None if 
+    it was not allocated from a pool."""
+    
+    def release(self):
+        """Returns this buffer to the :attr:`Context.pool` it was allocated 
+        from, or frees it if it was not allocated from a pool. Either way, it
+        must not be used again."""
+        if self.context is None:
+            raise Error("Buffer already released.")
+        if self.pool_key is None:
+            _orig_release_Buffer(self)
+            self.context = None
+        else:
+            self.context.pool.release(self)
+    
     def from_device(self, wait_for=None, queue=None):
         """Retrieves this buffer from the device."""
         return self.context.from_device(self, wait_for=wait_for, queue=queue)
@@ -575,7 +672,7 @@ class Buffer(Buffer):
             return src.dtype
         except AttributeError:
             try:
-                dtype = src.cl_dtype.dtype
+                dtype = src.cl_dtype.np_dtype
                 if dtype is not None:
                     return dtype
                 else:
@@ -664,6 +761,12 @@ class Program(Program):
     def __init__(self, context, *args, **kwargs):
         _orig__init_Program(self, context, *args, **kwargs)
         self.context = context
+        
+    source = None
+    """The source the program was built from by :meth:`Context.compile`."""
+    
+    options = None
+    """The build options given to :meth:`Context.compile`."""
 _cl.Program = Program
 
 #############################################################################
@@ -671,6 +774,18 @@ _cl.Program = Program
 #############################################################################
 _orig__init_Kernel = _cl.Kernel.__init__
 _orig__call_Kernel = _cl.Kernel.__call__
+_int32_info = _numpy.iinfo(_numpy.int32)
+_int64_info = _numpy.iinfo(_numpy.int64)
+_float32_info = _numpy.finfo(_numpy.float32)
+_float64_info = _numpy.finfo(_numpy.float64)
+def _work_items(global_size, width, local_size):
+    """Returns the global size for a kernel processing ``width`` elements of
+    the first dimension of ``global_size`` per work-item."""
+    n = (global_size[0] + width - 1) // width
+    if local_size:
+        n = (n + local_size[0] - 1) // local_size[0] * local_size[0]
+    return (n,) + tuple(global_size[1:])
+
 class Kernel(Kernel):
     """Represents an OpenCL kernel."""
     
@@ -683,6 +798,16 @@ class Kernel(Kernel):
         self.queue = program.context.queue
         self.name = name
 
+    elements_per_work_item = 1
+    """The number of elements each work-item processes.
+    
+    Kernels generated by :func:`clq.backends.opencl.vectorize.vectorize` 
+    process several elements per work-item and take the total number of 
+    elements as an additional, last argument. When this is more than 1, the 
+    ``global_size`` passed to :meth:`__call__` counts elements: its first 
+    dimension is divided by this (rounding up, to a multiple of the 
+    ``local_size`` if one is given) and appended to the arguments."""
+
     def __call__(self, *args, **kwargs):
         """
         Extended to use the default queue if the first argument is
@@ -692,11 +817,75 @@ class Kernel(Kernel):
         Also provides support for :meth:`Context.Out` and :meth:`Context.InOut`.
         
         Python ints and floats are converted to numpy ints and floats 
-        automatically. The default floating point data type is ``float``, not
-        ``double``, which is only used if the number cannot fit into the range
-        of the float. The default integer data type is ``int``, with ``long``
-        being used if the number is out of range of ``int``.
+        automatically (see :meth:`scalar_type`).
+        
+        If ``local_size`` is not given and an :mod:`autotuner 
+        <clq.backends.opencl.autotune>` is active, the local size it chose
+        is used.
+        
+        For many launches of the same kernel, see :meth:`prepare`.
         """
+        queue, global_size, args = self._split_args(args, kwargs)
+        
+        trial = None
+        if 'local_size' not in kwargs:
+            tuner = autotune.active
+            if tuner is not None:
+                kwargs['local_size'], trial = tuner.choose(self, queue, 
+                                                           global_size)
+
+        width = self.elements_per_work_item
+        if width > 1:
+            n_elements = global_size[0]
+            global_size = _work_items(global_size, width, 
+                                      kwargs.get('local_size'))
+            args = tuple(args) + (_numpy.int32(n_elements),)
+
+        args = tuple(self._process_args(args))
+
+        if trial is None:
+            event = _orig__call_Kernel(self, queue, global_size, *args, 
+                                       **kwargs)
+        else:
+            event = trial.launch(_orig__call_Kernel, self, queue, global_size,
+                                 *args, **kwargs)
+        
+        for arg in args:
+            hook = getattr(arg, 'post_kernel_hook', None)
+            if hook is not None:
+                hook(self.program.context, arg, event)
+
+        return event
+    
+    def prepare(self, *args, **kwargs):
+        """Returns a :class:`PreparedKernel` that launches this kernel with 
+        the queue, sizes and argument types fixed now.
+        
+        Takes the same arguments as :meth:`__call__` (the queue, the global 
+        size or an array of that shape, the kernel arguments and 
+        ``local_size``), but does not launch the kernel. The arguments are 
+        set on the kernel, and the types of Python ints and floats among 
+        them are fixed for later launches. If ``local_size`` is not given,
+        it is looked up in the active :mod:`autotuner 
+        <clq.backends.opencl.autotune>`, if any, without tuning online::
+        
+            step = kernel.prepare(state, state, 0.5, local_size=(64,))
+            for i in xrange(10000):
+                step() # the same arguments
+                step(state, state, i * 0.5) # only the last argument is set
+        """
+        queue, global_size, args = self._split_args(args, kwargs)
+        local_size = kwargs.pop('local_size', _unset)
+        if local_size is _unset:
+            tuner = autotune.active
+            local_size = None if tuner is None else \
+                tuner.lookup(self, queue, global_size)
+        return PreparedKernel(self, queue, global_size, local_size, args)
+    
+    def _split_args(self, args, kwargs):
+        """Returns the queue, global size and kernel arguments from the 
+        arguments to :meth:`__call__`, popping ``queue`` and ``global_size``
+        from ``kwargs`` if they were passed there."""
         queue = args[0]
         if not isinstance(queue, CommandQueue):
             queue = kwargs.pop('queue', None)
@@ -715,43 +904,143 @@ class Kernel(Kernel):
                     global_size = kwargs.pop('global_size')
         else:
             args = args[1:]
-
-        args = tuple(self._process_args(args))
-
-        event = _orig__call_Kernel(self, queue, global_size, *args, **kwargs)
-        
-        for arg in args:
-            hook = getattr(arg, 'post_kernel_hook', None)
-            if hook is not None:
-                hook(self.program.context, arg, event)
-
-        return event
+        return queue, global_size, args
     
     def _process_args(self, args):
         for arg in args:
-            if isinstance(arg, (_numpy.number, MemoryObject)):
+            # numpy.void covers scalars of vector dtypes (e.g. float4.np_dtype)
+            if isinstance(arg, (_numpy.number, _numpy.void, MemoryObject)):
                 yield arg
             else:
                 yield self.convert_arg(arg)
     
     @classmethod
     def convert_arg(cls, arg):
+        """Converts a Python int or float to a numpy scalar (see 
+        :meth:`scalar_type`)."""
+        return cls.scalar_type(arg)(arg)
+    
+    @classmethod
+    def scalar_type(cls, arg):
+        """Returns the numpy type that a Python int or float is passed as.
+        
+        The default floating point data type is ``float``, not ``double``, 
+        which is only used if the number cannot fit into the range of the 
+        float. The default integer data type is ``int``, with ``long`` being
+        used if the number is out of range of ``int``.
+        """
         if cypy.is_int_like(arg):
-            if cl_int.min <= arg <= cl_int.max:
-                yield _numpy.int32(arg)
-            elif cl_long.min <= arg <= cl_long.max:
-                yield _numpy.int64(arg)
+            if _int32_info.min <= arg <= _int32_info.max:
+                return _numpy.int32
+            elif _int64_info.min <= arg <= _int64_info.max:
+                return _numpy.int64
             else:
                 raise Error("Integer-like number is out of range of long: %s" %
                             str(arg))
         elif cypy.is_float_like(arg):
-            if cl_float.min <= arg <= cl_float.max:
-                yield _numpy.float32(arg)
-            elif cl_float.min <= arg <= cl_float.max:
-                yield _numpy.float64(arg)
+            if _float32_info.min <= arg <= _float32_info.max:
+                return _numpy.float32
+            elif _float64_info.min <= arg <= _float64_info.max:
+                return _numpy.float64
             else:
                 raise Error("Float-like number is out of range of double: %s" %
                             str(arg))
         else:
             raise Error("Invalid argument: %s" % str(arg))
 _cl.Kernel = Kernel
+
+class PreparedKernel(object):
+    """Launches a kernel repeatedly with minimal host overhead. 
+    
+    Created by :meth:`Kernel.prepare`, which fixes the queue, the global and
+    local sizes and the type each argument is passed as. Calling a prepared
+    kernel with no arguments launches it with the arguments it was last 
+    given. Calling it with all of its arguments sets only those that are not
+    the same objects as last time, then launches it. Either way, returns the
+    launch's :class:`Event`.
+    
+    Python ints and floats are converted to the numpy type chosen for the 
+    value the argument was prepared with, so, e.g., an argument prepared 
+    with ``0.5`` is always passed as a ``float``.
+    
+    The arguments are stored on the kernel itself, so a kernel should not be
+    launched by any other means, or by another prepared kernel, while it is 
+    also being launched by this one.
+    """
+    def __init__(self, kernel, queue, global_size, local_size, args):
+        global_size = tuple(global_size)
+        if local_size is not None:
+            local_size = tuple(local_size)
+        n_args = len(args)
+        width = kernel.elements_per_work_item
+        if width > 1:
+            n_elements = global_size[0]
+            global_size = _work_items(global_size, width, local_size)
+            kernel.set_arg(n_args, _numpy.int32(n_elements))
+        self.kernel = kernel
+        self.queue = queue
+        self.global_size = global_size
+        self.local_size = local_size
+        self.n_args = n_args
+        
+        self._types = [None if isinstance(arg, (_numpy.number, _numpy.void, 
+                                                MemoryObject))
+                       else Kernel.scalar_type(arg) for arg in args]
+        self._values = [_unset] * n_args
+        self._hooks = { }
+        for i, arg in enumerate(args):
+            self.set_arg(i, arg)
+            
+    kernel = None
+    """The :class:`Kernel` launched."""
+    
+    queue = None
+    """The :class:`CommandQueue` the kernel is launched on."""
+    
+    global_size = None
+    """The global size, as a tuple (in work-items, not elements, if the 
+    kernel has an :attr:`elements_per_work_item 
+    <Kernel.elements_per_work_item>` above 1)."""
+    
+    local_size = None
+    """The local size, as a tuple, or None to let the driver choose."""
+    
+    n_args = None
+    """The number of arguments the kernel is called with."""
+    
+    def set_arg(self, i, value):
+        """Sets argument ``i`` for subsequent launches, unless it is already 
+        ``value``."""
+        if value is self._values[i]:
+            return
+        arg_type = self._types[i]
+        self.kernel.set_arg(i, value if arg_type is None else arg_type(value))
+        self._values[i] = value
+        hook = getattr(value, 'post_kernel_hook', None)
+        if hook is None:
+            self._hooks.pop(i, None)
+        else:
+            self._hooks[i] = hook
+    
+    def __call__(self, *args, **kwargs):
+        """Launches the kernel, first setting any of ``args`` that changed.
+        
+        ``wait_for`` can be passed as a keyword argument."""
+        if args:
+            if len(args) != self.n_args:
+                raise Error("%s takes %d arguments (%d given)." % 
+                            (self.kernel.name, self.n_args, len(args)))
+            values = self._values
+            for i, value in enumerate(args):
+                if value is not values[i]:
+                    self.set_arg(i, value)
+        event = enqueue_nd_range_kernel(self.queue, self.kernel, 
+                                        self.global_size, self.local_size, 
+                                        None, kwargs.get('wait_for'))
+        if self._hooks:
+            context = self.kernel.program.context
+            values = self._values
+            for i, hook in self._hooks.iteritems():
+                hook(context, values[i], event)
+        return event
+_unset = object()
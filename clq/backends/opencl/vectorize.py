@@ -0,0 +1,419 @@
+"""Automatic vectorization of element-wise kernels.
+
+A kernel is element-wise if each work-item reads and writes only the
+elements of its ``__global`` buffers at ``get_global_id(0)``::
+
+    @clq.fn
+    def ew_add(a, b, dest, get_global_id):
+        gid = get_global_id(0)
+        dest[gid] = a[gid] + b[gid]
+
+:func:`vectorize` turns such a kernel into one that processes ``width``
+consecutive elements per work-item, loading and storing them with
+``vloadN`` and ``vstoreN`` and computing on vector types. The last
+work-item processes the elements left over, one at a time::
+
+    scalar = ew_add.compile(OpenCL, float_p, float_p, float_p,
+                            get_global_id.cl_type)
+    vectorized = clq.backends.opencl.vectorize.vectorize(scalar, 4)
+    program = ctx.compile(vectorized.concrete_fn.program_item.code)
+    kernel = vectorized.configure(program.ew_add_v4)
+    kernel(a_buf, b_buf, dest_buf, global_size=a.shape)
+
+The vectorized kernel takes the number of elements as an additional, last
+argument. :class:`configured <VectorizedFn.configure>` kernels append it
+and scale the global size down themselves, so they are called like the
+original kernel (see :attr:`pyocl.Kernel.elements_per_work_item
+<clq.backends.opencl.pyocl.Kernel.elements_per_work_item>`).
+
+Vectorization is opt-in, and :func:`vectorize` raises
+:class:`NotVectorizableError`, explaining why, for kernels that:
+
+- contain control flow or ``return`` statements,
+- access memory other than ``__global`` or ``__constant`` buffers of one
+  scalar type with vector types, or at an index other than
+  ``get_global_id(0)``,
+- use the global id other than as an index,
+- compare values or call functions other than the
+  :data:`element-wise builtins
+  <clq.backends.opencl.builtin_defs.elementwise_fns>`,
+- compute values of another type than the elements from them (floating
+  point scalars are allowed, and converted to the element type, so 
+  ``2.0 * x[gid]`` is computed in single precision for ``float`` buffers).
+
+Scalar arguments and local variables computed only from them stay scalars,
+and are combined with vectors element-wise.
+"""
+import ast as _ast
+import copy
+
+import clq
+from clq import ir
+import clq.backends.opencl as ocl
+from clq.backends.opencl import builtin_defs
+
+class NotVectorizableError(clq.Error):
+    """Raised by :func:`vectorize` for kernels that are not element-wise."""
+
+class VectorizedFn(object):
+    """The result of :func:`vectorize`."""
+    def __init__(self, scalar_fn, concrete_fn, width):
+        self.scalar_fn = scalar_fn
+        self.concrete_fn = concrete_fn
+        self.width = width
+
+    scalar_fn = None
+    """The original :class:`concrete function <clq.ConcreteFn>`."""
+
+    concrete_fn = None
+    """The vectorized :class:`concrete function <clq.ConcreteFn>`."""
+
+    width = None
+    """The number of elements processed by each work-item."""
+
+    def configure(self, kernel):
+        """Sets the :attr:`elements_per_work_item
+        <clq.backends.opencl.pyocl.Kernel.elements_per_work_item>` of the
+        :class:`kernel <clq.backends.opencl.pyocl.Kernel>` built from
+        :attr:`concrete_fn`, and returns it."""
+        kernel.elements_per_work_item = self.width
+        return kernel
+
+def vectorize(concrete_fn, width=4):
+    """Returns a :class:`VectorizedFn` processing ``width`` elements per
+    work-item, or raises :class:`NotVectorizableError`."""
+    if width not in ocl.vector_type_sizes:
+        raise clq.Error("Invalid vector width: %r." % width)
+    analysis = _Analysis(concrete_fn)
+    analysis.run()
+    element_type = analysis.element_type
+    vector_type = element_type.vector_types[width]
+
+    generic_fn = concrete_fn.generic_fn
+    used = set(generic_fn.all_variables)
+    fresh = lambda name: _fresh(name, used)
+    # builtins are called by the name of the argument they are passed as
+    vload, vstore = "vload%d" % width, "vstore%d" % width
+    for name in (vload, vstore):
+        if name in used:
+            raise NotVectorizableError(
+                "'%s' uses the name '%s'." % (generic_fn.name, name))
+    names = {
+        "vload": vload,
+        "vstore": vstore,
+        "vector": fresh("_" + vector_type.name),
+        "n": fresh("_n"),
+        "i": fresh("_i"),
+        "gid": analysis.gid or fresh("_gid"),
+    }
+    renames = dict((name, fresh(name + "_s"))
+                   for name in generic_fn.local_variables
+                   if name != analysis.gid)
+
+    ast = _vectorized_ast(generic_fn.original_ast, analysis, width, names,
+                          renames)
+    arg_types = tuple(concrete_fn.arg_types) + (
+        ocl.builtins[vload].cl_type,
+        ocl.builtins[vstore].cl_type,
+        vector_type.cl_type,
+        ocl.int)
+    vectorized_fn = clq.fn.from_ast(ast).compile(concrete_fn.backend,
+                                                 *arg_types)
+    try:
+        vectorized_fn.program_item
+    except clq.Error as e:
+        raise NotVectorizableError(
+            "The vectorized version of '%s' is invalid: %s" %
+            (generic_fn.name, e))
+    return VectorizedFn(concrete_fn, vectorized_fn, width)
+
+def _fresh(name, used):
+    while name in used:
+        name += "_"
+    used.add(name)
+    return name
+
+##############################################################################
+## Analysis
+##############################################################################
+class _Analysis(object):
+    """Checks that a concrete function is element-wise."""
+    def __init__(self, concrete_fn):
+        self.concrete_fn = concrete_fn
+        self.context = concrete_fn.typed_ast.context
+        self.vector_locals = set()
+
+    gid = None
+    """The variable assigned ``get_global_id(0)``, if any."""
+
+    gid_fn = None
+    """The name of the ``get_global_id`` argument."""
+
+    element_type = None
+    """The type of the elements of the buffers accessed."""
+
+    vector_locals = None
+    """The local variables that are vectors after vectorization."""
+
+    def fail(self, message):
+        raise NotVectorizableError("'%s' is not element-wise: it %s." %
+                                   (self.concrete_fn.generic_fn.name, message))
+
+    def type_of(self, node):
+        return node.unresolved_type.resolve(self.context)
+
+    def run(self):
+        for stmt in self.concrete_fn.generic_fn.annotated_ast.body:
+            cls = type(stmt)
+            if cls is ir.Assign:
+                target = stmt.targets[0]
+                if type(target) is ir.Name and self.is_global_id(stmt.value):
+                    if self.gid is not None:
+                        self.fail("assigns get_global_id(0) more than once")
+                    self.gid = target.id
+                    continue
+                self.check_target(target)
+                self.check_value(target, stmt.value, False)
+            elif cls is ir.AugAssign:
+                self.check_target(stmt.target)
+                self.check_value(stmt.target, stmt.value, True)
+            elif cls is ir.Expr:
+                self.check_expr(stmt.value)
+            elif cls is not ir.Pass:
+                self.fail("contains an unsupported '%s' statement" % 
+                          cls.__name__.lower())
+        if self.element_type is None:
+            self.fail("does not access memory at get_global_id(0)")
+
+    def check_value(self, target, value, augmented):
+        vector = self.check_expr(value)
+        if type(target) is ir.Name:
+            if vector:
+                self.vector_locals.add(target.id)
+        elif augmented and not vector:
+            self.check_type(self.type_of(value))
+
+    def is_global_id(self, node):
+        if type(node) is not ir.Call or len(node.args) != 1:
+            return False
+        arg = node.args[0]
+        func_type = self.type_of(node.func)
+        if isinstance(func_type, ocl.BuiltinFnType) and \
+                func_type.builtin is builtin_defs.get_global_id and \
+                type(node.func) is ir.Name and \
+                type(arg) is ir.Num and arg.n == 0:
+            self.gid_fn = node.func.id
+            return True
+        return False
+
+    def check_target(self, target):
+        cls = type(target)
+        if cls is ir.Name:
+            if target.id == self.gid:
+                self.fail("assigns to '%s'" % target.id)
+        elif cls is ir.Subscript:
+            self.check_access(target)
+        else:
+            self.fail("assigns to a '%s'" % cls.__name__.lower())
+
+    def check_access(self, node):
+        value, index = node.value, node.slice
+        if type(index) is not ir.Index or not (
+                type(index.value) is ir.Name and index.value.id == self.gid
+                and self.gid is not None or self.is_global_id(index.value)):
+            self.fail("accesses memory at an index other than "
+                      "get_global_id(0)")
+        if type(value) is not ir.Name or \
+                value.id not in self.concrete_fn.arg_map:
+            self.fail("accesses memory other than its arguments")
+        ptr_type = self.type_of(value)
+        if not isinstance(ptr_type, (ocl.GlobalPtrType, ocl.ConstantPtrType)):
+            self.fail("accesses '%s', which is not a __global or "
+                      "__constant pointer" % value.id)
+        target_type = ptr_type.target_type
+        if not getattr(target_type, "vector_types", None):
+            self.fail("accesses elements of type '%s', which has no "
+                      "vector types" % target_type.name)
+        if self.element_type is None:
+            self.element_type = target_type
+        elif target_type is not self.element_type:
+            self.fail("accesses elements of types '%s' and '%s'" %
+                      (self.element_type.name, target_type.name))
+
+    def check_expr(self, node):
+        """Returns whether ``node`` is a vector after vectorization."""
+        cls = type(node)
+        if cls is ir.Subscript:
+            self.check_access(node)
+            return True
+        elif cls is ir.Name:
+            if node.id == self.gid:
+                self.fail("uses '%s' other than as an index" % node.id)
+            return node.id in self.vector_locals
+        elif cls is ir.Call:
+            func_type = self.type_of(node.func)
+            if not isinstance(func_type, ocl.BuiltinFnType) or \
+                    func_type.builtin not in builtin_defs.elementwise_fns:
+                self.fail("calls '%s', which is not an element-wise builtin" %
+                          getattr(node.func, "id", func_type.name))
+            children = node.args
+        elif cls is ir.BinOp:
+            children = (node.left, node.right)
+        elif cls is ir.UnaryOp:
+            children = (node.operand,)
+        elif cls in (ir.Num, ir.Str):
+            return False
+        else:
+            self.fail("contains an unsupported '%s' expression" % 
+                      cls.__name__)
+        vector = False
+        for child in children:
+            vector = self.check_expr(child) or vector
+        if vector:
+            self.check_type(self.type_of(node))
+        return vector
+
+    def check_type(self, scalar_type):
+        # vector operations are done on the element type, which must not 
+        # change the result (beyond the rounding of floating point scalars)
+        element_type = self.element_type
+        if scalar_type is not element_type and not (
+                isinstance(scalar_type, ocl.FloatType) and
+                isinstance(element_type, ocl.FloatType)):
+            self.fail("computes a '%s' from elements of type '%s'" %
+                      (scalar_type.name, element_type.name))
+
+##############################################################################
+## Code Generation
+##############################################################################
+def _vectorized_ast(function, analysis, width, names, renames):
+    """Returns the definition of the vectorized function::
+    
+        def f_vN(args, vloadN, vstoreN, _floatN, _n):
+            gid = get_global_id(0)
+            if gid * N + N <= _n:
+                # the body, on the N elements from gid * N
+            else:
+                for _i in (gid * N, _n):
+                    # the body, on the element at _i
+    """
+    function = copy.deepcopy(function)
+    gid, n = names["gid"], names["n"]
+    prologue = [_ast.Assign(
+        targets=[_ast.Name(id=gid, ctx=_ast.Store())],
+        value=_ast.Call(func=_ast.Name(id=analysis.gid_fn, ctx=_ast.Load()),
+                        args=[_ast.Num(n=0)], keywords=[], starargs=None,
+                        kwargs=None))]
+    body = [ ]
+    for stmt in function.body:
+        if isinstance(stmt, _ast.Expr) and isinstance(stmt.value, _ast.Str):
+            prologue.insert(0, stmt)
+        elif not (isinstance(stmt, _ast.Assign) and 
+                  isinstance(stmt.targets[0], _ast.Name) and 
+                  stmt.targets[0].id == analysis.gid):
+            body.append(stmt)
+    
+    start = _ast.BinOp(left=_ast.Name(id=gid, ctx=_ast.Load()), 
+                       op=_ast.Mult(), right=_ast.Num(n=width))
+    test = _ast.Compare(
+        left=_ast.BinOp(left=start, op=_ast.Add(), right=_ast.Num(n=width)),
+        ops=[_ast.LtE()], comparators=[_ast.Name(id=n, ctx=_ast.Load())])
+    remainder = _ast.For(
+        target=_ast.Name(id=names["i"], ctx=_ast.Store()),
+        iter=_ast.Tuple(elts=[copy.deepcopy(start), 
+                              _ast.Name(id=n, ctx=_ast.Load())],
+                        ctx=_ast.Load()),
+        body=_ScalarBody(names["i"], renames).body(copy.deepcopy(body)),
+        orelse=[])
+    function.body = prologue + [_ast.If(
+        test=test, body=_VectorBody(names).body(body), orelse=[remainder])]
+    
+    function.name = "%s_v%d" % (function.name, width)
+    function.args.args.extend(
+        _ast.Name(id=names[name], ctx=_ast.Param())
+        for name in ("vload", "vstore", "vector", "n"))
+    return _ast.fix_missing_locations(function)
+
+class _VectorBody(_ast.NodeTransformer):
+    """Rewrites statements to load, compute on and store vectors."""
+    def __init__(self, names):
+        self.names = names
+        self.vector_locals = set()
+    
+    def body(self, stmts):
+        return [self.visit(stmt) for stmt in stmts] or [_ast.Pass()]
+    
+    def is_vector(self, node):
+        for child in _ast.walk(node):
+            if isinstance(child, _ast.Subscript) or \
+                    isinstance(child, _ast.Name) and \
+                    child.id in self.vector_locals:
+                return True
+        return False
+    
+    def name(self, key):
+        return _ast.Name(id=self.names[key], ctx=_ast.Load())
+    
+    def load(self, ptr):
+        return _ast.Call(func=self.name("vload"), 
+                         args=[self.name("gid"), ptr], keywords=[], 
+                         starargs=None, kwargs=None)
+    
+    def store(self, node, value):
+        ptr = node.targets[0].value if isinstance(node, _ast.Assign) \
+            else node.target.value
+        return _ast.copy_location(_ast.Expr(value=_ast.Call(
+            func=self.name("vstore"), args=[value, self.name("gid"), ptr],
+            keywords=[], starargs=None, kwargs=None)), node)
+    
+    def splat(self, value, vector):
+        # scalars are copied to each element when stored
+        if vector:
+            return value
+        return _ast.Call(func=self.name("vector"), args=[value], keywords=[],
+                         starargs=None, kwargs=None)
+    
+    def visit_Assign(self, node):
+        target = node.targets[0]
+        vector = self.is_vector(node.value)
+        value = self.visit(node.value)
+        if isinstance(target, _ast.Subscript):
+            return self.store(node, self.splat(value, vector))
+        if vector:
+            self.vector_locals.add(target.id)
+        node.value = value
+        return node
+    
+    def visit_AugAssign(self, node):
+        target = node.target
+        vector = self.is_vector(node.value)
+        value = self.visit(node.value)
+        if isinstance(target, _ast.Subscript):
+            return self.store(node, _ast.BinOp(
+                left=self.load(target.value), op=node.op, right=value))
+        if vector:
+            self.vector_locals.add(target.id)
+        node.value = value
+        return node
+    
+    def visit_Subscript(self, node):
+        return _ast.copy_location(self.load(node.value), node)
+
+class _ScalarBody(_ast.NodeTransformer):
+    """Rewrites statements to process the element at index ``i``, with 
+    renamed local variables."""
+    def __init__(self, i, renames):
+        self.i = i
+        self.renames = renames
+    
+    def body(self, stmts):
+        return [self.visit(stmt) for stmt in stmts] or [_ast.Pass()]
+    
+    def visit_Subscript(self, node):
+        node.value = self.visit(node.value)
+        node.slice = _ast.Index(value=_ast.Name(id=self.i, ctx=_ast.Load()))
+        return node
+    
+    def visit_Name(self, node):
+        node.id = self.renames.get(node.id, node.id)
+        return node
@@ -0,0 +1,318 @@
+"""A persistent, content-addressed on-disk cache of compiled program items.
+
+Specializing a :class:`generic function <clq.GenericFn>` runs both the
+:class:`GenericFnVisitor <clq.internals.GenericFnVisitor>` and the
+:class:`ConcreteFnVisitor <clq.internals.ConcreteFnVisitor>`. When a cache is
+active, the :class:`program items <clq.ProgramItem>` produced for a
+:class:`concrete function <clq.ConcreteFn>` are saved to disk and loaded from
+there in later processes, so neither visitor needs to run again.
+
+Caching is off by default. To turn it on for the whole process::
+
+    import clq.cache
+    clq.cache.enable("/var/cache/clq", max_size=64*1024*1024)
+
+Entries are keyed by a hash of the generic function's syntax tree, the
+argument types, the :attr:`inline <clq.GenericFn.inline>` hints of the
+function and of the functions passed to it, the backend name and a
+:func:`fingerprint <compiler_fingerprint>` of the compiler's own sources, so
+changing any of these invalidates the corresponding entries implicitly. Entries are written to a temporary file and atomically
+renamed into place, so several worker processes can share a single cache
+directory.
+"""
+import ast as _ast
+import os as _os
+import errno as _errno
+import hashlib as _hashlib
+import cPickle as _pickle
+
+import clq
+
+format_version = 3
+"""The version of the on-disk entry format. Bumped whenever it changes, which
+invalidates all existing entries."""
+
+active = None
+"""The process-wide :class:`ProgramItemCache` consulted by
+:class:`clq.ConcreteFn`, or None if caching is disabled (the default)."""
+
+def enable(path, max_size=None):
+    """Creates a :class:`ProgramItemCache` at ``path`` and makes it
+    :data:`active`. Returns the cache."""
+    global active
+    active = ProgramItemCache(path, max_size)
+    return active
+
+def disable():
+    """Disables caching. Entries already on disk are left alone."""
+    global active
+    active = None
+
+def ast_hash(ast):
+    """Returns a hex digest identifying the content of a syntax tree.
+
+    Uses :func:`ast.dump`, so formatting, comments and line numbers in the
+    original source do not affect the hash.
+    """
+    return _hashlib.sha1(_ast.dump(ast)).hexdigest()
+
+def compiler_fingerprint():
+    """Returns a hex digest of the sources of the :mod:`clq` and :mod:`cypy` 
+    packages, which determine the code generated for a function. 
+    
+    Computed the first time it is needed in a process.
+    """
+    global _compiler_fingerprint
+    fingerprint = _compiler_fingerprint
+    if fingerprint is None:
+        import cypy
+        digest = _hashlib.sha1()
+        for package in (clq, cypy):
+            root = _os.path.dirname(_os.path.abspath(package.__file__))
+            for dirpath, dirnames, filenames in _os.walk(root):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if not filename.endswith(".py"):
+                        continue
+                    path = _os.path.join(dirpath, filename)
+                    digest.update(_os.path.relpath(path, root) + "\0")
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+        fingerprint = _compiler_fingerprint = digest.hexdigest()
+    return fingerprint
+
+_compiler_fingerprint = None
+
+def type_key(clq_type):
+    """Returns a string uniquely identifying a type for the purposes of
+    caching.
+
+    Function types are identified by the content of the underlying generic
+    function rather than by name, since two different functions may share a
+    name, and by its inline hint, since the optimizer may inline calls to it.
+    """
+    generic_fn = getattr(clq_type, 'generic_fn', None)
+    if generic_fn is None:
+        concrete_fn = getattr(clq_type, 'concrete_fn', None)
+        if concrete_fn is not None:
+            return "%s(%s)" % (type(clq_type).__name__,
+                               key_for(concrete_fn))
+        return "%s(%s)" % (type(clq_type).__name__, clq_type.name)
+    return "%s(%s,%s)" % (type(clq_type).__name__,
+                          ast_hash(generic_fn.original_ast),
+                          inline_key(generic_fn))
+
+def inline_key(generic_fn):
+    """Returns a string identifying the :attr:`inline <clq.GenericFn.inline>`
+    hint that applies to a generic function."""
+    import clq.optimize
+    return "inline:%r" % clq.optimize._inline_hint(generic_fn)
+
+def key_for(concrete_fn):
+    """Returns the cache key for the provided :class:`concrete function
+    <clq.ConcreteFn>`."""
+    parts = [str(format_version),
+             compiler_fingerprint(),
+             concrete_fn.backend.name,
+             ast_hash(concrete_fn.generic_fn.original_ast),
+             inline_key(concrete_fn.generic_fn)]
+    parts.extend(type_key(arg_type) for arg_type in concrete_fn.arg_types)
+    optimizer = concrete_fn.backend.optimizer
+    if optimizer is not None:
+        parts.append("optimize:" + optimizer.key)
+    if concrete_fn.backend.mangle_names:
+        parts.append("mangle")
+    return _hashlib.sha1("\0".join(parts)).hexdigest()
+
+class DirectoryCache(object):
+    """A directory of cached entries, each a pickled dict stored in a file 
+    named by its key. Keeps statistics and evicts the least recently used 
+    entries to bound its size. Subclasses decide what is stored (see 
+    :class:`ProgramItemCache` and 
+    :class:`clq.backends.opencl.binaries.BinaryCache`).
+
+    ``path``
+        The directory to store entries in. Created if it does not exist.
+
+    ``max_size``
+        If not None, the least recently used entries are evicted whenever the
+        total size of the entries, in bytes, exceeds this.
+    """
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        try:
+            _os.makedirs(path)
+        except OSError as e:
+            if e.errno != _errno.EEXIST:
+                raise
+
+    path = None
+    """The cache directory."""
+
+    max_size = None
+    """The maximum total size of all entries, in bytes, or None if unbounded."""
+
+    suffix = ".clqc"
+    """The filename suffix used for entries."""
+
+    @property
+    def stats(self):
+        """A dict containing the hit, miss, write, eviction and error
+        counters for this cache."""
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    writes=self.writes,
+                    evictions=self.evictions,
+                    errors=self.errors)
+
+    def filename_for(self, key):
+        """Returns the path of the entry file for ``key``."""
+        return _os.path.join(self.path, key + self.suffix)
+
+    def _load_entry(self, key, decode):
+        """Returns ``decode(entry)`` for the entry stored under ``key``, or 
+        None if there is none.
+
+        Unreadable or corrupted entries, including those for which 
+        ``decode`` raises an exception, are deleted and treated as misses.
+        """
+        filename = self.filename_for(key)
+        try:
+            f = open(filename, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+
+        try:
+            try:
+                entry = _pickle.load(f)
+            finally:
+                f.close()
+            if entry['key'] != key:
+                raise ValueError("Key mismatch.")
+            value = decode(entry)
+        except Exception:
+            # corrupted, truncated or from an incompatible version
+            self.errors += 1
+            self.misses += 1
+            self._remove(filename)
+            return None
+
+        # update the access time for LRU eviction
+        try:
+            _os.utime(filename, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return value
+
+    def _store_entry(self, key, entry):
+        """Saves ``entry``, a dict, under ``key``.
+
+        The entry is written to a temporary file which is then renamed into
+        place, so concurrent readers never see a partially written entry.
+        """
+        entry['key'] = key
+        import tempfile # slow to import, and only needed when writing
+        fd, tmp_filename = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        try:
+            f = _os.fdopen(fd, 'wb')
+            try:
+                _pickle.dump(entry, f, _pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            _os.rename(tmp_filename, self.filename_for(key))
+        except (IOError, OSError):
+            self.errors += 1
+            self._remove(tmp_filename)
+            return
+
+        self.writes += 1
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def discard(self, key):
+        """Removes the entry stored under ``key``, if any, counting it as an 
+        error. Used when an entry that loaded successfully turns out to be
+        unusable."""
+        if self._remove(self.filename_for(key)):
+            self.errors += 1
+
+    def entries(self):
+        """Returns a list of ``(last access time, size, filename)`` tuples for
+        all entries currently in the cache."""
+        entries = [ ]
+        suffix = self.suffix
+        for name in _os.listdir(self.path):
+            if not name.endswith(suffix):
+                continue
+            filename = _os.path.join(self.path, name)
+            try:
+                st = _os.stat(filename)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    @property
+    def size(self):
+        """The total size of all entries, in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_size):
+        """Removes the least recently used entries until the total size is at
+        most ``max_size`` bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= max_size:
+            return
+        entries.sort()
+        for _, size, filename in entries:
+            if total <= max_size:
+                break
+            if self._remove(filename):
+                self.evictions += 1
+            total -= size
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for _, _, filename in self.entries():
+            self._remove(filename)
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            _os.remove(filename)
+            return True
+        except OSError:
+            return False
+
+class ProgramItemCache(DirectoryCache):
+    """A directory of cached program items (see :class:`DirectoryCache`)."""
+    def load(self, concrete_fn):
+        """Returns a pair ``(program_items, program_item)`` for the provided
+        concrete function, or None if it is not in the cache.
+
+        Unreadable or corrupted entries are deleted and treated as misses.
+        """
+        def decode(entry):
+            items = tuple(clq.ProgramItem(name, code)
+                          for name, code in entry['items'])
+            return (items, items[entry['program_item']])
+        return self._load_entry(key_for(concrete_fn), decode)
+
+    def store(self, concrete_fn, program_items, program_item):
+        """Saves the provided program items for ``concrete_fn``."""
+        program_items = tuple(program_items)
+        self._store_entry(key_for(concrete_fn), {
+            'items': tuple((item.name, item.code) for item in program_items),
+            'program_item': program_items.index(program_item)
+        })
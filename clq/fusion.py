@@ -0,0 +1,343 @@
+"""Fusion of element-wise generic functions into a single kernel.
+
+A pipeline of small element-wise kernels launches one kernel per stage and
+passes intermediate results through global memory. :func:`fuse` composes
+the stages into one generic function, which runs each stage in turn for
+the element at ``get_global_id(0)``::
+
+    @clq.fn
+    def scale(x, y, s, get_global_id):
+        gid = get_global_id(0)
+        y[gid] = x[gid] * s
+
+    @clq.fn
+    def offset(y, z, o, get_global_id):
+        gid = get_global_id(0)
+        z[gid] = y[gid] + o
+
+    scale_offset = clq.fusion.fuse((scale, offset), temporaries=("y",))
+    print scale_offset.fusion
+    concrete_fn = scale_offset.compile(OpenCL, float_p, float,
+                                       get_global_id.cl_type, float_p, float)
+
+Arguments with the same name in several stages are the same argument of the
+fused function, which takes the arguments of each stage, in order, without
+repeating them. Buffers are assumed not to overlap.
+
+Buffers named in ``temporaries`` only pass values between stages: they are
+removed from the arguments and kept in a local variable of the same name
+(so in a register), holding the value stored by the last write, with its
+type. Each temporary must be written by a stage, outside of any control
+flow, before it is read. Other buffers written by one stage and read by a
+later one are written to and read back from memory, as in separate
+kernels.
+
+Each stage must be element-wise: it only accesses the elements of its
+arguments at ``get_global_id(0)`` (directly or through a variable assigned
+once from it) and does not return. Local variables whose names are used by
+other stages are renamed.
+
+The decisions made are recorded as :class:`decisions <Decision>` in the
+:class:`Fusion` available as the ``fusion`` attribute of the fused
+function.
+"""
+import ast as _ast
+import copy
+
+import clq
+
+class FusionError(clq.Error):
+    """Raised by :func:`fuse` for stages that cannot be fused."""
+
+class Decision(object):
+    """Describes a decision made when fusing."""
+    def __init__(self, stage, message):
+        self.stage = stage
+        self.message = message
+
+    stage = None
+    """The :class:`generic function <clq.GenericFn>` of the stage concerned,
+    or None if the decision concerns the fused function as a whole."""
+
+    message = None
+    """A description of the decision."""
+
+    def __str__(self):
+        if self.stage is None:
+            return self.message
+        return "%s: %s" % (self.stage.name, self.message)
+
+    def __repr__(self):
+        return "Decision(%r, %r)" % (getattr(self.stage, "name", None),
+                                     self.message)
+
+class Fusion(object):
+    """Describes how a fused generic function was composed."""
+    def __init__(self, stages, temporaries):
+        self.stages = stages
+        self.temporaries = temporaries
+        self.decisions = [ ]
+
+    stages = None
+    """The generic functions fused, in order."""
+
+    temporaries = None
+    """The names of the buffers kept in registers."""
+
+    generic_fn = None
+    """The fused :class:`generic function <clq.GenericFn>`."""
+
+    decisions = None
+    """A list of :class:`decisions <Decision>`."""
+
+    def decide(self, stage, message):
+        self.decisions.append(Decision(stage, message))
+
+    def __str__(self):
+        return "\n".join(str(decision) for decision in self.decisions)
+
+def fuse(generic_fns, temporaries=(), name=None):
+    """Returns a generic function running the element-wise ``generic_fns``
+    in order, for each element.
+
+    ``temporaries``
+        The names of the buffers passing values between stages that are
+        only needed in registers.
+    ``name``
+        The name of the fused function. Defaults to the names of the stages
+        joined by underscores.
+    """
+    stages = tuple(_Stage(generic_fn.specialize())
+                   for generic_fn in generic_fns)
+    if not stages:
+        raise FusionError("No functions to fuse.")
+    temporaries = tuple(temporaries)
+    fusion = Fusion(tuple(stage.generic_fn for stage in stages), temporaries)
+    for temporary in temporaries:
+        if not any(temporary in stage.arg_names for stage in stages):
+            raise FusionError(
+                "Temporary '%s' is not an argument of any stage." % temporary)
+
+    # arguments, and the names used by more than one stage
+    arg_names = [ ]
+    users = { }
+    for stage in stages:
+        for arg_name in stage.arg_names:
+            if arg_name not in arg_names and arg_name not in temporaries:
+                arg_names.append(arg_name)
+        for var in set(stage.arg_names + stage.local_names):
+            users.setdefault(var, [ ]).append(stage)
+    gid_fn = "get_global_id"
+    for arg_name in arg_names:
+        if len(users[arg_name]) > 1 and arg_name != gid_fn:
+            fusion.decide(None, "'%s' is shared by %s" % (
+                arg_name, _names(users[arg_name])))
+
+    # local variables, with a single variable holding get_global_id(0)
+    used = set(users)
+    gid = stages[0].gid
+    if gid is None or any(gid in users and stage in users[gid] and 
+                          gid != stage.gid for stage in stages):
+        gid = _fresh("gid", used)
+    body = [ ]
+    written = { } # temporary => stage that first wrote it
+    for stage in stages:
+        renames = { }
+        for local_name in stage.local_names:
+            if local_name == stage.gid:
+                renames[local_name] = gid
+            elif len(users[local_name]) > 1 or local_name == gid:
+                renames[local_name] = new_name = _fresh(
+                    "%s_%s" % (stage.name, local_name), used)
+                fusion.decide(stage.generic_fn, "renamed '%s' to '%s'" %
+                              (local_name, new_name))
+        stage.check_temporaries(temporaries, written, fusion)
+        body.extend(_StageBody(stage, gid, renames,
+                               temporaries).visit(copy.deepcopy(stmt))
+                    for stmt in stage.body)
+    for temporary in temporaries:
+        if temporary not in written:
+            raise FusionError("Temporary '%s' is never written." % temporary)
+
+    # intermediates kept in memory
+    for i, stage in enumerate(stages):
+        for buffer_name in sorted(stage.writes - set(temporaries)):
+            readers = [later for later in stages[i + 1:]
+                       if buffer_name in later.reads]
+            if readers:
+                fusion.decide(stage.generic_fn,
+                    "'%s' is read back from memory by %s (it is not "
+                    "temporary)" % (buffer_name, _names(readers)))
+
+    if name is None:
+        name = "_".join(stage.name for stage in stages)
+    prologue = _ast.Assign(
+        targets=[_ast.Name(id=gid, ctx=_ast.Store())],
+        value=_ast.Call(func=_ast.Name(id=gid_fn, ctx=_ast.Load()),
+                        args=[_ast.Num(n=0)], keywords=[], starargs=None,
+                        kwargs=None))
+    function = _ast.FunctionDef(
+        name=name,
+        args=_ast.arguments(args=[_ast.Name(id=arg_name, ctx=_ast.Param())
+                                  for arg_name in arg_names],
+                            vararg=None, kwarg=None, defaults=[]),
+        body=[prologue] + body, decorator_list=[])
+    generic_fn = clq.fn.from_ast(_ast.fix_missing_locations(
+        _ast.copy_location(function, stages[0].generic_fn.original_ast)))
+    fusion.decide(None, "fused %d stages into '%s(%s)'" % (
+        len(stages), name, ", ".join(arg_names)))
+    fusion.generic_fn = generic_fn
+    generic_fn.fusion = fusion
+    return generic_fn
+
+def _names(stages):
+    return ", ".join("'%s'" % stage.name for stage in stages)
+
+def _fresh(name, used):
+    while name in used:
+        name += "_"
+    used.add(name)
+    return name
+
+def _is_global_id(node):
+    return isinstance(node, _ast.Call) and \
+        isinstance(node.func, _ast.Name) and \
+        node.func.id == "get_global_id" and len(node.args) == 1 and \
+        isinstance(node.args[0], _ast.Num) and node.args[0].n == 0
+
+class _Stage(object):
+    """Checks that a generic function is element-wise."""
+    def __init__(self, generic_fn):
+        self.generic_fn = generic_fn
+        self.name = generic_fn.name
+        self.arg_names = tuple(generic_fn.arg_names)
+        self.local_names = tuple(sorted(generic_fn.local_variables))
+        self.reads, self.writes = set(), set()
+
+        body = self.body = [ ]
+        for stmt in generic_fn.original_ast.body:
+            if isinstance(stmt, _ast.Expr) and isinstance(stmt.value, _ast.Str):
+                continue # docstring
+            if isinstance(stmt, _ast.Assign) and len(stmt.targets) == 1 and \
+                    isinstance(stmt.targets[0], _ast.Name) and \
+                    _is_global_id(stmt.value):
+                if self.gid is not None:
+                    self.fail("assigns get_global_id(0) more than once")
+                self.gid = stmt.targets[0].id
+                continue
+            body.append(stmt)
+        for stmt in body:
+            self.check(stmt)
+
+    gid = None
+    """The variable assigned ``get_global_id(0)``, if any."""
+
+    def fail(self, message):
+        raise FusionError("'%s' cannot be fused: it %s." % (self.name, message))
+
+    def is_index(self, node):
+        return isinstance(node, _ast.Index) and (
+            isinstance(node.value, _ast.Name) and node.value.id == self.gid or
+            _is_global_id(node.value))
+
+    def check(self, stmt):
+        for node in _ast.walk(stmt):
+            if isinstance(node, _ast.Return):
+                self.fail("returns")
+            elif isinstance(node, _ast.Subscript):
+                value = node.value
+                if not isinstance(value, _ast.Name) or \
+                        value.id not in self.arg_names:
+                    self.fail("accesses memory other than its arguments")
+                if not self.is_index(node.slice):
+                    self.fail("accesses memory at an index other than "
+                              "get_global_id(0)")
+                if isinstance(node.ctx, _ast.Store):
+                    self.writes.add(value.id)
+                else:
+                    self.reads.add(value.id)
+            elif isinstance(node, _ast.Name) and node.id == self.gid and \
+                    not isinstance(node.ctx, _ast.Load):
+                self.fail("assigns to '%s'" % node.id)
+        for node in _ast.walk(stmt):
+            if isinstance(node, _ast.AugAssign) and \
+                    isinstance(node.target, _ast.Subscript):
+                self.reads.add(node.target.value.id)
+
+    def check_temporaries(self, temporaries, written, fusion):
+        """Checks that temporaries are written before they are read, and
+        records the stage that first writes each in ``written``."""
+        temporaries = set(temporaries)
+        subscripted = set(id(node.value) for stmt in self.body
+                          for node in _ast.walk(stmt)
+                          if isinstance(node, _ast.Subscript))
+        for stmt in self.body:
+            for node in _ast.walk(stmt):
+                if isinstance(node, _ast.Name) and node.id in temporaries \
+                        and id(node) not in subscripted:
+                    self.fail("uses temporary '%s' other than as %s[%s]" %
+                              (node.id, node.id, 
+                               self.gid or "get_global_id(0)"))
+        read_from = set()
+        for stmt in self.body:
+            self._check_temporaries(stmt, temporaries, written, read_from,
+                                    True)
+        for name in sorted(read_from):
+            fusion.decide(self.generic_fn,
+                          "reads temporary '%s' from a register, written by "
+                          "'%s'" % (name, written[name].name))
+
+    def _check_temporaries(self, stmt, temporaries, written, read_from,
+                           top_level):
+        def accesses(node, ctx):
+            return set(child.value.id for child in _ast.walk(node)
+                       if isinstance(child, _ast.Subscript) and
+                       isinstance(child.ctx, ctx) and
+                       child.value.id in temporaries)
+        if isinstance(stmt, (_ast.If, _ast.For, _ast.While)):
+            # the header is evaluated first
+            header = stmt.test if not isinstance(stmt, _ast.For) \
+                else stmt.iter
+            reads, writes = accesses(header, _ast.Load), set()
+        elif isinstance(stmt, _ast.AugAssign):
+            reads = accesses(stmt.value, _ast.Load) | \
+                accesses(stmt.target, _ast.Store)
+            writes = accesses(stmt.target, _ast.Store)
+        else:
+            reads = accesses(stmt, _ast.Load)
+            writes = accesses(stmt, _ast.Store)
+        for name in reads:
+            if name not in written:
+                self.fail("reads temporary '%s' before it is written" % name)
+            if written[name] is not self:
+                read_from.add(name)
+        for name in writes:
+            if name not in written:
+                if not top_level:
+                    self.fail("first writes temporary '%s' conditionally" %
+                              name)
+                written[name] = self
+        if isinstance(stmt, (_ast.If, _ast.For, _ast.While)):
+            for child in stmt.body + stmt.orelse:
+                self._check_temporaries(child, temporaries, written,
+                                        read_from, False)
+
+class _StageBody(_ast.NodeTransformer):
+    """Renames the variables of a stage and replaces temporaries by local
+    variables."""
+    def __init__(self, stage, gid, renames, temporaries):
+        self.stage = stage
+        self.gid = gid
+        self.renames = renames
+        self.temporaries = temporaries
+
+    def visit_Subscript(self, node):
+        name = node.value.id
+        if name in self.temporaries:
+            return _ast.copy_location(_ast.Name(id=name, ctx=node.ctx), node)
+        node.slice = _ast.Index(value=_ast.Name(id=self.gid, ctx=_ast.Load()))
+        return node
+
+    def visit_Name(self, node):
+        node.id = self.renames.get(node.id, node.id)
+        return node
@@ -0,0 +1,196 @@
+"""Futures for specializing and building programs in the background.
+
+Specialization runs in Python on :data:`compile_executor`, a single thread,
+while programs are built by the OpenCL driver on :data:`build_executor`, a
+pool of threads, so the driver builds one program while the next is being
+specialized, and both overlap with whatever the calling thread does::
+
+    saxpy_ff = saxpy.compile_async(OpenCL, float, float.ptr_global, ...)
+    saxpy_dd = saxpy.compile_async(OpenCL, double, double.ptr_global, ...)
+    program = clq.futures.build_async(ctx, (saxpy_ff, saxpy_dd))
+    ... # load data
+    program.saxpy(...) # blocks until the program has been built
+
+The compiler itself is not thread-safe, so the compiler's work is serialized
+by :data:`clq.compiler_lock`: :meth:`GenericFn.compile <clq.GenericFn.compile>`
+holds it while specializing and creating the concrete function, and it is held
+while annotating a generic function and while generating a concrete
+function's typed syntax tree and program items. A compile in another thread,
+including the calling one, therefore waits for the step in progress on
+:data:`compile_executor`, and both threads get the same interned objects for
+the same signature. Builds on :data:`build_executor` do not take the lock.
+"""
+import sys as _sys
+import threading as _threading
+import Queue as _Queue
+
+import clq
+
+class Future(object):
+    """The result of a computation that may not have finished yet."""
+    def __init__(self):
+        self._done = _threading.Event()
+        self._callbacks = [ ]
+        self._lock = _threading.Lock()
+
+    _result = None
+    _exc_info = None
+
+    def done(self):
+        """Returns whether the computation has finished."""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Returns the result of the computation, waiting for it to finish if
+        necessary, or raises the exception it raised.
+
+        If ``timeout`` is not None and the computation does not finish within
+        that many seconds, raises a :class:`TimeoutError`.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("The computation did not finish in time.")
+        exc_info = self._exc_info
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns the exception raised by the computation, or None, waiting
+        for it to finish if necessary."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("The computation did not finish in time.")
+        exc_info = self._exc_info
+        return None if exc_info is None else exc_info[1]
+
+    def add_done_callback(self, fn):
+        """Calls ``fn`` with this future once it has finished (immediately,
+        in this thread, if it has already)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        """Finishes the computation with the provided result."""
+        self._result = result
+        self._finish()
+
+    def set_exc_info(self, exc_info):
+        """Finishes the computation with the exception described by
+        ``exc_info``, as returned by :func:`sys.exc_info`."""
+        self._exc_info = exc_info
+        self._finish()
+
+    def set_from(self, other):
+        """Finishes the computation with the outcome of ``other``, a finished
+        future."""
+        if other._exc_info is not None:
+            self.set_exc_info(other._exc_info)
+        else:
+            self.set_result(other._result)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, [ ]
+        for fn in callbacks:
+            fn(self)
+
+class ProgramFuture(Future):
+    """A future program. Other attributes, such as kernels, are looked up on
+    the program, waiting for it to be built only when first needed."""
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.result(), name)
+
+class TimeoutError(clq.Error):
+    """Raised if a :class:`Future` does not finish in time."""
+
+class Executor(object):
+    """Runs functions on a pool of daemon threads, started when first
+    needed."""
+    def __init__(self, max_workers, name="clq"):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue = _Queue.Queue()
+        self._threads = [ ]
+        self._lock = _threading.Lock()
+
+    max_workers = None
+    """The maximum number of threads. Can be changed, but threads already
+    started are kept."""
+
+    name = None
+    """The prefix of the names of the threads."""
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs ``fn(*args, **kwargs)`` on a thread in the pool and returns a
+        :class:`Future` of the result."""
+        return self.run(Future(), fn, *args, **kwargs)
+
+    def run(self, future, fn, *args, **kwargs):
+        """Runs ``fn(*args, **kwargs)`` on a thread in the pool and sets the
+        result on ``future``, which is returned."""
+        self._queue.put((future, fn, args, kwargs))
+        with self._lock:
+            threads = self._threads
+            if len(threads) < self.max_workers and \
+                    self._queue.qsize() > self._idle:
+                thread = _threading.Thread(
+                    target=self._work,
+                    name="%s-%d" % (self.name, len(threads)))
+                thread.daemon = True
+                threads.append(thread)
+                thread.start()
+        return future
+
+    _idle = 0
+
+    def _work(self):
+        queue = self._queue
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = queue.get()
+            with self._lock:
+                self._idle -= 1
+            future, fn, args, kwargs = item
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                future.set_exc_info(_sys.exc_info())
+            else:
+                future.set_result(result)
+            del item, future, fn, args, kwargs
+
+compile_executor = Executor(1, "clq-compile")
+"""Runs specializations (see :meth:`GenericFn.compile_async
+<clq.GenericFn.compile_async>`), one at a time."""
+
+build_executor = Executor(4, "clq-build")
+"""Runs program builds (see :meth:`ProgramModule.build_async
+<clq.ProgramModule.build_async>`)."""
+
+def build_async(ctx, concrete_fns, options=""):
+    """Returns a :class:`ProgramFuture` of the program containing the
+    provided concrete functions, or futures of them (e.g. from
+    :meth:`GenericFn.compile_async <clq.GenericFn.compile_async>`), built by
+    ``ctx.compile``.
+
+    The program items are collected on :data:`compile_executor`, after the
+    specializations already submitted to it, and the program is then built
+    on :data:`build_executor`.
+    """
+    program = ProgramFuture()
+    def collect():
+        module = clq.ProgramModule(
+            concrete_fn.result() if isinstance(concrete_fn, Future)
+            else concrete_fn for concrete_fn in concrete_fns)
+        module.build_async(ctx, options).add_done_callback(program.set_from)
+    def failed(future):
+        if future.exception() is not None:
+            program.set_from(future)
+    compile_executor.submit(collect).add_done_callback(failed)
+    return program
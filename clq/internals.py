@@ -1,18 +1,23 @@
 import ast as _ast # http://docs.python.org/library/ast.html
+import copy
 
 import cypy
 import cypy.astx as astx
 
-from clq import (InvalidOperationError, TypeResolutionError, Context)
+from clq import (InvalidOperationError, TypeResolutionError, Context, 
+                 profiling, ir)
 
 class GenericFnVisitor(_ast.NodeVisitor):
-    """A visitor that produces a copy of a generic function's abstract syntax 
-    tree annotated with the following additional information:
+    """A visitor that translates a generic function's abstract syntax tree 
+    into the :mod:`intermediate representation <clq.ir>`, annotated with the 
+    following additional information:
     
     - :class:`unresolved types <UnresolvedType>` for each expression (in the 
       ``unresolved_type`` attribute)
     - maps from variable names to their unresolved types
     
+    The root of the result is a copy of the ``FunctionDef`` node carrying 
+    these maps and the number of IR nodes (``n_nodes``).
     """
     def __init__(self):
         self.all_variables = { }
@@ -30,6 +35,9 @@ class GenericFnVisitor(_ast.NodeVisitor):
         self.return_type = None
         """The unresolved return type of this function"""
         
+        self.n_nodes = 0
+        """The number of IR nodes created so far."""
+        
         # used internally to prevent nested function declarations
         self._in_function = False
     
@@ -37,6 +45,13 @@ class GenericFnVisitor(_ast.NodeVisitor):
         raise InvalidOperationError(
             "Unsupported operation: " + type(node).__name__, node)
         
+    def _new(self, cls, node, **fields):
+        # creates an IR node of type cls corresponding to the source node
+        index = self.n_nodes
+        self.n_nodes = index + 1
+        return cls(index, getattr(node, 'lineno', None), 
+                   getattr(node, 'col_offset', None), **fields)
+        
     ######################################################################
     ## Statements
     ######################################################################
@@ -65,7 +80,8 @@ class GenericFnVisitor(_ast.NodeVisitor):
             all_variables=cypy.frozendict(self.all_variables),
             arguments=cypy.frozendict(self.arguments),
             local_variables=cypy.frozendict(self.local_variables),
-            free_variables=cypy.frozendict(self.free_variables)
+            free_variables=cypy.frozendict(self.free_variables),
+            n_nodes=self.n_nodes
         )
     
     def visit_arguments(self, node):
@@ -87,10 +103,16 @@ class GenericFnVisitor(_ast.NodeVisitor):
     
     def visit_Return(self, node):
         value = node.value
+        if value is not None:
+            value = self.visit(value)
+            
+        new_node = self._new(ir.Return, node, 
+            value=value
+        )
+        
         if value is None:
-            return_type = VoidURT()
+            return_type = VoidURT(new_node)
         else:
-            value = self.visit(value)
             return_type = value.unresolved_type
             
         cur_return_type = self.return_type
@@ -100,11 +122,9 @@ class GenericFnVisitor(_ast.NodeVisitor):
             # can think of the return value as just another value that
             # is being assigned to implicitly.
             self.return_type = MultipleAssignmentURT(cur_return_type, 
-                                                     return_type, node)
+                                                     return_type, new_node)
         
-        return astx.copy_node(node, 
-            value=value
-        )
+        return new_node
     
     def visit_Assign(self, node):
         value = self.visit(node.value)
@@ -116,7 +136,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         targets = [ self.visit(targets[0]) ]
         self.cur_assignment_type = None
         
-        return astx.copy_node(node,
+        return self._new(ir.Assign, node,
             targets=targets,
             value=value
         )
@@ -141,7 +161,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         target = self.visit(target)
         self.cur_assignment_type = None
         
-        return astx.copy_node(node,
+        return self._new(ir.AugAssign, node,
             target=tmp_binop.left,
             op=tmp_binop.op,
             value=tmp_binop.right
@@ -155,8 +175,30 @@ class GenericFnVisitor(_ast.NodeVisitor):
         # We only support the standard for x in ([start, ]stop[, step]) syntax
         # with positive step sizes.
         
+        # for x in unroll(bounds[, factor]) gives an unrolling hint
+        iter = node.iter
+        unroll = None
+        if isinstance(iter, _ast.Call) and isinstance(iter.func, _ast.Name) \
+                and iter.func.id == "unroll":
+            args = iter.args
+            if not 1 <= len(args) <= 2 or iter.keywords or iter.starargs \
+                    or iter.kwargs:
+                raise InvalidOperationError(
+                    "unroll takes the loop bounds and an optional factor.", 
+                    node)
+            if len(args) == 2:
+                factor = args[1]
+                if not isinstance(factor, _ast.Num) or \
+                        not isinstance(factor.n, (int, long)) or factor.n < 1:
+                    raise InvalidOperationError(
+                        "The unroll factor must be a positive integer "
+                        "literal.", node)
+                unroll = factor.n
+            else:
+                unroll = True
+            iter = args[0]
+        
         # insert missing iteration bounds if not specified
-        iter = astx.deep_copy_node(node.iter)
         if isinstance(iter, _ast.Tuple):
             elts = iter.elts
             n_elts = len(elts)
@@ -203,15 +245,16 @@ class GenericFnVisitor(_ast.NodeVisitor):
             )
         )
         
-        return astx.copy_node(node,
-            target=target,
+        return self._new(ir.For, node,
+            target=init.targets[0],
             iter=iter,
             body=[self.visit(stmt) for stmt in node.body],
             orelse=[],
             
             init=init,
             guard=guard,
-            update_stmt=update_stmt
+            update_stmt=update_stmt,
+            unroll=unroll
         )
 
     def visit_While(self, node):
@@ -219,32 +262,32 @@ class GenericFnVisitor(_ast.NodeVisitor):
             raise InvalidOperationError(
                 "else clauses on while loops are not supported.", node)
         
-        return astx.copy_node(node,
+        return self._new(ir.While, node,
             test=self.visit(node.test),
             body=[self.visit(stmt) for stmt in node.body],
             orelse=[]
         )
     
     def visit_If(self, node):
-        return astx.copy_node(node,
+        return self._new(ir.If, node,
             test=self.visit(node.test),
             body=[self.visit(stmt) for stmt in node.body],
             orelse=[self.visit(stmt) for stmt in node.orelse]
         )
     
     def visit_Expr(self, node):
-        return astx.copy_node(node,
+        return self._new(ir.Expr, node,
             value=self.visit(node.value)
         )
     
     def visit_Pass(self, node):
-        return astx.copy_node(node)
+        return self._new(ir.Pass, node)
     
     def visit_Break(self, node):
-        return astx.copy_node(node)
+        return self._new(ir.Break, node)
     
     def visit_Continue(self, node):
-        return astx.copy_node(node)
+        return self._new(ir.Continue, node)
     
     def visit_Exec(self, node):
         if node.globals:
@@ -254,7 +297,8 @@ class GenericFnVisitor(_ast.NodeVisitor):
             raise InvalidOperationError(
                 "Cannot specify locals with `exec`.", node.locals[0])
             
-        return astx.copy_node(node,
+        return self._new(ir.Exec, node,
+            body=node.body,
             globals=None,
             locals=None
         )
@@ -263,8 +307,9 @@ class GenericFnVisitor(_ast.NodeVisitor):
     ## Supported Operators
     ######################################################################
     def _visit_op(self, node):
-        # all operators are just copied directly
-        return astx.copy_node(node)
+        # operators carry no information of their own, so they are shared
+        # with the original syntax tree
+        return node
     
     visit_Add = _visit_op
     visit_Sub = _visit_op
@@ -298,7 +343,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         operand = self.visit(node.operand)
         op = self.visit(node.op)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.UnaryOp, node,
             op=op,
             operand=operand)
         new_node.unresolved_type = UnaryOpURT(new_node)
@@ -309,7 +354,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         op = self.visit(node.op)
         right = self.visit(node.right)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.BinOp, node,
             left=left,
             op=op,
             right=right)
@@ -320,7 +365,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         op = self.visit(node.op)
         values = [self.visit(expr) for expr in node.values]
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.BoolOp, node,
             op=op,
             values=values)
         new_node.unresolved_type = BoolOpURT(new_node)
@@ -336,7 +381,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         ops = [self.visit(node.ops[0])]
         comparators = [self.visit(comparators[0])]
             
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.Compare, node,
             left=left,
             ops=ops,
             comparators=comparators)
@@ -351,7 +396,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         body = self.visit(node.body)
         orelse = self.visit(node.orelse)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.IfExp, node,
             test=test,
             body=body,
             orelse=orelse)
@@ -374,7 +419,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         func = self.visit(node.func)        
         args = [ self.visit(arg) for arg in node.args ]
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.Call, node,
             func=func, 
             args=args, 
             keywords=[], 
@@ -387,7 +432,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         value = self.visit(node.value)
         ctx = self.visit(node.ctx)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.Attribute, node,
             value=value, 
             attr=node.attr, 
             ctx=ctx)
@@ -399,7 +444,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         slice = self.visit(node.slice)
         ctx = self.visit(node.ctx)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.Subscript, node,
             value=value, 
             slice=slice, 
             ctx=ctx)
@@ -408,7 +453,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
     
     def visit_Ellipsis(self, node):
         # here in case a custom type wants to support it
-        return astx.copy_node(node)
+        return self._new(ir.Ellipsis, node)
     
     def visit_Slice(self, node):
         # here in case a custom type wants to support it
@@ -424,7 +469,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
         if step is not None:
             step = self.visit(step)
             
-        return astx.copy_node(node,
+        return self._new(ir.Slice, node,
             lower=lower,
             upper=upper,
             step=step
@@ -435,32 +480,32 @@ class GenericFnVisitor(_ast.NodeVisitor):
         if dims:
             dims = [self.visit(dim) for dim in dims]
             
-        return astx.copy_node(node, 
+        return self._new(ir.ExtSlice, node, 
             dims=dims
         )
     
     def visit_Index(self, node):
         value = self.visit(node.value)
         
-        new_node = astx.copy_node(node,
+        new_node = self._new(ir.Index, node,
             value=value)
         new_node.unresolved_type=value.unresolved_type
         return new_node
-        
-    def visit_Load(self, node):
-        return astx.copy_node(node)
     
-    def visit_Store(self, node):
-        return astx.copy_node(node)
-    
-    def visit_Param(self, node):
-        return astx.copy_node(node)
+    def _visit_ctx(self, node):
+        # like operators, shared with the original syntax tree
+        return node
+        
+    visit_Load = _visit_ctx
+    visit_Store = _visit_ctx
+    visit_Param = _visit_ctx
     
     def visit_Name(self, node):
         id = node.id
         ctx = self.visit(node.ctx)
         ctx_t = type(ctx)
-        name = astx.copy_node(node,
+        name = self._new(ir.Name, node,
+            id=id,
             ctx=ctx
         )
         unresolved_type = NameURT(name)
@@ -501,22 +546,78 @@ class GenericFnVisitor(_ast.NodeVisitor):
         return name
         
     def visit_Num(self, node):
-        new_node = astx.copy_node(node)
-        new_node.unresolved_type = NumURT(node)
+        new_node = self._new(ir.Num, node, n=node.n)
+        new_node.unresolved_type = NumURT(new_node)
         return new_node
     
     def visit_Str(self, node):
-        new_node = astx.copy_node(node)
-        new_node.unresolved_type = StrURT(node)
+        new_node = self._new(ir.Str, node, s=node.s)
+        new_node.unresolved_type = StrURT(new_node)
         return new_node
     
+##############################################################################
+## Partial Evaluation
+##############################################################################
+class ConstantSubstitution(_ast.NodeTransformer):
+    """Copies the syntax tree of a generic function, replacing references to
+    the names in ``constants`` with numeric literals and removing the 
+    arguments of those names.
+    
+    See :meth:`GenericFn.specialize <clq.GenericFn.specialize>`.
+    """
+    def __init__(self, constants):
+        self.constants = constants
+        
+    def visit_FunctionDef(self, node):
+        node = copy.deepcopy(node)
+        constants = self.constants
+        node.args.args = [arg for arg in node.args.args 
+                          if arg.id not in constants]
+        node.body = [self.visit(stmt) for stmt in node.body]
+        return node
+    
+    def visit_Name(self, node):
+        id = node.id
+        if id in self.constants:
+            if not isinstance(node.ctx, _ast.Load):
+                raise InvalidOperationError(
+                    "Constants cannot be assigned to: %s." % id, node)
+            return _ast.copy_location(_ast.Num(n=self.constants[id]), node)
+        return node
+    
 ##############################################################################
 ## Unresolved Types
 ##############################################################################
+def _unresolved_types(*nodes):
+    return tuple(node.unresolved_type for node in nodes 
+                 if hasattr(node, 'unresolved_type'))
+
 class UnresolvedType(object):
     """Abstract base class for unresolved types."""
     def __init__(self, node):
         self.node = node
+        
+    def resolve(self, context):
+        """Returns the concrete type this resolves to in the provided 
+        :class:`context <clq.Context>`.
+        
+        Results are kept in ``context.resolved_types``, so each unresolved 
+        type is resolved at most once per context and the table is released 
+        along with the context. Resolution is done by the context's 
+        :class:`TypeInference` engine, which calls :meth:`_resolve` once the 
+        types of the :meth:`children` are known.
+        """
+        try:
+            return context.resolved_types[self]
+        except KeyError:
+            return context.inference.evaluate(self)
+    
+    def children(self):
+        """Returns the unresolved types that :meth:`_resolve` depends on."""
+        return ()
+        
+    def _resolve(self, context):
+        raise NotImplementedError()
 
 class VoidURT(UnresolvedType):
     """Represents the void return type."""
@@ -526,8 +627,7 @@ class VoidURT(UnresolvedType):
     def __repr__(self):
         return "Void()"
     
-    @cypy.memoize
-    def resolve(self, context):
+    def _resolve(self, context):
         return context.backend.void_type(context, self.node)
 
 class NumURT(UnresolvedType):
@@ -538,8 +638,7 @@ class NumURT(UnresolvedType):
     def __repr__(self):
         return "Num(%s)" % str(self.node.n)
     
-    @cypy.memoize
-    def resolve(self, context):
+    def _resolve(self, context):
         return context.backend.resolve_Num(context, self.node)
     
 class StrURT(UnresolvedType):
@@ -550,8 +649,7 @@ class StrURT(UnresolvedType):
     def __repr__(self):
         return "Str('''%s''')" % self.node.s
     
-    @cypy.memoize
-    def resolve(self, context):
+    def _resolve(self, context):
         return context.backend.resolve_Str(context, self.node)
     
 class AttributeURT(UnresolvedType):
@@ -565,8 +663,10 @@ class AttributeURT(UnresolvedType):
         return "Attribute(%s, %s)" % (repr(node.value.unresolved_type),
                                       node.attr)
     
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        return _unresolved_types(self.node.value)
+    
+    def _resolve(self, context):
         node = self.node
         value_type = node.value.unresolved_type.resolve(context)            
         return value_type.resolve_Attribute(context, node)
@@ -583,8 +683,11 @@ class SubscriptURT(UnresolvedType):
         return "Subscript(%s, %s)" % (repr(node.value.unresolved_type),
                                       repr(node.slice.unresolved_type))
         
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        node = self.node
+        return _unresolved_types(node.value, node.slice)
+        
+    def _resolve(self, context):
         node = self.node
         value_type = node.value.unresolved_type.resolve(context)
         return value_type.resolve_Subscript(context, node)
@@ -601,8 +704,10 @@ class UnaryOpURT(UnresolvedType):
         return "UnaryOp(%s, %s)" % (type(node.op).__name__,
                                       repr(node.operand.unresolved_type))
         
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        return _unresolved_types(self.node.operand)
+        
+    def _resolve(self, context):
         node = self.node
         operand_type = node.operand.unresolved_type.resolve(context)
         return operand_type.resolve_UnaryOp(context, node)
@@ -621,8 +726,11 @@ class BinOpURT(UnresolvedType):
                                         type(node.op).__name__,
                                         repr(node.right.unresolved_type))
         
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        node = self.node
+        return _unresolved_types(node.left, node.right)
+        
+    def _resolve(self, context):
         node = self.node
         left_type = node.left.unresolved_type.resolve(context)
         return left_type.resolve_BinOp(context, node)
@@ -641,8 +749,11 @@ class CompareURT(UnresolvedType):
                                         type(node.op).__name__,
                                         repr(node.comparators[0].unresolved_type))
             
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        node = self.node
+        return _unresolved_types(node.left, *node.comparators)
+            
+    def _resolve(self, context):
         node = self.node
         left_type = node.left.unresolved_type.resolve(context)
         return left_type.resolve_Compare(context, node)  
@@ -661,8 +772,10 @@ class BoolOpURT(UnresolvedType):
                                    ", ".join(repr(value.unresolved_type)
                                              for value in node.values))
             
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        return _unresolved_types(*self.node.values)
+            
+    def _resolve(self, context):
         node = self.node
         left_type = node.values[0].unresolved_type.resolve(context)
         return left_type.resolve_BoolOp(context, node)
@@ -675,8 +788,7 @@ class NameURT(UnresolvedType):
     def __repr__(self):
         return "Name('%s')" % self.node.id
     
-    @cypy.memoize
-    def resolve(self, context):
+    def _resolve(self, context):
         node = self.node
         id = node.id
         
@@ -684,42 +796,25 @@ class NameURT(UnresolvedType):
             # is it an argument?
             return context.concrete_fn.arg_map[id]
         except KeyError:
-            # no? then it must be a local variable
-            
-            try:
-                return context._multiple_assignment_prev[id]
-            except KeyError:
-                # we have to assign it a type
-                try:
-                    var = context.generic_fn.local_variables[id]
-                except KeyError:
-                    raise TypeResolutionError(
-                        "Definition for name could not be found: %s." % id, node)
-                
-                #
-                # Have to keep a stack for multiple assignments to be handled
-                # correctly when they are recursive, e.g.
-                #
-                #    i = 0
-                #    i = i + 1.0
-                #
-                # Here, i has unresolved type:
-                #    
-                #    i: 0 <=> `i + 1.0
-                #
-                # If we didn't keep track of what name we're currently 
-                # working on, multiple assignment resolution would loop 
-                # forever when it saw the nested `i term.
-                #
-                 
-                prev_resolving_name = context._resolving_name
-                context._resolving_name = id
-
-                resolved_type = var.resolve(context)
-                
-                context._resolving_name = prev_resolving_name
-            
-                return resolved_type
+            pass
+        
+        # no? then it must be a local variable
+        inference = context.inference
+        graph = inference.graph
+        try:
+            prev = graph.self_references[self]
+        except KeyError:
+            if id not in graph.assignments:
+                raise TypeResolutionError(
+                    "Definition for name could not be found: %s." % id, node)
+            return inference.variable_type(id)
+        
+        # a reference to a variable from within a value being assigned to it 
+        # has the type of the variable before that assignment
+        if prev is None:
+            raise TypeResolutionError(
+                "Variable referenced before assignment: %s." % id, node)
+        return prev.resolve(context)
         
 class MultipleAssignmentURT(UnresolvedType):
     """The unresolved type of variables that have been assigned to multiple 
@@ -739,22 +834,30 @@ class MultipleAssignmentURT(UnresolvedType):
         return "MultipleAssignment(%s, %s)" % (repr(self.prev.unresolved_type),
                                                repr(self.new.unresolved_type))
         
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        return (self.prev, self.new)
+        
+    def _resolve(self, context):
         prev, new, node = self.prev, self.new, self.node
         prev_type = prev.resolve(context)
+        return prev_type.resolve_MultipleAssignment(context, prev, new, node)
         
-        _resolving_name = context._resolving_name
-        if _resolving_name:
-            context._multiple_assignment_prev[_resolving_name] = prev_type
-            
-        resolved_type = prev_type.resolve_MultipleAssignment(context, prev, new, node)
-        
-        if _resolving_name:
-            del context._multiple_assignment_prev[_resolving_name]
-            
-        return resolved_type
+class KnownURT(UnresolvedType):
+    """The type of a node created after type resolution (e.g. by the 
+    :mod:`optimizer <clq.optimize>`), which is known in advance."""
+    def __init__(self, node, clq_type):
+        UnresolvedType.__init__(self, node)
+        self.clq_type = clq_type
         
+    def __str__(self):
+        return str(self.clq_type)
+    
+    def __repr__(self):
+        return "Known(%r)" % self.clq_type
+    
+    def _resolve(self, context):
+        return self.clq_type
+
 class CallURT(UnresolvedType):
     """The unresolved type of call expressions."""
     def __str__(self):
@@ -769,21 +872,324 @@ class CallURT(UnresolvedType):
                                  ", ".join(repr(arg.unresolved_type)
                                            for arg in node.args))
         
-    @cypy.memoize
-    def resolve(self, context):
+    def children(self):
+        node = self.node
+        return _unresolved_types(node.func, *node.args)
+        
+    def _resolve(self, context):
         node = self.node
         func_type = node.func.unresolved_type.resolve(context)
         return func_type.resolve_Call(context, node)
 
+##############################################################################
+## Type Inference
+##############################################################################
+class InferenceGraph(object):
+    """The dependencies between the local variables of a generic function.
+    
+    This does not depend on the argument types, so it is computed once per
+    :class:`generic function <clq.GenericFn>` (see 
+    :attr:`clq.GenericFn.inference_graph`) and shared by the 
+    :class:`TypeInference` engines of all of its concrete functions.
+    """
+    def __init__(self, generic_fn):
+        local_variables = generic_fn.annotated_ast.local_variables
+        self.assignments = { }
+        self.values = { }
+        self.self_references = { }
+        self.dependencies = { }
+        
+        for name in sorted(local_variables.iterkeys()):
+            # unwind the chain of multiple assignments built up by 
+            # GenericFnVisitor.visit_Name
+            urt = local_variables[name]
+            links = [ ]
+            while (isinstance(urt, MultipleAssignmentURT) and 
+                   isinstance(urt.node, ir.Name) and urt.node.id == name):
+                links.append(urt)
+                urt = urt.prev
+            links.reverse()
+            assignments = self.assignments[name] = [urt] + links
+            values = self.values[name] = [urt] + [link.new for link in links]
+            
+            dependencies = self.dependencies[name] = cypy.SetList()
+            for i, value in enumerate(values):
+                prev = assignments[i - 1] if i > 0 else None
+                for ref in _name_references(value):
+                    id = ref.node.id
+                    if id == name:
+                        self.self_references[ref] = prev
+                    elif id in local_variables:
+                        dependencies.append(id)
+        
+        self.components = _strongly_connected_components(
+            sorted(self.assignments.iterkeys()), self.dependencies)
+        self.component_of = { }
+        for i, component in enumerate(self.components):
+            for name in component:
+                self.component_of[name] = i
+    
+    assignments = None
+    """variable name => list of unresolved types, where the ith item is the
+    type of the variable after its first i + 1 assignments"""
+    
+    values = None
+    """variable name => list of the unresolved types of the values assigned 
+    to it, in order"""
+    
+    self_references = None
+    """:class:`NameURT` => the unresolved type of the variable before the 
+    assignment the name appears in (or None for the first assignment), for 
+    references to a variable from within values being assigned to it, as in
+    ``i = i + 1``"""
+    
+    dependencies = None
+    """variable name => the other variables referenced by values assigned to 
+    it"""
+    
+    components = None
+    """The strongly connected components of the dependency graph, as lists of
+    variable names, ordered so that each component only depends on the 
+    components before it."""
+    
+    component_of = None
+    """variable name => index of its component in :attr:`components`"""
+
+def _name_references(urt):
+    """Yields the :class:`NameURT` objects reachable from ``urt`` through
+    :meth:`UnresolvedType.children`."""
+    stack = [urt]
+    seen = set()
+    while stack:
+        urt = stack.pop()
+        if urt in seen:
+            continue
+        seen.add(urt)
+        if isinstance(urt, NameURT):
+            yield urt
+        stack.extend(urt.children())
+
+def _strongly_connected_components(nodes, edges):
+    # iterative version of Tarjan's algorithm, which emits each component 
+    # after all of the components it depends on
+    index = { }
+    lowlink = { }
+    on_stack = set()
+    stack = [ ]
+    components = [ ]
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(edges[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges[successor])))
+                    break
+                elif successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = [ ]
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    component.sort()
+                    components.append(component)
+    return components
+
+class _UnknownType(Exception):
+    """Raised while solving mutually dependent variables when a type depends 
+    on a variable that has not been assigned an approximate type yet."""
+
+class TypeInference(object):
+    """Resolves the unresolved types in a :class:`context <clq.Context>`.
+    
+    Expressions are resolved bottom-up using an explicit work stack rather 
+    than recursion, so deeply nested expressions and long chains of 
+    assignments do not hit the recursion limit, and each unresolved type is 
+    resolved once.
+    
+    The type of a local variable is the result of combining the types of all 
+    of the values assigned to it, in order, with 
+    ``resolve_MultipleAssignment``. Variables are solved in the order given 
+    by :attr:`InferenceGraph.components`. Within a value being assigned to a 
+    variable, references to that variable have its type before the 
+    assignment (so ``i = 0; i = i + 1.0`` makes ``i`` a float, but the ``i`` 
+    on the right is an int). Groups of variables which depend on each other 
+    are solved by iterating until their types stop changing.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.graph = context.generic_fn.inference_graph
+        self.variable_types = { }
+        self._next_component = 0
+        self._approximations = None
+        self._log = None
+        
+    max_iterations = 100
+    """The maximum number of iterations used to solve a group of mutually 
+    dependent variables before giving up."""
+    
+    variable_types = None
+    """variable name => concrete type, for the variables solved so far"""
+    
+    def clear(self):
+        """Discards all resolved types. They are recomputed if needed."""
+        self.context.resolved_types.clear()
+        self.variable_types.clear()
+        self._next_component = 0
+        
+    def evaluate(self, urt):
+        """Resolves ``urt``, and any of its children that have not been 
+        resolved yet, and returns its concrete type."""
+        context = self.context
+        resolved_types = context.resolved_types
+        try:
+            return resolved_types[urt]
+        except KeyError:
+            pass
+        
+        self_references = self.graph.self_references
+        log = self._log
+        stack = [(urt, False)]
+        while stack:
+            current, ready = stack.pop()
+            if current in resolved_types:
+                continue
+            if ready:
+                resolved_types[current] = current._resolve(context)
+                if log is not None:
+                    log.append(current)
+            else:
+                stack.append((current, True))
+                if current in self_references:
+                    children = (self_references[current],)
+                else:
+                    children = current.children()
+                for child in children:
+                    if child is not None and child not in resolved_types:
+                        stack.append((child, False))
+        return resolved_types[urt]
+    
+    def variable_type(self, name):
+        """Returns the concrete type of the local variable ``name``, solving 
+        it (and the variables it depends on) if necessary."""
+        try:
+            return self.variable_types[name]
+        except KeyError:
+            pass
+        
+        approximations = self._approximations
+        if approximations is not None and name in approximations:
+            approximation = approximations[name]
+            if approximation is None:
+                raise _UnknownType()
+            return approximation
+        
+        graph = self.graph
+        index = graph.component_of[name]
+        components = graph.components
+        while self._next_component <= index:
+            component = components[self._next_component]
+            self._next_component += 1
+            self._solve(component)
+        return self.variable_types[name]
+    
+    def _solve(self, component):
+        if len(component) == 1:
+            name = component[0]
+            self.variable_types[name] = self.evaluate(
+                self.graph.assignments[name][-1])
+            return
+        
+        context = self.context
+        resolved_types = context.resolved_types
+        prev_approximations = self._approximations
+        prev_log = self._log
+        approximations = self._approximations = dict.fromkeys(component)
+        try:
+            for _ in xrange(self.max_iterations):
+                log = self._log = [ ]
+                changed = False
+                for name in component:
+                    approximation = self._combine_assignments(name)
+                    if approximation != approximations[name]:
+                        approximations[name] = approximation
+                        changed = True
+                if not changed:
+                    break
+                # types computed from the old approximations are stale
+                for urt in log:
+                    resolved_types.pop(urt, None)
+            else:
+                raise TypeResolutionError(
+                    "Types of mutually dependent variables %s did not "
+                    "converge." % ", ".join(component), 
+                    self.graph.assignments[component[0]][-1].node)
+        finally:
+            self._approximations = prev_approximations
+            self._log = prev_log
+            
+        for name in component:
+            resolved_type = approximations[name]
+            if resolved_type is None:
+                raise TypeResolutionError(
+                    "Could not infer a type for variable: %s." % name,
+                    self.graph.assignments[name][-1].node)
+            self.variable_types[name] = resolved_type
+            
+    def _combine_assignments(self, name):
+        # combines the types of the values assigned so far that can be 
+        # resolved using the current approximations, or returns None if 
+        # there are none
+        context = self.context
+        resolved_types = context.resolved_types
+        log = self._log
+        graph = self.graph
+        current = None
+        for i, value in enumerate(graph.values[name]):
+            try:
+                value_type = self.evaluate(value)
+            except _UnknownType:
+                value_type = None
+            if i == 0 or current is None:
+                current = value_type
+            elif value_type is not None:
+                link = graph.assignments[name][i]
+                current = current.resolve_MultipleAssignment(
+                    context, link.prev, link.new, link.node)
+            if i > 0 and current is not None:
+                link = graph.assignments[name][i]
+                resolved_types[link] = current
+                log.append(link)
+        return current
+
 ##############################################################################
 ## Concrete Function Visitor
 ##############################################################################
 class ConcreteFnVisitor(_ast.NodeVisitor):
-    """A visitor that produces a copy of a cl.oquence concrete function's 
-    syntax tree annotated with concrete types and code.
+    """A visitor that generates code for a cl.oquence concrete function from 
+    its generic function's :mod:`intermediate representation <clq.ir>`.
     
-    The types are provided in the clq_type attribute and the code is provided
-    in the code attribute.
+    Each expression produces an :class:`ir.Typed <clq.ir.Typed>` record, 
+    providing the type in the clq_type attribute and the code in the code 
+    attribute, which is also stored in ``context.typed`` at the index of the
+    expression's node. The IR itself is not copied.
     """
     def __init__(self, concrete_fn, backend):
         self.concrete_fn = concrete_fn
@@ -799,16 +1205,26 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         # visit arguments
         args = self.visit(node.args)
         
-        # visit body
-        for stmt in node.body:
+        # optimize and visit body
+        body = node.body
+        optimizer = context.backend.optimizer
+        if optimizer is not None:
+            with profiling.phase(self.concrete_fn, "optimize"):
+                body = optimizer.optimize(context, body)
+        for stmt in body:
             self.visit(stmt)
             
         # generate program item
-        program_item = context.backend.generate_program_item(context)
+        with profiling.phase(self.concrete_fn, "assemble"):
+            program_item = context.backend.generate_program_item(context)
         context.program_item = program_item
         context.program_items.append(program_item)
         context.backend.add_program_items(context.program_items)
         
+        # code generation is complete, so the resolution tables are no 
+        # longer needed (anything resolved later is simply resolved again)
+        context.inference.clear()
+        
         # return final AST
         return astx.copy_node(node,
             name=program_item.name,
@@ -836,15 +1252,15 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
     def visit_Assign(self, node):
         context = self.context
         target = node.targets[0]
-        if isinstance(target, _ast.Name):
+        if isinstance(target, ir.Name):
             target_type = target.unresolved_type.resolve(context)
             target_type.validate_Assign(context, node)
             target_type.generate_Assign(context, node)
-        elif isinstance(target, _ast.Attribute):
+        elif isinstance(target, ir.Attribute):
             value_type = target.value.unresolved_type.resolve(context)
             value_type.validate_AssignAttribute(context, node)
             value_type.generate_AssignAttribute(context, node)
-        elif isinstance(target, _ast.Subscript):
+        elif isinstance(target, ir.Subscript):
             value_type = target.value.unresolved_type.resolve(context)
             value_type.validate_AssignSubscript(context, node)
             value_type.generate_AssignSubscript(context, node)
@@ -855,15 +1271,15 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         context = self.context
         target = node.target
         
-        if isinstance(target, _ast.Name):
+        if isinstance(target, ir.Name):
             target_type = target.unresolved_type.resolve(context)
             target_type.validate_AugAssign(context, node)
             target_type.generate_AugAssign(context, node)
-        elif isinstance(target, _ast.Attribute):
+        elif isinstance(target, ir.Attribute):
             value_type = target.value.unresolved_type.resolve(context)
             value_type.validate_AugAssignAttribute(context, node)
             value_type.generate_AugAssignAttribute(context, node)
-        elif isinstance(target, _ast.Subscript):
+        elif isinstance(target, ir.Subscript):
             value_type = target.value.unresolved_type.resolve(context)
             value_type.validate_AugAssignSubscript(context, node)
             value_type.generate_AugAssignSubscript(context, node)
@@ -944,6 +1360,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         operand_type = node.operand.unresolved_type.resolve(context)
         new = operand_type.generate_UnaryOp(context, node)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_BinOp(self, node):
@@ -952,6 +1369,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         left_type = node.left.unresolved_type.resolve(context)
         new = left_type.generate_BinOp(context, node)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Compare(self, node):
@@ -960,6 +1378,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         left_type = node.left.unresolved_type.resolve(context)
         new = left_type.generate_Compare(context, node)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_BoolOp(self, node):
@@ -968,6 +1387,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         left_type = node.values[0].unresolved_type.resolve(context)
         new = left_type.generate_BoolOp(context, node)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
             
     ######################################################################
@@ -978,6 +1398,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         new = context.backend.generate_IfExp(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Call(self, node):
@@ -986,6 +1407,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         new = func_type.generate_Call(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Attribute(self, node):
@@ -994,6 +1416,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         new = value_type.generate_Attribute(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Subscript(self, node):
@@ -1002,28 +1425,27 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         new = value_type.generate_Subscript(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Index(self, node):
         value = self.visit(node.value)
-        return astx.copy_node(node,
-            value=value,
-            code=value.code,
-            clq_type=value.clq_type
-        )
+        new = self.context.typed[node.index] = ir.Typed(node, value.code, 
+                                                        value.clq_type)
+        return new
         
     def visit_Name(self, node):
         context = self.context
-        return astx.copy_node(node,
-            code=node.id,
-            clq_type=context.observe(node.unresolved_type.resolve(context), node)
-        )
+        clq_type = context.observe(node.unresolved_type.resolve(context), node)
+        new = context.typed[node.index] = ir.Typed(node, node.id, clq_type)
+        return new
         
     def visit_Num(self, node):
         context = self.context
         new = context.backend.generate_Num(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
     
     def visit_Str(self, node):
@@ -1031,4 +1453,5 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         new = context.backend.generate_Str(context, node)
         clq_type = node.unresolved_type.resolve(context)
         new.clq_type = context.observe(clq_type, node)
+        context.typed[node.index] = new
         return new
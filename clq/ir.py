@@ -0,0 +1,113 @@
+"""The intermediate representation of generic functions.
+
+The :class:`GenericFnVisitor <clq.internals.GenericFnVisitor>` translates the
+body of a generic function into a tree of :class:`nodes <Node>` once. The
+node classes mirror the corresponding classes in the :mod:`ast` module (same
+names and fields, so visitors and backends can treat them alike) but use
+``__slots__``, and each node is numbered with an :attr:`index <Node.index>`
+unique within its function.
+
+Code generation does not copy this tree. Instead, each expression visited by
+the :class:`ConcreteFnVisitor <clq.internals.ConcreteFnVisitor>` produces a
+small :class:`Typed` record holding the generated code and concrete type,
+which is stored in ``context.typed`` at the index of its node.
+
+Operators and expression contexts (``ast.Add``, ``ast.Load``, ...) carry no
+information of their own, so the original :mod:`ast` objects are used
+directly.
+"""
+
+class Node(object):
+    """Base class for nodes of the intermediate representation."""
+    __slots__ = ("index", "lineno", "col_offset", "unresolved_type")
+
+    _fields = ()
+    """The names of the child fields, as in :class:`ast.AST`."""
+
+    def __init__(self, index, lineno=None, col_offset=None, **fields):
+        self.index = index
+        self.lineno = lineno
+        self.col_offset = col_offset
+        self.unresolved_type = None
+        for name in self._fields:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError("%s has no fields %s" %
+                            (type(self).__name__, ", ".join(fields)))
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__,
+                           ", ".join("%s=%r" % (name, getattr(self, name))
+                                     for name in self._fields))
+
+def _node_class(name, fields, doc):
+    cls = type(name, (Node,), {
+        "__slots__": fields,
+        "_fields": fields,
+        "__doc__": doc
+    })
+    globals()[name] = cls
+    node_classes[name] = cls
+    return cls
+
+node_classes = { }
+"""class name => node class"""
+
+# statements
+_node_class("Return", ("value",), "``return value``")
+_node_class("Assign", ("targets", "value"), "``targets[0] = value``")
+_node_class("AugAssign", ("target", "op", "value"), "``target op= value``")
+_node_class("For", ("target", "iter", "body", "orelse",
+                    "init", "guard", "update_stmt", "unroll"),
+            "``for target in iter: body``, with the equivalent ``init`` "
+            "assignment, ``guard`` comparison and ``update_stmt``. "
+            "``unroll`` is the hint given with ``unroll(iter, factor)``: "
+            "None if there was none, True to unroll fully, or the factor.")
+_node_class("While", ("test", "body", "orelse"), "``while test: body``")
+_node_class("If", ("test", "body", "orelse"),
+            "``if test: body else: orelse``")
+_node_class("Expr", ("value",), "An expression used as a statement.")
+_node_class("Pass", (), "``pass``")
+_node_class("Break", (), "``break``")
+_node_class("Continue", (), "``continue``")
+_node_class("Exec", ("body", "globals", "locals"),
+            "``exec body``, used to insert code verbatim.")
+
+# expressions
+_node_class("UnaryOp", ("op", "operand"), "``op operand``")
+_node_class("BinOp", ("left", "op", "right"), "``left op right``")
+_node_class("BoolOp", ("op", "values"), "``values[0] op values[1] ...``")
+_node_class("Compare", ("left", "ops", "comparators"),
+            "``left ops[0] comparators[0]``")
+_node_class("IfExp", ("test", "body", "orelse"), "``body if test else orelse``")
+_node_class("Call", ("func", "args", "keywords", "starargs", "kwargs"),
+            "``func(*args)``")
+_node_class("Attribute", ("value", "attr", "ctx"), "``value.attr``")
+_node_class("Subscript", ("value", "slice", "ctx"), "``value[slice]``")
+_node_class("Ellipsis", (), "``...``")
+_node_class("Slice", ("lower", "upper", "step"), "``lower:upper:step``")
+_node_class("ExtSlice", ("dims",), "``dims[0], dims[1], ...``")
+_node_class("Index", ("value",), "A single subscript index.")
+_node_class("Name", ("id", "ctx"), "A variable.")
+_node_class("Num", ("n",), "A numeric literal.")
+_node_class("Str", ("s",), "A string literal.")
+
+class Typed(object):
+    """The code and concrete type generated for a node of a particular
+    concrete function.
+
+    Any other attribute is looked up on the :attr:`node`, so a typed record
+    can be used in place of its node (e.g. ``typed.id`` for a name).
+    """
+    __slots__ = ("node", "code", "clq_type")
+
+    def __init__(self, node, code=None, clq_type=None):
+        self.node = node
+        self.code = code
+        self.clq_type = clq_type
+
+    def __getattr__(self, name):
+        return getattr(self.node, name)
+
+    def __repr__(self):
+        return "Typed(%r, %r)" % (self.node, self.code)
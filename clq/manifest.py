@@ -0,0 +1,221 @@
+"""Manifests describing kernels compiled ahead of time by ``clqcc``.
+
+``clqcc`` specializes the generic functions in a module for the signatures
+it is given and writes the resulting OpenCL source to a ``.cl`` file, along
+with a JSON manifest listing each kernel's name and argument types. Loading
+the manifest at run time needs neither the module nor the cl.oquence
+compiler::
+
+    import clq.manifest
+    manifest = clq.manifest.load("build/kernels.json")
+    program = manifest.build(ctx)
+    saxpy = manifest.kernel(program, "saxpy")
+
+A manifest is a JSON object with these keys:
+
+``format``
+    The version of the manifest format (see :data:`format_version`).
+
+``clq_version``
+    The version of cl.oquence that generated it.
+
+``module``
+    The name of the module that the functions were found in.
+
+``source``
+    The path of the ``.cl`` file, relative to the manifest.
+
+``kernels``
+    A list of :class:`entries <Entry>`, one per specialization, each an
+    object with the keys ``fn``, ``name``, ``arg_types``, ``constants``,
+    ``args`` and ``return_type`` described below.
+
+The list of kernels can also be given to ``clqcc`` as the signatures to
+compile (see :func:`Entry.from_json`).
+"""
+import os as _os
+import json as _json
+
+import clq
+
+format_version = 1
+"""The version of the manifest format written by :meth:`Manifest.save`."""
+
+class Entry(object):
+    """Describes one specialization of a generic function in a
+    :class:`Manifest`."""
+    def __init__(self, fn, arg_types, constants=None, name=None, args=None,
+                 return_type=None):
+        self.fn = fn
+        self.arg_types = tuple(arg_types)
+        self.constants = dict(constants or { })
+        self.name = name
+        self.args = tuple(tuple(arg) for arg in args or ())
+        self.return_type = return_type
+
+    fn = None
+    """The name of the generic function in its module."""
+
+    arg_types = None
+    """The names of the types of each of the unbound arguments (as
+    understood by :func:`clq.backends.opencl.t`, or the name of another
+    generic function in the module)."""
+
+    constants = None
+    """The arguments bound to constants, as a dict."""
+
+    name = None
+    """The name of the kernel in the generated source, or None if not yet
+    compiled."""
+
+    args = None
+    """A ``(name, type name)`` pair for each kernel argument, in order.
+    Arguments of virtual types (functions and types) are not passed to the
+    kernel, so they do not appear here."""
+
+    return_type = None
+    """The name of the return type."""
+
+    @classmethod
+    def from_json(cls, obj):
+        """Returns an entry from its JSON representation: either an object
+        with the keys described above, of which only ``fn`` and
+        ``arg_types`` are required, or a string giving a signature (see
+        :func:`parse_signature`)."""
+        if isinstance(obj, basestring):
+            return parse_signature(obj)
+        try:
+            return cls(obj["fn"], obj["arg_types"], obj.get("constants"),
+                       obj.get("name"), obj.get("args"),
+                       obj.get("return_type"))
+        except (KeyError, TypeError):
+            raise clq.Error("Invalid kernel entry: %r" % (obj,))
+
+    def to_json(self):
+        """Returns the JSON representation of this entry."""
+        return {
+            "fn": self.fn,
+            "name": self.name,
+            "arg_types": list(self.arg_types),
+            "constants": self.constants,
+            "args": [list(arg) for arg in self.args],
+            "return_type": self.return_type
+        }
+
+    @property
+    def signature(self):
+        """This entry written as a signature (see :func:`parse_signature`)."""
+        args = list(self.arg_types)
+        args.extend("%s=%r" % item for item in sorted(self.constants.items()))
+        return "%s(%s)" % (self.fn, ", ".join(args))
+
+def parse_signature(signature):
+    """Returns an :class:`Entry` from a signature of the form
+    ``fn(type, ..., name=constant, ...)``, e.g.
+    ``"scale(__global float*, float, n=4)"``."""
+    fn, paren, args = signature.partition("(")
+    fn = fn.strip()
+    if not paren or not args.rstrip().endswith(")") or not fn:
+        raise clq.Error("Invalid signature: %s" % signature)
+    arg_types, constants = [ ], { }
+    for arg in args.rstrip()[:-1].split(","):
+        arg = arg.strip()
+        if not arg:
+            continue
+        name, eq, value = arg.partition("=")
+        if eq:
+            try:
+                constants[name.strip()] = _json.loads(value.strip())
+            except ValueError:
+                raise clq.Error("Invalid constant in signature %s: %s" %
+                                (signature, arg))
+        else:
+            arg_types.append(arg)
+    return Entry(fn, arg_types, constants)
+
+class Manifest(object):
+    """The kernels in a ``.cl`` file generated by ``clqcc``."""
+    def __init__(self, module, source, entries=(), path=None):
+        self.module = module
+        self.source = source
+        self.entries = list(entries)
+        self.path = path
+        self._programs = { }
+
+    module = None
+    """The name of the module the kernels were compiled from."""
+
+    source = None
+    """The path of the ``.cl`` file, relative to the manifest."""
+
+    entries = None
+    """A list of :class:`entries <Entry>`, one per kernel."""
+
+    path = None
+    """The path the manifest was loaded from or saved to, if any."""
+
+    @property
+    def source_path(self):
+        """The path of the ``.cl`` file."""
+        if self.path is None:
+            return self.source
+        return _os.path.join(_os.path.dirname(self.path), self.source)
+
+    def find(self, fn, *arg_types):
+        """Returns the entry for generic function ``fn`` with the provided
+        argument type names, which may be omitted if there is only one
+        specialization of ``fn``."""
+        candidates = [entry for entry in self.entries if entry.fn == fn and
+                      (not arg_types or entry.arg_types == arg_types)]
+        if len(candidates) != 1:
+            raise clq.Error("%s kernels match %s(%s)." %
+                            (len(candidates) or "No", fn, ", ".join(arg_types)))
+        return candidates[0]
+
+    def build(self, ctx, options=""):
+        """Returns the program built from the ``.cl`` file by ``ctx.compile``
+        (e.g. a :class:`pyocl.Context
+        <clq.backends.opencl.pyocl.Context>`), building it once per context
+        and set of options."""
+        key = (ctx, options if isinstance(options, basestring)
+                    else tuple(options))
+        program = self._programs.get(key, None)
+        if program is None:
+            with open(self.source_path) as f:
+                source = f.read()
+            program = self._programs[key] = ctx.compile(source, options)
+        return program
+
+    def kernel(self, program, fn, *arg_types):
+        """Returns the kernel in ``program`` (from :meth:`build`) for the
+        entry given by :meth:`find`."""
+        return getattr(program, self.find(fn, *arg_types).name)
+
+    def to_json(self):
+        """Returns the JSON representation of this manifest."""
+        return {
+            "format": format_version,
+            "clq_version": clq.version.version_str,
+            "module": self.module,
+            "source": self.source,
+            "kernels": [entry.to_json() for entry in self.entries]
+        }
+
+    def save(self, path):
+        """Writes this manifest to ``path``."""
+        with open(path, "w") as f:
+            _json.dump(self.to_json(), f, indent=2, sort_keys=True)
+            f.write("\n")
+        self.path = path
+
+def load(path):
+    """Returns the :class:`Manifest` saved at ``path``."""
+    with open(path) as f:
+        try:
+            obj = _json.load(f)
+        except ValueError as e:
+            raise clq.Error("Invalid manifest %s: %s" % (path, e))
+    if not isinstance(obj, dict) or obj.get("format") != format_version:
+        raise clq.Error("Unsupported manifest format in %s." % path)
+    entries = [Entry.from_json(entry) for entry in obj["kernels"]]
+    return Manifest(obj["module"], obj["source"], entries, path)
@@ -0,0 +1,1385 @@
+"""An optional optimizer for concrete functions.
+
+By default, the code generated for a concrete function mirrors its source. A
+backend with an :attr:`optimizer <clq.Backend.optimizer>` instead passes the
+:mod:`intermediate representation <clq.ir>` of each function body through an
+:class:`Optimizer` after type resolution and before code generation::
+
+    import clq.optimize
+    OpenCL = clq.backends.opencl.Backend()
+    OpenCL.optimizer = clq.optimize.Optimizer(cse=False)
+    concrete_fn = sum.compile(OpenCL, cl_float_p, cl_float_p, cl_float_p)
+    for change in concrete_fn.optimizations:
+        print change
+
+The following passes are available, and run in this order:
+
+``inline``
+    Inlining. Calls to generic and concrete functions whose bodies have at
+    most ``inline_limit`` IR nodes (or that are hinted with 
+    :attr:`clq.GenericFn.inline`) are replaced by a copy of the body, with 
+    the local variables and the parameters that are assigned to or bound 
+    to complex arguments renamed ``_inlN_name``, so the other passes work 
+    across the call. Only functions that end with their only ``return`` 
+    statement (if any) are inlined, and only where the call is evaluated
+    unconditionally, as the body runs before the rest of the statement: 
+    not in ``while`` tests or loop headers, nor in the later operands of 
+    ``and``, ``or`` and conditional expressions. Functions with side 
+    effects are only inlined into statements that have none otherwise.
+
+``fold``
+    Constant folding. Operations on numeric literals are evaluated with the
+    semantics of the generated C (literals are ``int`` or ``double``), and
+    ``x * 1``, ``x / 1``, ``x - 0`` and, for integers, ``x + 0`` are replaced
+    by ``x`` when that does not change the type of the result.
+
+``unroll``
+    Loop unrolling. ``for`` loops whose bounds are integer literals (after
+    folding) are unrolled fully if they run at most ``unroll_limit`` times,
+    and otherwise by ``unroll_factor``, with the iterations left over
+    unrolled after the loop. Individual loops can override this with
+    :func:`clq.unroll`. Loops containing ``break``, ``continue`` or
+    assignments to the loop variable are left alone.
+
+``dce``
+    Dead code elimination. Removes branches of ``if`` statements with
+    constant conditions, ``while`` loops with constant false conditions,
+    statements following a ``return``, ``break`` or ``continue``, and
+    assignments to local variables whose value is never read.
+
+``cse``
+    Common subexpression elimination. Within each straight-line sequence of
+    statements, an expression that is computed more than once, with no
+    intervening assignment to the variables it uses (or to memory, if it
+    reads memory), is computed once into a new local variable.
+
+The IR of the generic function is shared by all of its concrete functions,
+so it is never modified: changed statements and expressions are copies,
+typed with :class:`KnownURT <clq.internals.KnownURT>`.
+
+Calls are assumed to write to memory unless the type of the function says
+otherwise (:meth:`clq.Type.effects_Call`).
+"""
+import ast as _ast
+
+import cypy.astx as astx
+
+import clq
+from clq import ir, internals
+
+passes = ("inline", "fold", "unroll", "dce", "cse")
+"""The names of the passes, in the order in which they run."""
+
+class Change(object):
+    """Describes a change made by the optimizer."""
+    def __init__(self, concrete_fn, pass_name, lineno, message):
+        self.concrete_fn = concrete_fn
+        self.pass_name = pass_name
+        self.lineno = lineno
+        self.message = message
+
+    concrete_fn = None
+    """The :class:`concrete function <clq.ConcreteFn>` that was changed."""
+
+    pass_name = None
+    """The name of the pass that made the change (see :data:`passes`)."""
+
+    lineno = None
+    """The line of the affected code, relative to the function, or None."""
+
+    message = None
+    """A description of the change."""
+
+    def __str__(self):
+        return "%s:%s: %s: %s" % (self.concrete_fn.generic_fn.name,
+                                  self.lineno, self.pass_name, self.message)
+
+    def __repr__(self):
+        return "Change(%r, %r, %r)" % (self.pass_name, self.lineno,
+                                       self.message)
+
+class Optimizer(object):
+    """Runs the enabled passes over the body of each concrete function.
+
+    Each keyword argument enables or disables the pass of the same name.
+    """
+    def __init__(self, fold=True, unroll=True, dce=True, cse=True,
+                 unroll_limit=8, unroll_factor=4, inline=True, 
+                 inline_limit=40):
+        self.inline = inline
+        self.inline_limit = inline_limit
+        self.fold = fold
+        self.unroll = unroll
+        self.dce = dce
+        self.cse = cse
+        self.unroll_limit = unroll_limit
+        self.unroll_factor = unroll_factor
+        self.counts = dict((name, 0) for name in passes)
+
+    inline = True
+    """Whether inlining is enabled."""
+
+    inline_limit = 40
+    """Functions whose bodies have more IR nodes than this are only inlined
+    if hinted (see :attr:`clq.GenericFn.inline`)."""
+
+    fold = True
+    """Whether constant folding is enabled."""
+
+    unroll = True
+    """Whether loop unrolling is enabled."""
+
+    unroll_limit = 8
+    """Loops running at most this many times are unrolled fully."""
+
+    unroll_factor = 4
+    """The factor by which other loops with constant bounds are unrolled.
+    1 disables partial unrolling."""
+
+    dce = True
+    """Whether dead code elimination is enabled."""
+
+    cse = True
+    """Whether common subexpression elimination is enabled."""
+
+    counts = None
+    """pass name => the number of changes it has made so far, over all
+    functions"""
+
+    @property
+    def key(self):
+        """A string identifying the enabled passes, which is part of the
+        key of :mod:`persistently cached <clq.cache>` program items."""
+        return ",".join(self._key_part(name) for name in passes 
+                        if getattr(self, name))
+
+    def _key_part(self, name):
+        if name == "inline":
+            return "inline:%d" % self.inline_limit
+        if name == "unroll":
+            return "unroll:%d:%d" % (self.unroll_limit, self.unroll_factor)
+        return name
+
+    def optimize(self, context, body):
+        """Returns an optimized version of the statements in ``body``,
+        recording each change in ``context.optimizations``."""
+        function = _FunctionOptimizer(context)
+        if self.inline:
+            body = function.inline_block(body, self.inline_limit)
+        if self.fold:
+            body = function.fold_block(body)
+        if self.unroll:
+            body = function.unroll_block(body, self.unroll_limit,
+                                         self.unroll_factor, self.fold)
+        if self.dce:
+            body = function.dce(body)
+        if self.cse:
+            body = function.cse_block(body)
+
+        counts = self.counts
+        for change in function.changes:
+            counts[change.pass_name] += 1
+        context.optimizations.extend(function.changes)
+        return body
+
+##############################################################################
+## Constant Evaluation
+##############################################################################
+# raw integer literals are ints in the generated code
+_int_min = -2 ** 31
+_int_max = 2 ** 31 - 1
+
+def _literal_value(n):
+    """Returns the value that the code generated for the literal ``n`` has,
+    or None if it isn't a real number."""
+    if isinstance(n, bool):
+        return None
+    if isinstance(n, (int, long)):
+        return n
+    if isinstance(n, float):
+        return n
+    return None
+
+def _fits(value):
+    """Returns whether ``value`` can be generated as a literal of the type
+    it was computed with."""
+    if isinstance(value, float):
+        return value - value == 0.0 # finite
+    return _int_min <= value <= _int_max
+
+def _c_div(left, right):
+    # C division truncates towards zero
+    quotient = abs(left) // abs(right)
+    if (left < 0) != (right < 0):
+        quotient = -quotient
+    return quotient
+
+def _eval_BinOp(op, left, right):
+    """Evaluates a binary operation as the generated C would, or returns
+    None if that isn't possible (or the result is undefined)."""
+    if isinstance(left, float) or isinstance(right, float):
+        left, right = float(left), float(right)
+        if op is _ast.Add:
+            return left + right
+        elif op is _ast.Sub:
+            return left - right
+        elif op is _ast.Mult:
+            return left * right
+        elif op is _ast.Div:
+            if right == 0.0:
+                return None
+            return left / right
+        return None
+
+    if op is _ast.Add:
+        return left + right
+    elif op is _ast.Sub:
+        return left - right
+    elif op is _ast.Mult:
+        return left * right
+    elif op is _ast.Div:
+        if right == 0:
+            return None
+        return _c_div(left, right)
+    elif op is _ast.Mod:
+        if right == 0:
+            return None
+        return left - right * _c_div(left, right)
+    elif op is _ast.LShift:
+        if left < 0 or not 0 <= right < 32:
+            return None
+        return left << right
+    elif op is _ast.RShift:
+        if not 0 <= right < 32:
+            return None
+        return left >> right
+    elif op is _ast.BitOr:
+        return left | right
+    elif op is _ast.BitXor:
+        return left ^ right
+    elif op is _ast.BitAnd:
+        return left & right
+    return None
+
+def _eval_UnaryOp(op, operand):
+    if op is _ast.USub:
+        return -operand
+    elif op is _ast.UAdd:
+        return operand
+    elif op is _ast.Invert and not isinstance(operand, float):
+        return ~operand
+    return None
+
+_comparisons = {
+    _ast.Eq: lambda left, right: left == right,
+    _ast.NotEq: lambda left, right: left != right,
+    _ast.Lt: lambda left, right: left < right,
+    _ast.LtE: lambda left, right: left <= right,
+    _ast.Gt: lambda left, right: left > right,
+    _ast.GtE: lambda left, right: left >= right,
+}
+
+##############################################################################
+## Reporting
+##############################################################################
+def source(node):
+    """Returns Python source code for an IR node, for use in reports."""
+    cls = type(node)
+    if cls is ir.Name:
+        return node.id
+    elif cls is ir.Num:
+        return repr(node.n) if isinstance(node.n, float) else str(node.n)
+    elif cls is ir.Str:
+        return repr(node.s)
+    elif cls is ir.BinOp:
+        return "%s %s %s" % (_operand_source(node.left),
+                             astx.all_operators[type(node.op)],
+                             _operand_source(node.right))
+    elif cls is ir.UnaryOp:
+        op = astx.all_operators[type(node.op)]
+        if isinstance(node.op, _ast.Not):
+            op += " "
+        return op + _operand_source(node.operand)
+    elif cls is ir.Compare:
+        terms = [_operand_source(node.left)]
+        for op, comparator in zip(node.ops, node.comparators):
+            terms.append(astx.all_operators[type(op)])
+            terms.append(_operand_source(comparator))
+        return " ".join(terms)
+    elif cls is ir.BoolOp:
+        op = " %s " % astx.all_operators[type(node.op)]
+        return op.join(_operand_source(value) for value in node.values)
+    elif cls is ir.IfExp:
+        return "%s if %s else %s" % (_operand_source(node.body),
+                                     _operand_source(node.test),
+                                     _operand_source(node.orelse))
+    elif cls is ir.Call:
+        return "%s(%s)" % (source(node.func),
+                           ", ".join(source(arg) for arg in node.args))
+    elif cls is ir.Attribute:
+        return "%s.%s" % (_operand_source(node.value), node.attr)
+    elif cls is ir.Subscript:
+        return "%s[%s]" % (_operand_source(node.value), source(node.slice))
+    elif cls is ir.Index:
+        return source(node.value)
+    elif cls is ir.Assign:
+        return "%s = %s" % (source(node.targets[0]), source(node.value))
+    elif cls is ir.AugAssign:
+        return "%s %s= %s" % (source(node.target),
+                              astx.all_operators[type(node.op)],
+                              source(node.value))
+    elif cls is ir.Return:
+        if node.value is None:
+            return "return"
+        return "return " + source(node.value)
+    elif cls is ir.Expr:
+        return source(node.value)
+    return cls.__name__.lower()
+
+def _operand_source(node):
+    code = source(node)
+    if isinstance(node, (ir.BinOp, ir.UnaryOp, ir.Compare, ir.BoolOp,
+                         ir.IfExp)) or code.startswith("-"):
+        return "(%s)" % code
+    return code
+
+##############################################################################
+## Helpers
+##############################################################################
+# calls in inlined bodies are inlined up to this depth
+_max_inline_depth = 8
+
+def _inline_hint(generic_fn):
+    """Returns the :attr:`inline <clq.GenericFn.inline>` hint of 
+    ``generic_fn`` or of the function it was specialized from."""
+    while generic_fn is not None:
+        if generic_fn.inline is not None:
+            return generic_fn.inline
+        generic_fn = generic_fn.unspecialized
+    return None
+
+def _children(node):
+    """Yields the IR nodes directly below ``node``."""
+    for name in node._fields:
+        value = getattr(node, name)
+        if isinstance(value, ir.Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ir.Node):
+                    yield item
+
+def _walk(node):
+    """Yields ``node`` and all the IR nodes below it."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(_children(node))
+
+_simple_statements = (ir.Assign, ir.AugAssign, ir.Return, ir.Expr)
+_terminators = (ir.Return, ir.Break, ir.Continue)
+
+# expressions worth computing only once
+_cse_candidates = (ir.BinOp, ir.UnaryOp, ir.Compare, ir.BoolOp, ir.IfExp,
+                   ir.Call, ir.Attribute, ir.Subscript)
+
+_effect_order = { None: 0, "read": 1, "write": 2 }
+
+def _combine_effects(a, b):
+    if _effect_order[b] > _effect_order[a]:
+        return b
+    return a
+
+class _Group(object):
+    # the occurrences of an expression computed more than once
+    def __init__(self, key, first):
+        self.key = key
+        self.first = first
+        self.count = 1
+        self.temp = None
+
+class _Available(object):
+    # the expressions available at a point in a straight-line block
+    def __init__(self):
+        self.groups = { }
+        self.by_name = { }
+        self.memory = set()
+
+    def add(self, group, names, effects):
+        key = group.key
+        self.groups[key] = group
+        for name in names:
+            self.by_name.setdefault(name, set()).add(key)
+        if effects is not None:
+            self.memory.add(key)
+
+    def kill_name(self, name):
+        groups = self.groups
+        for key in self.by_name.pop(name, ()):
+            groups.pop(key, None)
+
+    def kill_memory(self):
+        groups = self.groups
+        for key in self.memory:
+            groups.pop(key, None)
+        self.memory = set()
+
+    def clear(self):
+        self.groups.clear()
+        self.by_name.clear()
+        self.memory = set()
+
+##############################################################################
+## Passes
+##############################################################################
+class _FunctionOptimizer(object):
+    """Runs the passes over the body of a single concrete function."""
+    def __init__(self, context):
+        self.context = context
+        self.changes = [ ]
+        self._temp_count = 0
+        self._inline_count = 0
+
+    def report(self, pass_name, node, message):
+        self.changes.append(Change(self.context.concrete_fn, pass_name,
+                                   node.lineno, message))
+
+    def type_of(self, node):
+        return node.unresolved_type.resolve(self.context)
+
+    def new(self, cls, node, clq_type=None, **fields):
+        """Creates a node of type ``cls`` in place of ``node``, with the
+        concrete type ``clq_type`` if it is an expression."""
+        typed = self.context.typed
+        new = cls(len(typed), node.lineno, node.col_offset, **fields)
+        typed.append(None)
+        if clq_type is not None:
+            new.unresolved_type = internals.KnownURT(new, clq_type)
+        return new
+
+    def copy(self, node, **fields):
+        """Returns a copy of ``node`` with the given fields replaced."""
+        values = dict((name, getattr(node, name)) for name in node._fields)
+        values.update(fields)
+        clq_type = None
+        if node.unresolved_type is not None:
+            clq_type = self.type_of(node)
+        return self.new(type(node), node, clq_type, **values)
+
+    def effects(self, node, context=None, skip=None):
+        """Returns the combined side effects of the expressions in ``node``,
+        as described by :meth:`clq.Type.effects_Call`. 
+        
+        Types are resolved in ``context``, which defaults to the context of 
+        the function being optimized. Calls for which ``skip(call)`` is true
+        are left out, along with their arguments."""
+        if context is None:
+            context = self.context
+        effects = None
+        stack = [node]
+        while stack:
+            child = stack.pop()
+            cls = type(child)
+            if cls is ir.Call:
+                if skip is not None and skip(child):
+                    continue
+                func_type = child.func.unresolved_type.resolve(context)
+                effects = _combine_effects(
+                    effects, func_type.effects_Call(context, child))
+            elif cls is ir.Subscript or cls is ir.Attribute:
+                if isinstance(child.ctx, _ast.Load):
+                    effects = _combine_effects(effects, "read")
+            if effects == "write":
+                break
+            stack.extend(_children(child))
+        return effects
+
+    @staticmethod
+    def read_names(node):
+        """Returns the names of the variables read in ``node``."""
+        names = set()
+        for child in _walk(node):
+            if type(child) is ir.Name:
+                if isinstance(child.ctx, _ast.Load):
+                    names.add(child.id)
+            elif type(child) is ir.AugAssign:
+                target = child.target
+                if type(target) is ir.Name:
+                    names.add(target.id)
+        return names
+
+    @staticmethod
+    def constant(node):
+        """Returns the value of a numeric literal, or None."""
+        if type(node) is ir.Num:
+            return _literal_value(node.n)
+        return None
+
+    ######################################################################
+    ## Inlining
+    ######################################################################
+    def inline_block(self, stmts, limit, depth=0):
+        """Returns ``stmts`` with calls to generic and concrete functions
+        replaced by the bodies of the functions called, where allowed."""
+        block = [ ]
+        for stmt in stmts:
+            cls = type(stmt)
+            if cls in _simple_statements or cls is ir.If:
+                prelude = [ ]
+                stmt = self.inline_stmt(stmt, prelude, limit, depth)
+                block.extend(prelude)
+                if stmt is None:
+                    continue
+            if cls is ir.If:
+                body = self.inline_block(stmt.body, limit, depth)
+                orelse = self.inline_block(stmt.orelse, limit, depth)
+                if body != stmt.body or orelse != stmt.orelse:
+                    stmt = self.copy(stmt, body=body, orelse=orelse)
+            elif cls is ir.For or cls is ir.While:
+                body = self.inline_block(stmt.body, limit, depth)
+                if body != stmt.body:
+                    stmt = self.copy(stmt, body=body)
+            block.append(stmt)
+        return block
+
+    def inline_stmt(self, stmt, prelude, limit, depth):
+        """Returns ``stmt`` with the calls it evaluates first inlined, 
+        adding the statements that must run before it to ``prelude``, or 
+        None if nothing is left of it."""
+        # the bodies run before the rest of the statement, so functions with
+        # side effects are only inlined into statements without others 
+        # (calls that could be inlined aside)
+        cls = type(stmt)
+        evaluated = stmt.test if cls is ir.If else stmt
+        others = self.effects(evaluated, skip=self._is_fn_call)
+        inline = lambda node: self.inline_expr(node, prelude, limit, depth,
+                                               others)
+        if cls is ir.If:
+            test = inline(stmt.test)
+            if test is stmt.test:
+                return stmt
+            return self.copy(stmt, test=test)
+
+        value = stmt.value
+        if value is None:
+            return stmt
+        if type(value) is ir.Call:
+            # the value of the function replaces the call directly
+            call = self._map(value, inline)
+            result = self.inline_call(call, prelude, limit, depth, others,
+                                      stmt)
+            if result is not False:
+                return result
+            new_value = call
+        else:
+            new_value = inline(value)
+        if new_value is value:
+            return stmt
+        return self.copy(stmt, value=new_value)
+
+    def inline_expr(self, node, prelude, limit, depth, others):
+        # inlines the calls in the unconditionally evaluated parts of node
+        inline = lambda child: self.inline_expr(child, prelude, limit, depth,
+                                                others)
+        cls = type(node)
+        if cls is ir.BoolOp:
+            first = inline(node.values[0])
+            if first is not node.values[0]:
+                node = self.copy(node, values=[first] + node.values[1:])
+        elif cls is ir.IfExp:
+            test = inline(node.test)
+            if test is not node.test:
+                node = self.copy(node, test=test)
+        else:
+            node = self._map(node, inline)
+        if cls is ir.Call:
+            result = self.inline_call(node, prelude, limit, depth, others)
+            if result is not False:
+                return result
+        return node
+
+    def _map(self, node, function):
+        # a copy of node with function applied to each child, or node if
+        # that changes nothing
+        fields = { }
+        for name in node._fields:
+            value = getattr(node, name)
+            if isinstance(value, ir.Node):
+                new_value = function(value)
+                if new_value is not value:
+                    fields[name] = new_value
+            elif isinstance(value, list) and value \
+                    and isinstance(value[0], ir.Node):
+                new_value = [function(item) for item in value]
+                if any(new is not old for new, old in zip(new_value, value)):
+                    fields[name] = new_value
+        if fields:
+            return self.copy(node, **fields)
+        return node
+
+    def _is_fn_call(self, node):
+        return isinstance(self.type_of(node.func),
+                          (clq.GenericFnType, clq.ConcreteFnType))
+
+    def inline_call(self, call, prelude, limit, depth, others, stmt=None):
+        """Adds the body of the function called by ``call`` to ``prelude``
+        and returns the expression replacing the call, or False if it is 
+        not inlined.
+        
+        If ``stmt`` is given, ``call`` is its value, and the statement 
+        replacing it (or None) is returned instead."""
+        func_type = self.type_of(call.func)
+        if isinstance(func_type, clq.GenericFnType):
+            callee = func_type.generic_fn.compile(
+                self.context.backend, *[self.type_of(arg) 
+                                        for arg in call.args])
+        elif isinstance(func_type, clq.ConcreteFnType):
+            callee = func_type.concrete_fn
+        else:
+            return False
+        generic_fn = callee.generic_fn
+        hint = _inline_hint(generic_fn)
+        if hint is False or depth >= _max_inline_depth:
+            return False
+        body = generic_fn.annotated_ast.body
+        size = sum(1 for top in body for node in _walk(top))
+        if hint is None and size > limit:
+            return False
+        if not self._inlinable(body):
+            return False
+        returns = bool(body) and type(body[-1]) is ir.Return and \
+            body[-1].value is not None
+        if not returns and (stmt is None or type(stmt) is not ir.Expr):
+            return False
+        callee_context = callee.typed_ast.context
+        effects = None
+        for top in body:
+            effects = _combine_effects(effects, 
+                                       self.effects(top, callee_context))
+        if effects is not None and others is not None and \
+                "write" in (effects, others):
+            return False
+        names = { }
+        args = zip(generic_fn.arg_names, call.args, callee.arg_types)
+        for name, arg, arg_type in args:
+            if isinstance(arg_type, clq.VirtualType):
+                # functions are referred to by name
+                if type(arg) is not ir.Name:
+                    return False
+                names[name] = arg
+
+        # parameters that are not assigned to refer to simple arguments 
+        # directly, and the others are copied, as are local variables
+        n = self._inline_count
+        self._inline_count += 1
+        temporaries = self.context.temporaries
+        assigned = self._assigned(body)
+        stmts = [ ]
+        for name, arg, arg_type in args:
+            if name in names:
+                continue
+            if name not in assigned and type(arg) in (ir.Name, ir.Num):
+                names[name] = arg
+                continue
+            temp = names[name] = self._inline_name(n, name)
+            temporaries[temp] = arg_type
+            stmts.append(self.new(ir.Assign, call, targets=[
+                self.new(ir.Name, call, arg_type, id=temp, ctx=_ast.Store())
+            ], value=arg))
+        local_variables = generic_fn.local_variables
+        for name in sorted(local_variables):
+            temp = names[name] = self._inline_name(n, name)
+            temporaries[temp] = local_variables[name].resolve(callee_context)
+        stmts.extend(self.transplant(top, call, callee_context, names)
+                     for top in body)
+        value = stmts.pop().value if returns else None
+        prelude.extend(self.inline_block(stmts, limit, depth + 1))
+        self.report("inline", call, "inlined %s (%d nodes%s)" % (
+            source(call), size, ", hinted" if hint else ""))
+
+        if stmt is not None:
+            if type(stmt) is not ir.Expr:
+                return self.copy(stmt, value=value)
+            if value is None or self.effects(value) is None:
+                return None
+            return self.copy(stmt, value=value)
+        if type(value) in (ir.Name, ir.Num):
+            return value
+        clq_type = self.type_of(value)
+        temp = self._inline_name(n, "value")
+        temporaries[temp] = clq_type
+        prelude.append(self.new(ir.Assign, call, targets=[
+            self.new(ir.Name, call, clq_type, id=temp, ctx=_ast.Store())
+        ], value=value))
+        return self.new(ir.Name, call, clq_type, id=temp, ctx=_ast.Load())
+
+    @staticmethod
+    def _inlinable(body):
+        # a single return, at the end, and no verbatim code
+        last = len(body) - 1
+        for i, top in enumerate(body):
+            for node in _walk(top):
+                cls = type(node)
+                if cls is ir.Exec or cls is ir.Return and (
+                        node is not top or i != last):
+                    return False
+        return True
+
+    @staticmethod
+    def _assigned(body):
+        names = set()
+        for top in body:
+            for node in _walk(top):
+                if type(node) is ir.Name and \
+                        not isinstance(node.ctx, _ast.Load):
+                    names.add(node.id)
+        return names
+
+    def _inline_name(self, n, name):
+        # the name of the copy of variable name for the nth inlined call
+        all_variables = self.context.generic_fn.all_variables
+        temporaries = self.context.temporaries
+        temp = "_inl%d_%s" % (n, name)
+        while temp in all_variables or temp in temporaries:
+            temp += "_"
+        return temp
+
+    def transplant(self, node, call, context, names):
+        """Returns a copy of ``node``, from the body of a function called by 
+        ``call`` and typed in ``context``, with each variable renamed (to a
+        string) or replaced (by a copy of an expression) as given by 
+        ``names``."""
+        cls = type(node)
+        if cls is ir.Name:
+            replacement = names.get(node.id, node.id)
+            if isinstance(replacement, ir.Node):
+                return self.copy(replacement)
+            return self.new(ir.Name, call, 
+                            node.unresolved_type.resolve(context),
+                            id=replacement, ctx=node.ctx)
+        fields = { }
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, ir.Node):
+                value = self.transplant(value, call, context, names)
+            elif isinstance(value, list) and value \
+                    and isinstance(value[0], ir.Node):
+                value = [self.transplant(item, call, context, names)
+                         for item in value]
+            fields[field] = value
+        clq_type = None
+        if node.unresolved_type is not None:
+            clq_type = node.unresolved_type.resolve(context)
+        return self.new(cls, call, clq_type, **fields)
+
+    ######################################################################
+    ## Constant Folding
+    ######################################################################
+    def fold_block(self, stmts):
+        return [self.fold(stmt) for stmt in stmts]
+
+    def fold(self, node):
+        """Returns ``node`` with its constant subexpressions folded."""
+        fields = None
+        for name in node._fields:
+            value = getattr(node, name)
+            if isinstance(value, ir.Node):
+                new_value = self.fold(value)
+            elif isinstance(value, list) and value \
+                    and isinstance(value[0], ir.Node):
+                new_value = [self.fold(item) for item in value]
+                for item, new_item in zip(value, new_value):
+                    if item is not new_item:
+                        break
+                else:
+                    new_value = value
+            else:
+                continue
+            if new_value is not value:
+                if fields is None:
+                    fields = { }
+                fields[name] = new_value
+        if fields is not None:
+            node = self.copy(node, **fields)
+
+        cls = type(node)
+        if cls is ir.BinOp:
+            return self.fold_BinOp(node)
+        elif cls is ir.UnaryOp:
+            return self.fold_UnaryOp(node)
+        elif cls is ir.Compare:
+            return self.fold_Compare(node)
+        return node
+
+    def folded(self, node, value):
+        new = self.new(ir.Num, node, self.type_of(node), n=value)
+        self.report("fold", node, "%s -> %s" % (source(node), source(new)))
+        return new
+
+    def fold_BinOp(self, node):
+        op = type(node.op)
+        left = self.constant(node.left)
+        right = self.constant(node.right)
+        if left is not None and right is not None:
+            value = _eval_BinOp(op, left, right)
+            if value is not None and _fits(value):
+                return self.folded(node, value)
+            return node
+
+        # identities
+        if right is not None:
+            other, constant = node.left, right
+            identity = ((op is _ast.Sub and constant == 0) or
+                        (op is _ast.Mult and constant == 1) or
+                        (op is _ast.Div and constant == 1) or
+                        (op is _ast.Add and constant == 0
+                         and isinstance(right, (int, long))))
+        elif left is not None:
+            other, constant = node.right, left
+            identity = ((op is _ast.Mult and constant == 1) or
+                        (op is _ast.Add and constant == 0
+                         and isinstance(left, (int, long))))
+        else:
+            return node
+        if not identity:
+            return node
+        clq_type = self.type_of(node)
+        other_type = self.type_of(other)
+        if other_type is not clq_type:
+            return node
+        if op is _ast.Add and not hasattr(clq_type, "unsigned"):
+            # x + 0 is not x for floating point -0.0
+            return node
+        self.report("fold", node, "%s -> %s" % (source(node), source(other)))
+        return other
+
+    def fold_UnaryOp(self, node):
+        operand = self.constant(node.operand)
+        if operand is None:
+            return node
+        value = _eval_UnaryOp(type(node.op), operand)
+        if value is not None and _fits(value):
+            return self.folded(node, value)
+        return node
+
+    def fold_Compare(self, node):
+        if len(node.ops) != 1:
+            return node
+        left = self.constant(node.left)
+        right = self.constant(node.comparators[0])
+        if left is None or right is None:
+            return node
+        compare = _comparisons.get(type(node.ops[0]))
+        if compare is None:
+            return node
+        if isinstance(left, float) or isinstance(right, float):
+            left, right = float(left), float(right)
+        return self.folded(node, 1 if compare(left, right) else 0)
+
+    ######################################################################
+    ## Loop Unrolling
+    ######################################################################
+    def unroll_block(self, stmts, limit, factor, fold):
+        """Returns ``stmts`` with for loops unrolled, innermost first."""
+        block = [ ]
+        for stmt in stmts:
+            cls = type(stmt)
+            if cls is ir.If:
+                body = self.unroll_block(stmt.body, limit, factor, fold)
+                orelse = self.unroll_block(stmt.orelse, limit, factor, fold)
+                if body != stmt.body or orelse != stmt.orelse:
+                    stmt = self.copy(stmt, body=body, orelse=orelse)
+            elif cls is ir.For or cls is ir.While:
+                body = self.unroll_block(stmt.body, limit, factor, fold)
+                if body != stmt.body:
+                    stmt = self.copy(stmt, body=body)
+                if cls is ir.For:
+                    unrolled = self.unroll(stmt, limit, factor)
+                    if unrolled is not None:
+                        if fold:
+                            unrolled = self.fold_block(unrolled)
+                        block.extend(unrolled)
+                        continue
+            block.append(stmt)
+        return block
+
+    def unroll(self, loop, limit, factor):
+        """Returns the statements replacing the for loop ``loop``, or None
+        if it is not unrolled."""
+        hint = loop.unroll
+        if hint is not True and hint is not None:
+            if hint == 1:
+                return None
+            factor = hint
+        init = loop.init
+        name = init.targets[0].id
+        start = self.constant(init.value)
+        stop = self.constant(loop.guard.comparators[0])
+        step = self.constant(loop.update_stmt.value)
+        for value in (start, stop, step):
+            if not isinstance(value, (int, long)):
+                return None
+        if step <= 0 or not self._unrollable(loop.body, name):
+            return None
+        n = max(0, -(-(stop - start) // step))
+        end = start + n * step
+        if not _fits(end):
+            return None
+        description = "'for %s in (%d, %d, %d)'" % (name, start, stop, step)
+
+        if hint is True or (hint is None and n <= limit) or factor >= n:
+            self.report("unroll", loop, "unrolled %s fully (%d iterations)" %
+                        (description, n))
+            block = [ ]
+            for i in xrange(n):
+                block.extend(self._iteration(loop, start + i * step))
+            block.append(self._final_assignment(loop, end))
+            return block
+        if factor <= 1:
+            return None
+
+        # the main loop runs a multiple of factor times, and the iterations
+        # left over are unrolled after it
+        n_main = n // factor * factor
+        var_type = self.type_of(init.targets[0])
+        step_node = loop.update_stmt.value
+        step_type = self.type_of(step_node)
+        body = list(loop.body)
+        for i in xrange(1, factor):
+            def offset(node, i=i):
+                var = self.new(ir.Name, node, var_type, id=name,
+                               ctx=_ast.Load())
+                amount = self.new(ir.Num, node, step_type, n=i * step)
+                return self.new(ir.BinOp, node, var_type, left=var,
+                                op=_ast.Add(), right=amount)
+            body.extend(self.instantiate(stmt, name, offset)
+                        for stmt in loop.body)
+        guard = loop.guard
+        stop_node = guard.comparators[0]
+        guard = self.copy(guard, comparators=[
+            self.new(ir.Num, stop_node, self.type_of(stop_node),
+                     n=start + n_main * step)])
+        update_stmt = self.copy(loop.update_stmt, value=self.new(
+            ir.Num, step_node, step_type, n=factor * step))
+        block = [self.copy(loop, body=body, guard=guard,
+                           update_stmt=update_stmt)]
+        for i in xrange(n_main, n):
+            block.extend(self._iteration(loop, start + i * step))
+        if n_main < n:
+            block.append(self._final_assignment(loop, end))
+        self.report("unroll", loop, "unrolled %s by %d (%d iterations, "
+                    "%d left over)" % (description, factor, n, n - n_main))
+        return block
+
+    @staticmethod
+    def _unrollable(stmts, name):
+        for stmt in stmts:
+            for node in _walk(stmt):
+                cls = type(node)
+                if cls is ir.Break or cls is ir.Continue or cls is ir.Exec:
+                    return False
+                elif cls is ir.Assign:
+                    targets = node.targets
+                elif cls is ir.AugAssign:
+                    targets = (node.target,)
+                else:
+                    continue
+                for target in targets:
+                    if type(target) is ir.Name and target.id == name:
+                        return False
+        return True
+
+    def _iteration(self, loop, value):
+        # a copy of the body of loop with the loop variable set to value
+        def literal(node):
+            return self.new(ir.Num, node, self.type_of(node), n=value)
+        name = loop.init.targets[0].id
+        return [self.instantiate(stmt, name, literal) for stmt in loop.body]
+
+    def _final_assignment(self, loop, value):
+        # the loop variable has the value that ended the loop afterwards
+        target = loop.init.targets[0]
+        start = loop.init.value
+        return self.new(ir.Assign, loop, targets=[
+            self.new(ir.Name, target, self.type_of(target), id=target.id,
+                     ctx=_ast.Store())
+        ], value=self.new(ir.Num, start, self.type_of(start), n=value))
+
+    def instantiate(self, node, name, replacement):
+        """Returns a copy of ``node``, sharing no nodes with it, in which
+        each reference to the variable ``name`` is replaced by
+        ``replacement(reference)``."""
+        if type(node) is ir.Name and node.id == name and \
+                isinstance(node.ctx, _ast.Load):
+            return replacement(node)
+        fields = { }
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, ir.Node):
+                fields[field] = self.instantiate(value, name, replacement)
+            elif isinstance(value, list) and value \
+                    and isinstance(value[0], ir.Node):
+                fields[field] = [self.instantiate(item, name, replacement)
+                                 for item in value]
+        return self.copy(node, **fields)
+
+    ######################################################################
+    ## Dead Code Elimination
+    ######################################################################
+    def dce(self, body):
+        body = self.prune_block(body)
+        read = set()
+        for stmt in body:
+            read |= self.read_names(stmt)
+            for node in _walk(stmt):
+                if type(node) is ir.Exec:
+                    # verbatim code may read anything
+                    return self.remove_dead_stores(body, None)
+        return self.remove_dead_stores(body, read)
+
+    def prune_block(self, stmts):
+        """Removes unreachable statements from ``stmts``."""
+        block = [ ]
+        for i, stmt in enumerate(stmts):
+            cls = type(stmt)
+            if cls is ir.If:
+                test = self.constant(stmt.test)
+                if test is not None:
+                    self.report("dce", stmt, "'if %s' is always %s" %
+                                (source(stmt.test), "true" if test else "false"))
+                    block.extend(self.prune_block(
+                        stmt.body if test else stmt.orelse))
+                else:
+                    body = self.prune_block(stmt.body)
+                    orelse = self.prune_block(stmt.orelse)
+                    if body != stmt.body or orelse != stmt.orelse:
+                        stmt = self.copy(stmt, body=body, orelse=orelse)
+                    block.append(stmt)
+            elif cls is ir.While and self.constant(stmt.test) is not None \
+                    and not self.constant(stmt.test):
+                self.report("dce", stmt, "removed 'while %s'" %
+                            source(stmt.test))
+            elif cls is ir.While or cls is ir.For:
+                body = self.prune_block(stmt.body)
+                if body != stmt.body:
+                    stmt = self.copy(stmt, body=body)
+                block.append(stmt)
+            else:
+                block.append(stmt)
+
+            if block and type(block[-1]) in _terminators:
+                rest = stmts[i + 1:]
+                if rest:
+                    self.report("dce", rest[0],
+                                "removed %d unreachable statement(s)" %
+                                len(rest))
+                break
+        return block
+
+    def _removable(self, name):
+        # whether assignments to name can be removed
+        context = self.context
+        return (name in context.generic_fn.local_variables or
+                name in context.temporaries)
+
+    def remove_dead_stores(self, stmts, read):
+        """Removes assignments to local variables in ``stmts`` that are
+        never read (if ``read``, the set of all variables read, is
+        provided) or that are overwritten before being read."""
+        # walk backwards, tracking the variables that are assigned to later
+        # in the block before being read
+        overwritten = set()
+        block = [ ]
+        for stmt in reversed(stmts):
+            cls = type(stmt)
+            if cls is ir.Assign and type(stmt.targets[0]) is ir.Name:
+                name = stmt.targets[0].id
+                value = stmt.value
+                if type(value) is ir.Name and value.id == name:
+                    self.report("dce", stmt, "removed '%s' (no effect)" %
+                                source(stmt))
+                    continue
+                if self._removable(name) and \
+                        self.effects(stmt.value) != "write":
+                    if read is not None and name not in read:
+                        self.report("dce", stmt, "removed '%s' (never read)" %
+                                    source(stmt))
+                        continue
+                    if name in overwritten:
+                        self.report("dce", stmt,
+                                    "removed '%s' (overwritten)" %
+                                    source(stmt))
+                        continue
+                overwritten.add(name)
+                overwritten -= self.read_names(stmt.value)
+            elif cls in _simple_statements:
+                overwritten -= self.read_names(stmt)
+            elif cls is ir.Pass:
+                pass
+            else:
+                overwritten.clear()
+                if cls is ir.If:
+                    body = self.remove_dead_stores(stmt.body, read)
+                    orelse = self.remove_dead_stores(stmt.orelse, read)
+                    if not body and not orelse and \
+                            self.effects(stmt.test) != "write":
+                        self.report("dce", stmt, "removed empty 'if %s'" %
+                                    source(stmt.test))
+                        continue
+                    if body != stmt.body or orelse != stmt.orelse:
+                        stmt = self.copy(stmt, body=body, orelse=orelse)
+                elif cls is ir.For or cls is ir.While:
+                    body = self.remove_dead_stores(stmt.body, read)
+                    if body != stmt.body:
+                        stmt = self.copy(stmt, body=body)
+            block.append(stmt)
+        block.reverse()
+        return block
+
+    ######################################################################
+    ## Common Subexpression Elimination
+    ######################################################################
+    def cse_block(self, stmts):
+        """Returns ``stmts`` with common subexpressions computed once."""
+        available = _Available()
+        keys = { }        # id(node) => (key, names, effects) or None
+        occurrences = { } # id(node) => _Group
+        created = [ ]     # for each statement, the groups first seen there
+        block = [ ]
+
+        for stmt in stmts:
+            groups = [ ]
+            cls = type(stmt)
+            if cls in _simple_statements:
+                effects = self.effects(stmt)
+                if effects != "write":
+                    for expr in self._evaluated(stmt):
+                        self._scan(expr, available, keys, occurrences, groups)
+                else:
+                    available.kill_memory()
+                for target in self._targets(stmt):
+                    if type(target) is ir.Name:
+                        available.kill_name(target.id)
+                    else:
+                        available.kill_memory()
+                if cls is ir.Return:
+                    available.clear()
+            elif cls is ir.If:
+                self._scan(stmt.test, available, keys, occurrences, groups)
+                available.clear()
+                body = self.cse_block(stmt.body)
+                orelse = self.cse_block(stmt.orelse)
+                if body != stmt.body or orelse != stmt.orelse:
+                    stmt = self.copy(stmt, body=body, orelse=orelse)
+            elif cls is ir.For or cls is ir.While:
+                available.clear()
+                body = self.cse_block(stmt.body)
+                if body != stmt.body:
+                    stmt = self.copy(stmt, body=body)
+            else:
+                available.clear()
+            block.append(stmt)
+            created.append(groups)
+
+        # choose the expressions to compute into temporaries
+        context = self.context
+        try:
+            void_t = context.backend.void_type(context, None)
+        except clq.TypeResolutionError:
+            void_t = None
+        selected = False
+        for groups in created:
+            for group in groups:
+                if group.count < 2:
+                    continue
+                clq_type = self.type_of(group.first)
+                if isinstance(clq_type, clq.VirtualType) or clq_type == void_t:
+                    continue
+                group.temp = (self._temp_name(), clq_type)
+                selected = True
+        if not selected:
+            return block
+
+        new_block = [ ]
+        for stmt, groups in zip(block, created):
+            for group in groups:
+                if group.temp is None:
+                    continue
+                name, clq_type = group.temp
+                context.temporaries[name] = clq_type
+                first = group.first
+                target = self.new(ir.Name, first, clq_type, id=name,
+                                  ctx=_ast.Store())
+                value = self._replace(first, occurrences, top=True)
+                new_block.append(self.new(ir.Assign, first,
+                                          targets=[target], value=value))
+                self.report("cse", first, "%s (%d times) -> %s" %
+                            (source(first), group.count, name))
+            if type(stmt) in _simple_statements:
+                stmt = self._replace(stmt, occurrences)
+            elif type(stmt) is ir.If:
+                test = self._replace(stmt.test, occurrences)
+                if test is not stmt.test:
+                    stmt = self.copy(stmt, test=test)
+            new_block.append(stmt)
+        return new_block
+
+    def _temp_name(self):
+        all_variables = self.context.generic_fn.all_variables
+        while True:
+            name = "_cse%d" % self._temp_count
+            self._temp_count += 1
+            if name not in all_variables:
+                return name
+
+    @staticmethod
+    def _targets(stmt):
+        cls = type(stmt)
+        if cls is ir.Assign:
+            return stmt.targets
+        elif cls is ir.AugAssign:
+            return (stmt.target,)
+        return ()
+
+    def _evaluated(self, stmt):
+        # the expressions evaluated by a simple statement
+        value = stmt.value
+        exprs = [value] if value is not None else [ ]
+        for target in self._targets(stmt):
+            cls = type(target)
+            if cls is ir.Subscript:
+                exprs.append(target.value)
+                exprs.append(target.slice)
+            elif cls is ir.Attribute:
+                exprs.append(target.value)
+        return exprs
+
+    def _key(self, node, keys):
+        """Returns a tuple ``(key, names, effects)`` for the expression
+        ``node``, where expressions with equal keys compute the same value
+        if the variables in ``names`` and, if ``effects`` is not None,
+        memory have not changed. Returns None if it has no key."""
+        node_id = id(node)
+        try:
+            return keys[node_id]
+        except KeyError:
+            pass
+
+        cls = type(node)
+        if cls is ir.Name:
+            result = (("Name", node.id), frozenset((node.id,)), None)
+        elif cls is ir.Num:
+            result = (("Num", type(node.n).__name__, node.n), frozenset(),
+                      None)
+        else:
+            if cls is ir.BinOp:
+                key = ("BinOp", type(node.op))
+            elif cls is ir.UnaryOp:
+                key = ("UnaryOp", type(node.op))
+            elif cls is ir.Compare:
+                key = ("Compare",) + tuple(type(op) for op in node.ops)
+            elif cls is ir.BoolOp:
+                key = ("BoolOp", type(node.op))
+            elif cls is ir.IfExp:
+                key = ("IfExp",)
+            elif cls is ir.Index:
+                key = ("Index",)
+            elif cls is ir.Call:
+                effects = self.type_of(node.func).effects_Call(self.context,
+                                                               node)
+                if effects == "write":
+                    keys[node_id] = None
+                    return None
+                key = ("Call",)
+            elif cls is ir.Attribute and isinstance(node.ctx, _ast.Load):
+                key = ("Attribute", node.attr)
+            elif cls is ir.Subscript and isinstance(node.ctx, _ast.Load):
+                key = ("Subscript",)
+            else:
+                keys[node_id] = None
+                return None
+
+            names = frozenset()
+            effects = None
+            if cls is ir.Call or cls is ir.Attribute or cls is ir.Subscript:
+                effects = "read"
+            for child in _children(node):
+                child_key = self._key(child, keys)
+                if child_key is None:
+                    keys[node_id] = None
+                    return None
+                key += (child_key[0],)
+                names = names | child_key[1]
+                effects = _combine_effects(effects, child_key[2])
+            if cls is ir.Call and effects == "read" and \
+                    self.type_of(node.func).effects_Call(self.context,
+                                                         node) is None:
+                # pure functions of their arguments
+                effects = None
+                for arg in node.args:
+                    effects = _combine_effects(effects, keys[id(arg)][2])
+            result = (key, names, effects)
+        keys[node_id] = result
+        return result
+
+    def _scan(self, node, available, keys, occurrences, groups):
+        # records the occurrences of candidate expressions in the
+        # unconditionally evaluated parts of node, in evaluation order
+        cls = type(node)
+        candidate = cls in _cse_candidates and not (
+            cls is ir.UnaryOp and type(node.operand) in (ir.Name, ir.Num))
+        key = self._key(node, keys) if candidate else None
+        if key is not None:
+            group = available.groups.get(key[0])
+            if group is not None:
+                group.count += 1
+                occurrences[id(node)] = group
+                return
+
+        if cls is ir.BoolOp:
+            children = node.values[:1]
+        elif cls is ir.IfExp:
+            children = (node.test,)
+        else:
+            children = _children(node)
+        for child in children:
+            self._scan(child, available, keys, occurrences, groups)
+
+        if key is not None:
+            group = _Group(key[0], node)
+            available.add(group, key[1], key[2])
+            occurrences[id(node)] = group
+            groups.append(group)
+
+    def _replace(self, node, occurrences, top=False):
+        # replaces the occurrences of selected groups with their temporaries
+        if not top:
+            group = occurrences.get(id(node))
+            if group is not None and group.temp is not None:
+                name, clq_type = group.temp
+                return self.new(ir.Name, node, clq_type, id=name,
+                                ctx=_ast.Load())
+        fields = None
+        for name in node._fields:
+            value = getattr(node, name)
+            if isinstance(value, ir.Node):
+                new_value = self._replace(value, occurrences)
+            elif isinstance(value, list) and value \
+                    and isinstance(value[0], ir.Node):
+                new_value = [self._replace(item, occurrences)
+                             for item in value]
+                for item, new_item in zip(value, new_value):
+                    if item is not new_item:
+                        break
+                else:
+                    new_value = value
+            else:
+                continue
+            if new_value is not value:
+                if fields is None:
+                    fields = { }
+                fields[name] = new_value
+        if fields is not None:
+            return self.copy(node, **fields)
+        return node
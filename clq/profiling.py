@@ -0,0 +1,352 @@
+"""Opt-in timing of the phases of the cl.oquence compiler.
+
+Compiling a :class:`concrete function <clq.ConcreteFn>` goes through the
+following phases:
+
+``parse``
+    Producing a Python syntax tree from source (:func:`cypy.astx.infer_ast`).
+
+``annotate``
+    The :class:`GenericFnVisitor <clq.internals.GenericFnVisitor>` pass, done
+    once per :class:`generic function <clq.GenericFn>`.
+
+``resolve``
+    Resolving :class:`unresolved types <clq.internals.UnresolvedType>`.
+
+``optimize``
+    The backend's :attr:`optimizer <clq.Backend.optimizer>`, if any 
+    (:mod:`clq.optimize`).
+
+``generate``
+    The :class:`ConcreteFnVisitor <clq.internals.ConcreteFnVisitor>` pass.
+
+``assemble``
+    Assembling the final program item from the generated statements
+    (:meth:`clq.Backend.generate_program_item`).
+
+A :class:`Profile` records the wall time and number of calls of each phase,
+and of each AST node type visited, separately for every function compiled
+while it is active::
+
+    import clq.profiling
+    with clq.profiling.Profile() as profile:
+        sum.compile(OpenCL, cl_float_p, cl_float_p, cl_float_p).program_item
+    print profile.to_json(indent=2)
+
+Times are exclusive: time spent in a nested phase (for example, resolving a
+type during code generation, or compiling a function called by the function
+being compiled) is not counted again in the enclosing phase. Likewise, the
+time reported for a node type does not include the time spent visiting its
+children.
+
+When no profile is active, the only cost is one check per compiled function.
+The per-node and per-resolution hooks are installed on the visitor classes
+only while a profile is active.
+"""
+import json as _json
+import threading as _threading
+import timeit as _timeit
+
+clock = _timeit.default_timer
+"""The timer used for all measurements."""
+
+phases = ("parse", "annotate", "resolve", "optimize", "generate", 
+          "assemble")
+"""The names of the phases, in pipeline order."""
+
+active = None
+"""The :class:`Profile` currently recording, or None (the default)."""
+
+class _NullPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_null_phase = _NullPhase()
+
+def phase(fn, name):
+    """Returns a context manager timing the named phase for ``fn`` (a
+    :class:`clq.GenericFn` or :class:`clq.ConcreteFn`) in the active
+    profile. Does nothing if no profile is active."""
+    profile = active
+    if profile is None:
+        return _null_phase
+    return _Phase(profile, profile.record_for(fn), name)
+
+class _Phase(object):
+    def __init__(self, profile, record, name):
+        self.profile = profile
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.profile._enter_phase(self.record, self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile._exit_phase()
+
+class Record(object):
+    """Timings for a single generic or concrete function."""
+    def __init__(self, fn):
+        self.fn = fn
+        self.phases = { }
+        self.nodes = { }
+
+    fn = None
+    """The :class:`clq.GenericFn` or :class:`clq.ConcreteFn` timed, or None
+    for work done outside of any function."""
+
+    phases = None
+    """phase name => [seconds, calls]"""
+
+    nodes = None
+    """phase name => node type name => [seconds, calls]"""
+
+    @property
+    def kind(self):
+        """One of "concrete", "generic" or "other"."""
+        fn = self.fn
+        if fn is None:
+            return "other"
+        if hasattr(fn, "arg_types"):
+            return "concrete"
+        return "generic"
+
+    @property
+    def seconds(self):
+        """The total time recorded for this function."""
+        return sum(seconds for seconds, _ in self.phases.itervalues())
+
+    def add(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            self.phases[phase] = [seconds, 1]
+        else:
+            stats[0] += seconds
+            stats[1] += 1
+
+    def add_node(self, phase, node_type, seconds):
+        nodes = self.nodes.get(phase)
+        if nodes is None:
+            nodes = self.nodes[phase] = { }
+        stats = nodes.get(node_type)
+        if stats is None:
+            nodes[node_type] = [seconds, 1]
+        else:
+            stats[0] += seconds
+            stats[1] += 1
+
+    @property
+    def report(self):
+        """A JSON-compatible dict describing this record."""
+        fn = self.fn
+        kind = self.kind
+        report = { "kind": kind, "seconds": self.seconds }
+        if kind == "concrete":
+            report["name"] = fn.generic_fn.__name__
+            report["arg_types"] = [getattr(arg_type, "name", str(arg_type))
+                                   for arg_type in fn.arg_types]
+            report["backend"] = fn.backend.name
+        elif kind == "generic":
+            report["name"] = fn.__name__
+        report["phases"] = _stats_dict(self.phases)
+        report["nodes"] = dict((phase, _stats_dict(nodes))
+                               for phase, nodes in self.nodes.iteritems())
+        return report
+
+def _stats_dict(stats):
+    return dict((key, { "seconds": seconds, "calls": calls })
+                for key, (seconds, calls) in stats.iteritems())
+
+def _merge(into, stats):
+    for key, (seconds, calls) in stats.iteritems():
+        total = into.get(key)
+        if total is None:
+            into[key] = [seconds, calls]
+        else:
+            total[0] += seconds
+            total[1] += calls
+
+class Profile(object):
+    """Records compiler timings while active.
+
+    Use as a context manager, or call :meth:`start` and :meth:`stop`.
+    Profiles may be nested; only the innermost one records.
+    """
+    def __init__(self):
+        self.records = [ ]
+        self._records_by_fn = { }
+        self._stacks = _Stacks()
+        self._previous = None
+        self._started = None
+        self.seconds = 0.0
+
+    records = None
+    """A list of :class:`records <Record>`, in the order in which the
+    corresponding functions were first seen."""
+
+    seconds = None
+    """The total wall time this profile has been active."""
+
+    def start(self):
+        """Makes this the :data:`active` profile."""
+        global active
+        if self._started is not None:
+            raise RuntimeError("Profile is already active.")
+        self._previous = active
+        if self._previous is None:
+            _install_hooks()
+        active = self
+        self._started = clock()
+
+    def stop(self):
+        """Stops recording and restores the previously active profile."""
+        global active
+        if active is not self:
+            raise RuntimeError("Profile is not the active profile.")
+        self.seconds += clock() - self._started
+        self._started = None
+        active = self._previous
+        self._previous = None
+        if active is None:
+            _remove_hooks()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def record_for(self, fn):
+        """Returns the :class:`Record` for ``fn``, creating it if needed."""
+        records_by_fn = self._records_by_fn
+        try:
+            return records_by_fn[fn]
+        except KeyError:
+            record = records_by_fn[fn] = Record(fn)
+            self.records.append(record)
+            return record
+
+    def add(self, fn, phase, seconds):
+        """Adds time measured outside of the profile to a phase of ``fn``."""
+        self.record_for(fn).add(phase, seconds)
+        phase_stack = self._stacks.phases
+        if phase_stack:
+            phase_stack[-1][3] += seconds
+
+    ###########################################################################
+    # Timers
+    ###########################################################################
+    # phase stack entries are [record, phase, start, child seconds]
+    def _enter_phase(self, record, name):
+        self._stacks.phases.append([record, name, clock(), 0.0])
+
+    def _exit_phase(self):
+        phase_stack = self._stacks.phases
+        record, name, start, child_seconds = phase_stack.pop()
+        elapsed = clock() - start
+        record.add(name, elapsed - child_seconds)
+        if phase_stack:
+            phase_stack[-1][3] += elapsed
+
+    # node stack entries are [record, phase, node type, start, child seconds]
+    def _enter_node(self, node):
+        stacks = self._stacks
+        phase_stack = stacks.phases
+        if phase_stack:
+            record, phase = phase_stack[-1][0:2]
+        else:
+            record, phase = self.record_for(None), "other"
+        stacks.nodes.append([record, phase, type(node).__name__,
+                             clock(), 0.0])
+
+    def _exit_node(self):
+        node_stack = self._stacks.nodes
+        record, phase, node_type, start, child_seconds = node_stack.pop()
+        elapsed = clock() - start
+        record.add_node(phase, node_type, elapsed - child_seconds)
+        if node_stack:
+            node_stack[-1][4] += elapsed
+
+    ###########################################################################
+    # Reporting
+    ###########################################################################
+    @property
+    def report(self):
+        """A JSON-compatible dict containing a report for each function,
+        along with totals over all functions."""
+        phase_totals = { }
+        node_totals = { }
+        for record in self.records:
+            _merge(phase_totals, record.phases)
+            for phase, nodes in record.nodes.iteritems():
+                _merge(node_totals.setdefault(phase, { }), nodes)
+        return {
+            "seconds": self.seconds,
+            "functions": [record.report for record in self.records],
+            "phases": _stats_dict(phase_totals),
+            "nodes": dict((phase, _stats_dict(nodes))
+                          for phase, nodes in node_totals.iteritems())
+        }
+
+    def to_json(self, **kwargs):
+        """Returns :attr:`report` as a JSON string. Keyword arguments are
+        passed to :func:`json.dumps`."""
+        return _json.dumps(self.report, **kwargs)
+
+    def dump(self, f, **kwargs):
+        """Writes :attr:`report` as JSON to the file-like object ``f``."""
+        _json.dump(self.report, f, **kwargs)
+
+class _Stacks(_threading.local):
+    # the phases and nodes being timed, separately for each thread since 
+    # functions may be compiled on several threads at once (see clq.futures)
+    def __init__(self):
+        self.phases = [ ]
+        self.nodes = [ ]
+
+###############################################################################
+# Hooks
+###############################################################################
+# The hooks can still be running on another thread after the last profile 
+# is stopped and they are removed, in which case nothing is recorded.
+def _profiled_visit(self, node):
+    profile = active
+    if profile is None:
+        return _visit(self, node)
+    profile._enter_node(node)
+    try:
+        return _visit(self, node)
+    finally:
+        profile._exit_node()
+
+def _profiled_resolve(self, context):
+    profile = active
+    if profile is None:
+        return _resolve(self, context)
+    profile._enter_phase(profile.record_for(context.concrete_fn), "resolve")
+    try:
+        return _resolve(self, context)
+    finally:
+        profile._exit_phase()
+
+_visit = None
+_resolve = None
+
+def _install_hooks():
+    global _visit, _resolve
+    from clq import internals
+    _visit = internals.GenericFnVisitor.visit.im_func
+    internals.GenericFnVisitor.visit = _profiled_visit
+    internals.ConcreteFnVisitor.visit = _profiled_visit
+    _resolve = internals.UnresolvedType.__dict__["resolve"]
+    internals.UnresolvedType.resolve = _profiled_resolve
+
+def _remove_hooks():
+    from clq import internals
+    del internals.GenericFnVisitor.visit
+    del internals.ConcreteFnVisitor.visit
+    internals.UnresolvedType.resolve = _resolve
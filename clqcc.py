@@ -1,2 +1,147 @@
-# TODO: clqcc
+"""Compiles the generic functions in a module to OpenCL ahead of time.
 
+    python clqcc.py [options] MODULE [SIGNATURE ...]
+
+``MODULE`` is the name of a module importable from the current directory, or
+the path of a Python file. Each ``SIGNATURE`` names a generic function in the
+module (a function decorated with ``@clq.fn``) and the types to specialize it
+for, with any arguments bound to constants given by name::
+
+    python clqcc.py -o build kernels.py \\
+        "saxpy(float, __global float*, __global float*, get_global_id)" \\
+        "scale(__global float*, n=4)"
+
+Types are written as in OpenCL (see :func:`clq.backends.opencl.t`), or as the
+name of another generic function in the module to pass that function. The
+signatures can also be read from a JSON file given by ``--signatures``,
+containing either a list of signatures or a manifest written by an earlier
+run, whose kernels are compiled again.
+
+Writes ``NAME.cl``, containing every kernel and the functions they call, and
+``NAME.json``, a :mod:`manifest <clq.manifest>` giving the name and argument
+types of each kernel, to the output directory. ``NAME`` defaults to the name
+of the module. Function names are :meth:`mangled <clq.Backend.mangle>`, so
+any number of specializations of a function can be compiled together. At run
+time, the kernels can be loaded from the manifest without the module or the
+compiler (see :mod:`clq.manifest`).
+"""
+import os
+import sys
+import imp
+import json
+import optparse
+
+import clq
+import clq.manifest
+import clq.optimize
+import clq.backends.opencl as ocl
+
+def import_module(name):
+    """Imports the module with the provided name, or from the provided path
+    if ``name`` ends in ``.py`` or contains a path separator."""
+    if name.endswith(".py") or os.sep in name:
+        module_name = os.path.splitext(os.path.basename(name))[0]
+        return imp.load_source(module_name, name)
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    __import__(name)
+    return sys.modules[name]
+
+def generic_fns(module):
+    """Returns a dict of the generic functions in ``module``, by name."""
+    return dict((name, value) for name, value in vars(module).iteritems()
+                if isinstance(value, clq.GenericFn))
+
+def resolve_type(name, fns):
+    """Returns the type named ``name``, which is the type of the generic
+    function of that name in ``fns`` if there is one."""
+    generic_fn = fns.get(name, None)
+    if generic_fn is not None:
+        return generic_fn.cl_type
+    return ocl.t(name)
+
+def compile_entries(fns, entries, backend):
+    """Compiles each :class:`entry <clq.manifest.Entry>` for ``backend``,
+    filling in its kernel name, arguments and return type. Returns a
+    :class:`clq.ProgramModule` of the compiled functions."""
+    module = clq.ProgramModule()
+    for entry in entries:
+        generic_fn = fns.get(entry.fn, None)
+        if generic_fn is None:
+            raise clq.Error("No generic function named %s." % entry.fn)
+        arg_types = tuple(resolve_type(name, fns) for name in entry.arg_types)
+        constants = dict((str(name), value)
+                         for name, value in entry.constants.iteritems())
+        concrete_fn = generic_fn.compile(backend, *arg_types, **constants)
+        module.add(concrete_fn)
+        entry.name = concrete_fn.name
+        entry.args = tuple(
+            (arg_name, arg_type.name) for arg_name, arg_type in
+            zip(concrete_fn.generic_fn.arg_names, concrete_fn.arg_types)
+            if not isinstance(arg_type, clq.VirtualType))
+        entry.return_type = concrete_fn.return_type.name
+    return module
+
+def read_signatures(path):
+    """Returns a list of :class:`entries <clq.manifest.Entry>` from a JSON
+    list of signatures or a manifest."""
+    with open(path) as f:
+        try:
+            obj = json.load(f)
+        except ValueError as e:
+            raise clq.Error("Invalid signatures file %s: %s" % (path, e))
+    if isinstance(obj, dict):
+        obj = obj.get("kernels", ())
+    return [clq.manifest.Entry.from_json(item) for item in obj]
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [options] MODULE [SIGNATURE ...]")
+    parser.add_option("-o", "--output-dir", default=".",
+                      help="directory to write NAME.cl and NAME.json to")
+    parser.add_option("-n", "--name",
+                      help="base name of the output files (default: module)")
+    parser.add_option("-s", "--signatures", action="append", default=[ ],
+                      metavar="FILE", help="JSON file of signatures to "
+                      "compile, or a manifest to compile again (repeatable)")
+    parser.add_option("-O", "--optimize", action="store_true",
+                      help="run the optimizer (see clq.optimize)")
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("no module given")
+
+    try:
+        module = import_module(args[0])
+        fns = generic_fns(module)
+        entries = [clq.manifest.parse_signature(signature)
+                   for signature in args[1:]]
+        for path in options.signatures:
+            entries.extend(read_signatures(path))
+        if not entries:
+            parser.error("no signatures given; generic functions in %s: %s" %
+                         (module.__name__, ", ".join(sorted(fns)) or "none"))
+
+        backend = ocl.Backend()
+        backend.mangle_names = True
+        if options.optimize:
+            backend.optimizer = clq.optimize.Optimizer()
+        program_module = compile_entries(fns, entries, backend)
+    except clq.Error as e:
+        sys.stderr.write("clqcc: error: %s\n" % e)
+        return 1
+
+    name = options.name or module.__name__.rpartition(".")[2]
+    if not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+    source = name + ".cl"
+    with open(os.path.join(options.output_dir, source), "w") as f:
+        f.write(program_module.code)
+    manifest = clq.manifest.Manifest(module.__name__, source, entries)
+    manifest.save(os.path.join(options.output_dir, name + ".json"))
+    for entry in entries:
+        print "%s: %s" % (entry.name, entry.signature)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -11,6 +11,8 @@ import inspect as _inspect
 import functools as _functools
 import math as _math
 import re as _re
+import weakref as _weakref
+import collections as _collections
 
 ##############################################################################
 ## Error Handling
@@ -1421,11 +1423,135 @@ def is_senior_subclass(obj, cls, testcls):
             if issubclass(base, testcls):
                 return False
             
+class InternPool(object):
+    """The pool of instances of an :func:`intern` class.
+    
+    This default implementation keeps every instance alive for the lifetime 
+    of the class. See :class:`WeakInternPool` and :class:`LRUInternPool` for
+    bounded alternatives, and :func:`set_intern_pool` to install one.
+    
+    Keeps count of lookups that found an existing instance (``hits``) and 
+    those that had to create a new one (``misses``).
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._map = self._make_map()
+        
+    def _make_map(self):
+        return { }
+        
+    def __getitem__(self, key):
+        return self._map[key]
+    
+    def __setitem__(self, key, obj):
+        self._map[key] = obj
+        
+    def __len__(self):
+        return len(self._map)
+    
+    def items(self):
+        """Returns a list of (key, instance) pairs currently in the pool."""
+        return self._map.items()
+    
+    def clear(self):
+        """Removes all instances from the pool."""
+        self._map.clear()
+        
+    @property
+    def hit_rate(self):
+        """The fraction of lookups that found an existing instance, or None if 
+        there have not been any lookups."""
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return None
+        return float(self.hits) / lookups
+    
+    @property
+    def stats(self):
+        """A dict containing the size, hits, misses and hit rate of the pool."""
+        return dict(pool=self.__class__.__name__,
+                    size=len(self),
+                    hits=self.hits,
+                    misses=self.misses,
+                    hit_rate=self.hit_rate)
+    
+class WeakInternPool(InternPool):
+    """A pool which holds its instances weakly, so they are dropped once 
+    they are no longer referenced anywhere else."""
+    def _make_map(self):
+        return _weakref.WeakValueDictionary()
+    
+    def items(self):
+        return [(key, obj) for key, obj in self._map.items() if obj is not None]
+    
+class LRUInternPool(InternPool):
+    """A pool which holds at most ``max_size`` instances, dropping the least
+    recently used instance when full."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.evictions = 0
+        InternPool.__init__(self)
+        
+    def _make_map(self):
+        return _collections.OrderedDict()
+        
+    def __getitem__(self, key):
+        map = self._map
+        obj = map.pop(key)
+        map[key] = obj
+        return obj
+    
+    def __setitem__(self, key, obj):
+        map = self._map
+        map[key] = obj
+        if len(map) > self.max_size:
+            map.popitem(last=False)
+            self.evictions += 1
+            
+    @property
+    def stats(self):
+        stats = InternPool.stats.fget(self)
+        stats['max_size'] = self.max_size
+        stats['evictions'] = self.evictions
+        return stats
+
+interned_classes = [ ]
+"""A list of all classes that have been passed to :func:`intern`."""
+
+def get_intern_pool(cls):
+    """Returns the :class:`InternPool` used by the provided intern class."""
+    return cls._intern__pool
+
+def set_intern_pool(cls, pool):
+    """Replaces the :class:`InternPool` used by the provided intern class.
+    
+    Instances in the previous pool are moved to the new one, subject to its 
+    policy. For example, to keep at most 1000 concrete functions alive::
+    
+        cypy.set_intern_pool(clq.ConcreteFn, cypy.LRUInternPool(1000))
+    
+    Subclasses sharing the class's pool use the new pool too.
+    """
+    old_pool = cls._intern__pool
+    for key, obj in old_pool.items():
+        pool[key] = obj
+    pool.hits += old_pool.hits
+    pool.misses += old_pool.misses
+    cls._intern__pool = pool
+    
+def intern_stats():
+    """Returns a dict mapping the qualified name of each intern class to the
+    ``stats`` of its pool (see :attr:`InternPool.stats`)."""
+    return dict(("%s.%s" % (cls.__module__, cls.__name__), 
+                 cls._intern__pool.stats)
+                for cls in interned_classes)
+
 class intern(object):  
     # a class just so the name mangling mechanisms are invoked, deleted below
     
     @staticmethod
-    def intern(cls_):
+    def intern(cls_, pool=None):
         """Transforms the provided class into an interned class.
         
         That is, initializing the class multiple times with the same arguments 
@@ -1480,9 +1606,18 @@ class intern(object):
                   The default implementation is provided by fn_arg_hash_function
                   applied to __init__, or generic_arg_hash_function if that 
                   doesn't work.
+                  
+        Instances are kept in ``pool``, an :class:`InternPool` which by 
+        default keeps them alive forever. With a :class:`WeakInternPool` or 
+        :class:`LRUInternPool`, instances can leave the pool, so the same 
+        arguments only produce the same object while it is still pooled. 
+        See also :func:`set_intern_pool` and :func:`intern_stats`.
         
         """
-        cls_.__pool = { }
+        if pool is None:
+            pool = InternPool()
+        cls_.__pool = pool
+        interned_classes.append(cls_)
         
         __init__ = cls_.__init__
         try:
@@ -1508,10 +1643,12 @@ class intern(object):
                 except (AttributeError, TypeError):
                     hash_function = generic_arg_hash_function
             
+            pool = cls_.__pool
             try:
                 # look-up object
                 hash = hash_function(None, *args, **kwargs)  # none because self is not created yet
-                obj = cls_.__pool[hash]
+                obj = pool[hash]
+                pool.hits += 1
             except (TypeError, KeyError) as e:
                 # if arguments not hashable or object not found, need to 
                 # make a new object
@@ -1526,7 +1663,8 @@ class intern(object):
                 
                 # put it in ze pool
                 if isinstance(e, KeyError):
-                    cls_.__pool[hash] = obj
+                    pool.misses += 1
+                    pool[hash] = obj
                 
                 # re-override __new__
                 cls_.__new__ = __static_new__
@@ -1781,7 +1919,86 @@ class frozendict(dict):
     
     __delitem__ = __setitem__ = clear = pop = popitem = setdefault = update = \
         _NO_BAD
-        
+
+class LazyDict(dict):
+    """A dict which is populated by calling ``load(self)`` the first time it
+    is read from.
+
+        >>> d = LazyDict(lambda d: d.update(a=1))
+        >>> d.loaded
+        False
+        >>> d['a']
+        1
+
+    Writing to the dict does not trigger loading, so ``load`` may populate it
+    indirectly (e.g. by importing a module which adds entries to it).
+    """
+    def __init__(self, load):
+        dict.__init__(self)
+        self._load = load
+
+    loaded = False
+    """Whether ``load`` has been called."""
+
+    def load(self):
+        """Calls ``load`` if it has not been called yet."""
+        if not self.loaded:
+            # set first so that reads during loading don't recurse
+            self.loaded = True
+            try:
+                self._load(self)
+            except:
+                self.loaded = False
+                raise
+
+    def __getitem__(self, key):
+        if not self.loaded:
+            self.load()
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if not self.loaded:
+            self.load()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self.load()
+        return "LazyDict(%s)" % dict.__repr__(self)
+
+    def _loading(method): #@NoSelf
+        def _method(self, *args, **kwargs):
+            self.load()
+            return method(self, *args, **kwargs)
+        _method.__name__ = method.__name__
+        _method.__doc__ = method.__doc__
+        return _method
+
+    get = _loading(dict.get)
+    has_key = _loading(dict.has_key)
+    keys = _loading(dict.keys)
+    values = _loading(dict.values)
+    items = _loading(dict.items)
+    iterkeys = _loading(dict.iterkeys)
+    itervalues = _loading(dict.itervalues)
+    iteritems = _loading(dict.iteritems)
+    copy = _loading(dict.copy)
+    del _loading
+
 class stack(list):
     """A stack is a list which iterates in reverse by default.
     
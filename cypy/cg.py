@@ -307,6 +307,138 @@ class CG(object):
         if self._pop_next:
             self._pop_next = False
 
+class RopeCG(CG):
+    """A faster code generator that produces the same code as :class:`CG`.
+
+    Rather than inspecting the last string appended and indenting newlines
+    with a regular expression, it keeps track of whether it is at the start
+    of a line as it goes and indents using ``str.replace``, so strings that
+    neither start a line nor contain a newline are added as they are. Nested
+    tuples and lists are walked with an explicit stack, and :meth:`CG.tab` 
+    and :meth:`CG.untab` are recognized without inspecting their signatures.
+
+    If ``stream`` is provided (anything with a ``write`` method, e.g. a file
+    or a ``cStringIO.StringIO``), the code is written to it every 
+    ``buffer_size`` strings instead of being kept, and :meth:`flush` must be
+    called once done::
+
+        with open("kernels.cl", "w") as f:
+            g = RopeCG(stream=f)
+            g.append(code)
+            g.flush()
+    """
+    @cypy.autoinit
+    def __init__(self, processor=None, stream=None, buffer_size=4096,
+                 **kwargs): pass
+
+    stream = None
+    """The stream that code is written to, or None to keep it in
+    :attr:`code_builder`."""
+
+    buffer_size = 4096
+    """The number of strings to buffer before writing them to 
+    :attr:`stream`."""
+
+    _line_start = True
+
+    def append(self, code):
+        """Appends code, as described by :meth:`CG.append`."""
+        pop_next = self._pop_next
+        if pop_next:
+            self._pop_next = False
+
+        processor = self.processor
+        tab, untab = CG.tab, CG.untab
+        write = self.code_builder.append
+        stream = self.stream
+        line_start = self._line_start
+        indent_depth = self.indent_depth
+        stack = [ ]
+        while True:
+            if isinstance(code, basestring):
+                if processor is None:
+                    tokens = (code,)
+                else:
+                    # the processor may append non-strings as it goes
+                    self._line_start = line_start
+                    self.indent_depth = indent_depth
+                    tokens = processor(code)
+                for token in tokens:
+                    if processor is not None:
+                        line_start = self._line_start
+                        indent_depth = self.indent_depth
+                    if line_start:
+                        if indent_depth > 0:
+                            write(" " * indent_depth)
+                            line_start = False
+                        if token[:1] == "\n":
+                            token = token[1:]
+                    if indent_depth > 0 and "\n" in token:
+                        # newlines that end the token, or precede one that 
+                        # does, are not indented (see cypy.re_nonend_newline)
+                        indent = "\n" + " " * indent_depth
+                        if token[-2:] == "\n\n":
+                            token = token[:-2].replace("\n", indent) + "\n\n"
+                        elif token[-1] == "\n":
+                            token = token[:-1].replace("\n", indent) + "\n"
+                        else:
+                            token = token.replace("\n", indent)
+                    if token:
+                        write(token)
+                        line_start = token[-1] == "\n"
+                    if processor is not None:
+                        self._line_start = line_start
+                if stream is not None and \
+                        len(self.code_builder) >= self.buffer_size:
+                    self.flush()
+            elif type(code) is tuple or type(code) is list:
+                stack.append(iter(code))
+            elif code is tab:
+                indent_depth += self.default_indent
+            elif code is untab:
+                indent_depth -= self.default_indent
+            elif code is not None and code is not self:
+                # anything else may append to or change the indentation of 
+                # this generator itself
+                self._line_start = line_start
+                self.indent_depth = indent_depth
+                self._process_nonstrings(code)
+                line_start = self._line_start
+                indent_depth = self.indent_depth
+
+            while stack:
+                try:
+                    code = next(stack[-1])
+                    break
+                except StopIteration:
+                    stack.pop()
+            else:
+                break
+
+        self._line_start = line_start
+        self.indent_depth = indent_depth
+        if pop_next:
+            self.pop_context()
+        return self
+
+    def flush(self):
+        """Writes any buffered code to :attr:`stream`, if provided."""
+        stream = self.stream
+        if stream is not None:
+            code_builder = self.code_builder
+            if code_builder:
+                stream.write("".join(code_builder))
+                del code_builder[:]
+
+    @property
+    def code(self):
+        """Returns the concatenated list of strings upon access.
+
+        Not available if the code is being written to :attr:`stream`."""
+        if self.stream is not None:
+            raise cypy.Error("The code was written to a stream.")
+        return "".join(self.code_builder)
+
 ## Processing identifiers
 class IdentifierProcessor(object):
     """Breaks a string into identifiers and replaces them using the substitutor.
@@ -17,7 +17,7 @@ a_buf = ctx.to_device(a)
 b_buf = ctx.to_device(b)
 dest_buf = ctx.alloc(like=a)
 
-ew_add(a_buf, b_buf, dest_buf, global_size=a.shape, local_size=(1,)).wait()
+ew_add(a_buf, b_buf, dest_buf, global_size=a.shape).wait()
 
 c = ctx.from_device(dest_buf)
 
@@ -14,7 +14,7 @@ import clq.backends.opencl as ocl
 # TODO: unique naming
 # TODO: extern
 
-g = cg.CG()
+g = cg.RopeCG()
 """
 '''Automatically generated unit tests for the cl.oquence OpenCL backend.
 
@@ -0,0 +1,157 @@
+'''Unit tests for the work-group size autotuner 
+(clq.backends.opencl.autotune).'''
+import gc
+import time
+import weakref
+import shutil
+import tempfile
+import unittest
+
+import clq.backends.opencl.autotune as autotune
+import clq.backends.opencl.binaries as binaries
+
+class FakePlatform(object):
+    name = "Fake Platform"
+    version = "OpenCL 1.2 Fake"
+    
+class FakeDevice(object):
+    platform = FakePlatform()
+    name = "Fake Device"
+    driver_version = "1.0"
+    
+class FakeEvent(object):
+    def wait(self):
+        pass
+    
+class FakeQueue(object):
+    device = FakeDevice()
+    
+    def finish(self):
+        pass
+    
+class FakeProgram(object):
+    source = "kernel void f(global float* a) { }"
+    options = ""
+    
+class FakeKernel(object):
+    """Takes longer the further the local size is from (4,)."""
+    program = FakeProgram()
+    name = "f"
+    queue = FakeQueue()
+    
+    def __init__(self):
+        self.launches = [ ]
+    
+    def __call__(self, queue, global_size, *args, **kwargs):
+        return self.launch(self, queue, global_size, *args, **kwargs)
+        
+    @staticmethod
+    def launch(kernel, queue, global_size, *args, **kwargs):
+        local_size = kwargs['local_size']
+        kernel.launches.append(local_size)
+        if local_size == (16,):
+            raise RuntimeError("Out of resources.")
+        n = 8 if local_size is None else abs(local_size[0] - 4) + 1
+        time.sleep(0.001 * n)
+        return FakeEvent()
+    
+class FakeTuner(autotune.Tuner):
+    samples = 2
+    
+    def limits(self, kernel, device):
+        return (16,), 16, 1
+
+class CandidatesTest(unittest.TestCase):
+    def test_candidates(self):
+        self.assertEqual(autotune.candidates((12,), (1024,), 1024),
+                         [None, (12,), (6,), (4,), (3,), (2,), (1,)])
+        self.assertEqual(autotune.candidates((12,), (4,), 1024, 2),
+                         [None, (4,), (2,), (3,), (1,)])
+        self.assertEqual(autotune.candidates((64, 64), (64, 64), 64, 32, 4),
+                         [None, (1, 64), (2, 32), (4, 16)])
+        
+class TunerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        autotune.disable()
+        shutil.rmtree(self.path)
+        
+    def test_tune(self):
+        tuner = FakeTuner(autotune.TuningDatabase(self.path))
+        kernel, queue = FakeKernel(), FakeQueue()
+        self.assertEqual(tuner.lookup(kernel, queue, (16,)), None)
+        self.assertEqual(tuner.choose(kernel, queue, (16,)), (None, None))
+        self.assertEqual(tuner.tune(kernel, (16,), "arg"), (4,))
+        self.assertEqual(tuner.choose(kernel, queue, [16]), ((4,), None))
+        
+        # persisted for new tuners, but not for other kernels and sizes
+        tuner = FakeTuner(autotune.TuningDatabase(self.path))
+        self.assertEqual(tuner.lookup(kernel, queue, (16,)), (4,))
+        self.assertEqual(tuner.lookup(kernel, queue, (8,)), None)
+        other = FakeKernel()
+        other.program = FakeProgram()
+        other.program.source = "kernel void g(global float* a) { }"
+        self.assertEqual(tuner.lookup(other, queue, (16,)), None)
+        local_size, timings = tuner.database.load(autotune.key_for(
+            autotune.kernel_key(kernel), 
+            binaries.device_key(FakeDevice()), (16,)))
+        self.assertEqual(local_size, (4,))
+        self.assertEqual(timings[0][0], (4,))
+        self.assertTrue((16,) not in [size for size, _ in timings])
+        
+    def test_online(self):
+        tuner = autotune.enable(self.path, online=True)
+        self.assertTrue(autotune.active is tuner)
+        tuner.limits = FakeTuner.limits.__get__(tuner)
+        tuner.samples = 1
+        kernel, queue = FakeKernel(), FakeQueue()
+        n_candidates = len(autotune.candidates((16,), (16,), 16))
+        for i in xrange(n_candidates + 2):
+            local_size, trial = tuner.choose(kernel, queue, (16,))
+            if trial is None:
+                kernel.launch(kernel, queue, (16,), local_size=local_size)
+            else:
+                trial.launch(kernel.launch, kernel, queue, (16,), 
+                             local_size=local_size)
+        # the failing candidate is retried with the driver's choice
+        self.assertEqual(kernel.launches[:6], 
+                         [None, (16,), None, (8,), (4,), (2,)])
+        self.assertEqual(kernel.launches[-2:], [(4,), (4,)])
+        self.assertEqual(autotune.enable(self.path).lookup(
+            kernel, queue, (16,)), (4,))
+
+    def test_memo(self):
+        tuner = FakeTuner(online=True)
+        tuner.max_memo = 2
+        kernel, queue = FakeKernel(), FakeQueue()
+        self.assertEqual(tuner.tune(kernel, (16,)), (4,))
+        # results are keyed by content, not by kernel and queue objects
+        self.assertEqual(tuner.choose(FakeKernel(), FakeQueue(), (16,)), 
+                         ((4,), None))
+        ref = weakref.ref(kernel)
+        del kernel
+        gc.collect()
+        self.assertTrue(ref() is None)
+        
+        kernel = FakeKernel()
+        for size in (8, 4, 2):
+            tuner.choose(kernel, queue, (size,))
+        self.assertEqual(len(tuner._tunings), 2)
+        tuner.tune(kernel, (8,))
+        tuner.tune(kernel, (4,))
+        self.assertEqual(len(tuner._chosen), 2)
+        # the oldest result was forgotten, and there is no database
+        self.assertEqual(tuner.lookup(kernel, queue, (16,)), None)
+        self.assertEqual(tuner.lookup(kernel, queue, (8,)), (4,))
+        
+        unknown = FakeKernel()
+        unknown.program = FakeProgram()
+        unknown.program.source = None
+        self.assertEqual(tuner.choose(unknown, queue, (16,)), (None, None))
+        self.assertEqual(tuner.tune(unknown, (16,)), (4,))
+        self.assertEqual(tuner.lookup(unknown, queue, (16,)), None)
+
+if __name__ == "__main__":
+    unittest.main()
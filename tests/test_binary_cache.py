@@ -0,0 +1,88 @@
+'''Unit tests for the OpenCL program binary cache 
+(clq.backends.opencl.binaries).'''
+import shutil
+import tempfile
+import unittest
+import cPickle as pickle
+
+import clq.backends.opencl.binaries as binaries
+
+class FakePlatform(object):
+    name = "Fake Platform"
+    version = "OpenCL 1.2 Fake"
+    
+class FakeDevice(object):
+    platform = FakePlatform()
+    name = "Fake Device"
+    
+    def __init__(self, driver_version="1.0"):
+        self.driver_version = driver_version
+
+class BinaryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = binaries.enable(self.path)
+        self.key = binaries.key_for("kernel void f() { }", "-O2",
+                                    [binaries.device_key(FakeDevice())])
+        
+    def tearDown(self):
+        binaries.disable()
+        shutil.rmtree(self.path)
+        
+    def test_miss_then_hit(self):
+        self.assertEqual(self.cache.load(self.key), None)
+        self.cache.store(self.key, ["binary 0", "binary 1"])
+        self.assertEqual(self.cache.load(self.key), ("binary 0", "binary 1"))
+        self.assertEqual(self.cache.stats, dict(hits=1, misses=1, writes=1,
+                                                evictions=0, errors=0))
+        
+    def test_key(self):
+        device_key = binaries.device_key(FakeDevice())
+        keys = set((
+            self.key,
+            binaries.key_for("kernel void g() { }", "-O2", [device_key]),
+            binaries.key_for("kernel void f() { }", "", [device_key]),
+            binaries.key_for("kernel void f() { }", "-O2", 
+                             [binaries.device_key(FakeDevice("1.1"))]),
+            binaries.key_for("kernel void f() { }", "-O2", 
+                             [device_key, device_key])))
+        self.assertEqual(len(keys), 5)
+        
+    def test_corruption(self):
+        self.cache.store(self.key, ["binary"])
+        filename = self.cache.filename_for(self.key)
+        with open(filename, "rb") as f:
+            entry = pickle.load(f)
+        entry["binaries"] = ("binarz",)
+        with open(filename, "wb") as f:
+            pickle.dump(entry, f)
+        self.assertEqual(self.cache.load(self.key), None)
+        self.assertEqual(self.cache.stats["errors"], 1)
+        self.assertEqual(self.cache.entries(), [ ])
+        
+        self.cache.store(self.key, ["binary"])
+        with open(filename, "r+b") as f:
+            f.truncate(10)
+        self.assertEqual(self.cache.load(self.key), None)
+        self.assertEqual(self.cache.stats["errors"], 2)
+        
+        self.cache.store(self.key, ["binary"])
+        self.cache.discard(self.key)
+        self.assertEqual(self.cache.load(self.key), None)
+        self.assertEqual(self.cache.stats["errors"], 3)
+        
+    def test_not_built(self):
+        self.cache.store(self.key, ["binary", ""])
+        self.assertEqual(self.cache.stats["writes"], 0)
+        
+    def test_eviction(self):
+        for i in xrange(4):
+            self.cache.store(binaries.key_for(str(i), "", ()), ["x" * 1000])
+        entry_size = self.cache.entries()[0][1]
+        cache = binaries.BinaryCache(self.path, max_size=2 * entry_size)
+        cache.store(self.key, ["x" * 1000])
+        self.assertTrue(len(cache.entries()) <= 2)
+        self.assertTrue(cache.stats["evictions"] >= 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+'''Unit tests for the device buffer pool (clq.backends.opencl.pool).'''
+import unittest
+
+import clq.backends.opencl.pool as pool
+
+class FakeBuffer(object):
+    def __init__(self, flags, size):
+        self.flags = flags
+        self.size = size
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        self.allocated = [ ]
+        self.freed = [ ]
+        self.fail = False
+        self.pool = pool.BufferPool(self.allocate, self.freed.append, 4096)
+        
+    def allocate(self, flags, size):
+        if self.fail:
+            self.fail = False
+            raise MemoryError("Out of device memory.")
+        buffer = FakeBuffer(flags, size)
+        self.allocated.append(buffer)
+        return buffer
+    
+    def test_size_class(self):
+        self.assertEqual([pool.size_class(size) for size in 
+                          (1, 256, 257, 1024, 1025, 1200, 1281, 1537, 2047)],
+                         [256, 256, 320, 1024, 1280, 1280, 1536, 1792, 2048])
+        for size in xrange(1, 10000, 7):
+            size_class = pool.size_class(size)
+            self.assertTrue(size <= size_class)
+            self.assertTrue(size_class <= max(size * 5 // 4, 256))
+        
+    def test_reuse(self):
+        a = self.pool.alloc(1, 1000)
+        a.shape = (250,)
+        self.assertEqual((a.flags, a.size, a.pool_key), (1, 1024, (1, 1024)))
+        self.pool.release(a)
+        self.assertFalse(hasattr(a, "shape"))
+        self.assertTrue(self.pool.alloc(1, 1024) is a)
+        self.assertTrue(self.pool.alloc(1, 1024) is not a)
+        b = self.pool.alloc(2, 1000)
+        self.pool.release(b)
+        self.assertTrue(self.pool.alloc(1, 1000) is not b)
+        self.assertEqual(self.pool.stats, dict(
+            allocations=5, hits=1, misses=4, releases=2, evictions=0, 
+            retained=1, retained_bytes=1024))
+        self.assertEqual(len(self.allocated), 4)
+        
+    def test_cap(self):
+        buffers = [self.pool.alloc(1, 1024) for _ in xrange(5)]
+        for buffer in buffers:
+            self.pool.release(buffer)
+        # the least recently released buffer is freed
+        self.assertEqual(self.freed, buffers[:1])
+        self.assertEqual(self.pool.retained_bytes, 4096)
+        big = self.pool.alloc(1, 8192)
+        self.pool.release(big)
+        self.assertEqual(self.freed, [buffers[0], big])
+        self.assertEqual(self.pool.stats["evictions"], 1)
+        self.pool.max_retained = 2048
+        self.pool.release(self.pool.alloc(1, 300))
+        self.assertEqual(self.freed[2:], buffers[1:4])
+        self.assertEqual(self.pool.retained, 2)
+        self.pool.clear()
+        self.assertEqual(self.pool.retained_bytes, 0)
+        self.assertEqual(len(self.freed), 7)
+        
+    def test_out_of_memory(self):
+        self.pool.release(self.pool.alloc(1, 1024))
+        self.fail = True
+        self.pool.alloc(1, 2048)
+        self.assertEqual(len(self.freed), 1)
+        self.fail = True
+        self.assertRaises(MemoryError, self.pool.alloc, 1, 2048)
+
+if __name__ == "__main__":
+    unittest.main()
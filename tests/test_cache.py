@@ -0,0 +1,99 @@
+'''Unit tests for the persistent program item cache (clq.cache).'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import clq
+import clq.cache
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+plus_src = '''
+def plus(a, b):
+    return a + b
+'''
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = clq.cache.enable(self.path)
+
+    def tearDown(self):
+        clq.cache.disable()
+        shutil.rmtree(self.path)
+
+    def test_miss_then_hit(self):
+        first = clq.fn.from_source(plus_src).compile(OpenCL, ocl.int, ocl.int)
+        code = first.program_item.code
+        self.assertEqual(self.cache.stats['misses'], 1)
+        self.assertEqual(self.cache.stats['writes'], 1)
+
+        # a new generic function with the same source hits the cache
+        second = clq.fn.from_source(plus_src).compile(OpenCL, ocl.int, ocl.int)
+        self.assertEqual(second.program_item.code, code)
+        self.assertEqual(second.program_items[-1].code, code)
+        self.assertEqual(self.cache.stats['hits'], 1)
+        self.assertFalse(hasattr(second, '_visitor'))
+
+    def test_key_depends_on_types(self):
+        plus = clq.fn.from_source(plus_src)
+        self.assertNotEqual(
+            clq.cache.key_for(plus.compile(OpenCL, ocl.int, ocl.int)),
+            clq.cache.key_for(plus.compile(OpenCL, ocl.float, ocl.int)))
+
+    def test_key_depends_on_compiler(self):
+        concrete_fn = clq.fn.from_source(plus_src).compile(OpenCL, ocl.int,
+                                                           ocl.int)
+        key = clq.cache.key_for(concrete_fn)
+        fingerprint = clq.cache.compiler_fingerprint()
+        self.assertEqual(len(fingerprint), 40)
+        self.addCleanup(setattr, clq.cache, "_compiler_fingerprint", 
+                        fingerprint)
+        clq.cache._compiler_fingerprint = "0" * 40
+        self.assertNotEqual(clq.cache.key_for(concrete_fn), key)
+
+    def test_key_depends_on_inline_hints(self):
+        apply = clq.fn.from_source('''
+def apply(f, a):
+    return f(a, a)
+''')
+        plus = clq.fn.from_source(plus_src)
+        keys = set()
+        for hint in (None, True, False):
+            plus.inline = hint
+            keys.add(clq.cache.key_for(apply.compile(OpenCL, plus.cl_type,
+                                                     ocl.int)))
+            apply.inline = hint
+            keys.add(clq.cache.key_for(apply.compile(OpenCL, plus.cl_type,
+                                                     ocl.int)))
+        self.assertEqual(len(keys), 5)
+
+    def test_corrupted_entry(self):
+        concrete_fn = clq.fn.from_source(plus_src).compile(OpenCL,
+                                                           ocl.int, ocl.int)
+        concrete_fn.program_item
+        filename = self.cache.filename_for(clq.cache.key_for(concrete_fn))
+        f = open(filename, 'wb')
+        f.write("garbage")
+        f.close()
+
+        concrete_fn = clq.fn.from_source(plus_src).compile(OpenCL,
+                                                           ocl.int, ocl.int)
+        self.assertEqual(concrete_fn.program_item.name, "plus")
+        self.assertEqual(self.cache.stats['errors'], 1)
+        self.assertEqual(self.cache.stats['hits'], 0)
+
+    def test_eviction(self):
+        for type in (ocl.int, ocl.float, ocl.short, ocl.long):
+            clq.fn.from_source(plus_src).compile(OpenCL, type, type).program_item
+        self.assertEqual(len(self.cache.entries()), 4)
+
+        entry_size = self.cache.entries()[0][1]
+        self.cache.evict(2 * entry_size)
+        self.assertTrue(len(self.cache.entries()) <= 2)
+        self.assertTrue(self.cache.stats['evictions'] >= 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+'''Unit tests for the code generators in cypy.cg.'''
+import unittest
+import cStringIO
+
+import cypy
+import cypy.cg as cg
+
+tab, untab = cg.CG.tab, cg.CG.untab
+
+class Expression(object):
+    _CG_expression = ("x", " + ", "y")
+
+samples = (
+    "",
+    "\n",
+    ("a\n", "\n", "b"),
+    ("{\n", tab, "x;\n", "y;\n\n", "z;", untab, "\n}\n"),
+    ("{\n", tab, "\n\nx\ny\n\n", "", "\n", tab, "a\n\n\nb", untab, untab),
+    (tab, "", "q", untab, "\n", "", "r"),
+    ("f(", ["a", ("b", None)], ")", 3, "\n", tab, lambda: "g;\n",
+     lambda g: g.append("h;\n"), Expression(), untab),
+    (tab, tab, "deep\n", untab, "shallow\nstill\n", untab, "top"),
+)
+
+def generate(cls, code, **kwargs):
+    g = cls(**kwargs)
+    g.append(code)
+    return g
+
+class RopeCGTest(unittest.TestCase):
+    def test_same_code(self):
+        for code in samples:
+            expected = generate(cg.CG, code)
+            g = generate(cg.RopeCG, code)
+            self.assertEqual(g.code, expected.code)
+            self.assertEqual(g.indent_depth, expected.indent_depth)
+        
+    def test_incremental(self):
+        expected, g = cg.CG(), cg.RopeCG()
+        for code in samples:
+            expected.append(code)
+            g.append(code)
+        self.assertEqual(g.code, expected.code)
+        
+    def test_lines(self):
+        src = '''
+            if x:
+                y
+        '''
+        self.assertEqual(cg.RopeCG.lines_once(src, x="a"), 
+                         cg.CG.lines_once(src, x="a"))
+        g, expected = cg.RopeCG(), cg.CG()
+        for generator in (g, expected):
+            src >> generator
+            (tab, "z\n", untab) >> generator
+        self.assertEqual(g.code, expected.code)
+        
+    def test_processor(self):
+        code = ("{\n", tab, "a = b;\n", untab, "}\n")
+        context = dict(a="alpha", b=("beta", "\n", "gamma"))
+        expected = cg.CG.with_id_processor()
+        expected(**context).append(code)
+        g = cg.RopeCG.with_id_processor()
+        g(**context).append(code)
+        self.assertEqual(g.code, expected.code)
+        
+    def test_stream(self):
+        code = [("x", str(i), ";\n", tab, "y\n", untab) for i in xrange(100)]
+        stream = cStringIO.StringIO()
+        g = cg.RopeCG(stream=stream, buffer_size=16)
+        g.append(code)
+        self.assertTrue(0 < len(stream.getvalue()) < 
+                        len(generate(cg.CG, code).code))
+        g.flush()
+        self.assertEqual(stream.getvalue(), generate(cg.CG, code).code)
+        self.assertRaises(cypy.Error, lambda: g.code)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+'''Unit tests for the ahead-of-time compiler (clqcc) and clq.manifest.'''
+import os
+import re
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import cStringIO
+
+import clq
+import clq.manifest
+import clq.backends.opencl as ocl
+
+import clqcc
+
+module_src = '''
+import clq
+
+@clq.fn
+def plus(a, b):
+    return a + b
+
+@clq.fn
+def add(a, b, out, n, plus, get_global_id):
+    gid = get_global_id(0)
+    out[gid] = plus(a[gid], b[gid]) * n
+'''
+
+class FakeContext(object):
+    def __init__(self):
+        self.compiled = [ ]
+        
+    def compile(self, source, options=""):
+        self.compiled.append((source, options))
+        return FakeProgram()
+
+class FakeProgram(object):
+    def __getattr__(self, name):
+        return "kernel " + name
+
+class TypeParserTest(unittest.TestCase):
+    def test_t(self):
+        self.assertTrue(ocl.t("float4") is ocl.float4)
+        self.assertTrue(ocl.t("__global float*") is ocl.float.ptr_global)
+        self.assertTrue(ocl.t("local int *") is ocl.int.ptr_shared)
+        self.assertTrue(ocl.t("TypeType(uchar2)") is ocl.uchar2.cl_type)
+        from clq.backends.opencl.builtin_defs import get_global_id
+        self.assertTrue(ocl.t("get_global_id") is get_global_id.cl_type)
+        for name in ("global float", "flaot", "TypeType(get_global_id)",
+                     "__global __local int*", "int* __global", 
+                     "unsigned float"):
+            self.assertRaises(clq.Error, ocl.t, name)
+
+    def test_pointers_and_qualifiers(self):
+        self.assertTrue(ocl.t("__global int**") is ocl.int.ptr_global.ptr)
+        self.assertTrue(ocl.t("local int * __global *") is 
+                        ocl.int.ptr_local.ptr_global)
+        self.assertTrue(ocl.t("float*") is ocl.float.ptr)
+        self.assertTrue(ocl.float.ptr is ocl.float.ptr_private)
+        self.assertTrue(ocl.t("const __global float*") is 
+                        ocl.float.ptr_global)
+        self.assertTrue(ocl.t("unsigned int") is ocl.uint)
+        self.assertTrue(ocl.t("unsigned") is ocl.uint)
+        self.assertTrue(ocl.t("char*") is ocl.string)
+
+    def test_round_trip(self):
+        def types(cl_type, depth):
+            yield cl_type
+            yield cl_type.cl_type
+            if depth:
+                for attr in ("ptr_global", "ptr_shared", "ptr_private", 
+                             "ptr_constant"):
+                    for ptr_type in types(getattr(cl_type, attr), depth - 1):
+                        yield ptr_type
+        for base_type in ocl.base_types.values() + [ocl.void, ocl.bool, 
+                                                    ocl.string]:
+            for cl_type in types(base_type, 2):
+                self.assertTrue(ocl.t(cl_type.name) is cl_type, cl_type.name)
+            
+    def test_parse_signature(self):
+        entry = clq.manifest.parse_signature(
+            "scale(__global float*, float, n=4, k=-0.5)")
+        self.assertEqual(entry.fn, "scale")
+        self.assertEqual(entry.arg_types, ("__global float*", "float"))
+        self.assertEqual(entry.constants, {"n": 4, "k": -0.5})
+        self.assertEqual(clq.manifest.parse_signature(entry.signature)
+                         .constants, entry.constants)
+        self.assertRaises(clq.Error, clq.manifest.parse_signature, "scale")
+
+class ClqccTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.module_path = os.path.join(self.dir, "aot_kernels.py")
+        with open(self.module_path, "w") as f:
+            f.write(module_src)
+        self.out = os.path.join(self.dir, "build")
+        
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        
+    def run_clqcc(self, *args):
+        stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        try:
+            return clqcc.main(["-o", self.out] + list(args))
+        finally:
+            sys.stdout = stdout
+            
+    def test_compile(self):
+        signatures = ("add(__global float*, __global float*, __global float*,"
+                      " plus, get_global_id, n=2.0)",
+                      "add(__global int*, __global int*, __global int*, "
+                      "plus, get_global_id, n=2)")
+        self.assertEqual(self.run_clqcc(self.module_path, *signatures), 0)
+        with open(os.path.join(self.out, "aot_kernels.cl")) as f:
+            source = f.read()
+        manifest = clq.manifest.load(os.path.join(self.out, 
+                                                  "aot_kernels.json"))
+        self.assertEqual(manifest.module, "aot_kernels")
+        self.assertEqual(len(manifest.entries), 2)
+        entry = manifest.find("add", "__global int*", "__global int*", 
+                              "__global int*", "plus", "get_global_id")
+        self.assertTrue(re.match(r"^add__11global_intp11global_intp"
+                                 r"11global_intp13plus_[0-9a-f]{8}"
+                                 r"13get_global_id_3n_2$", entry.name))
+        self.assertEqual(entry.args, (("a", "__global int*"), 
+                                      ("b", "__global int*"),
+                                      ("out", "__global int*")))
+        self.assertEqual(entry.return_type, "void")
+        for entry in manifest.entries:
+            self.assertTrue(" %s(" % entry.name in source)
+        self.assertTrue("plus__5float5float(a[gid], b[gid])" in source)
+        self.assertTrue("plus__3int3int(a[gid], b[gid])" in source)
+        self.assertRaises(clq.Error, manifest.find, "add")
+        
+        ctx = FakeContext()
+        program = manifest.build(ctx)
+        self.assertTrue(manifest.build(ctx) is program)
+        self.assertEqual(ctx.compiled, [(source, "")])
+        self.assertEqual(manifest.kernel(program, "add", *entry.arg_types),
+                         "kernel " + entry.name)
+        
+        # the manifest can be compiled again
+        manifest_path = os.path.join(self.dir, "signatures.json")
+        shutil.copy(manifest.path, manifest_path)
+        self.assertEqual(self.run_clqcc("-n", "again", "-s", manifest_path,
+                                        self.module_path), 0)
+        with open(os.path.join(self.out, "again.cl")) as f:
+            self.assertEqual(f.read(), source)
+        with open(os.path.join(self.out, "again.json")) as f:
+            self.assertEqual(json.load(f)["kernels"], 
+                             [e.to_json() for e in manifest.entries])
+            
+    def test_errors(self):
+        stderr = sys.stderr
+        sys.stderr = cStringIO.StringIO()
+        try:
+            self.assertEqual(self.run_clqcc(self.module_path, "missing(int)"),
+                             1)
+            self.assertEqual(self.run_clqcc(self.module_path, 
+                                            "plus(int, flaot)"), 1)
+            self.assertRaises(SystemExit, self.run_clqcc, self.module_path)
+        finally:
+            sys.stderr = stderr
+
+if __name__ == "__main__":
+    unittest.main()
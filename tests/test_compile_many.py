@@ -0,0 +1,95 @@
+'''Unit tests for GenericFn.compile_many.'''
+import time
+import threading
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+src = '''
+def scale(a, b):
+    c = a * b
+    return c + a
+'''
+
+signatures = [(ocl.int, ocl.int), (ocl.float, ocl.int), (ocl.long, ocl.short),
+              (ocl.double, ocl.float), (ocl.int, ocl.int)]
+
+class CompileManyTest(unittest.TestCase):
+    def compile(self, processes):
+        backend = ocl.Backend()
+        concrete_fns = clq.fn.from_source(src).compile_many(
+            backend, signatures, processes=processes)
+        return backend, concrete_fns
+
+    def test_matches_serial(self):
+        serial_backend, serial = self.compile(1)
+        parallel_backend, parallel = self.compile(3)
+        self.assertEqual(len(parallel), len(signatures))
+        self.assertTrue(parallel[0] is parallel[-1])
+        self.assertEqual([cf.program_item.code for cf in parallel],
+                         [cf.program_item.code for cf in serial])
+        self.assertEqual([item.code for item in parallel_backend.program_items],
+                         [item.code for item in serial_backend.program_items])
+
+    def test_return_types(self):
+        serial = self.compile(1)[1]
+        parallel = self.compile(3)[1]
+        for serial_fn, parallel_fn in zip(serial, parallel):
+            self.assertTrue(parallel_fn.return_type is serial_fn.return_type)
+            # received from the workers rather than compiled again
+            self.assertTrue(parallel_fn._typed_ast is None)
+
+    def test_errors_raised_in_caller(self):
+        bad = clq.fn.from_source('''
+def bad(a):
+    return undefined_name
+''')
+        self.assertRaises(clq.TypeResolutionError, bad.compile_many,
+                          ocl.Backend(), [(ocl.int,), (ocl.float,)], 2)
+
+    def test_lock_held_by_another_thread(self):
+        # e.g. by a compile_async job; workers forked while it is held would
+        # inherit it held and wait for it forever
+        generic_fn = clq.fn.from_source(src)
+        concrete_fns = [generic_fn.compile(ocl.Backend(), *arg_types)
+                        for arg_types in signatures[:2]]
+        acquired = threading.Event()
+        def hold():
+            with clq.compiler_lock:
+                acquired.set()
+                time.sleep(0.2)
+        holder = threading.Thread(target=hold)
+        holder.start()
+        acquired.wait()
+        results = [ ]
+        def compile():
+            results.append(clq._compile_in_pool(concrete_fns, 2))
+        compiler = threading.Thread(target=compile)
+        compiler.daemon = True
+        compiler.start()
+        compiler.join(10)
+        holder.join()
+        self.assertEqual(len(results), 1)
+        self.assertEqual([entry[0] for entry in results[0]],
+                         [tuple((item.name, item.code) 
+                                for item in cf.program_items)
+                          for cf in concrete_fns])
+
+    def test_concurrent_calls(self):
+        results = { }
+        def compile(i):
+            results[i] = self.compile(2)[1]
+        threads = [threading.Thread(target=compile, args=(i,)) 
+                   for i in xrange(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        serial = self.compile(1)[1]
+        for i in xrange(2):
+            self.assertEqual([cf.program_item.code for cf in results[i]],
+                             [cf.program_item.code for cf in serial])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+'''Unit tests for the fusion of element-wise generic functions.'''
+import unittest
+
+import clq
+import clq.fusion
+import clq.backends.opencl as ocl
+from clq.backends.opencl.builtin_defs import get_global_id
+
+scale = clq.fn.from_source('''
+def scale(x, y, s, get_global_id):
+    gid = get_global_id(0)
+    t = x[gid] * s
+    y[gid] = t
+''')
+
+offset = clq.fn.from_source('''
+def offset(y, z, o, get_global_id):
+    i = get_global_id(0)
+    t = y[i] + o
+    z[i] = t
+    z[i] += y[get_global_id(0)]
+''')
+
+def stage(body, name="stage"):
+    return clq.fn.from_source(
+        "def %s(y, z, get_global_id):\n    gid = get_global_id(0)\n"
+        "    %s\n" % (name, body))
+
+class FusionTest(unittest.TestCase):
+    def test_temporary(self):
+        fused = clq.fusion.fuse((scale, offset), temporaries=("y",))
+        self.assertEqual(fused.name, "scale_offset")
+        self.assertEqual(fused.arg_names,
+                         ("x", "s", "get_global_id", "z", "o"))
+        p = ocl.float.ptr_global
+        code = fused.compile(ocl.Backend(), p, ocl.float,
+                             get_global_id.cl_type, p,
+                             ocl.float).program_item.code
+        self.assertEqual(code.count("get_global_id(0)"), 1)
+        self.assertTrue("    float y;" in code)
+        self.assertTrue("scale_t = (x[gid] * s);" in code)
+        self.assertTrue("y = scale_t;" in code)
+        self.assertTrue("offset_t = (y + o);" in code)
+        self.assertTrue("z[gid] += y;" in code)
+        messages = [str(decision) for decision in fused.fusion.decisions]
+        self.assertTrue("offset: renamed 't' to 'offset_t'" in messages)
+        self.assertTrue("offset: reads temporary 'y' from a register, "
+                        "written by 'scale'" in messages)
+        self.assertTrue(fused.fusion.stages == (scale, offset))
+
+    def test_memory(self):
+        fused = clq.fusion.fuse((scale, offset), name="pipeline")
+        self.assertEqual(fused.arg_names,
+                         ("x", "y", "s", "get_global_id", "z", "o"))
+        p = ocl.float.ptr_global
+        code = fused.compile(ocl.Backend(), p, p, ocl.float,
+                             get_global_id.cl_type, p,
+                             ocl.float).program_item.code
+        self.assertTrue("void pipeline(" in code)
+        self.assertTrue("y[gid] = scale_t;" in code)
+        self.assertTrue("offset_t = (y[gid] + o);" in code)
+        report = str(fused.fusion)
+        self.assertTrue("'y' is shared by 'scale', 'offset'" in report)
+        self.assertTrue("scale: 'y' is read back from memory by 'offset'"
+                        in report)
+
+    def test_errors(self):
+        fuse = clq.fusion.fuse
+        FusionError = clq.fusion.FusionError
+        for body in ("z[gid + 1] = 1.0",
+                     "z[0] = 1.0",
+                     "return z[gid]",
+                     "gid = 2"):
+            self.assertRaises(FusionError, fuse, (stage(body),))
+        writer = stage("y[gid] = 1.0", "writer")
+        for stages in ((stage("z[gid] = y[gid]"), writer),
+                       (stage("if z[gid] > 0:\n        y[gid] = 1.0"),),
+                       (writer, stage("z[gid] = y")),
+                       (stage("z[gid] = 1.0"),)):
+            self.assertRaises(FusionError, fuse, stages, temporaries=("y",))
+        self.assertRaises(FusionError, fuse, (writer,), temporaries=("w",))
+        self.assertRaises(FusionError, fuse, ())
+
+if __name__ == "__main__":
+    unittest.main()
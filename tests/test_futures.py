@@ -0,0 +1,134 @@
+'''Unit tests for background specialization and builds (clq.futures).'''
+import sys
+import time
+import threading
+import unittest
+
+import clq
+import clq.futures
+import clq.backends.opencl as ocl
+
+plus = clq.fn.from_source('''
+def plus(a, b):
+    return a + b
+''')
+
+class FakeProgram(object):
+    def __init__(self, source):
+        self.source = source
+        self.thread = threading.current_thread().name
+        
+    def __getattr__(self, name):
+        return "kernel " + name
+
+class FakeContext(object):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.compiled = [ ]
+        self.started = threading.Event()
+        
+    def compile(self, source, options=""):
+        self.started.set()
+        time.sleep(self.delay)
+        if "error" in options:
+            raise clq.Error("Build failed.")
+        self.compiled.append((source, options))
+        return FakeProgram(source)
+
+class FutureTest(unittest.TestCase):
+    def test_future(self):
+        future = clq.futures.Future()
+        self.assertFalse(future.done())
+        self.assertRaises(clq.futures.TimeoutError, future.result, 0.01)
+        calls = [ ]
+        future.add_done_callback(calls.append)
+        future.set_result(3)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), 3)
+        self.assertEqual(future.exception(), None)
+        self.assertEqual(calls, [future])
+        future.add_done_callback(calls.append)
+        self.assertEqual(len(calls), 2)
+        
+    def test_executor(self):
+        executor = clq.futures.Executor(2, "test")
+        event = threading.Event()
+        blocked = executor.submit(event.wait)
+        self.assertEqual(executor.submit(lambda: 2 + 2).result(1.0), 4)
+        failed = executor.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, failed.result)
+        self.assertTrue(isinstance(failed.exception(), ZeroDivisionError))
+        self.assertFalse(blocked.done())
+        event.set()
+        blocked.result(1.0)
+        self.assertEqual(len(executor._threads), 2)
+
+class AsyncCompileTest(unittest.TestCase):
+    def test_compile_async(self):
+        backend = ocl.Backend()
+        future = plus.compile_async(backend, ocl.int, ocl.float)
+        concrete_fn = future.result(10.0)
+        self.assertTrue(concrete_fn is plus.compile(backend, ocl.int, 
+                                                    ocl.float))
+        self.assertTrue(concrete_fn.return_type is ocl.float)
+        failed = plus.compile_async(backend, ocl.int)
+        self.assertRaises(clq.Error, failed.result, 10.0)
+        
+    def test_build_async(self):
+        backend = ocl.Backend()
+        backend.mangle_names = True
+        futures = [plus.compile_async(backend, t, t) 
+                   for t in (ocl.int, ocl.float, ocl.double)]
+        ctx = FakeContext(delay=0.2)
+        start = time.time()
+        program = clq.futures.build_async(ctx, futures, "-O2")
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertTrue(isinstance(program, clq.futures.ProgramFuture))
+        self.assertEqual(program.plus__3int3int, "kernel plus__3int3int")
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertTrue(program.thread.startswith("clq-build"))
+        self.assertEqual(len(ctx.compiled), 1)
+        source, options = ctx.compiled[0]
+        self.assertEqual(options, "-O2")
+        for future in futures:
+            self.assertTrue(future.result().program_item.code in source)
+        
+    def test_build_async_errors(self):
+        backend = ocl.Backend()
+        failed = plus.compile_async(backend, ocl.int)
+        program = clq.futures.build_async(FakeContext(), (failed,))
+        self.assertRaises(clq.Error, program.result, 10.0)
+        module = clq.ProgramModule((plus.compile(backend, ocl.int, ocl.int),))
+        program = module.build_async(FakeContext(), "error")
+        self.assertRaises(clq.Error, getattr, program, "plus")
+        
+    def test_concurrent_compiles_share_objects(self):
+        backend = ocl.Backend()
+        # switch threads as often as possible to expose races
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        self.addCleanup(sys.setcheckinterval, interval)
+        for i in xrange(50):
+            scale = clq.fn.from_source('''
+def scale(a, n):
+    return a * n + %d
+''' % i)
+            future = scale.compile_async(backend, ocl.int, n=i)
+            concrete_fn = scale.compile(backend, ocl.int, n=i)
+            self.assertTrue(future.result(10.0) is concrete_fn)
+            self.assertTrue(concrete_fn.generic_fn is scale.specialize(n=i))
+
+    def test_overlap(self):
+        # the next function is specialized while the driver builds
+        backend = ocl.Backend()
+        ctx = FakeContext(delay=0.5)
+        module = clq.ProgramModule((plus.compile(backend, ocl.int, ocl.int),))
+        program = module.build_async(ctx)
+        ctx.started.wait(10.0)
+        future = plus.compile_async(backend, ocl.short, ocl.short)
+        future.result(10.0)
+        self.assertFalse(program.done())
+        program.result(10.0)
+
+if __name__ == "__main__":
+    unittest.main()
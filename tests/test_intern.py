@@ -0,0 +1,61 @@
+'''Unit tests for the configurable pools used by cypy.intern.'''
+import gc
+import unittest
+
+import cypy
+
+class N(object):
+    def __init__(self, n):
+        self.n = n
+
+class InternPoolTest(unittest.TestCase):
+    def make_class(self, pool=None):
+        cls = type("N", (N,), {})
+        return cypy.intern(cls, pool)
+
+    def test_default_pool(self):
+        cls = self.make_class()
+        self.assertTrue(cls(5) is cls(5))
+        stats = cypy.get_intern_pool(cls).stats
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_weak_pool(self):
+        cls = self.make_class(cypy.WeakInternPool())
+        five = cls(5)
+        self.assertTrue(cls(5) is five)
+        for i in xrange(1000):
+            cls(i + 10)
+        gc.collect()
+        self.assertEqual(len(cypy.get_intern_pool(cls)), 1)
+
+    def test_lru_pool(self):
+        cls = self.make_class(cypy.LRUInternPool(2))
+        one, two = cls(1), cls(2)
+        self.assertTrue(cls(1) is one)
+        cls(3) # evicts 2, the least recently used
+        pool = cypy.get_intern_pool(cls)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.evictions, 1)
+        self.assertTrue(cls(1) is one)
+        self.assertFalse(cls(2) is two)
+
+    def test_set_intern_pool(self):
+        cls = self.make_class()
+        five = cls(5)
+        cypy.set_intern_pool(cls, cypy.LRUInternPool(10))
+        self.assertTrue(cls(5) is five)
+        self.assertTrue(isinstance(cypy.get_intern_pool(cls),
+                                   cypy.LRUInternPool))
+
+    def test_intern_stats(self):
+        cls = self.make_class()
+        cls(1)
+        self.assertTrue(cls in cypy.interned_classes)
+        self.assertTrue(any(stats['misses'] == 1 for stats in
+                            cypy.intern_stats().itervalues()))
+
+if __name__ == "__main__":
+    unittest.main()
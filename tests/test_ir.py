@@ -0,0 +1,72 @@
+'''Unit tests for the intermediate representation in clq.ir.'''
+import unittest
+
+import clq
+import clq.ir as ir
+import clq.backends.opencl as ocl
+
+src = '''
+def kernel(a, b):
+    c = a * b
+    for i in (0, b, 1):
+        c += i
+    if c > a:
+        c = c - a
+    return c
+'''
+
+def walk(nodes):
+    # nodes may be shared, e.g. the target of a for loop and its init
+    stack = list(nodes)
+    seen = set()
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ir.Node) and node not in seen:
+            seen.add(node)
+            yield node
+            for name in node._fields:
+                value = getattr(node, name)
+                if isinstance(value, list):
+                    stack.extend(value)
+                else:
+                    stack.append(value)
+
+class IRTest(unittest.TestCase):
+    def setUp(self):
+        self.generic_fn = clq.fn.from_source(src)
+        self.annotated_ast = self.generic_fn.annotated_ast
+        
+    def test_nodes(self):
+        nodes = list(walk(self.annotated_ast.body))
+        self.assertTrue(nodes)
+        for node in nodes:
+            self.assertFalse(hasattr(node, '__dict__'))
+        indices = [node.index for node in nodes]
+        self.assertEqual(len(set(indices)), len(indices))
+        self.assertTrue(max(indices) < self.annotated_ast.n_nodes)
+        
+    def test_typed_by_index(self):
+        concrete_fn = self.generic_fn.compile(ocl.Backend(), ocl.int, 
+                                              ocl.float)
+        context = concrete_fn.typed_ast.context
+        self.assertEqual(len(context.typed), self.annotated_ast.n_nodes)
+        ret = self.annotated_ast.body[-1]
+        self.assertTrue(isinstance(ret, ir.Return))
+        typed = context.typed[ret.value.index]
+        self.assertEqual(typed.code, "c")
+        self.assertEqual(typed.clq_type, ocl.float)
+        self.assertEqual(typed.id, "c")
+        
+    def test_annotated_ast_shared(self):
+        first = self.generic_fn.compile(ocl.Backend(), ocl.int, ocl.int)
+        second = self.generic_fn.compile(ocl.Backend(), ocl.int, ocl.float)
+        first.program_item, second.program_item
+        self.assertTrue(self.generic_fn.annotated_ast is self.annotated_ast)
+        c_index = self.annotated_ast.body[0].targets[0].index
+        self.assertEqual(first.typed_ast.context.typed[c_index].clq_type, 
+                         ocl.int)
+        self.assertEqual(second.typed_ast.context.typed[c_index].clq_type, 
+                         ocl.float)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+'''Unit tests for the lazily constructed OpenCL tables.'''
+import os
+import sys
+import subprocess
+import unittest
+
+import cypy
+import clq.backends.opencl as ocl
+
+class LazyDictTest(unittest.TestCase):
+    def test_loads_on_first_read(self):
+        calls = [ ]
+        def load(d):
+            calls.append(1)
+            d['a'] = 1
+        d = cypy.LazyDict(load)
+        d['b'] = 2
+        self.assertFalse(d.loaded)
+        self.assertTrue('a' in d)
+        self.assertEqual(sorted(d.keys()), ['a', 'b'])
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_load_is_retried(self):
+        def load(d):
+            raise ImportError()
+        d = cypy.LazyDict(load)
+        self.assertRaises(ImportError, d.get, 'a')
+        self.assertFalse(d.loaded)
+
+class OpenCLTablesTest(unittest.TestCase):
+    def test_not_loaded_on_import(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        output = subprocess.Popen([sys.executable, "-c", 
+            "import sys, clq.backends.opencl; "
+            "print sorted(m for m in ('numpy', 'multiprocessing', "
+            "'clq.backends.opencl.builtin_defs') if m in sys.modules)"], 
+            stdout=subprocess.PIPE, env=env).communicate()[0]
+        self.assertEqual(output.strip(), "[]")
+
+    def test_builtins(self):
+        import clq.backends.opencl.builtin_defs as defs
+        self.assertTrue(ocl.builtins['get_global_id'] is defs.get_global_id)
+        self.assertTrue(ocl.builtins['true'] is defs.true)
+        # reserved keywords take precedence, as they are defined last
+        self.assertTrue(isinstance(ocl.builtins['sizeof'], 
+                                   ocl.ReservedKeyword))
+        self.assertTrue(ocl.extensions['cl_khr_fp64'] is 
+                        ocl.Extension('cl_khr_fp64'))
+        self.assertEqual(defs.atom_add.requires_extensions(
+            ocl.int.ptr_global), (defs.cl_khr_global_int32_base_atomics,))
+
+    def test_module_attributes(self):
+        from clq.backends.opencl import get_global_id, cl_khr_fp64
+        import clq.backends.opencl.builtin_defs as defs
+        self.assertTrue(get_global_id is defs.get_global_id)
+        self.assertTrue(cl_khr_fp64 is ocl.extensions['cl_khr_fp64'])
+        self.assertTrue(hasattr(ocl, 'get_global_id'))
+        self.assertFalse(hasattr(ocl, 'no_such_builtin'))
+        # the module and the functions defined in it share a namespace
+        func_globals = ocl.Backend.__init__.im_func.func_globals
+        ocl.test_attribute = 1
+        try:
+            self.assertEqual(func_globals['test_attribute'], 1)
+            func_globals['test_attribute'] = 2
+            self.assertEqual(ocl.test_attribute, 2)
+        finally:
+            del ocl.test_attribute
+        self.assertFalse(hasattr(ocl, 'test_attribute'))
+        self.assertFalse('test_attribute' in func_globals)
+        self.assertTrue('Backend' in dir(ocl))
+
+    def test_np_dtype(self):
+        self.assertEqual(ocl.half.np_dtype, None)
+        self.assertEqual(ocl.size_t.np_dtype, None)
+        try:
+            import numpy
+        except ImportError:
+            return
+        self.assertEqual(ocl.float.np_dtype, numpy.dtype('float32'))
+        self.assertTrue(ocl.to_cl_type[numpy.dtype('int16')] is ocl.short)
+
+if __name__ == "__main__":
+    unittest.main()
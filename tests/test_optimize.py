@@ -0,0 +1,237 @@
+'''Unit tests for the optimizer (clq.optimize).'''
+import unittest
+import ast as _ast
+
+import clq
+import clq.optimize
+import clq.backends.opencl as ocl
+from clq.backends.opencl.builtin_defs import atom_add, get_global_id
+import clq.stdlib
+
+def compile(src, backend, *arg_types):
+    concrete_fn = clq.fn.from_source(src).compile(backend, *arg_types)
+    return concrete_fn, concrete_fn.program_item.code
+
+def optimizing_backend(**passes):
+    backend = ocl.Backend()
+    backend.optimizer = clq.optimize.Optimizer(**passes)
+    return backend
+
+fold_src = '''
+def fold(x):
+    a = 0xFD43FD * 3 + 1
+    b = -7 / 2
+    d = 6.28318531 * 2.0
+    e = 1 / 0
+    f = x * 1 + (x - 0)
+    return a + b + d + e + f
+'''
+
+cse_src = '''
+def cse(a, b, c, i):
+    c[i] = a[i * 2] + b[i * 2]
+    c[i + 1] = a[i * 2] * a[i * 2]
+    return b[i * 2]
+'''
+
+dce_src = '''
+def dce(a, x):
+    unused = a[0] * 2
+    y = x
+    y = x + 1
+    if 2 > 1:
+        y = y + 2
+    else:
+        y = 0
+    return y
+'''
+
+unroll_src = '''
+def unroll(a, out, gid):
+    s = 0.0
+    for i in (3):
+        for j in (3):
+            s = s + a[gid + i * 3 + j]
+    out[gid] = s
+    t = 0.0
+    for i in (0, 10):
+        t = t + a[i]
+    out[1] = t + i
+    for k in unroll((0, 20, 2), 3):
+        out[k] = 1
+    for m in unroll(5, 1):
+        out[m] = 2
+    for n in unroll((0, 50)):
+        out[n] = 3
+'''
+
+class EvaluationTest(unittest.TestCase):
+    def test_c_semantics(self):
+        e = clq.optimize._eval_BinOp
+        self.assertEqual(e(_ast.Div, -7, 2), -3)
+        self.assertEqual(e(_ast.Mod, -7, 2), -1)
+        self.assertEqual(e(_ast.Div, 7.0, 2), 3.5)
+        self.assertEqual(e(_ast.Div, 1, 0), None)
+        self.assertEqual(e(_ast.LShift, 1, 32), None)
+        self.assertEqual(e(_ast.Mod, 1.0, 2), None)
+        self.assertFalse(clq.optimize._fits(2 ** 31))
+        self.assertFalse(clq.optimize._fits(float("inf")))
+
+class OptimizerTest(unittest.TestCase):
+    def test_disabled_by_default(self):
+        concrete_fn, code = compile(fold_src, ocl.Backend(), ocl.int)
+        self.assertTrue("(0xFD43FD" in code or "16598013 * 3" in code)
+        self.assertEqual(concrete_fn.optimizations, [])
+
+    def test_fold(self):
+        concrete_fn, code = compile(fold_src, optimizing_backend(), ocl.int)
+        self.assertTrue("a = 49794040;" in code)
+        self.assertTrue("b = -3;" in code)
+        self.assertTrue("d = 12.56637062;" in code)
+        self.assertTrue("e = (1 / 0);" in code)
+        self.assertTrue("f = (x + x);" in code)
+        passes = set(change.pass_name for change in concrete_fn.optimizations)
+        self.assertEqual(passes, set(["fold"]))
+
+    def test_cse(self):
+        p = ocl.float.ptr_global
+        concrete_fn, code = compile(cse_src, optimizing_backend(),
+                                    p, p, p, ocl.int)
+        self.assertEqual(code.count("(i * 2)"), 1)
+        self.assertTrue("    int _cse0;" in code)
+        # the stores to c may change a and b, so loads are only reused 
+        # within the second statement
+        self.assertEqual(code.count("a[_cse0]"), 2)
+        self.assertTrue("(_cse1 * _cse1)" in code)
+        self.assertEqual(code.count("b[_cse0]"), 2)
+        messages = [change.message for change in concrete_fn.optimizations]
+        self.assertTrue("i * 2 (4 times) -> _cse0" in messages)
+        self.assertTrue("a[i * 2] (2 times) -> _cse1" in messages)
+
+    def test_cse_impure_call(self):
+        src = '''
+def impure(p, atom_add):
+    x = p[0] + atom_add(p, 1)
+    return x + p[0]
+'''
+        concrete_fn, code = compile(src, optimizing_backend(),
+                                    ocl.int.ptr_global, atom_add.cl_type)
+        self.assertEqual(code.count("p[0]"), 2)
+
+    def test_dce(self):
+        concrete_fn, code = compile(dce_src, optimizing_backend(),
+                                    ocl.int.ptr_global, ocl.int)
+        self.assertFalse("unused" in code)
+        self.assertFalse("y = x;" in code)
+        self.assertFalse("if" in code)
+        self.assertFalse("y = 0;" in code)
+        self.assertTrue("y = (y + 2);" in code)
+
+    def test_toggles(self):
+        backend = optimizing_backend(inline=False, fold=False, unroll=False,
+                                     cse=False)
+        concrete_fn, code = compile(dce_src, backend,
+                                    ocl.int.ptr_global, ocl.int)
+        self.assertTrue("if ((2 > 1))" in code or "if (2 > 1)" in code)
+        self.assertFalse("unused" in code)
+        self.assertEqual(backend.optimizer.key, "dce")
+        self.assertEqual(backend.optimizer.counts["fold"], 0)
+        self.assertEqual(backend.optimizer.counts["dce"],
+                         len(concrete_fn.optimizations))
+
+    def test_unroll(self):
+        p = ocl.float.ptr_global
+        concrete_fn, code = compile(unroll_src, optimizing_backend(cse=False),
+                                    p, p, ocl.int)
+        # the 3x3 loop nest is unrolled fully and the indices folded
+        self.assertFalse("for (j" in code)
+        self.assertTrue("s = (s + a[((gid + 6) + 1)]);" in code)
+        self.assertTrue("for (i = 0; i < 8; i += 4) {" in code)
+        self.assertTrue("t = (t + a[(i + 3)]);" in code)
+        self.assertTrue("t = (t + a[9]);" in code)
+        self.assertTrue("i = 10;" in code)
+        # hints
+        self.assertTrue("for (k = 0; k < 18; k += 6) {" in code)
+        self.assertTrue("out[18] = 1;" in code)
+        self.assertTrue("out[(k + 4)] = 1;" in code)
+        self.assertTrue("for (m = 0; m < 5; m += 1) {" in code)
+        self.assertFalse("out[4] = 2;" in code)
+        self.assertTrue("out[4] = 3;" in code)
+        messages = [change.message for change in concrete_fn.optimizations
+                    if change.pass_name == "unroll"]
+        self.assertTrue("unrolled 'for i in (0, 10, 1)' by 4 "
+                        "(10 iterations, 2 left over)" in messages)
+
+    def test_unroll_limits(self):
+        p = ocl.float.ptr_global
+        backend = optimizing_backend(unroll_limit=20, unroll_factor=1)
+        concrete_fn, code = compile(unroll_src, backend, p, p, ocl.int)
+        self.assertFalse("for (i" in code)
+        self.assertTrue("for (m" in code)
+        self.assertEqual(backend.optimizer.key,
+                         "inline:40,fold,unroll:20:1,dce,cse")
+
+    def test_inline(self):
+        src = '''
+def inlined(a, out, plus, simple_randf, get_global_id):
+    gid = get_global_id(0)
+    x = plus(a[gid], 2.0)
+    out[gid] = plus(x, 1.0) * simple_randf(out, get_global_id)
+    while plus(x, 1.0) < 10.0:
+        x = x + 1.0
+'''
+        p = ocl.float.ptr_global
+        arg_types = (p, p, clq.stdlib.plus.cl_type,
+                     clq.stdlib.simple_randf.cl_type, get_global_id.cl_type)
+        concrete_fn, code = compile(src, optimizing_backend(cse=False),
+                                    *arg_types)
+        self.assertTrue("_inl0_a = a[gid];" in code)
+        self.assertTrue("x = (_inl0_a + 2.0);" in code)
+        self.assertTrue("_inl1_value = (x + 1.0);" in code)
+        self.assertTrue("out[_inl2_gid] = _inl2_x;" in code)
+        self.assertTrue("out[gid] = (_inl1_value * _inl2_value);" in code)
+        # loop tests are evaluated more than once
+        self.assertTrue("while ((plus(x, 1.0) < 10.0))" in code or
+                        "while (plus(x, 1.0) < 10.0)" in code)
+        messages = [change.message for change in concrete_fn.optimizations
+                    if change.pass_name == "inline"]
+        self.assertTrue("inlined plus(a[gid], 2.0) (4 nodes)" in messages)
+
+        backend = optimizing_backend(cse=False, inline_limit=10)
+        code = compile(src, backend, *arg_types)[1]
+        self.assertTrue("simple_randf(out)" in code)
+        self.assertEqual(backend.optimizer.key,
+                         "inline:10,fold,unroll:8:4,dce")
+
+    def test_inline_hint(self):
+        src = '''
+def hinted(a, helper):
+    return helper(a[0]) + a[1]
+'''
+        helper = clq.fn.from_source('''
+def helper(x):
+    x = x * 2
+    return x
+''')
+        arg_types = (ocl.int.ptr_global, helper.cl_type)
+        code = compile(src, optimizing_backend(inline_limit=1), *arg_types)[1]
+        self.assertTrue("helper(a[0])" in code)
+        helper.inline = True
+        code = compile(src, optimizing_backend(inline_limit=1), *arg_types)[1]
+        self.assertTrue("_inl0_x = a[0];" in code)
+        self.assertTrue("_inl0_x = (_inl0_x * 2);" in code)
+        self.assertTrue("return (_inl0_x + a[1]);" in code)
+        helper.inline = False
+        code = compile(src, optimizing_backend(), *arg_types)[1]
+        self.assertTrue("helper(a[0])" in code)
+
+    def test_shared_ir_unchanged(self):
+        arg_types = (ocl.int.ptr_global, ocl.int)
+        expected = compile(dce_src, ocl.Backend(), *arg_types)[1]
+        generic_fn = clq.fn.from_source(dce_src)
+        generic_fn.compile(optimizing_backend(), *arg_types).program_item
+        code = generic_fn.compile(ocl.Backend(), *arg_types).program_item.code
+        self.assertEqual(code, expected)
+
+if __name__ == "__main__":
+    unittest.main()
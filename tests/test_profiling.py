@@ -0,0 +1,96 @@
+'''Unit tests for the compiler profiler (clq.profiling).'''
+import json
+import threading
+import unittest
+
+import clq
+import clq.internals
+import clq.profiling
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+src = '''
+def mix(a, b, f):
+    c = a * b + a
+    if c > b:
+        c = f(c)
+    return c
+'''
+
+double_src = '''
+def double(x):
+    return x + x
+'''
+
+class ProfileTest(unittest.TestCase):
+    def compile(self):
+        double = clq.fn.from_source(double_src)
+        mix = clq.fn.from_source(src)
+        return mix.compile(OpenCL, ocl.int, ocl.int, double.cl_type)
+
+    def test_phases_and_nodes(self):
+        with clq.profiling.Profile() as profile:
+            self.compile().program_item
+        report = json.loads(profile.to_json())
+
+        concrete = [f for f in report['functions'] if f['kind'] == 'concrete']
+        self.assertEqual([f['name'] for f in concrete], ['mix', 'double'])
+        self.assertEqual(concrete[0]['arg_types'][:2], ['int', 'int'])
+        for phase in ('generate', 'resolve', 'assemble'):
+            self.assertEqual(concrete[0]['phases'][phase]['calls'] > 0, True)
+        self.assertEqual(concrete[0]['phases']['assemble']['calls'], 1)
+        self.assertTrue('BinOp' in concrete[0]['nodes']['generate'])
+
+        generic = [f for f in report['functions'] if f['kind'] == 'generic']
+        self.assertEqual(sorted(f['name'] for f in generic), 
+                         ['double', 'mix'])
+        self.assertEqual(report['phases']['parse']['calls'], 2)
+        self.assertEqual(report['phases']['annotate']['calls'], 2)
+        self.assertTrue('If' in report['nodes']['annotate'])
+        self.assertTrue(report['seconds'] >= 0)
+
+    def test_hooks_removed(self):
+        with clq.profiling.Profile():
+            with clq.profiling.Profile() as inner:
+                self.compile().program_item
+            self.assertTrue(clq.profiling.active is not None)
+        self.assertTrue(clq.profiling.active is None)
+        self.assertTrue(inner.records)
+        self.assertFalse('visit' in clq.internals.ConcreteFnVisitor.__dict__)
+        self.assertFalse('visit' in clq.internals.GenericFnVisitor.__dict__)
+
+    def test_threads(self):
+        # phases are nested separately on each thread
+        profile = clq.profiling.Profile()
+        with profile:
+            with clq.profiling.phase(None, "generate"):
+                thread = threading.Thread(
+                    target=lambda: profile.add(None, "optimize", 1.0))
+                thread.start()
+                thread.join()
+        phases = profile.record_for(None).phases
+        self.assertEqual(phases["optimize"], [1.0, 1])
+        self.assertTrue(0 <= phases["generate"][0] < 1.0)
+
+    def test_hooks_after_stop(self):
+        # e.g. still running on another thread when the profile is stopped
+        with clq.profiling.Profile():
+            visit = clq.internals.ConcreteFnVisitor.visit
+            resolve = clq.internals.UnresolvedType.resolve
+        self.assertTrue(visit.im_func is clq.profiling._profiled_visit)
+        self.assertTrue(resolve.im_func is clq.profiling._profiled_resolve)
+        clq.internals.ConcreteFnVisitor.visit = visit
+        clq.internals.UnresolvedType.resolve = resolve
+        try:
+            self.assertEqual(self.compile().program_item.name, 'mix')
+        finally:
+            del clq.internals.ConcreteFnVisitor.visit
+            clq.internals.UnresolvedType.resolve = clq.profiling._resolve
+
+    def test_disabled(self):
+        self.assertTrue(clq.profiling.active is None)
+        self.assertEqual(self.compile().program_item.name, 'mix')
+
+if __name__ == "__main__":
+    unittest.main()
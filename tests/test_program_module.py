@@ -0,0 +1,193 @@
+'''Unit tests for clq.ProgramModule.'''
+import gc
+import re
+import unittest
+
+import cypy
+import clq
+import clq.backends.opencl as ocl
+
+class FakeContext(object):
+    def __init__(self):
+        self.compiled = [ ]
+        
+    def compile(self, source, options=""):
+        self.compiled.append((source, options))
+        return len(self.compiled)
+
+class ProgramModuleTest(unittest.TestCase):
+    def setUp(self):
+        backend = ocl.Backend()
+        self.helper = clq.fn.from_source('''
+def helper(x):
+    return x + 1
+''')
+        caller = clq.fn.from_source('''
+def caller(a, f):
+    return f(a) * 2
+''')
+        other = clq.fn.from_source('''
+def other(a, f):
+    return f(a) - 2
+''')
+        helper_type = self.helper.cl_type
+        self.caller = caller.compile(backend, ocl.int, helper_type)
+        self.other = other.compile(backend, ocl.int, helper_type)
+        
+    def test_shared_items_appear_once(self):
+        module = clq.ProgramModule((self.caller, self.other))
+        names = [item.name for item in module]
+        self.assertEqual(len(module), 3)
+        self.assertEqual(len(set(names)), 3)
+        helper_idx = module.index(self.caller.program_items[0])
+        self.assertTrue(helper_idx < module.index(self.caller.program_item))
+        self.assertTrue(helper_idx < module.index(self.other.program_item))
+        self.assertEqual(module.concrete_fns, [self.caller, self.other])
+        
+    def test_dedupe_by_content(self):
+        item = self.caller.program_item
+        module = clq.ProgramModule()
+        module.append(item)
+        module.append(clq.ProgramItem(item.name, item.code))
+        self.assertEqual(len(module), 1)
+        self.assertTrue(clq.ProgramItem(item.name, item.code) in module)
+        
+    def test_extend_front(self):
+        a, b, c = [clq.ProgramItem(name, name) for name in "abc"]
+        module = clq.ProgramModule()
+        module.append(c)
+        module.extend_front((a, b, c))
+        self.assertEqual([item.name for item in module], ["a", "b", "c"])
+        
+    def test_build_once(self):
+        module = clq.ProgramModule((self.caller,))
+        ctx = FakeContext()
+        self.assertEqual(module.build(ctx), module.build(ctx))
+        self.assertEqual(len(ctx.compiled), 1)
+        self.assertEqual(ctx.compiled[0][0], module.code)
+        module.add(self.other)
+        module.build(ctx)
+        self.assertEqual(len(ctx.compiled), 2)
+
+class MangleTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = ocl.Backend()
+        self.backend.mangle_names = True
+        self.identity = clq.fn.from_source('''
+def identity(x):
+    return x
+''')
+        
+    def test_specializations_share_program(self):
+        backend, identity = self.backend, self.identity
+        p = ocl.float.ptr_global
+        fns = (identity.compile(backend, ocl.int),
+               identity.compile(backend, ocl.float),
+               identity.compile(backend, p))
+        names = [concrete_fn.name for concrete_fn in fns]
+        self.assertEqual(names, ["identity__3int", "identity__5float", 
+                                 "identity__13global_floatp"])
+        module = clq.ProgramModule(fns)
+        self.assertEqual(len(module), 3)
+        ctx = FakeContext()
+        module.build(ctx)
+        self.assertEqual(len(ctx.compiled), 1)
+        for concrete_fn in fns:
+            self.assertTrue(backend.demangle(concrete_fn.name) is concrete_fn)
+        self.assertRaises(clq.Error, backend.demangle, "identity")
+        
+    def test_calls_and_constants(self):
+        backend = self.backend
+        caller = clq.fn.from_source('''
+def caller(a, n, f, get_global_id):
+    return f(a * n) + get_global_id(0)
+''')
+        from clq.backends.opencl.builtin_defs import get_global_id
+        concrete_fn = caller.compile(backend, ocl.int, self.identity.cl_type,
+                                     get_global_id.cl_type, n=-2.5)
+        identity_t = self.identity.cl_type.mangled_name
+        self.assertTrue(re.match(r"^identity_[0-9a-f]{8}$", identity_t))
+        self.assertEqual(concrete_fn.name, 
+                         "caller__3int%d%s13get_global_id_6n_m2p5" % 
+                         (len(identity_t), identity_t))
+        code = concrete_fn.program_item.code
+        self.assertTrue("identity__5float((a * -2.5))" in code)
+        self.assertEqual(concrete_fn.program_items[0].name, 
+                         "identity__5float")
+        
+    def test_unambiguous(self):
+        backend = self.backend
+        names = set()
+        for src, arg_types, constants in (
+                ("def f__int(b): return b", (ocl.float,), { }),
+                ("def f(a, b): return b", (ocl.int, ocl.float), { }),
+                ("def f(a, b): return b", (ocl.float,), {"a": 1}),
+                ("def f__(a_1, b): return b", (ocl.float,), {"a_1": 1}),
+                ("def f(a__1, b): return b", (ocl.float,), {"a__1": 1})):
+            generic_fn = clq.fn.from_source(src)
+            names.add(generic_fn.compile(backend, *arg_types, 
+                                         **constants).name)
+        self.assertEqual(len(names), 5)
+        # functions of the same name passed as arguments
+        apply = clq.fn.from_source('''
+def apply(f, x):
+    return f(x)
+''')
+        other = clq.fn.from_source('''
+def identity(x):
+    return x + 1
+''')
+        self.assertNotEqual(
+            backend.mangle(apply.compile(backend, self.identity.cl_type, 
+                                         ocl.int)),
+            backend.mangle(apply.compile(backend, other.cl_type, ocl.int)))
+        
+    def test_collision(self):
+        backend = self.backend
+        self.identity.compile(backend, ocl.int).program_item
+        other = clq.fn.from_source('''
+def identity(x):
+    return x + 1
+''')
+        self.assertRaises(clq.Error, 
+                          lambda: other.compile(backend, ocl.int).program_item)
+        same = clq.fn.from_source('''
+def identity(x):
+    return x
+''')
+        same.compile(backend, ocl.int).program_item
+        
+    def test_disabled_by_default(self):
+        concrete_fn = self.identity.compile(ocl.Backend(), ocl.int)
+        self.assertEqual(concrete_fn.name, "identity")
+        
+    def test_weakly_pooled_fns_are_collected(self):
+        classes = (clq.ConcreteFn, clq.GenericFn)
+        pools = [cypy.get_intern_pool(cls) for cls in classes]
+        for cls in classes:
+            cypy.set_intern_pool(cls, cypy.WeakInternPool())
+        try:
+            gc.collect()
+            before = [len(cypy.get_intern_pool(cls)) for cls in classes]
+            for mangle_names in (False, True):
+                backend = ocl.Backend()
+                backend.mangle_names = mangle_names
+                for i in xrange(50):
+                    fn = clq.fn.from_source('''
+def throwaway_%d(x):
+    return x
+''' % i)
+                    fn.compile(backend, ocl.int).program_item
+                fn_name = fn.compile(backend, ocl.int).name
+                del fn
+                gc.collect()
+                self.assertEqual([len(cypy.get_intern_pool(cls)) 
+                                  for cls in classes], before)
+                self.assertRaises(clq.Error, backend.demangle, 
+                                  fn_name if mangle_names else "throwaway_0")
+        finally:
+            for cls, pool in zip(classes, pools):
+                cypy.set_intern_pool(cls, pool)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+'''Unit tests for binding arguments and module-level names to constants
+(GenericFn.specialize).'''
+import unittest
+
+import clq
+import clq.optimize
+import clq.backends.opencl as ocl
+
+WIDTH = 16
+SCALE = 0.1 + 0.2
+NAME = "not a number"
+
+@clq.fn
+def row_start(row):
+    return row * WIDTH + SCALE
+
+@clq.fn
+def store_row_start(p, row):
+    if row < 0:
+        return
+    p[row] = row * WIDTH
+
+scale_src = '''
+def scale(a, n, factor):
+    return a[n - 1] * factor
+'''
+
+class SpecializeTest(unittest.TestCase):
+    def test_arguments(self):
+        generic_fn = clq.fn.from_source(scale_src)
+        concrete_fn = generic_fn.compile(ocl.Backend(), ocl.float.ptr_global,
+                                         n=4, factor=2.5)
+        code = concrete_fn.program_item.code
+        self.assertEqual(concrete_fn.generic_fn.arg_names, ("a",))
+        self.assertTrue("(__global float* a)" in code)
+        self.assertTrue("a[(4 - 1)] * 2.5" in code)
+        self.assertEqual(concrete_fn.generic_fn.constants,
+                         {"n": 4, "factor": 2.5})
+        self.assertTrue(concrete_fn.generic_fn.unspecialized is generic_fn)
+
+    def test_cached(self):
+        generic_fn = clq.fn.from_source(scale_src)
+        backend = ocl.Backend()
+        p = ocl.float.ptr_global
+        first = generic_fn.compile(backend, p, n=4, factor=2.5)
+        self.assertTrue(generic_fn.compile(backend, p, factor=2.5, n=4)
+                        is first)
+        self.assertFalse(generic_fn.compile(backend, p, n=4, factor=2)
+                         is first)
+        self.assertFalse(generic_fn.compile(backend, p, n=5, factor=2.5)
+                         is first)
+        self.assertTrue(generic_fn.specialize() is generic_fn)
+
+    def test_folded(self):
+        backend = ocl.Backend()
+        backend.optimizer = clq.optimize.Optimizer()
+        concrete_fn = clq.fn.from_source(scale_src).compile(
+            backend, ocl.float.ptr_global, n=4, factor=2.5)
+        self.assertTrue("a[3] * 2.5" in concrete_fn.program_item.code)
+
+    def test_globals(self):
+        concrete_fn = row_start.compile(ocl.Backend(), ocl.int)
+        code = concrete_fn.program_item.code
+        self.assertTrue("(row * 16)" in code)
+        self.assertTrue(repr(SCALE) in code)
+        self.assertEqual(concrete_fn.generic_fn.constants,
+                         {"WIDTH": 16, "SCALE": SCALE})
+
+    def test_globals_with_bare_return(self):
+        # the syntax tree is annotated when specializing, before compiling
+        concrete_fn = store_row_start.compile(ocl.Backend(), 
+                                              ocl.int.ptr_global, ocl.int)
+        self.assertTrue("p[row] = (row * 16);" in 
+                        concrete_fn.program_item.code)
+        self.assertTrue(concrete_fn.return_type is ocl.void)
+
+    def test_errors(self):
+        generic_fn = clq.fn.from_source(scale_src)
+        self.assertRaises(clq.Error, generic_fn.specialize, m=1)
+        self.assertRaises(clq.Error, generic_fn.specialize, n=NAME)
+        self.assertRaises(clq.Error, generic_fn.specialize, n=float("nan"))
+        assigned = clq.fn.from_source('''
+def assigned(n):
+    n = 2
+''')
+        self.assertRaises(clq.InvalidOperationError, assigned.specialize, n=1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+'''Unit tests for the type inference engine in clq.internals.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+def compile(src, *arg_types):
+    concrete_fn = clq.fn.from_source(src).compile(ocl.Backend(), *arg_types)
+    concrete_fn.program_item
+    return concrete_fn
+
+class TypeInferenceTest(unittest.TestCase):
+    def test_long_chain(self):
+        n = 2000
+        lines = ["def chain(a, b):", "    x0 = a"]
+        for i in xrange(1, n):
+            lines.append("    x%d = x%d + b" % (i, i - 1))
+        lines.append("    return x%d" % (n - 1))
+        concrete_fn = compile("\n".join(lines) + "\n", ocl.int, ocl.float)
+        self.assertEqual(concrete_fn.return_type, ocl.float)
+        code = concrete_fn.program_item.code
+        self.assertTrue("    int x0;" in code)
+        self.assertTrue("    float x%d;" % (n - 1) in code)
+
+    def test_self_reference(self):
+        concrete_fn = compile('''
+def count(a):
+    i = 0
+    i = i + a
+    return i
+''', ocl.float)
+        self.assertTrue("    float i;" in concrete_fn.program_item.code)
+
+    def test_mutual_dependence(self):
+        concrete_fn = compile('''
+def mutual(a, n):
+    s = 0
+    t = 0
+    for k in (0, n, 1):
+        s = t + a
+        t = s + 1
+    return s
+''', ocl.float, ocl.int)
+        code = concrete_fn.program_item.code
+        self.assertTrue("    float s;" in code)
+        self.assertTrue("    float t;" in code)
+
+    def test_graph_is_shared(self):
+        generic_fn = clq.fn.from_source('''
+def f(a):
+    x = a
+    y = x + 1
+    return y
+''')
+        graph = generic_fn.inference_graph
+        self.assertEqual(graph.components, [["x"], ["y"]])
+        generic_fn.compile(ocl.Backend(), ocl.int).program_item
+        generic_fn.compile(ocl.Backend(), ocl.float).program_item
+        self.assertTrue(generic_fn.inference_graph is graph)
+
+    def test_undefined_name(self):
+        self.assertRaises(clq.TypeResolutionError, compile, '''
+def undefined(a):
+    x = a
+    x = x + y
+    return x
+''', ocl.int)
+
+if __name__ == "__main__":
+    unittest.main()
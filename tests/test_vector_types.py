@@ -0,0 +1,166 @@
+'''Unit tests for the OpenCL vector types.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+from clq.backends.opencl.builtin_defs import (get_global_id, vloads, vstores,
+                                              conversions, dot)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+vload4, vstore4 = vloads[2], vstores[2]
+
+saxpy4_src = '''
+def saxpy4(a, x, y, get_global_id, vload4, vstore4, float4, convert_int4,
+           dot):
+    gid = get_global_id(0)
+    v = vload4(gid, x)
+    r = a * v + vload4(gid, y)
+    r.x = r.w
+    r.yz += 1.0
+    s = float4(r.xy, 0.0, v.s3)
+    t = s.wzyx - float4(2.0)
+    c = convert_int4(t) + (t > v)
+    vstore4(r * dot(t, v), gid, y)
+    return c.x
+'''
+
+def compile(src, *arg_types):
+    return clq.fn.from_source(src).compile(ocl.Backend(), *arg_types)
+
+def resolve(src, *arg_types):
+    return compile(src, *arg_types).return_type
+
+class VectorTypeTest(unittest.TestCase):
+    def test_types(self):
+        self.assertEqual(len(ocl.vector_types), 11 * 5)
+        self.assertTrue(ocl.float4 is ocl.vector_types["float4"])
+        self.assertTrue(ocl.float.vector_types[4] is ocl.float4)
+        self.assertTrue(ocl.uchar16.base_type is ocl.uchar)
+        self.assertEqual(ocl.float4.n, 4)
+        self.assertEqual(ocl.float4.min_sizeof, 16)
+        self.assertEqual(ocl.double3.max_sizeof, 32)
+        self.assertTrue(ocl.float8.comparison_type is ocl.int8)
+        self.assertTrue(ocl.double2.comparison_type is ocl.long2)
+        self.assertTrue(ocl.uchar4.comparison_type is ocl.char4)
+        self.assertEqual(ocl.size_t.vector_types, None)
+
+    def test_components(self):
+        v = ocl.float4
+        self.assertEqual(v.components("x"), (0,))
+        self.assertEqual(v.components("wzyx"), (3, 2, 1, 0))
+        self.assertEqual(v.components("s30"), (3, 0))
+        self.assertEqual(v.components("hi"), (2, 3))
+        self.assertEqual(v.components("odd"), (1, 3))
+        self.assertEqual(ocl.int16.components("sF"), (15,))
+        self.assertEqual(v.components("s4"), None)
+        self.assertEqual(v.components("xs"), None)
+        self.assertEqual(ocl.float8.components("x"), None)
+        self.assertTrue(v.component_type("x") is ocl.float)
+        self.assertTrue(v.component_type("xyz") is ocl.float3)
+        self.assertTrue(ocl.int16.component_type("lo") is ocl.int8)
+        self.assertRaises(clq.TypeResolutionError,
+                          ocl.float8.component_type, "s01234")
+
+    def test_operators(self):
+        src = "def f(a, b):\n    return a %s b\n"
+        self.assertTrue(resolve(src % "+", ocl.float4, ocl.float4)
+                        is ocl.float4)
+        self.assertTrue(resolve(src % "*", ocl.float, ocl.float4)
+                        is ocl.float4)
+        self.assertTrue(resolve(src % "/", ocl.int4, ocl.int) is ocl.int4)
+        self.assertTrue(resolve(src % "<<", ocl.uint2, ocl.int) is ocl.uint2)
+        self.assertTrue(resolve(src % "<", ocl.float4, ocl.float4)
+                        is ocl.int4)
+        self.assertTrue(resolve(src % ">", ocl.float, ocl.double2)
+                        is ocl.long2)
+        self.assertRaises(clq.TypeResolutionError, resolve, src % "+",
+                          ocl.float4, ocl.int4)
+        self.assertRaises(clq.TypeResolutionError, resolve, src % "+",
+                          ocl.float4, ocl.float8)
+        self.assertRaises(clq.TypeResolutionError, resolve, src % "<<",
+                          ocl.float4, ocl.int)
+        neg = "def f(a):\n    return -a\n"
+        self.assertTrue(resolve(neg, ocl.short8) is ocl.short8)
+
+    def test_scalar_conversion(self):
+        # scalars are converted to the element type, which OpenCL does not
+        # do implicitly when their rank is higher
+        def code(src, *arg_types):
+            return compile(src, *arg_types).program_item.code
+        scale = "def f(v):\n    return v * 2.5\n"
+        self.assertTrue("(v * ((int)2.5))" in code(scale, ocl.int4))
+        src = "def f(a, b):\n    return a %s b\n"
+        self.assertTrue("(a * ((float)b))" in 
+                        code(src % "*", ocl.float4, ocl.double))
+        self.assertTrue("(((float)a) - b)" in 
+                        code(src % "-", ocl.double, ocl.float4))
+        self.assertTrue("(((double)a) < b)" in 
+                        code(src % "<", ocl.float, ocl.double2))
+        self.assertTrue("(a + b)" in code(src % "+", ocl.float4, ocl.float))
+
+    def test_kernel(self):
+        concrete_fn = compile(saxpy4_src, ocl.float, ocl.float.ptr_global,
+                              ocl.float.ptr_global, get_global_id.cl_type,
+                              vload4.cl_type, vstore4.cl_type,
+                              ocl.float4.cl_type,
+                              conversions["convert_int4"].cl_type,
+                              dot.cl_type)
+        code = concrete_fn.program_item.code
+        self.assertTrue("float4 v;" in code)
+        self.assertTrue("int4 c;" in code)
+        self.assertTrue("v = vload4(gid, x);" in code)
+        self.assertTrue("r.x = r.w;" in code)
+        self.assertTrue("r.yz += 1.0;" in code)
+        self.assertTrue("s = ((float4)(r.xy, 0.0, v.s3));" in code)
+        self.assertTrue("t = (s.wzyx - ((float4)(2.0)));" in code)
+        self.assertTrue("c = (convert_int4(t) + (t > v));" in code)
+        self.assertTrue("vstore4((r * dot(t, v)), gid, y);" in code)
+        self.assertTrue(concrete_fn.return_type is ocl.int)
+
+    def test_errors(self):
+        p = ocl.float.ptr_global
+        assign_src = '''
+def f(p, vload4):
+    v = vload4(0, p)
+    v.%s = %s
+'''
+        for attr, value in (("xx", "1.0"), ("q", "1.0"), ("xy", "v")):
+            self.assertRaises(clq.TypeResolutionError,
+                              lambda: compile(assign_src % (attr, value), p,
+                                              vload4.cl_type).program_item)
+        construct_src = '''
+def f(float4):
+    return float4(1.0, 2.0)
+'''
+        self.assertRaises(clq.TypeResolutionError, resolve, construct_src,
+                          ocl.float4.cl_type)
+        store_src = '''
+def f(p, v, vstore4):
+    vstore4(v, 0, p)
+'''
+        self.assertRaises(clq.TypeResolutionError, resolve, store_src, p,
+                          ocl.int4, vstore4.cl_type)
+        as_src = '''
+def f(v, as_int4):
+    return as_int4(v)
+'''
+        self.assertTrue(resolve(as_src, ocl.float4,
+                                conversions["as_int4"].cl_type) is ocl.int4)
+        self.assertRaises(clq.TypeResolutionError, resolve, as_src,
+                          ocl.double4, conversions["as_int4"].cl_type)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_np_dtype(self):
+        dtype = ocl.float4.np_dtype
+        self.assertEqual(dtype.itemsize, 16)
+        self.assertEqual(dtype.names, ("s0", "s1", "s2", "s3"))
+        self.assertEqual(ocl.float3.np_dtype.itemsize, 16)
+        self.assertTrue(ocl.to_cl_type[ocl.int8.np_dtype] is ocl.int8)
+        self.assertEqual(ocl.half4.np_dtype, None)
+
+if __name__ == "__main__":
+    unittest.main()
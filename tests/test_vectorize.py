@@ -0,0 +1,79 @@
+'''Unit tests for the automatic vectorization of element-wise kernels.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+from clq.backends.opencl.builtin_defs import get_global_id, sqrt, dot
+from clq.backends.opencl.vectorize import vectorize, NotVectorizableError
+
+ew_add_src = '''
+def ew_add(a, b, dest, get_global_id):
+    gid = get_global_id(0)
+    dest[gid] = a[gid] + b[gid]
+'''
+
+scale_src = '''
+def scale(s, x, get_global_id, sqrt):
+    t = s * 2.0
+    v = sqrt(x[get_global_id(0)]) * t
+    x[get_global_id(0)] = v
+    x[get_global_id(0)] += t
+'''
+
+def compile(src, *arg_types):
+    return clq.fn.from_source(src).compile(ocl.Backend(), *arg_types)
+
+class VectorizeTest(unittest.TestCase):
+    def test_ew_add(self):
+        p = ocl.float.ptr_global
+        scalar = compile(ew_add_src, p, p, p, get_global_id.cl_type)
+        vectorized = vectorize(scalar, 4)
+        self.assertEqual(vectorized.width, 4)
+        self.assertTrue(vectorized.scalar_fn is scalar)
+        code = vectorized.concrete_fn.program_item.code
+        self.assertTrue("void ew_add_v4(__global float* a, __global float* b, "
+                        "__global float* dest, int _n)" in code)
+        self.assertTrue("if (((gid * 4) + 4) <= _n) {" in code)
+        self.assertTrue("vstore4((vload4(gid, a) + vload4(gid, b)), "
+                        "gid, dest);" in code)
+        self.assertTrue("for (_i = (gid * 4); _i < _n; _i += 1) {" in code)
+        self.assertTrue("dest[_i] = (a[_i] + b[_i]);" in code)
+
+        double = vectorize(compile(ew_add_src, *((ocl.double.ptr_global,) * 3 +
+                                               (get_global_id.cl_type,))), 2)
+        self.assertTrue("vload2(gid, a)" in double.concrete_fn.program_item.code)
+
+    def test_scalars(self):
+        scalar = compile(scale_src, ocl.float, ocl.float.ptr_global,
+                         get_global_id.cl_type, sqrt.cl_type)
+        code = vectorize(scalar, 8).concrete_fn.program_item.code
+        self.assertTrue("    float t;" in code)
+        self.assertTrue("    float8 v;" in code)
+        self.assertTrue("    float v_s;" in code)
+        self.assertTrue("_gid = get_global_id(0);" in code)
+        self.assertTrue("v = (sqrt(vload8(_gid, x)) * t);" in code)
+        self.assertTrue("vstore8(v, _gid, x);" in code)
+        self.assertTrue("vstore8((vload8(_gid, x) + t), _gid, x);" in code)
+        self.assertTrue("x[_i] = v_s;" in code)
+
+    def test_not_vectorizable(self):
+        p = ocl.float.ptr_global
+        for body, b in (("a[gid + 1] = 1.0", p),
+                        ("a[0] = 1.0", p),
+                        ("a[gid] = gid", p),
+                        ("if a[gid] > 0:\n        a[gid] = 0.0", p),
+                        ("a[gid] = a[gid] > 0", p),
+                        ("a[gid] = b[gid]", ocl.int.ptr_global),
+                        ("a[gid] = b[gid]", ocl.float.ptr_private),
+                        ("a[gid] = dot(b[gid], b[gid])", p),
+                        ("b[gid] = b[gid] * 2.5", ocl.int.ptr_global)):
+            src = "def f(a, b, dot, get_global_id):\n" \
+                  "    gid = get_global_id(0)\n    %s\n" % body
+            scalar = compile(src, p, b, dot.cl_type, get_global_id.cl_type)
+            self.assertRaises(NotVectorizableError, vectorize, scalar)
+        self.assertRaises(clq.Error, vectorize, 
+                          compile(ew_add_src, p, p, p, get_global_id.cl_type),
+                          5)
+
+if __name__ == "__main__":
+    unittest.main()